@@ -148,6 +148,17 @@ echo "  Total:          $TOTAL_CERTS certificates"
 echo ""
 echo -e "${GREEN}[SUCCESS]${COFF} CA bundle ready at: $OUTPUT_FILE"
 echo ""
+
+# Deduplicated bundle and hashed directory (-CApath) in $BD/trust; only what
+# changed since the last run is rewritten. Set TRUST_NATIVE=0 to skip.
+if [ "${TRUST_NATIVE:-1}" != "0" ] && command -v issuer > /dev/null; then
+    if issuer trust build --base-dir "$BD" --system-ca "$SYSTEM_CA" > /dev/null; then
+        echo -e "${GREEN}[SUCCESS]${COFF} Hashed CA directory ready at: $BD/trust/certs"
+    else
+        echo -e "${YELLOW}[WARNING]${COFF} issuer trust build failed; $BD/trust not updated"
+    fi
+    echo ""
+fi
 echo "Usage:"
 echo "  # Verify your own certificates:"
 echo "  ./tsa_verify.sh document.pdf --ca-file $OUTPUT_FILE --verify-cert"
@@ -155,4 +166,9 @@ echo ""
 echo "  # Verify timestamps (TSA certificates):"
 echo "  openssl ts -verify -in file.sign_tsa.tsr -data file.pdf -CAfile $OUTPUT_FILE"
 echo ""
+if [ -d "$BD/trust/certs" ]; then
+    echo "  # Same, loading only the CAs the chain needs:"
+    echo "  ./tsa_verify.sh document.pdf --ca-path $BD/trust/certs --verify-cert"
+    echo ""
+fi
 
@@ -11,7 +11,8 @@
 #
 # Options:
 #   --crl FILE          Use specific CRL file instead of auto-detecting
-#   --ca-bundle FILE    Use specific CA bundle for verification
+#   --ca-bundle FILE    Use specific CA bundle for verification (a hashed
+#                       directory such as trust/certs works too)
 #   --verbose           Show detailed certificate information
 #   --quiet             Minimal output (exit code only)
 #   --json              Output results in JSON format
@@ -69,7 +70,9 @@ Check if a certificate is valid or revoked against CRL.
 
 Options:
   --crl FILE          Use specific CRL file instead of auto-detecting
-  --ca-bundle FILE    Use specific CA bundle for verification
+  --ca-bundle FILE    Use specific CA bundle for verification; a hashed
+                      directory (issuer trust build: \$BD/trust/certs) is
+                      used as -CApath, loading only the CAs needed
   --verbose, -v       Show detailed certificate information
   --quiet, -q         Minimal output (exit code only)
   --json              Output results in JSON format
@@ -86,6 +89,9 @@ Examples:
   # Check with custom CA bundle
   $0 cert.pem --ca-bundle /path/to/ca-bundle.pem
 
+  # Check against the hashed trust directory
+  $0 cert.pem --ca-bundle ~/.config/demo-cfssl/trust/certs
+
   # Verbose mode with all details
   $0 cert.pem --verbose
 
@@ -102,6 +108,7 @@ Exit Codes:
 
 Environment Variables:
   CRL_CHECK_BD        Override base directory (default: ~/.config/demo-cfssl)
+  CRL_CHECK_NATIVE    0: do not use 'issuer crlcheck' for --batch --json
 
 EOF
     exit 0
@@ -306,7 +313,9 @@ function check_certificate() {
     fi
     
     # Perform full OpenSSL verification with CRL check
-    local VERIFY_OUTPUT=$(openssl verify -CAfile "$CA_BUNDLE" -crl_check -CRLfile "$CRL_FILE" "$CERT_FILE" 2>&1)
+    local CA_OPT="-CAfile"
+    [ -d "$CA_BUNDLE" ] && CA_OPT="-CApath"
+    local VERIFY_OUTPUT=$(openssl verify $CA_OPT "$CA_BUNDLE" -crl_check -CRLfile "$CRL_FILE" "$CERT_FILE" 2>&1)
     local VERIFY_CODE=$?
     
     if [ $VERBOSE -eq 1 ]; then
@@ -365,6 +374,28 @@ function batch_check() {
         return 2
     fi
     
+    # The native checker parses each CRL once instead of running openssl per
+    # certificate; set CRL_CHECK_NATIVE=0 to keep the loop below
+    if [ $JSON_OUTPUT -eq 1 ] && [ "${CRL_CHECK_NATIVE:-1}" != "0" ] && command -v issuer > /dev/null; then
+        local NATIVE_ARGS=(--base-dir "$BD")
+        [ -n "$CUSTOM_CRL" ] && NATIVE_ARGS+=(--crl "$CUSTOM_CRL")
+        [ -n "$CUSTOM_CA_BUNDLE" ] && NATIVE_ARGS+=(--ca-bundle "$CUSTOM_CA_BUNDLE")
+        local NATIVE_OUT
+        NATIVE_OUT=$(mktemp) || return 2
+        local RC=0
+        issuer crlcheck "$BATCH_FILE" "${NATIVE_ARGS[@]}" > "$NATIVE_OUT" || RC=$?
+        # Nothing written: the checker could not start (bad CRL, missing
+        # dependency); its error is on stderr, check with the loop below
+        if [ $RC -ne 0 ] && [ ! -s "$NATIVE_OUT" ]; then
+            rm -f "$NATIVE_OUT"
+            echo -e "${YELLOW}[WARNING]${COFF} issuer crlcheck failed (exit $RC), falling back to openssl" >&2
+        else
+            cat "$NATIVE_OUT"
+            rm -f "$NATIVE_OUT"
+            return $RC
+        fi
+    fi
+    
     local TOTAL=0
     local VALID=0
     local REVOKED=0
@@ -55,6 +55,9 @@ function usage() {
     echo "  list [ca|ica]               - List revoked certificates"
     echo "  info [ca|ica]               - Show CRL information"
     echo ""
+    echo "Environment:"
+    echo "  CRL_MK_NATIVE=0             - Append to index.txt instead of using 'issuer revocation'"
+    echo ""
     echo "Revocation Reasons:"
     echo "  unspecified                 - Default reason"
     echo "  keyCompromise               - Private key compromised"
@@ -194,6 +197,25 @@ function revoke_cert() {
     echo -e "  ${AZURE}Serial:${COFF}  $SERIAL"
     echo -e "  ${AZURE}Reason:${COFF}  $REASON"
     
+    # With the issuer package, the revocation store records the change (with
+    # a sequence number for the OCSP responder and delta CRLs) and exports
+    # index.txt; set CRL_MK_NATIVE=0 to append to index.txt directly
+    if [ "${CRL_MK_NATIVE:-1}" != "0" ] && command -v issuer > /dev/null; then
+        local RESULT
+        RESULT=$(issuer revocation revoke "$CERT_FILE" --reason "$REASON" --base-dir "$BD") || {
+            echo -e "${RED}Error: issuer revocation failed${COFF}"
+            return 1
+        }
+        if echo "$RESULT" | grep -q '"status": "unchanged"'; then
+            echo -e "${YELLOW}Warning: Certificate is already revoked${COFF}"
+            return 0
+        fi
+        local SEQ=$(echo "$RESULT" | grep -o '"seq": [0-9]*' | head -1 | cut -d' ' -f2)
+        echo -e "${GREEN}✓ Certificate revoked successfully (change $SEQ)${COFF}"
+        echo -e "${YELLOW}Note: Run './crl_mk.sh generate $CA_TYPE' to update the CRL${COFF}"
+        return 0
+    fi
+    
     # Check if certificate is already revoked
     if grep -q "^R.*$SERIAL" "$CRL_DIR/index.txt" 2>/dev/null; then
         echo -e "${YELLOW}Warning: Certificate is already revoked${COFF}"
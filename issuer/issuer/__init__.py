@@ -0,0 +1,10 @@
+"""issuer - native Python certificate issuance for the demo-cfssl CA."""
+
+from .ca import CertificateAuthority
+from .engine import Issuer
+from .profiles import Profile, load_profiles
+from .request import CertRequest
+
+__version__ = "0.1.0"
+__all__ = ["CertificateAuthority", "Issuer", "Profile", "load_profiles", "CertRequest",
+           "__version__"]
@@ -0,0 +1,62 @@
+"""CLI entry point for issuer."""
+
+import importlib
+import sys
+
+# Subcommand -> module providing main(argv) -> int
+COMMANDS = {
+    "issue": "engine",
+    "keypool": "keypool",
+    "inventory": "inventory",
+    "renew": "renew",
+    "serve": "api",
+    "acme": "acme",
+    "crl": "crl",
+    "crlcheck": "crlcheck",
+    "crlserve": "crlserve",
+    "revocation": "revocation",
+    "trust": "trust",
+    "sslcrtd": "sslcrtd",
+}
+
+USAGE = """usage: issuer COMMAND [options]
+
+issuer - native Python certificate issuance for the demo-cfssl CA
+
+commands:
+  issue      Issue host, S/MIME or TLS client certificates in bulk
+  keypool    Keep an encrypted pool of pre-generated keys filled
+  inventory  Index the certificates under $DEMO_CFSSL_DIR and query them
+  renew      Re-issue expiring certificates in batches (daemon or one pass)
+  serve      Run the CSR signing API (needs the "server" extra)
+  acme       Run the ACME server for Caddy, Traefik, certbot (needs the "server" extra)
+  crl        Generate full and delta CRLs from crl/<ca>/index.txt
+  crlcheck   Check many certificates against the CRLs (crl_check.sh --batch)
+  crlserve   Serve the CRLs over HTTP with conditional GET (needs the "server" extra)
+  revocation Revoke certificates in the revocation store, read its change feed
+  trust      Build the deduplicated CA bundle and hashed directory (-CApath)
+  sslcrtd    Squid sslcrtd_program helper: cached bumped-site certificates, pooled keys
+
+Use 'issuer COMMAND --help' for the options of a command."""
+
+
+def main():
+    """Main entry point for issuer CLI."""
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print(USAGE)
+        sys.exit(0 if len(sys.argv) > 1 else 2)
+    command = sys.argv[1]
+    if command not in COMMANDS:
+        print(f"issuer: unknown command '{command}'\n\n{USAGE}", file=sys.stderr)
+        sys.exit(2)
+    try:
+        module = importlib.import_module(f".{COMMANDS[command]}", __package__)
+    except ImportError as e:
+        print(f"issuer {command}: {e}; install the server extra: pip install -e '.[server]'",
+              file=sys.stderr)
+        sys.exit(2)
+    sys.exit(module.main(sys.argv[2:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,959 @@
+"""
+ACME (RFC 8555) server subset on top of the demo-cfssl intermediate CA.
+
+Lets Caddy, Traefik, certbot, lego and other ACME clients get and renew
+their certificates on their own, instead of running ``steps.sh`` for each
+host. Supported: directory, nonces, accounts, orders for ``dns`` and ``ip``
+identifiers, ``http-01`` and ``dns-01`` challenges, finalize and
+certificate download. Not supported: external account binding, key
+rollover and revocation (use ``crl_mk.sh``).
+
+Challenges are checked by a pluggable validator (see :data:`VALIDATORS`).
+``http`` performs real http-01 (and dns-01 with dnspython) checks. ``stub``
+accepts everything, for labs where the names do not resolve. Validations
+run concurrently as background tasks. Accounts, orders, authorizations and
+certificates are kept in memory. With ``ACME_DB`` they are also written
+through to SQLite and survive a restart. Certificates are signed with
+:class:`issuer.api.SigningService`, so they are indexed for OCSP as well.
+
+Run with ``issuer acme`` or ``uvicorn issuer.acme:app``.
+Configuration is read from environment variables (see :class:`AcmeConfig`).
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import importlib
+import ipaddress
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from .api import SigningService
+from .config import BD, ca_paths
+
+__version__ = "0.1.0"
+
+logger = logging.getLogger(__name__)
+
+ERROR_PREFIX = "urn:ietf:params:acme:error:"
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# One DNS label: ASCII letters, digits and inner hyphens (RFC 1123)
+_LDH_LABEL = re.compile(r'^[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?$')
+# Upper bound of the X.520 commonName
+CN_MAX_LENGTH = 64
+
+
+class AcmeError(Exception):
+    """An ACME problem document (RFC 8555 section 6.7)."""
+
+    def __init__(self, error_type: str, detail: str, status: int = 400):
+        super().__init__(detail)
+        self.type = error_type
+        self.detail = detail
+        self.status = status
+
+    def to_dict(self) -> dict:
+        return {"type": ERROR_PREFIX + self.type, "detail": self.detail, "status": self.status}
+
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64url_decode(data: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except (ValueError, TypeError) as e:
+        raise AcmeError("malformed", f"Invalid base64url: {e}")
+
+
+_CURVES = {"P-256": ec.SECP256R1(), "P-384": ec.SECP384R1(), "P-521": ec.SECP521R1()}
+
+# JWS alg -> (hash, key type)
+_ALGORITHMS = {
+    "ES256": (hashes.SHA256(), ec.EllipticCurvePublicKey),
+    "ES384": (hashes.SHA384(), ec.EllipticCurvePublicKey),
+    "ES512": (hashes.SHA512(), ec.EllipticCurvePublicKey),
+    "RS256": (hashes.SHA256(), rsa.RSAPublicKey),
+}
+
+
+def jwk_public_key(jwk: dict):
+    """Public key of an EC or RSA JWK."""
+    try:
+        if jwk["kty"] == "EC":
+            if jwk["crv"] not in _CURVES:
+                raise AcmeError("badPublicKey", f"Unsupported curve: {jwk['crv']}")
+            return ec.EllipticCurvePublicNumbers(
+                int.from_bytes(b64url_decode(jwk["x"])), int.from_bytes(b64url_decode(jwk["y"])),
+                _CURVES[jwk["crv"]]).public_key()
+        if jwk["kty"] == "RSA":
+            key = rsa.RSAPublicNumbers(
+                int.from_bytes(b64url_decode(jwk["e"])),
+                int.from_bytes(b64url_decode(jwk["n"]))).public_key()
+            if key.key_size < 2048:
+                raise AcmeError("badPublicKey", f"RSA key too small: {key.key_size}")
+            return key
+    except (KeyError, TypeError, ValueError) as e:
+        raise AcmeError("badPublicKey", f"Invalid JWK: {e}")
+    raise AcmeError("badPublicKey", f"Unsupported key type: {jwk.get('kty')}")
+
+
+def jwk_thumbprint(jwk: dict) -> str:
+    """RFC 7638 SHA-256 thumbprint of a JWK."""
+    members = ("crv", "kty", "x", "y") if jwk["kty"] == "EC" else ("e", "kty", "n")
+    canonical = json.dumps({m: jwk[m] for m in members}, separators=(',', ':'), sort_keys=True)
+    return b64url_encode(hashlib.sha256(canonical.encode()).digest())
+
+
+def verify_jws(key, alg: str, signing_input: bytes, signature: bytes):
+    """
+    Verify a JWS signature.
+
+    Raises:
+        AcmeError: If the algorithm does not fit the key or the signature is invalid
+    """
+    if alg not in _ALGORITHMS:
+        raise AcmeError("badSignatureAlgorithm", f"Unsupported algorithm: {alg}")
+    hash_algorithm, key_type = _ALGORITHMS[alg]
+    if not isinstance(key, key_type):
+        raise AcmeError("badSignatureAlgorithm", f"{alg} does not match the account key")
+    try:
+        if isinstance(key, ec.EllipticCurvePublicKey):
+            # JWS carries r || s; cryptography wants DER
+            size = (key.curve.key_size + 7) // 8
+            if len(signature) != 2 * size:
+                raise InvalidSignature()
+            key.verify(encode_dss_signature(int.from_bytes(signature[:size]),
+                                            int.from_bytes(signature[size:])),
+                       signing_input, ec.ECDSA(hash_algorithm))
+        else:
+            key.verify(signature, signing_input, padding.PKCS1v15(), hash_algorithm)
+    except InvalidSignature:
+        raise AcmeError("malformed", "JWS signature is invalid")
+
+
+def key_authorization(token: str, thumbprint: str) -> str:
+    return f"{token}.{thumbprint}"
+
+
+def dns01_value(key_auth: str) -> str:
+    """TXT record content expected at ``_acme-challenge.<domain>``."""
+    return b64url_encode(hashlib.sha256(key_auth.encode()).digest())
+
+
+class AcmeConfig:
+    """ACME server configuration from environment variables."""
+
+    def __init__(self):
+        """
+        Initialize configuration from environment variables.
+
+        Raises:
+            ValueError: If a value cannot be parsed
+        """
+        self.base_dir = BD
+        self.profile = os.getenv("ACME_PROFILE", "server")
+        self.validator = os.getenv("ACME_VALIDATOR", "http")
+        self.stub_delay = float(os.getenv("ACME_STUB_DELAY", "0"))
+        self.http_port = int(os.getenv("ACME_HTTP_PORT", "80"))
+        self.validation_timeout = float(os.getenv("ACME_VALIDATION_TIMEOUT", "10"))
+        self.validation_concurrency = int(os.getenv("ACME_VALIDATION_CONCURRENCY", "32"))
+        self.order_lifetime = timedelta(hours=float(os.getenv("ACME_ORDER_LIFETIME_HOURS", "24")))
+        # Stamp the CRL DP of each certificate's shard (crl/ica/partitions.json)
+        self.partitioned_crl = os.getenv("ACME_PARTITIONED_CRL", "").lower() in ("1", "true", "yes")
+
+        db = os.getenv("ACME_DB")
+        self.db_path = Path(db) if db else None
+
+        # Public base URL when behind a proxy; default: from the request
+        self.external_url = os.getenv("ACME_EXTERNAL_URL", "").rstrip('/') or None
+
+        # Domain suffixes that may be ordered; empty: any
+        allowed = os.getenv("ACME_ALLOWED_DOMAINS", "")
+        self.allowed_domains = [d.strip().lower().lstrip('.') for d in allowed.split(',') if d.strip()]
+
+    def validate(self) -> list[str]:
+        """Return a list of configuration errors (empty if valid)."""
+        errors = []
+        for name, path in ca_paths(self.base_dir).items():
+            if not path.exists():
+                errors.append(f"CA {name} not found: {path}")
+        if self.validation_concurrency < 1:
+            errors.append("ACME_VALIDATION_CONCURRENCY must be at least 1")
+        if self.db_path is not None and not self.db_path.parent.is_dir():
+            errors.append(f"Directory for ACME_DB not found: {self.db_path.parent}")
+        return errors
+
+    def __repr__(self) -> str:
+        return (
+            f"AcmeConfig(base_dir={self.base_dir}, profile={self.profile}, "
+            f"validator={self.validator}, concurrency={self.validation_concurrency}, "
+            f"db={self.db_path}, allowed_domains={self.allowed_domains or 'any'})"
+        )
+
+
+class AcmeStore:
+    """
+    Accounts, orders, authorizations, challenges, certificates and nonces.
+
+    Objects are plain dicts kept in memory; with a database path they are
+    written through to SQLite (WAL) and loaded again at start-up. Nonces are
+    only kept in memory: they are single-use, and clients retry on
+    ``badNonce`` with the fresh nonce of the error response.
+    """
+
+    KINDS = ("account", "order", "authz", "chall", "cert")
+
+    def __init__(self, db_path: Optional[Path] = None, max_nonces: int = 100000):
+        """
+        Raises:
+            RuntimeError: If the database cannot be opened
+        """
+        self.objects: dict[str, dict[str, dict]] = {kind: {} for kind in self.KINDS}
+        self.thumbprints: dict[str, str] = {}
+        self.nonces: OrderedDict[str, None] = OrderedDict()
+        self.max_nonces = max_nonces
+        self.db = None
+        if db_path is None:
+            return
+        try:
+            self.db = sqlite3.connect(db_path)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS objects ("
+                            "kind TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, "
+                            "PRIMARY KEY (kind, id))")
+            for kind, object_id, data in self.db.execute("SELECT kind, id, data FROM objects"):
+                self._add(kind, object_id, json.loads(data))
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Failed to open ACME database {db_path}: {e}")
+
+    def _add(self, kind: str, object_id: str, obj: dict):
+        self.objects[kind][object_id] = obj
+        if kind == "account":
+            self.thumbprints[obj["thumbprint"]] = object_id
+
+    def new_nonce(self) -> str:
+        nonce = secrets.token_urlsafe(16)
+        self.nonces[nonce] = None
+        if len(self.nonces) > self.max_nonces:
+            self.nonces.popitem(last=False)
+        return nonce
+
+    def use_nonce(self, nonce: Optional[str]) -> bool:
+        """Consume a nonce; False if it is unknown or already used."""
+        return nonce is not None and self.nonces.pop(nonce, False) is None
+
+    def get(self, kind: str, object_id: str) -> Optional[dict]:
+        return self.objects[kind].get(object_id)
+
+    def put(self, kind: str, obj: dict):
+        """Store (or update) an object; it must have an ``id``."""
+        self._add(kind, obj["id"], obj)
+        if self.db is not None:
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO objects (kind, id, data) VALUES (?, ?, ?)",
+                                (kind, obj["id"], json.dumps(obj)))
+
+    def account_by_thumbprint(self, thumbprint: str) -> Optional[dict]:
+        account_id = self.thumbprints.get(thumbprint)
+        return self.objects["account"][account_id] if account_id else None
+
+    def counts(self) -> dict:
+        counts = {kind: len(objects) for kind, objects in self.objects.items()}
+        counts["nonces"] = len(self.nonces)
+        return counts
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+
+
+class StubValidator:
+    """Accepts every challenge (after an optional delay); for labs and load tests."""
+
+    def __init__(self, config: AcmeConfig):
+        self.delay = config.stub_delay
+
+    async def validate(self, challenge_type: str, identifier: dict, token: str, key_auth: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+
+class NetworkValidator:
+    """Real http-01 checks, and dns-01 checks when dnspython is installed."""
+
+    def __init__(self, config: AcmeConfig):
+        self.port = config.http_port
+        self.timeout = config.validation_timeout
+
+    async def validate(self, challenge_type: str, identifier: dict, token: str, key_auth: str):
+        """
+        Raises:
+            AcmeError: If the response does not match the key authorization
+        """
+        if challenge_type == "http-01":
+            await self._http01(identifier["value"], token, key_auth)
+        else:
+            await self._dns01(identifier["value"], key_auth)
+
+    async def _http01(self, host: str, token: str, key_auth: str):
+        path = f"/.well-known/acme-challenge/{token}"
+        host_header = f"[{host}]" if ':' in host else host
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise AcmeError("connection", f"Connecting to {host}:{self.port}: {e or 'timeout'}")
+        try:
+            writer.write(f"GET {path} HTTP/1.0\r\nHost: {host_header}\r\n"
+                         f"User-Agent: issuer-acme/{__version__}\r\n\r\n".encode())
+            await writer.drain()
+            response = await asyncio.wait_for(self._read_response(reader), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise AcmeError("connection", f"Fetching http://{host_header}{path}: {e or 'timeout'}")
+        finally:
+            writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        status_line = head.split(b"\r\n", 1)[0].decode(errors='replace')
+        if status_line.split(' ')[1:2] != ["200"]:
+            raise AcmeError("unauthorized", f"http://{host_header}{path}: {status_line}", 403)
+        if body.strip().decode(errors='replace') != key_auth:
+            raise AcmeError("incorrectResponse", f"http://{host_header}{path}: key authorization mismatch", 403)
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader, limit: int = 65536) -> bytes:
+        """Read an HTTP/1.0 response until the server closes (at most ``limit`` bytes)."""
+        response = b""
+        while len(response) < limit:
+            chunk = await reader.read(limit - len(response))
+            if not chunk:
+                break
+            response += chunk
+        return response
+
+    async def _dns01(self, domain: str, key_auth: str):
+        try:
+            import dns.asyncresolver
+            import dns.exception
+        except ImportError:
+            raise AcmeError("serverInternal", "dns-01 validation needs dnspython", 500)
+        name = f"_acme-challenge.{domain}"
+        try:
+            answer = await dns.asyncresolver.resolve(name, "TXT", lifetime=self.timeout)
+        except dns.exception.DNSException as e:
+            raise AcmeError("dns", f"TXT lookup of {name}: {e}")
+        expected = dns01_value(key_auth)
+        values = [b"".join(r.strings).decode(errors='replace') for r in answer]
+        if expected not in values:
+            raise AcmeError("incorrectResponse", f"No matching TXT record at {name}", 403)
+
+
+# ACME_VALIDATOR names; any other value is imported as module:Class
+VALIDATORS = {"stub": StubValidator, "http": NetworkValidator}
+
+
+def load_validator(name: str, config: AcmeConfig):
+    """
+    Raises:
+        RuntimeError: If the validator cannot be loaded
+    """
+    if name in VALIDATORS:
+        return VALIDATORS[name](config)
+    module_name, _, class_name = name.partition(':')
+    try:
+        return getattr(importlib.import_module(module_name), class_name)(config)
+    except (ImportError, AttributeError, ValueError) as e:
+        raise RuntimeError(f"Cannot load validator '{name}': {e}")
+
+
+app = FastAPI(
+    title="issuer ACME",
+    description="ACME (RFC 8555) subset for the demo-cfssl intermediate CA",
+    version=__version__,
+)
+
+config: Optional[AcmeConfig] = None
+store: Optional[AcmeStore] = None
+service: Optional[SigningService] = None
+validator = None
+validation_slots: Optional[asyncio.Semaphore] = None
+validations: set[asyncio.Task] = set()
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the CA, the store and the validator."""
+    global config, store, service, validator, validation_slots
+
+    logger.info("Starting issuer ACME server...")
+    config = AcmeConfig()
+    logger.info(f"Configuration loaded: {config}")
+
+    errors = config.validate()
+    if errors:
+        logger.error(f"Configuration validation failed: {'; '.join(errors)}")
+        raise RuntimeError(f"Invalid configuration: {'; '.join(errors)}")
+
+    service = SigningService(config.base_dir, [config.profile], partitioned_crl=config.partitioned_crl)
+    store = AcmeStore(config.db_path)
+    validator = load_validator(config.validator, config)
+    validation_slots = asyncio.Semaphore(config.validation_concurrency)
+    logger.info(f"Issuing CA: {service.ca.cert.subject.rfc4514_string()}, store: {store.counts()}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if store is not None:
+        store.close()
+
+
+def _base_url(request: Request) -> str:
+    return config.external_url or str(request.base_url).rstrip('/')
+
+
+def _url(request: Request, path: str) -> str:
+    return f"{_base_url(request)}/acme/{path}"
+
+
+def _headers(request: Request, location: Optional[str] = None, up: Optional[str] = None) -> dict:
+    links = [f'<{_url(request, "directory")}>;rel="index"']
+    if up:
+        links.append(f'<{up}>;rel="up"')
+    headers = {
+        "Replay-Nonce": store.new_nonce(),
+        "Link": ", ".join(links),
+        "Cache-Control": "no-store",
+    }
+    if location:
+        headers["Location"] = location
+    return headers
+
+
+def _respond(request: Request, body: dict, status: int = 200,
+             location: Optional[str] = None, up: Optional[str] = None) -> JSONResponse:
+    return JSONResponse(body, status_code=status, headers=_headers(request, location, up))
+
+
+@app.exception_handler(AcmeError)
+async def acme_error_handler(request: Request, exc: AcmeError):
+    return JSONResponse(exc.to_dict(), status_code=exc.status, headers=_headers(request),
+                        media_type="application/problem+json")
+
+
+async def _verify(request: Request, new_account: bool = False) -> tuple[Optional[dict], dict]:
+    """
+    Check a JWS request: nonce, URL, key and signature.
+
+    Returns:
+        (payload, account) for ``kid`` requests, (payload, jwk) for new-account;
+        payload is None for POST-as-GET
+    """
+    try:
+        body = await request.json()
+        protected_b64, payload_b64, signature_b64 = (
+            body["protected"], body["payload"], body["signature"])
+        protected = json.loads(b64url_decode(protected_b64))
+    except (KeyError, TypeError, ValueError) as e:
+        raise AcmeError("malformed", f"Not a flattened JWS: {e}")
+
+    if not store.use_nonce(protected.get("nonce")):
+        raise AcmeError("badNonce", "Invalid or reused nonce")
+    if protected.get("url") != _base_url(request) + request.url.path:
+        raise AcmeError("unauthorized", "JWS url does not match the request URL", 401)
+    if ("jwk" in protected) == ("kid" in protected):
+        raise AcmeError("malformed", "JWS needs exactly one of jwk or kid")
+
+    if new_account:
+        if "jwk" not in protected:
+            raise AcmeError("malformed", "newAccount must be signed with jwk")
+        subject = protected["jwk"]
+        key = jwk_public_key(subject)
+    else:
+        if "kid" not in protected:
+            raise AcmeError("malformed", "Requests must be signed with kid")
+        prefix = _url(request, "account/")
+        kid = protected["kid"]
+        account = store.get("account", kid[len(prefix):]) if kid.startswith(prefix) else None
+        if account is None:
+            raise AcmeError("accountDoesNotExist", f"Unknown account: {kid}")
+        if account["status"] != "valid":
+            raise AcmeError("unauthorized", f"Account is {account['status']}", 403)
+        subject = account
+        key = jwk_public_key(account["jwk"])
+
+    verify_jws(key, protected.get("alg"), f"{protected_b64}.{payload_b64}".encode(),
+               b64url_decode(signature_b64))
+    if payload_b64 == "":
+        return None, subject
+    try:
+        return json.loads(b64url_decode(payload_b64)), subject
+    except ValueError as e:
+        raise AcmeError("malformed", f"Invalid payload: {e}")
+
+
+def _owned(kind: str, object_id: str, account: dict) -> dict:
+    """Object of the account, or 404."""
+    obj = store.get(kind, object_id)
+    if obj is None or _account_of(kind, obj) != account["id"]:
+        raise AcmeError("malformed", f"No such {kind}: {object_id}", 404)
+    return obj
+
+
+def _account_of(kind: str, obj: dict) -> str:
+    if kind == "chall":
+        obj = store.get("authz", obj["authz"])
+        kind = "authz"
+    if kind == "authz":
+        obj = store.get("order", obj["order"])
+    return obj["account"]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _timestamp(dt: datetime) -> str:
+    return dt.strftime(TIMESTAMP_FORMAT)
+
+
+def _expired(obj: dict) -> bool:
+    expires = datetime.strptime(obj["expires"], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    return expires <= _now()
+
+
+def _expire_authz(authz: dict):
+    """Mark a pending authorization past its ``expires`` as expired."""
+    if authz["status"] == "pending" and _expired(authz):
+        authz["status"] = "expired"
+        store.put("authz", authz)
+        _update_order(store.get("order", authz["order"]))
+
+
+def _expire_order(order: dict):
+    """Invalidate a pending or ready order past its ``expires``."""
+    if order["status"] in ("pending", "ready") and _expired(order):
+        order["status"] = "invalid"
+        order["error"] = AcmeError("malformed", "Order has expired", 403).to_dict()
+        store.put("order", order)
+
+
+def _account_body(request: Request, account: dict) -> dict:
+    return {
+        "status": account["status"],
+        "contact": account["contact"],
+        "orders": _url(request, f"account/{account['id']}/orders"),
+    }
+
+
+def _order_body(request: Request, order: dict) -> dict:
+    body = {
+        "status": order["status"],
+        "expires": order["expires"],
+        "identifiers": order["identifiers"],
+        "authorizations": [_url(request, f"authz/{a}") for a in order["authorizations"]],
+        "finalize": _url(request, f"order/{order['id']}/finalize"),
+    }
+    if order.get("cert"):
+        body["certificate"] = _url(request, f"cert/{order['cert']}")
+    if order.get("error"):
+        body["error"] = order["error"]
+    return body
+
+
+def _chall_body(request: Request, chall: dict) -> dict:
+    body = {
+        "type": chall["type"],
+        "url": _url(request, f"chall/{chall['id']}"),
+        "status": chall["status"],
+        "token": chall["token"],
+    }
+    if chall.get("validated"):
+        body["validated"] = chall["validated"]
+    if chall.get("error"):
+        body["error"] = chall["error"]
+    return body
+
+
+def _authz_body(request: Request, authz: dict) -> dict:
+    body = {
+        "status": authz["status"],
+        "expires": authz["expires"],
+        "identifier": authz["identifier"],
+        "challenges": [_chall_body(request, store.get("chall", c)) for c in authz["challenges"]],
+    }
+    if authz["wildcard"]:
+        body["wildcard"] = True
+    return body
+
+
+def _check_identifier(identifier: dict) -> dict:
+    """Normalized identifier; rejects unsupported types and names outside ACME_ALLOWED_DOMAINS."""
+    if not isinstance(identifier, dict):
+        raise AcmeError("malformed", "Identifier must be an object")
+    kind, value = identifier.get("type"), str(identifier.get("value", "")).lower()
+    if kind == "ip":
+        try:
+            return {"type": "ip", "value": str(ipaddress.ip_address(value))}
+        except ValueError:
+            raise AcmeError("rejectedIdentifier", f"Invalid IP address: {value}")
+    if kind != "dns":
+        raise AcmeError("unsupportedIdentifier", f"Unsupported identifier type: {kind}")
+    name = value[2:] if value.startswith("*.") else value
+    if not name or len(name) > 253 or not all(
+            _LDH_LABEL.match(label) for label in name.split('.')):
+        raise AcmeError("rejectedIdentifier", f"Invalid DNS name: {value}")
+    if config.allowed_domains and not any(
+            name == d or name.endswith('.' + d) for d in config.allowed_domains):
+        raise AcmeError("rejectedIdentifier", f"{value} is not in ACME_ALLOWED_DOMAINS", 403)
+    return {"type": "dns", "value": value}
+
+
+@app.get("/acme/directory")
+async def directory(request: Request):
+    """ACME directory."""
+    return JSONResponse({
+        "newNonce": _url(request, "new-nonce"),
+        "newAccount": _url(request, "new-account"),
+        "newOrder": _url(request, "new-order"),
+        "meta": {"externalAccountRequired": False},
+    })
+
+
+@app.head("/acme/new-nonce")
+async def new_nonce_head(request: Request):
+    return Response(status_code=200, headers=_headers(request))
+
+
+@app.get("/acme/new-nonce")
+async def new_nonce_get(request: Request):
+    return Response(status_code=204, headers=_headers(request))
+
+
+@app.get("/health")
+async def health():
+    """Health check endpoint."""
+    return {
+        "status": "healthy" if store is not None else "starting",
+        "validator": config.validator if config else None,
+        "pending_validations": len(validations),
+        "store": store.counts() if store else {},
+        "timestamp": _now().isoformat(),
+    }
+
+
+@app.post("/acme/new-account")
+async def new_account(request: Request):
+    """Create an account, or return the existing one of this key."""
+    payload, jwk = await _verify(request, new_account=True)
+    payload = payload or {}
+    thumbprint = jwk_thumbprint(jwk)
+    account = store.account_by_thumbprint(thumbprint)
+    if account is not None:
+        return _respond(request, _account_body(request, account),
+                        location=_url(request, f"account/{account['id']}"))
+    if payload.get("onlyReturnExisting"):
+        raise AcmeError("accountDoesNotExist", "No account for this key")
+    contact = payload.get("contact", [])
+    if not isinstance(contact, list) or not all(isinstance(c, str) for c in contact):
+        raise AcmeError("invalidContact", "contact must be a list of URLs")
+    account = {"id": secrets.token_urlsafe(12), "status": "valid", "contact": contact,
+               "jwk": jwk, "thumbprint": thumbprint, "created": _timestamp(_now())}
+    store.put("account", account)
+    logger.info(f"New account {account['id']} {contact}")
+    return _respond(request, _account_body(request, account), 201,
+                    location=_url(request, f"account/{account['id']}"))
+
+
+@app.post("/acme/account/{account_id}")
+async def update_account(account_id: str, request: Request):
+    """Account POST-as-GET, contact update or deactivation."""
+    payload, account = await _verify(request)
+    if account["id"] != account_id:
+        raise AcmeError("unauthorized", "Not your account", 403)
+    if payload:
+        if "contact" in payload:
+            account["contact"] = payload["contact"]
+        if payload.get("status") == "deactivated":
+            account["status"] = "deactivated"
+        store.put("account", account)
+    return _respond(request, _account_body(request, account))
+
+
+@app.post("/acme/account/{account_id}/orders")
+async def account_orders(account_id: str, request: Request):
+    """Orders of an account."""
+    _, account = await _verify(request)
+    if account["id"] != account_id:
+        raise AcmeError("unauthorized", "Not your account", 403)
+    orders = [o["id"] for o in store.objects["order"].values()
+              if o["account"] == account_id and o["status"] in ("pending", "ready", "processing")]
+    return _respond(request, {"orders": [_url(request, f"order/{o}") for o in orders]})
+
+
+@app.post("/acme/new-order")
+async def new_order(request: Request):
+    """Create an order with one authorization per identifier."""
+    payload, account = await _verify(request)
+    identifiers = (payload or {}).get("identifiers")
+    if not isinstance(identifiers, list) or not identifiers:
+        raise AcmeError("malformed", "identifiers must be a non-empty list")
+    identifiers = [_check_identifier(i) for i in identifiers]
+
+    expires = _timestamp(_now() + config.order_lifetime)
+    order = {"id": secrets.token_urlsafe(12), "account": account["id"], "status": "pending",
+             "expires": expires, "identifiers": identifiers, "authorizations": [],
+             "cert": None, "error": None}
+    for identifier in identifiers:
+        wildcard = identifier["value"].startswith("*.")
+        if wildcard:
+            types = ["dns-01"]
+        elif identifier["type"] == "ip":
+            types = ["http-01"]
+        else:
+            types = ["http-01", "dns-01"]
+        authz = {"id": secrets.token_urlsafe(12), "order": order["id"], "status": "pending",
+                 "expires": expires, "wildcard": wildcard, "challenges": [],
+                 "identifier": {"type": identifier["type"],
+                                "value": identifier["value"].removeprefix("*.")}}
+        for challenge_type in types:
+            chall = {"id": secrets.token_urlsafe(12), "authz": authz["id"], "type": challenge_type,
+                     "token": secrets.token_urlsafe(32), "status": "pending"}
+            store.put("chall", chall)
+            authz["challenges"].append(chall["id"])
+        store.put("authz", authz)
+        order["authorizations"].append(authz["id"])
+    store.put("order", order)
+    logger.info(f"New order {order['id']} for {[i['value'] for i in identifiers]}")
+    return _respond(request, _order_body(request, order), 201,
+                    location=_url(request, f"order/{order['id']}"))
+
+
+@app.post("/acme/order/{order_id}")
+async def get_order(order_id: str, request: Request):
+    _, account = await _verify(request)
+    order = _owned("order", order_id, account)
+    _expire_order(order)
+    return _respond(request, _order_body(request, order))
+
+
+@app.post("/acme/authz/{authz_id}")
+async def get_authz(authz_id: str, request: Request):
+    """Authorization POST-as-GET or deactivation."""
+    payload, account = await _verify(request)
+    authz = _owned("authz", authz_id, account)
+    _expire_authz(authz)
+    if payload and payload.get("status") == "deactivated":
+        authz["status"] = "deactivated"
+        store.put("authz", authz)
+        _update_order(store.get("order", authz["order"]))
+    return _respond(request, _authz_body(request, authz))
+
+
+@app.post("/acme/chall/{chall_id}")
+async def respond_challenge(chall_id: str, request: Request):
+    """Start validating a challenge (payload ``{}``) or return it (POST-as-GET)."""
+    payload, account = await _verify(request)
+    chall = _owned("chall", chall_id, account)
+    authz = store.get("authz", chall["authz"])
+    _expire_authz(authz)
+    if payload is not None and authz["status"] == "expired":
+        raise AcmeError("malformed", "Authorization has expired", 403)
+    if payload is not None and chall["status"] == "pending" and authz["status"] == "pending":
+        chall["status"] = "processing"
+        store.put("chall", chall)
+        task = asyncio.create_task(_validate(chall, authz, account))
+        validations.add(task)
+        task.add_done_callback(validations.discard)
+    return _respond(request, _chall_body(request, chall),
+                    up=_url(request, f"authz/{authz['id']}"))
+
+
+async def _validate(chall: dict, authz: dict, account: dict):
+    """Run one validation and update challenge, authorization and order."""
+    key_auth = key_authorization(chall["token"], account["thumbprint"])
+    async with validation_slots:
+        try:
+            await validator.validate(chall["type"], authz["identifier"], chall["token"], key_auth)
+            chall["status"] = "valid"
+            chall["validated"] = _timestamp(_now())
+        except AcmeError as e:
+            chall["status"] = "invalid"
+            chall["error"] = e.to_dict()
+        except Exception as e:
+            logger.error(f"Validator failed on {authz['identifier']}: {type(e).__name__}: {e}")
+            chall["status"] = "invalid"
+            chall["error"] = AcmeError("serverInternal", f"Validation failed: {e}", 500).to_dict()
+    store.put("chall", chall)
+    authz["status"] = chall["status"]
+    store.put("authz", authz)
+    logger.info(f"{chall['type']} for {authz['identifier']['value']}: {chall['status']}")
+    _update_order(store.get("order", authz["order"]))
+
+
+def _update_order(order: dict):
+    """Move a pending order to ready or invalid once its authorizations are decided."""
+    if order["status"] != "pending":
+        return
+    states = [store.get("authz", a)["status"] for a in order["authorizations"]]
+    if any(s in ("invalid", "deactivated", "expired") for s in states):
+        order["status"] = "invalid"
+        order["error"] = AcmeError("unauthorized", "An authorization failed", 403).to_dict()
+    elif all(s == "valid" for s in states):
+        order["status"] = "ready"
+    else:
+        return
+    store.put("order", order)
+
+
+def _csr_identifiers(csr: x509.CertificateSigningRequest) -> set[tuple[str, str]]:
+    names = set()
+    for attribute in csr.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME):
+        try:
+            names.add(("ip", str(ipaddress.ip_address(attribute.value))))
+        except ValueError:
+            names.add(("dns", attribute.value.lower()))
+    try:
+        sans = csr.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        sans = []
+    for name in sans:
+        if isinstance(name, x509.DNSName):
+            names.add(("dns", name.value.lower()))
+        elif isinstance(name, x509.IPAddress):
+            names.add(("ip", str(name.value)))
+        else:
+            raise AcmeError("badCSR", f"Unsupported SAN in CSR: {name}")
+    return names
+
+
+def _order_subject(hosts: list[str]) -> x509.Name:
+    """
+    Subject from the validated identifiers only, never from the CSR.
+
+    CN is the first identifier; a name too long for a CN leaves the subject
+    empty, with the names in the (then critical) SAN extension.
+    """
+    if len(hosts[0]) > CN_MAX_LENGTH:
+        return x509.Name([])
+    return x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, hosts[0])])
+
+
+@app.post("/acme/order/{order_id}/finalize")
+async def finalize(order_id: str, request: Request):
+    """Sign the order's CSR once all authorizations are valid."""
+    payload, account = await _verify(request)
+    order = _owned("order", order_id, account)
+    _expire_order(order)
+    if order["status"] != "ready":
+        raise AcmeError("orderNotReady", f"Order is {order['status']}", 403)
+    try:
+        csr = x509.load_der_x509_csr(b64url_decode((payload or {})["csr"]))
+    except (KeyError, ValueError) as e:
+        raise AcmeError("badCSR", f"Invalid CSR: {e}")
+    requested = {(i["type"], i["value"]) for i in order["identifiers"]}
+    if _csr_identifiers(csr) != requested:
+        raise AcmeError("badCSR", "CSR names do not match the order identifiers")
+
+    order["status"] = "processing"
+    store.put("order", order)
+    csr_pem = csr.public_bytes(serialization.Encoding.PEM).decode()
+    hosts = [i["value"] for i in order["identifiers"]]
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(None, service.sign_csr, csr_pem, config.profile,
+                                            hosts, _order_subject(hosts))
+    except ValueError as e:
+        order["status"] = "invalid"
+        order["error"] = AcmeError("badCSR", str(e)).to_dict()
+        store.put("order", order)
+        raise AcmeError("badCSR", str(e))
+    except Exception as e:
+        logger.error(f"Signing order {order_id} failed: {type(e).__name__}: {e}")
+        order["status"] = "invalid"
+        order["error"] = AcmeError("serverInternal", "Certificate issuance failed", 500).to_dict()
+        store.put("order", order)
+        raise
+
+    cert = {"id": secrets.token_urlsafe(12), "account": account["id"],
+            "serial": result["serial"], "pem": result["bundle_2"]}
+    store.put("cert", cert)
+    order["status"] = "valid"
+    order["cert"] = cert["id"]
+    store.put("order", order)
+    logger.info(f"Order {order_id} finalized: serial {result['serial']} for {hosts}")
+    return _respond(request, _order_body(request, order),
+                    location=_url(request, f"order/{order_id}"))
+
+
+@app.post("/acme/cert/{cert_id}")
+async def download_certificate(cert_id: str, request: Request):
+    """Certificate and intermediate (PEM chain)."""
+    _, account = await _verify(request)
+    cert = _owned("cert", cert_id, account)
+    return Response(cert["pem"], media_type="application/pem-certificate-chain",
+                    headers=_headers(request))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer acme``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer acme",
+        description="Run the ACME server (configuration from ACME_* env)"
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Host to bind to (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8092,
+        help="Port to bind to (default: 8092)"
+    )
+    parser.add_argument(
+        "--ssl-certfile",
+        help="Serve HTTPS with this certificate chain, e.g. hosts/acme.lan/bundle-3.pem"
+    )
+    parser.add_argument(
+        "--ssl-keyfile",
+        help="Key of --ssl-certfile"
+    )
+    parser.add_argument(
+        "--log-level",
+        default="info",
+        choices=["critical", "error", "warning", "info", "debug"],
+        help="Log level (default: info)"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    import uvicorn
+    scheme = "https" if args.ssl_certfile else "http"
+    print(f"Starting issuer ACME server, directory {scheme}://{args.host}:{args.port}/acme/directory")
+    print("Press CTRL+C to stop")
+    uvicorn.run("issuer.acme:app", host=args.host, port=args.port, log_level=args.log_level,
+                ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
+    return 0
@@ -0,0 +1,549 @@
+"""
+Certificate signing API for the demo-cfssl intermediate CA.
+
+Signs CSRs, or creates key and certificate from cfssl JSON requests, for the
+non-CA profiles of ``profiles.json`` (``server``, ``peer``, ``client``,
+``email``). Each certificate is returned with its bundles. Work runs on a
+process pool whose workers load the CA key and profiles once. Single
+requests are answered directly. Bulk submissions become jobs that run in
+the background and are polled by id. Every issued certificate is indexed as
+``issued/<serial>.pem``, so the OCSP responder knows it at once.
+
+Run with ``issuer serve`` or ``uvicorn issuer.api:app``.
+Configuration is read from environment variables (see :class:`ApiConfig`).
+"""
+
+import argparse
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from .ca import CertificateAuthority
+from .config import BD, ca_paths
+from .engine import index_issued
+from .keypool import KEYPOOL_DIR, KeyPool, read_passphrase
+from .partition import PARTITIONS_FILE, CrlPartitioning
+from .profiles import Profile, load_profiles
+from .request import CertRequest, parse_hosts
+
+__version__ = "0.1.0"
+
+logger = logging.getLogger(__name__)
+
+
+class ApiConfig:
+    """Signing API configuration from environment variables."""
+
+    def __init__(self):
+        """
+        Initialize configuration from environment variables.
+
+        Raises:
+            ValueError: If a value cannot be parsed
+        """
+        self.base_dir = BD
+        self.workers = int(os.getenv("ISSUER_API_WORKERS", str(os.cpu_count() or 1)))
+        self.queue_size = int(os.getenv("ISSUER_API_QUEUE_SIZE", "64"))
+        self.max_job_items = int(os.getenv("ISSUER_API_MAX_JOB_ITEMS", "1000"))
+        self.job_ttl = int(os.getenv("ISSUER_API_JOB_TTL", "3600"))
+
+        # Profiles offered; CA profiles are never offered
+        profiles = os.getenv("ISSUER_API_PROFILES", "server,peer,client,email")
+        self.profiles = [p.strip() for p in profiles.split(',') if p.strip()]
+
+        token_file = os.getenv("ISSUER_API_TOKEN_FILE")
+        self.token_file = Path(token_file) if token_file else None
+
+        # Keys for JSON requests come from the key pool when enabled
+        self.key_pool = os.getenv("ISSUER_API_KEY_POOL", "").lower() in ("1", "true", "yes")
+        self.key_pool_passphrase = read_passphrase() if self.key_pool else None
+
+        # Stamp the CRL DP of each certificate's shard (crl/ica/partitions.json)
+        self.partitioned_crl = os.getenv("ISSUER_API_PARTITIONED_CRL", "").lower() in ("1", "true", "yes")
+
+    def validate(self) -> list[str]:
+        """Return a list of configuration errors (empty if valid)."""
+        errors = []
+        for name, path in ca_paths(self.base_dir).items():
+            if not path.exists():
+                errors.append(f"CA {name} not found: {path}")
+        if not (self.base_dir / "profiles.json").exists():
+            errors.append(f"Profiles not found: {self.base_dir / 'profiles.json'}")
+        if not self.profiles:
+            errors.append("No profiles configured (ISSUER_API_PROFILES)")
+        if self.workers < 1:
+            errors.append("ISSUER_API_WORKERS must be at least 1")
+        if self.queue_size < 0:
+            errors.append("ISSUER_API_QUEUE_SIZE must not be negative")
+        if self.max_job_items < 1:
+            errors.append("ISSUER_API_MAX_JOB_ITEMS must be at least 1")
+        if self.token_file is not None and not self.token_file.exists():
+            errors.append(f"Token file not found: {self.token_file}")
+        if self.key_pool and not self.key_pool_passphrase:
+            errors.append("ISSUER_API_KEY_POOL needs ISSUER_KEYPOOL_PASSWORD[_FILE]")
+        if self.partitioned_crl and not (self.base_dir / "crl" / "ica" / PARTITIONS_FILE).exists():
+            errors.append("ISSUER_API_PARTITIONED_CRL needs a CRL partitioning "
+                          "(issuer crl partition)")
+        return errors
+
+    def __repr__(self) -> str:
+        return (
+            f"ApiConfig(base_dir={self.base_dir}, profiles={self.profiles}, "
+            f"workers={self.workers}, queue_size={self.queue_size}, "
+            f"max_job_items={self.max_job_items}, key_pool={self.key_pool}, "
+            f"partitioned_crl={self.partitioned_crl}, "
+            f"token={'set' if self.token_file else 'none'})"
+        )
+
+
+class SigningService:
+    """The CA, the offered profiles and the optional key pool of one worker."""
+
+    def __init__(self, base_dir: Path, profile_names: list[str],
+                 key_pool_passphrase: Optional[bytes] = None, partitioned_crl: bool = False):
+        """
+        Args:
+            partitioned_crl: Stamp the CRL DP of the certificate's shard per
+                ``crl/ica/partitions.json`` (see :mod:`issuer.partition`)
+
+        Raises:
+            RuntimeError: If the CA, profiles or key pool cannot be loaded
+            ValueError: If a configured profile is unknown or a CA profile
+        """
+        self.base_dir = base_dir
+        paths = ca_paths(base_dir)
+        self.ca = CertificateAuthority(paths["cert"], paths["key"], paths["root"])
+        if partitioned_crl:
+            self.ca.crl_partitioning = CrlPartitioning.load(base_dir / "crl" / "ica")
+            if self.ca.crl_partitioning is None:
+                raise RuntimeError(f"No CRL partitioning in {base_dir / 'crl' / 'ica' / PARTITIONS_FILE}; "
+                                   f"create one with 'issuer crl partition'")
+        all_profiles = load_profiles(base_dir / "profiles.json")
+        self.profiles: dict[str, Profile] = {}
+        for name in profile_names:
+            if name not in all_profiles:
+                raise ValueError(f"Unknown profile '{name}' in ISSUER_API_PROFILES")
+            if all_profiles[name].is_ca:
+                raise ValueError(f"CA profile '{name}' cannot be offered by the API")
+            self.profiles[name] = all_profiles[name]
+        self.key_pool = (KeyPool(base_dir / KEYPOOL_DIR, key_pool_passphrase)
+                         if key_pool_passphrase else None)
+
+    def _profile(self, name: str) -> Profile:
+        if name not in self.profiles:
+            raise ValueError(f"Unknown profile: {name}")
+        return self.profiles[name]
+
+    def _result(self, cert: x509.Certificate, profile: Profile) -> dict:
+        cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+        index_issued(self.base_dir, cert, cert_pem)
+        return {
+            "serial": format(cert.serial_number, 'x'),
+            "profile": profile.name,
+            "not_after": cert.not_valid_after_utc.isoformat(),
+            "certificate": cert_pem.decode(),
+            "bundle_2": (cert_pem + self.ca.cert_pem).decode(),
+            "bundle_3": (cert_pem + self.ca.chain_pem).decode(),
+        }
+
+    def sign_csr(self, csr_pem: str, profile: str, hosts: Optional[list[str]] = None,
+                 subject: Optional[x509.Name] = None) -> dict:
+        """
+        Sign a PEM CSR. ``hosts`` replaces the SANs requested in the CSR and
+        ``subject`` its subject.
+
+        Raises:
+            ValueError: If the CSR is malformed, not self-signed correctly or the profile unknown
+        """
+        profile = self._profile(profile)
+        try:
+            csr = x509.load_pem_x509_csr(csr_pem.encode())
+        except ValueError as e:
+            raise ValueError(f"Invalid CSR: {e}")
+        if not csr.is_signature_valid:
+            raise ValueError("CSR signature is invalid")
+        if hosts is not None:
+            sans = parse_hosts(hosts)
+        else:
+            try:
+                sans = list(csr.extensions.get_extension_for_class(
+                    x509.SubjectAlternativeName).value)
+            except x509.ExtensionNotFound:
+                sans = []
+        if subject is None:
+            subject = csr.subject
+        cert = self.ca.sign(csr.public_key(), subject, sans, profile)
+        return self._result(cert, profile)
+
+    def new_cert(self, spec: dict, profile: str) -> dict:
+        """
+        Generate a key and certificate from a cfssl JSON request.
+
+        Raises:
+            ValueError: If the request or profile is invalid
+        """
+        profile = self._profile(profile)
+        request = CertRequest(spec)
+        if not request.common_name and not request.hosts:
+            raise ValueError("Request needs a CN or hosts")
+        key = None
+        if self.key_pool is not None:
+            key = self.key_pool.take(request.key_algo, request.key_size)
+        key_source = "pool" if key is not None else "generated"
+        if key is None:
+            key = request.generate_key()
+        cert = self.ca.issue(key.public_key(), request, profile)
+        result = self._result(cert, profile)
+        result["private_key"] = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()
+        ).decode()
+        result["key_source"] = key_source
+        return result
+
+
+# Per-process signing service, set up by _init_worker
+_service: Optional[SigningService] = None
+
+
+def _init_worker(base_dir: Path, profile_names: list[str], key_pool_passphrase: Optional[bytes],
+                 partitioned_crl: bool):
+    global _service
+    _service = SigningService(base_dir, profile_names, key_pool_passphrase, partitioned_crl)
+
+
+def _sign_csr(csr_pem: str, profile: str, hosts: Optional[list[str]]) -> dict:
+    return _service.sign_csr(csr_pem, profile, hosts)
+
+
+def _new_cert(spec: dict, profile: str) -> dict:
+    return _service.new_cert(spec, profile)
+
+
+class SignRequest(BaseModel):
+    csr: str
+    profile: str = "server"
+    hosts: Optional[list[str]] = None
+
+
+class NewCertRequest(BaseModel):
+    request: dict
+    profile: str = "server"
+
+
+class JobItem(BaseModel):
+    csr: Optional[str] = None
+    request: Optional[dict] = None
+    profile: str = "server"
+    hosts: Optional[list[str]] = None
+
+
+class JobRequest(BaseModel):
+    items: list[JobItem]
+
+
+class Job:
+    """A bulk submission processed in the background."""
+
+    def __init__(self, items: list[JobItem]):
+        self.id = secrets.token_hex(8)
+        self.items = items
+        self.results: list[Optional[dict]] = [None] * len(items)
+        self.status = "queued"
+        self.created = datetime.now(timezone.utc)
+        self.finished: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self, results: bool = True) -> dict:
+        done = [r for r in self.results if r is not None]
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "total": len(self.items),
+            "done": len(done),
+            "failed": sum(1 for r in done if r["status"] == "error"),
+            "created": self.created.isoformat(),
+            "finished": self.finished.isoformat() if self.finished else None,
+        }
+        if results:
+            data["results"] = self.results
+        return data
+
+
+app = FastAPI(
+    title="issuer API",
+    description="Certificate signing service for the demo-cfssl intermediate CA",
+    version=__version__,
+)
+
+config: Optional[ApiConfig] = None
+executor: Optional[ProcessPoolExecutor] = None
+slots: Optional[asyncio.Semaphore] = None
+job_slots: Optional[asyncio.Semaphore] = None
+token: Optional[str] = None
+profile_info: dict[str, dict] = {}
+jobs: dict[str, Job] = {}
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the CA and start the worker pool."""
+    global config, executor, slots, job_slots, token
+
+    logger.info("Starting issuer API...")
+    config = ApiConfig()
+    logger.info(f"Configuration loaded: {config}")
+
+    errors = config.validate()
+    if errors:
+        logger.error(f"Configuration validation failed: {'; '.join(errors)}")
+        raise RuntimeError(f"Invalid configuration: {'; '.join(errors)}")
+
+    # Load once in the service process so bad CA material fails at startup
+    service = SigningService(config.base_dir, config.profiles, config.key_pool_passphrase,
+                             config.partitioned_crl)
+    for name, profile in service.profiles.items():
+        profile_info[name] = {"name": name, "usages": profile.usages,
+                              "expiry_hours": profile.expiry.total_seconds() / 3600}
+    logger.info(f"Issuing CA: {service.ca.cert.subject.rfc4514_string()}")
+    token = config.token_file.read_text().strip() if config.token_file else None
+
+    # spawn: do not fork the running event loop into workers
+    executor = ProcessPoolExecutor(
+        max_workers=config.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(config.base_dir, config.profiles, config.key_pool_passphrase,
+                  config.partitioned_crl),
+    )
+    # Spawn the workers now, so the first request does not pay for their start-up
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, os.getpid)
+                           for _ in range(config.workers)))
+    slots = asyncio.Semaphore(config.workers + config.queue_size)
+    # Jobs never occupy more than the workers, so single requests keep flowing
+    job_slots = asyncio.Semaphore(config.workers)
+    logger.info(f"Signing pool started: {config.workers} workers, queue size {config.queue_size}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the worker pool."""
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _check_token(request: Request):
+    if token is None:
+        return
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing token")
+
+
+async def _run(function, *args) -> dict:
+    """Run a signing function on the pool; bad input becomes 400."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, function, *args)
+    except BrokenProcessPool as e:
+        logger.error(f"Signing worker pool is broken: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/")
+async def root():
+    """Root endpoint with API information."""
+    return {
+        "service": "issuer API",
+        "version": __version__,
+        "endpoints": {
+            "sign": "/api/v1/sign (POST {csr, profile, hosts?})",
+            "newcert": "/api/v1/newcert (POST {request, profile})",
+            "jobs": "/api/v1/jobs (POST {items: [...]}), /api/v1/jobs/{id}",
+            "profiles": "/api/v1/profiles",
+            "health": "/health",
+        },
+    }
+
+
+@app.get("/health")
+async def health():
+    """Health check endpoint."""
+    return {
+        "status": "healthy" if executor is not None else "starting",
+        "workers": config.workers if config else 0,
+        "jobs": len(jobs),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+@app.get("/api/v1/profiles")
+async def list_profiles():
+    """Profiles offered by this service."""
+    return {"profiles": [profile_info[name] for name in sorted(profile_info)]}
+
+
+@app.post("/api/v1/sign")
+async def sign(body: SignRequest, request: Request):
+    """
+    Sign a CSR and return certificate and bundles.
+
+    Example:
+        curl -d "$(jq -n --rawfile csr host.csr '{csr: $csr, profile: "server"}')" \\
+            -H 'Content-Type: application/json' http://localhost:8090/api/v1/sign
+    """
+    _check_token(request)
+    if slots.locked():
+        raise HTTPException(status_code=503, detail="Signing queue full",
+                            headers={"Retry-After": "1"})
+    async with slots:
+        start = time.perf_counter()
+        result = await _run(_sign_csr, body.csr, body.profile, body.hosts)
+    logger.info(f"Signed CSR {result['serial']} ({body.profile}) in "
+                f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    return result
+
+
+@app.post("/api/v1/newcert")
+async def newcert(body: NewCertRequest, request: Request):
+    """
+    Create key and certificate from a cfssl JSON request (CN, hosts, key, names).
+
+    The private key is returned in the response; use /api/v1/sign to keep
+    keys on the client.
+    """
+    _check_token(request)
+    if slots.locked():
+        raise HTTPException(status_code=503, detail="Signing queue full",
+                            headers={"Retry-After": "1"})
+    async with slots:
+        start = time.perf_counter()
+        result = await _run(_new_cert, body.request, body.profile)
+    logger.info(f"Issued {result['serial']} ({body.profile}, key {result['key_source']}) in "
+                f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    return result
+
+
+async def _process_item(job: Job, index: int):
+    item = job.items[index]
+    async with job_slots:
+        try:
+            if item.csr is not None:
+                result = await _run(_sign_csr, item.csr, item.profile, item.hosts)
+            else:
+                result = await _run(_new_cert, item.request, item.profile)
+            result["status"] = "ok"
+        except HTTPException as e:
+            result = {"status": "error", "error": e.detail}
+        except Exception as e:
+            logger.error(f"Job {job.id} item {index} failed: {type(e).__name__}: {e}")
+            result = {"status": "error", "error": "Internal server error"}
+    result["index"] = index
+    job.results[index] = result
+
+
+async def _process_job(job: Job):
+    job.status = "running"
+    try:
+        await asyncio.gather(*(_process_item(job, i) for i in range(len(job.items))))
+    finally:
+        job.status = "done"
+        job.finished = datetime.now(timezone.utc)
+    logger.info(f"Job {job.id} done: {job.to_dict(results=False)}")
+
+
+def _expire_jobs():
+    now = datetime.now(timezone.utc)
+    for job_id in [j.id for j in jobs.values()
+                   if j.finished and (now - j.finished).total_seconds() > config.job_ttl]:
+        del jobs[job_id]
+
+
+@app.post("/api/v1/jobs", status_code=202)
+async def submit_job(body: JobRequest, request: Request):
+    """
+    Queue a bulk submission; poll ``GET /api/v1/jobs/{id}`` for the results.
+
+    Each item is either ``{"csr": ..., "profile": ..., "hosts": [...]}`` or
+    ``{"request": {...cfssl JSON...}, "profile": ...}``.
+    """
+    _check_token(request)
+    if not body.items:
+        raise HTTPException(status_code=400, detail="No items")
+    if len(body.items) > config.max_job_items:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {config.max_job_items} items per job")
+    for i, item in enumerate(body.items):
+        if (item.csr is None) == (item.request is None):
+            raise HTTPException(status_code=400,
+                                detail=f"Item {i}: give exactly one of csr or request")
+    _expire_jobs()
+    job = Job(body.items)
+    jobs[job.id] = job
+    # Keep a reference, the event loop only holds tasks weakly
+    job.task = asyncio.create_task(_process_job(job))
+    return JSONResponse(job.to_dict(results=False), status_code=202,
+                        headers={"Location": f"/api/v1/jobs/{job.id}"})
+
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Job status, with the results of the items finished so far."""
+    _check_token(request)
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return jobs[job_id].to_dict()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer serve``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer serve",
+        description="Run the certificate signing API (configuration from ISSUER_API_* env)"
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Host to bind to (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8090,
+        help="Port to bind to (default: 8090)"
+    )
+    parser.add_argument(
+        "--log-level",
+        default="info",
+        choices=["critical", "error", "warning", "info", "debug"],
+        help="Log level (default: info)"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    import uvicorn
+    print(f"Starting issuer API on {args.host}:{args.port}")
+    print("Press CTRL+C to stop")
+    uvicorn.run("issuer.api:app", host=args.host, port=args.port, log_level=args.log_level)
+    return 0
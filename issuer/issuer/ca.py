@@ -0,0 +1,120 @@
+"""Issuing CA: signs certificates in-process with the intermediate CA key."""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from .profiles import Profile
+from .request import CertRequest, hash_for_key
+
+# cfssl backdates certificates to tolerate clock skew
+BACKDATE = timedelta(minutes=5)
+
+
+class CertificateAuthority:
+    """The intermediate CA of a demo-cfssl base directory, loaded once."""
+
+    def __init__(self, cert_path: Path, key_path: Path, root_path: Path,
+                 key_password: Optional[bytes] = None):
+        """
+        Args:
+            cert_path: Issuing CA certificate (``ica-ca.pem``)
+            key_path: Issuing CA private key (``ica-key.pem``)
+            root_path: Root CA certificate (``ca.pem``), appended to bundle-3
+            key_password: Password of the CA key, if encrypted
+
+        Raises:
+            RuntimeError: If the CA material cannot be loaded
+        """
+        try:
+            self.cert_pem = cert_path.read_bytes()
+            self.root_pem = root_path.read_bytes()
+            self.cert = x509.load_pem_x509_certificate(self.cert_pem)
+            self.key = serialization.load_pem_private_key(key_path.read_bytes(), key_password)
+            self.root = x509.load_pem_x509_certificate(self.root_pem)
+        except (OSError, ValueError, TypeError) as e:
+            raise RuntimeError(f"Failed to load CA from {cert_path}: {e}")
+        if not isinstance(self.key, (ec.EllipticCurvePrivateKey, rsa.RSAPrivateKey)):
+            raise RuntimeError(f"Unsupported CA key type: {type(self.key).__name__}")
+        if self.cert.public_key().public_numbers() != self.key.public_key().public_numbers():
+            raise RuntimeError(f"CA key {key_path} does not match {cert_path}")
+
+        self.hash_algorithm = hash_for_key(self.key)
+        # Set to an issuer.partition.CrlPartitioning to stamp per-shard CRL DPs
+        self.crl_partitioning = None
+        self.authority_key_id = x509.AuthorityKeyIdentifier.from_issuer_public_key(
+            self.cert.public_key()
+        )
+
+    @property
+    def chain_pem(self) -> bytes:
+        """Intermediate followed by root, as appended to bundle-3.pem."""
+        return self.cert_pem + self.root_pem
+
+    def issue(self, public_key, request: CertRequest, profile: Profile,
+              now: Optional[datetime] = None) -> x509.Certificate:
+        """Sign a certificate for ``public_key`` per request and profile."""
+        return self.sign(public_key, request.subject(), request.subject_alt_names(),
+                         profile, now)
+
+    def sign(self, public_key, subject: x509.Name, sans: list[x509.GeneralName],
+             profile: Profile, now: Optional[datetime] = None) -> x509.Certificate:
+        """
+        Sign a certificate for ``public_key`` with the given subject and SANs.
+
+        The certificate never outlives the issuing CA. With a CRL
+        partitioning, the CRL Distribution Point is that of the certificate's
+        shard instead of the profile's ``crl_url``.
+        """
+        now = now or datetime.now(timezone.utc)
+        not_after = min(now + profile.expiry, self.cert.not_valid_after_utc)
+        serial = x509.random_serial_number()
+
+        builder = (
+            x509.CertificateBuilder()
+            .subject_name(subject)
+            .issuer_name(self.cert.subject)
+            .public_key(public_key)
+            .serial_number(serial)
+            .not_valid_before(now - BACKDATE)
+            .not_valid_after(not_after)
+            .add_extension(profile.key_usage(), critical=True)
+            .add_extension(x509.BasicConstraints(ca=profile.is_ca,
+                                                 path_length=profile.max_path_len
+                                                 if profile.is_ca else None),
+                           critical=True)
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False)
+            .add_extension(self.authority_key_id, critical=False)
+        )
+        eku = profile.extended_key_usage()
+        if eku is not None:
+            builder = builder.add_extension(eku, critical=False)
+        if sans:
+            # With an empty subject the SAN carries the identity (RFC 5280 4.2.1.6)
+            builder = builder.add_extension(x509.SubjectAlternativeName(sans),
+                                            critical=len(subject) == 0)
+
+        access = []
+        if profile.ocsp_url:
+            access.append(x509.AccessDescription(
+                x509.AuthorityInformationAccessOID.OCSP,
+                x509.UniformResourceIdentifier(profile.ocsp_url)))
+        for url in profile.issuer_urls:
+            access.append(x509.AccessDescription(
+                x509.AuthorityInformationAccessOID.CA_ISSUERS,
+                x509.UniformResourceIdentifier(url)))
+        if access:
+            builder = builder.add_extension(x509.AuthorityInformationAccess(access), critical=False)
+        crl_url = (self.crl_partitioning.url_for(serial, not_after)
+                   if self.crl_partitioning is not None else profile.crl_url)
+        if crl_url:
+            builder = builder.add_extension(x509.CRLDistributionPoints([
+                x509.DistributionPoint([x509.UniformResourceIdentifier(crl_url)],
+                                       None, None, None)
+            ]), critical=False)
+
+        return builder.sign(self.key, self.hash_algorithm)
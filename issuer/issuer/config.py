@@ -0,0 +1,27 @@
+"""Locations of the demo-cfssl CA material."""
+
+import os
+import re
+from pathlib import Path
+
+# Base directory shared with steps.sh, mkCert.sh and the OCSP responder
+BD = Path(os.getenv("DEMO_CFSSL_DIR", str(Path.home() / ".config" / "demo-cfssl")))
+
+# Every issued certificate is also stored as issued/<serial hex>.pem; the OCSP
+# responder (ocsp/main.py) looks certificates up there by serial
+ISSUED_DIR = "issued"
+
+
+def ca_paths(base_dir: Path) -> dict[str, Path]:
+    """Return the issuing (intermediate) CA, its key and the root under ``base_dir``."""
+    return {
+        "cert": base_dir / "ica-ca.pem",
+        "key": base_dir / "ica-key.pem",
+        "root": base_dir / "ca.pem",
+    }
+
+
+def slugify(name: str) -> str:
+    """Folder name for a person's CN, as ``step_email`` in steps.sh derives it."""
+    slug = re.sub(r'[^a-z0-9]', '_', name.lower())
+    return re.sub(r'_+', '_', slug).strip('_')
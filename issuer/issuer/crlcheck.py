@@ -0,0 +1,491 @@
+"""
+Batch revocation check: ``crl_check.sh --batch`` without a process per certificate.
+
+``crl_check.sh`` spawns several ``openssl`` processes per certificate and
+prints the whole CRL as text to grep for each serial, so a batch of 50k
+certificates takes hours. This module parses each CA's CRLs once into a set of
+revoked serials: the full CRL, the delta CRL if it applies to that full CRL,
+and the shard CRLs of a partitioned CA. It then checks every certificate
+in-process:
+
+1. the issuer is one of the CA certificates, chained to the CA bundle
+2. the issuer's CRL is present (``error:crl_not_found`` otherwise)
+3. the serial is not revoked
+4. the certificate is within its validity period
+5. the signature verifies against the issuer
+
+The output is the JSON array of ``crl_check.sh --batch FILE --json``, in
+input order, with the same keys and status values. Two statuses are new:
+``error:expired`` and ``error:not_yet_valid``. ``crl_check.sh`` reports
+those certificates as ``valid``, because the word "lookup" in OpenSSL's
+error message matches its ``OK`` test. Certificates are read on a process
+pool with ``-j``, and each worker parses the CRLs once.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.x509.oid import NameOID
+
+from .config import BD
+from .inventory import CERT_DIRS
+from .revocation import CA_FILES, openssl_serial
+from .trust import HashedDirectory
+
+logger = logging.getLogger(__name__)
+
+# Short names as OpenSSL prints them in -subject
+_NAME_LABELS = {
+    NameOID.COUNTRY_NAME: "C",
+    NameOID.STATE_OR_PROVINCE_NAME: "ST",
+    NameOID.LOCALITY_NAME: "L",
+    NameOID.ORGANIZATION_NAME: "O",
+    NameOID.ORGANIZATIONAL_UNIT_NAME: "OU",
+    NameOID.COMMON_NAME: "CN",
+    NameOID.EMAIL_ADDRESS: "emailAddress",
+    NameOID.SERIAL_NUMBER: "serialNumber",
+    NameOID.DOMAIN_COMPONENT: "DC",
+    NameOID.USER_ID: "UID",
+}
+
+
+def openssl_subject(name: x509.Name) -> str:
+    """A name as ``openssl x509 -subject`` prints it (``C = CZ, O = Org, CN = host``)."""
+    rdns = []
+    for rdn in name.rdns:
+        rdns.append(" + ".join(
+            f"{_NAME_LABELS.get(attr.oid, attr.oid.dotted_string)} = {attr.value}" for attr in rdn))
+    return ", ".join(rdns)
+
+
+def read_crl(path: Path) -> x509.CertificateRevocationList:
+    """
+    Load a PEM or DER CRL.
+
+    Raises:
+        RuntimeError: If the CRL cannot be read
+    """
+    try:
+        data = path.read_bytes()
+        if data.lstrip().startswith(b"-----BEGIN"):
+            return x509.load_pem_x509_crl(data)
+        return x509.load_der_x509_crl(data)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Failed to load CRL {path}: {e}")
+
+
+def load_crl(path: Path, issuer: x509.Certificate,
+             crl: Optional[x509.CertificateRevocationList] = None) -> x509.CertificateRevocationList:
+    """
+    Load a CRL (unless already given) and check that ``issuer`` signed it.
+
+    Raises:
+        RuntimeError: If the CRL cannot be read or is not signed by ``issuer``
+    """
+    crl = crl or read_crl(path)
+    if crl.issuer != issuer.subject or not crl.is_signature_valid(issuer.public_key()):
+        raise RuntimeError(f"CRL {path} is not signed by {issuer.subject.rfc4514_string()}")
+    if crl.next_update_utc is not None and crl.next_update_utc < datetime.now(timezone.utc):
+        logger.warning(f"CRL {path} is past its nextUpdate ({crl.next_update_utc.isoformat()})")
+    return crl
+
+
+def _crl_number(crl: x509.CertificateRevocationList) -> Optional[int]:
+    try:
+        return crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+    except x509.ExtensionNotFound:
+        return None
+
+
+def _is_remove(revoked: x509.RevokedCertificate) -> bool:
+    try:
+        reason = revoked.extensions.get_extension_for_class(x509.CRLReason).value.reason
+    except x509.ExtensionNotFound:
+        return False
+    return reason == x509.ReasonFlags.remove_from_crl
+
+
+class RevocationSet:
+    """The revoked serials of one CA, from its full, delta and shard CRLs."""
+
+    def __init__(self, issuer: x509.Certificate):
+        self.issuer = issuer
+        self.revoked: set[int] = set()
+        # Shard CRL URL (Issuing Distribution Point) -> revoked serials
+        self.shards: dict[str, set[int]] = {}
+        self.full_number: Optional[int] = None
+        self.crls = 0
+
+    def add_full(self, crl: x509.CertificateRevocationList):
+        """Add a complete CRL; a delta CRL (see :meth:`add_delta`) must follow its base."""
+        self.revoked.update(r.serial_number for r in crl)
+        number = _crl_number(crl)
+        if number is not None:
+            self.full_number = max(self.full_number or 0, number)
+        self.crls += 1
+
+    def add_delta(self, crl: x509.CertificateRevocationList, path: Path) -> bool:
+        """
+        Apply a delta CRL if it is a delta of the loaded full CRL (RFC 5280
+        section 5.2.4: base number <= full number < delta number).
+        """
+        base = crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator).value.crl_number
+        number = _crl_number(crl)
+        if self.full_number is not None and number is not None and number <= self.full_number:
+            logger.info(f"Ignoring delta CRL {path}: number {number} is older than "
+                        f"the full CRL ({self.full_number})")
+            return False
+        if self.full_number is None or number is None or not base <= self.full_number < number:
+            logger.warning(f"Ignoring delta CRL {path}: base {base}, number {number}, "
+                           f"full CRL number {self.full_number}")
+            return False
+        for revoked in crl:
+            if _is_remove(revoked):
+                self.revoked.discard(revoked.serial_number)
+            else:
+                self.revoked.add(revoked.serial_number)
+        self.crls += 1
+        return True
+
+    def add_shard(self, crl: x509.CertificateRevocationList, path: Path):
+        """Add a shard CRL under the URLs of its Issuing Distribution Point."""
+        try:
+            idp = crl.extensions.get_extension_for_class(x509.IssuingDistributionPoint).value
+        except x509.ExtensionNotFound:
+            logger.warning(f"Shard CRL {path} has no Issuing Distribution Point; adding it as full")
+            self.add_full(crl)
+            return
+        serials = {r.serial_number for r in crl}
+        for name in idp.full_name or []:
+            if isinstance(name, x509.UniformResourceIdentifier):
+                self.shards[name.value] = serials
+        self.crls += 1
+
+    def add(self, crl: x509.CertificateRevocationList, path: Path):
+        """Add a CRL of any kind (full, delta or shard)."""
+        extensions = {type(ext.value) for ext in crl.extensions}
+        if x509.DeltaCRLIndicator in extensions:
+            self.add_delta(crl, path)
+        elif x509.IssuingDistributionPoint in extensions:
+            self.add_shard(crl, path)
+        else:
+            self.add_full(crl)
+
+    def is_revoked(self, cert: x509.Certificate) -> bool:
+        serial = cert.serial_number
+        if serial in self.revoked:
+            return True
+        if not self.shards:
+            return False
+        try:
+            cdps = cert.extensions.get_extension_for_class(x509.CRLDistributionPoints).value
+        except x509.ExtensionNotFound:
+            return False
+        for point in cdps:
+            for name in point.full_name or []:
+                if serial in self.shards.get(getattr(name, "value", None), ()):
+                    return True
+        return False
+
+
+class BatchChecker:
+    """Checks certificates against the CA bundle and CRLs loaded once."""
+
+    def __init__(self, base_dir: Path, ca_bundle: Optional[Path] = None,
+                 crl_files: Optional[list[Path]] = None, verify_signatures: bool = True):
+        """
+        Args:
+            base_dir: demo-cfssl base directory
+            ca_bundle: Trust anchors, a PEM bundle or a hashed directory
+                (``issuer trust build``); default: ``ca-bundle.pem`` or
+                ``ca.pem`` in ``base_dir``, as crl_check.sh picks them
+            crl_files: CRLs to use instead of ``<ca>-crl.pem``,
+                ``<ca>-delta-crl.pem`` and ``crl/<ca>/shards/``; each is
+                matched to its CA by issuer name
+            verify_signatures: Verify each certificate's signature against its issuer
+
+        Raises:
+            RuntimeError: If the bundle or a CRL cannot be loaded
+        """
+        self.verify_signatures = verify_signatures
+        if ca_bundle is None:
+            ca_bundle = base_dir / "ca-bundle.pem"
+            if not ca_bundle.exists():
+                ca_bundle = base_dir / "ca.pem"
+        # A hashed directory is searched only for the issuers of our CAs
+        self.anchor_dir: Optional[HashedDirectory] = None
+        if ca_bundle.is_dir():
+            self.anchor_dir = HashedDirectory(ca_bundle)
+            anchors = []
+        else:
+            try:
+                anchors = x509.load_pem_x509_certificates(ca_bundle.read_bytes())
+            except (OSError, ValueError) as e:
+                raise RuntimeError(f"Failed to load CA bundle {ca_bundle}: {e}")
+
+        # Issuing CAs by subject: the anchors, plus the base directory's CA
+        # certificates that chain to one (verified once, not per certificate)
+        self.issuers: dict[x509.Name, x509.Certificate] = {a.subject: a for a in anchors}
+        ca_types: dict[str, x509.Certificate] = {}
+        for ca_type, (cert_name, _) in CA_FILES.items():
+            try:
+                ca_cert = x509.load_pem_x509_certificate((base_dir / cert_name).read_bytes())
+            except (OSError, ValueError):
+                continue
+            if self._chains(ca_cert):
+                self.issuers.setdefault(ca_cert.subject, ca_cert)
+                ca_types[ca_type] = ca_cert
+            else:
+                logger.warning(f"{base_dir / cert_name} does not chain to {ca_bundle}")
+
+        self.revocation: dict[x509.Name, RevocationSet] = {}
+        if crl_files is None:
+            for ca_type, ca_cert in ca_types.items():
+                self._load_default(base_dir, ca_type, ca_cert)
+        else:
+            for path in crl_files:
+                self._load_custom(path)
+
+    def _chains(self, cert: x509.Certificate) -> bool:
+        """True if ``cert`` is an anchor or directly issued by one."""
+        if cert.subject in self.issuers and self.issuers[cert.subject] == cert:
+            return True
+        if self.anchor_dir is not None:
+            if cert in self.anchor_dir.lookup(cert.subject):
+                return True
+            candidates = self.anchor_dir.lookup(cert.issuer)
+        else:
+            candidates = [self.issuers[cert.issuer]] if cert.issuer in self.issuers else []
+        for anchor in candidates:
+            try:
+                cert.verify_directly_issued_by(anchor)
+            except (InvalidSignature, ValueError, TypeError):
+                continue
+            self.issuers.setdefault(anchor.subject, anchor)
+            return True
+        return False
+
+    def _load_default(self, base_dir: Path, ca_type: str, ca_cert: x509.Certificate):
+        """The CRLs crl_mk.sh and ``issuer crl`` publish for one CA."""
+        full_path = base_dir / f"{ca_type}-crl.pem"
+        shard_paths = sorted((base_dir / "crl" / ca_type / "shards").glob("*.der"))
+        if not full_path.exists() and not shard_paths:
+            return
+        revocation = RevocationSet(ca_cert)
+        if full_path.exists():
+            revocation.add_full(load_crl(full_path, ca_cert))
+            delta_path = base_dir / f"{ca_type}-delta-crl.pem"
+            if delta_path.exists():
+                revocation.add_delta(load_crl(delta_path, ca_cert), delta_path)
+        for path in shard_paths:
+            revocation.add_shard(load_crl(path, ca_cert), path)
+        self.revocation[ca_cert.subject] = revocation
+        logger.info(f"{ca_type}: {revocation.crls} CRLs, {len(revocation.revoked)} revoked serials, "
+                    f"{len(revocation.shards)} shards")
+
+    def _load_custom(self, path: Path):
+        """A ``--crl`` file, attached to the CA that issued it."""
+        crl = read_crl(path)
+        issuer = self.issuers.get(crl.issuer)
+        if issuer is None:
+            raise RuntimeError(f"CRL {path} is issued by an unknown CA: {crl.issuer.rfc4514_string()}")
+        load_crl(path, issuer, crl)
+        revocation = self.revocation.setdefault(issuer.subject, RevocationSet(issuer))
+        revocation.add(crl, path)
+
+    def check(self, cert_file: str, now: Optional[datetime] = None) -> dict:
+        """Check one certificate file; never raises."""
+        now = now or datetime.now(timezone.utc)
+        result = {"certificate": cert_file, "serial": "", "subject": "", "status": ""}
+        try:
+            cert = x509.load_pem_x509_certificate(Path(cert_file).read_bytes())
+            result["serial"] = openssl_serial(cert.serial_number)
+            result["subject"] = openssl_subject(cert.subject)
+        except (OSError, ValueError):
+            result["status"] = "error:invalid_certificate"
+            return self._stamp(result, now)
+        result["status"] = self._status(cert, now)
+        return self._stamp(result, now)
+
+    def _status(self, cert: x509.Certificate, now: datetime) -> str:
+        issuer = self.issuers.get(cert.issuer)
+        if issuer is None:
+            return "error:verification_failed"
+        revocation = self.revocation.get(issuer.subject)
+        if revocation is None:
+            return "error:crl_not_found"
+        # Like crl_check.sh: a listed serial is revoked, whatever else is wrong
+        if revocation.is_revoked(cert):
+            return "revoked"
+        if now > cert.not_valid_after_utc:
+            return "error:expired"
+        if now < cert.not_valid_before_utc:
+            return "error:not_yet_valid"
+        if self.verify_signatures:
+            try:
+                cert.verify_directly_issued_by(issuer)
+            except (InvalidSignature, ValueError, TypeError):
+                return "error:verification_failed"
+        return "valid"
+
+    @staticmethod
+    def _stamp(result: dict, now: datetime) -> dict:
+        result["timestamp"] = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+        return result
+
+
+def read_batch(lines: Iterable[str]) -> Iterator[str]:
+    """Certificate paths of a batch file: one per line, ``#`` comments, ``~`` expanded."""
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line or line.lstrip().startswith("#"):
+            continue
+        yield os.path.expanduser(line) if line.startswith("~") else line
+
+
+def scan(base_dir: Path) -> Iterator[str]:
+    """Every ``<dir>/<name>/cert.pem`` of the steps.sh layout."""
+    for top in CERT_DIRS:
+        for path in sorted((base_dir / top).glob("*/cert.pem")):
+            yield str(path)
+
+
+# Per-process checker, set up by _init_worker
+_checker: Optional[BatchChecker] = None
+
+
+def _init_worker(base_dir: Path, ca_bundle: Optional[Path], crl_files: Optional[list[Path]],
+                 verify_signatures: bool):
+    global _checker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.getLogger(__name__).setLevel(logging.WARNING)
+    _checker = BatchChecker(base_dir, ca_bundle, crl_files, verify_signatures)
+
+
+def _check_one(cert_file: str) -> dict:
+    """Check one certificate in a worker; never raises."""
+    return _checker.check(cert_file)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer crlcheck``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer crlcheck",
+        description="Check many certificates against the CRLs, like crl_check.sh --batch FILE --json"
+    )
+    parser.add_argument(
+        "batch",
+        nargs="?",
+        help="File with one certificate path per line ('-' for stdin)"
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Check every cert.pem under hosts/, smime/, smime-openssl/, tls-clients/ and tsa/"
+    )
+    parser.add_argument(
+        "--crl",
+        type=Path,
+        action="append",
+        help="Use this CRL (PEM or DER) instead of the published ones; repeat for base and delta"
+    )
+    parser.add_argument(
+        "--ca-bundle",
+        type=Path,
+        help="Trust anchors: PEM bundle or hashed directory such as trust/certs "
+             "(default: ca-bundle.pem or ca.pem in the base directory)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="json: one array, as crl_check.sh --json; jsonl: one object per line (default: json)"
+    )
+    parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="Skip the signature check of each certificate (revocation and expiry only)"
+    )
+    parser.add_argument(
+        "--base-dir",
+        type=Path,
+        default=Path(os.getenv("CRL_CHECK_BD", str(BD))),
+        help="demo-cfssl directory (default: $CRL_CHECK_BD, $DEMO_CFSSL_DIR or ~/.config/demo-cfssl)"
+    )
+    parser.add_argument(
+        "--workers", "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of checking processes (default: CPU count)"
+    )
+    args = parser.parse_args(argv)
+
+    if not args.batch and not args.all:
+        parser.error("give a batch file or --all")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+    start = time.perf_counter()
+    try:
+        checker = BatchChecker(args.base_dir, args.ca_bundle, args.crl, not args.no_verify)
+        if args.all:
+            cert_files = list(scan(args.base_dir))
+        elif args.batch == "-":
+            cert_files = list(read_batch(sys.stdin))
+        else:
+            with open(args.batch, encoding='utf-8') as f:
+                cert_files = list(read_batch(f))
+    except (OSError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    loaded = time.perf_counter()
+
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker,
+            initargs=(args.base_dir, args.ca_bundle, args.crl, not args.no_verify))
+        chunksize = max(1, min(1024, len(cert_files) // (args.workers * 4)))
+        results = executor.map(_check_one, cert_files, chunksize=chunksize)
+    else:
+        executor = None
+        results = map(checker.check, cert_files)
+
+    counts = {"valid": 0, "revoked": 0, "error": 0}
+    out = sys.stdout
+    try:
+        if args.format == "json":
+            out.write("[\n")
+        for number, result in enumerate(results):
+            status = result["status"]
+            counts[status if status in counts else "error"] += 1
+            if args.format == "json":
+                out.write(("" if number == 0 else ",\n") + json.dumps(result, indent=2))
+            else:
+                out.write(json.dumps(result) + "\n")
+        if args.format == "json":
+            out.write("\n]\n")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print(f"{len(cert_files)} certificates in {time.perf_counter() - start:.2f}s "
+          f"(CRLs loaded in {loaded - start:.2f}s): {counts['valid']} valid, "
+          f"{counts['revoked']} revoked, {counts['error']} errors", file=sys.stderr)
+    # Exit codes of crl_check.sh --batch
+    if counts["error"]:
+        return 2
+    return 1 if counts["revoked"] else 0
@@ -0,0 +1,371 @@
+"""
+CRL distribution over HTTP with conditional GET.
+
+``crl_mk.sh`` and ``issuer crl`` only write CRL files; serving them is left to
+whatever static hosting a deployment wires up. This service publishes the
+CRLs of a demo-cfssl base directory:
+
+- ``/crl/<ca>.crl`` (DER), ``/crl/<ca>.pem``: the full CRL (``<ca>-crl.der``)
+- ``/crl/<ca>-delta.crl``: the delta CRL (``<ca>-delta-crl.der``)
+- ``/crl/<ca>-<shard>.crl``: shard CRLs (``crl/<ca>/shards/<shard>.der``),
+  matching a partition URL template of ``http://<host>/crl/<ca>-{shard}.crl``
+
+Each CRL is held in memory as DER and PEM and reloaded when its file changes
+(checked at most every ``CRL_SERVE_RELOAD_SECONDS``). Responses carry an
+``ETag`` (a hash of the content) and ``Last-Modified`` (thisUpdate), and
+answer ``If-None-Match``/``If-Modified-Since`` with 304. ``Cache-Control``
+lets caches keep a CRL until its nextUpdate, so they absorb nearly all
+requests. Bodies are sent from the in-memory copy of the version that was
+current when the request came in, so a reload never disturbs a response
+being sent.
+
+Run with ``issuer crlserve`` or ``uvicorn issuer.crlserve:app``. ``router``
+can also be mounted in another app; the OCSP responder (``ocsp/main.py``)
+mounts it when the issuer package is installed.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import Response
+
+from .config import BD
+from .revocation import CA_FILES
+
+__version__ = "0.1.0"
+
+logger = logging.getLogger(__name__)
+
+# URL suffix -> served encoding, content type (RFC 2585 for DER)
+VARIANTS = {
+    "crl": ("der", "application/pkix-crl"),
+    "der": ("der", "application/pkix-crl"),
+    "pem": ("pem", "application/x-pem-file"),
+}
+
+
+class CrlServeConfig:
+    """CRL distribution configuration from environment variables."""
+
+    def __init__(self):
+        """
+        Initialize configuration from environment variables.
+
+        Raises:
+            ValueError: If a value cannot be parsed
+        """
+        self.base_dir = BD
+        self.reload_seconds = float(os.getenv("CRL_SERVE_RELOAD_SECONDS", "1"))
+        # Upper bound for max-age, whatever the nextUpdate of a CRL
+        self.max_age = int(os.getenv("CRL_SERVE_MAX_AGE", "86400"))
+
+    def validate(self) -> list[str]:
+        """Return a list of configuration errors (empty if valid)."""
+        errors = []
+        if not self.base_dir.is_dir():
+            errors.append(f"Base directory not found: {self.base_dir}")
+        if self.reload_seconds < 0:
+            errors.append("CRL_SERVE_RELOAD_SECONDS must not be negative")
+        if self.max_age < 0:
+            errors.append("CRL_SERVE_MAX_AGE must not be negative")
+        return errors
+
+    def __repr__(self) -> str:
+        return (
+            f"CrlServeConfig(base_dir={self.base_dir}, reload_seconds={self.reload_seconds}, "
+            f"max_age={self.max_age})"
+        )
+
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+class PublishedCrl:
+    """One CRL as published: both encodings, validators and lifetime."""
+
+    def __init__(self, name: str, path: Path, key: tuple):
+        """
+        Args:
+            name: Name in the URL (``ica``, ``ica-delta``, ``ica-03``)
+            path: CRL file (DER or PEM)
+            key: (inode, mtime, size) of the file when it was read
+
+        Raises:
+            RuntimeError: If the file is not a CRL
+        """
+        self.name = name
+        self.path = path
+        self.key = key
+        data = path.read_bytes()
+        try:
+            if data.lstrip().startswith(b"-----BEGIN"):
+                crl = x509.load_pem_x509_crl(data)
+            else:
+                crl = x509.load_der_x509_crl(data)
+        except ValueError as e:
+            raise RuntimeError(f"Failed to load CRL {path}: {e}")
+        self.der = crl.public_bytes(serialization.Encoding.DER)
+        self.pem = crl.public_bytes(serialization.Encoding.PEM)
+        digest = hashlib.sha256(self.der).hexdigest()[:32]
+        self.etags = {"der": f'"{digest}"', "pem": f'"{digest}-pem"'}
+        self.this_update = crl.last_update_utc
+        self.next_update = crl.next_update_utc
+        try:
+            self.number = crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+        except x509.ExtensionNotFound:
+            self.number = None
+
+    def body(self, encoding: str) -> bytes:
+        return self.der if encoding == "der" else self.pem
+
+    def lifetime(self, max_age: int, now: datetime) -> int:
+        """Seconds a cache may keep this CRL: until nextUpdate, at most ``max_age``."""
+        if self.next_update is None:
+            return min(max_age, 3600)
+        return max(0, min(int((self.next_update - now).total_seconds()), max_age))
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "url": f"/crl/{self.name}.crl",
+            "number": self.number,
+            "this_update": self.this_update.isoformat(),
+            "next_update": self.next_update.isoformat() if self.next_update else None,
+            "der_bytes": len(self.der),
+            "etag": self.etags["der"],
+        }
+
+
+class CrlDirectory:
+    """The published CRLs of a base directory, reloaded when their files change."""
+
+    def __init__(self, base_dir: Path, reload_seconds: float = 1.0):
+        self.base_dir = base_dir
+        self.reload_seconds = reload_seconds
+        self.crls: dict[str, PublishedCrl] = {}
+        self.checked = 0.0
+
+    def _sources(self) -> dict[str, Path]:
+        """URL name -> file, as crl_mk.sh and issuer crl write them (DER preferred)."""
+        sources = {}
+        for ca_type in CA_FILES:
+            for name, stem in ((ca_type, f"{ca_type}-crl"), (f"{ca_type}-delta", f"{ca_type}-delta-crl")):
+                for suffix in (".der", ".pem"):
+                    path = self.base_dir / f"{stem}{suffix}"
+                    if path.exists():
+                        sources[name] = path
+                        break
+            shard_dir = self.base_dir / "crl" / ca_type / "shards"
+            if shard_dir.is_dir():
+                for path in shard_dir.glob("*.der"):
+                    sources[f"{ca_type}-{path.stem}"] = path
+        return sources
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Reload changed CRL files, at most every ``reload_seconds``.
+
+        Returns:
+            Number of CRLs (re)loaded or dropped
+        """
+        now = time.monotonic()
+        if not force and now - self.checked < self.reload_seconds:
+            return 0
+        self.checked = now
+        changed = 0
+        sources = self._sources()
+        for name in set(self.crls) - set(sources):
+            del self.crls[name]
+            changed += 1
+        for name, path in sources.items():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            current = self.crls.get(name)
+            if current is not None and current.key == key:
+                continue
+            try:
+                crl = PublishedCrl(name, path, key)
+            except (OSError, RuntimeError) as e:
+                # Keep serving the previous version
+                logger.warning(f"Not reloading {name}: {e}")
+                continue
+            self.crls[name] = crl
+            changed += 1
+            logger.info(f"Loaded CRL {name} from {path} (number {crl.number}, {len(crl.der)} bytes)")
+        return changed
+
+    def get(self, name: str) -> Optional[PublishedCrl]:
+        self.refresh()
+        return self.crls.get(name)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for GET)."""
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def _not_modified(request: Request, crl: PublishedCrl, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return crl.this_update <= since
+    return False
+
+
+config: Optional[CrlServeConfig] = None
+directory: Optional[CrlDirectory] = None
+
+router = APIRouter(prefix="/crl", tags=["crl"])
+
+
+def _directory() -> CrlDirectory:
+    """The CRL directory, set up on first use (also when mounted in another app)."""
+    global config, directory
+    if directory is None:
+        config = CrlServeConfig()
+        directory = CrlDirectory(config.base_dir, config.reload_seconds)
+        directory.refresh(force=True)
+    return directory
+
+
+@router.get("/")
+async def list_crls():
+    """The published CRLs."""
+    crls = _directory()
+    crls.refresh()
+    return {"crls": [crl.to_dict() for crl in sorted(crls.crls.values(), key=lambda c: c.name)]}
+
+
+@router.api_route("/{filename}", methods=["GET", "HEAD"])
+async def get_crl(filename: str, request: Request):
+    """A CRL as DER (``.crl``, ``.der``) or PEM (``.pem``), with conditional GET."""
+    name, _, suffix = filename.rpartition(".")
+    if suffix not in VARIANTS or not name:
+        raise HTTPException(status_code=404, detail=f"Unknown CRL: {filename}")
+    crl = _directory().get(name)
+    if crl is None:
+        raise HTTPException(status_code=404, detail=f"Unknown CRL: {filename}")
+
+    encoding, media_type = VARIANTS[suffix]
+    etag = crl.etags[encoding]
+    now = datetime.now(timezone.utc)
+    lifetime = crl.lifetime(config.max_age, now)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": _http_date(crl.this_update),
+        # Past nextUpdate: caches must come back every time until a new CRL is out
+        "Cache-Control": (f"public, max-age={lifetime}, no-transform" if lifetime
+                          else "public, max-age=0, must-revalidate, no-transform"),
+        "Expires": _http_date(now + timedelta(seconds=lifetime)),
+    }
+    if _not_modified(request, crl, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=crl.body(encoding), media_type=media_type, headers=headers)
+
+
+app = FastAPI(
+    title="issuer CRL distribution",
+    description="CRLs of the demo-cfssl CAs over HTTP with conditional GET",
+    version=__version__,
+)
+app.include_router(router)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the CRLs."""
+    logger.info("Starting CRL distribution...")
+    settings = CrlServeConfig()
+    logger.info(f"Configuration loaded: {settings}")
+    errors = settings.validate()
+    if errors:
+        logger.error(f"Configuration validation failed: {'; '.join(errors)}")
+        raise RuntimeError(f"Invalid configuration: {'; '.join(errors)}")
+    crls = _directory()
+    logger.info(f"Serving {len(crls.crls)} CRLs: {', '.join(sorted(crls.crls)) or 'none yet'}")
+
+
+@app.get("/")
+async def root():
+    """Root endpoint with service information."""
+    return {
+        "service": "issuer CRL distribution",
+        "version": __version__,
+        "endpoints": {
+            "crls": "/crl/",
+            "crl": "/crl/{ca}.crl, /crl/{ca}-delta.crl, /crl/{ca}-{shard}.crl (.pem for PEM)",
+            "health": "/health",
+        },
+    }
+
+
+@app.get("/health")
+async def health():
+    """Health check endpoint."""
+    crls = _directory()
+    return {
+        "status": "healthy",
+        "crls": len(crls.crls),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer crlserve``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer crlserve",
+        description="Serve the CRLs over HTTP (configuration from CRL_SERVE_* env)"
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Host to bind to (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8093,
+        help="Port to bind to (default: 8093)"
+    )
+    parser.add_argument(
+        "--log-level",
+        default="info",
+        choices=["critical", "error", "warning", "info", "debug"],
+        help="Log level (default: info)"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    import uvicorn
+    print(f"Starting CRL distribution on {args.host}:{args.port}")
+    print("Press CTRL+C to stop")
+    uvicorn.run("issuer.crlserve:app", host=args.host, port=args.port, log_level=args.log_level)
+    return 0
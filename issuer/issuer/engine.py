@@ -0,0 +1,427 @@
+"""
+Bulk issuance: generate keys and sign certificates on a process pool.
+
+Replaces the per-certificate ``cfssl gencert`` / ``openssl`` spawns of
+``steps.sh`` and ``mkCert.sh``. Each worker process loads the issuing CA,
+the signing profile and the request template once in its initializer; per
+certificate it only generates a key, signs and writes the files. The output
+layout is the one steps.sh produces, so both can be mixed freely:
+
+- ``hosts/<name>/``: cfg.json, key.pem, cert.pem, host.csr, bundle-2.pem,
+  bundle-3.pem, haproxy.pem, host.p12, host.json
+- ``smime/<slug>/``: cfg.json, key.pem, cert.pem, email.csr, bundle-2.pem,
+  bundle-3.pem, email.p12, email.json
+- ``tls-clients/<slug>/``: the same with ``client.*``
+
+As in steps.sh, a still-valid certificate is left alone and an expired one
+is reissued. ``<stem>.json`` is written last and marks a complete set.
+Every certificate is also indexed as ``issued/<serial>.pem``, where the OCSP
+responder finds it.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+from .ca import CertificateAuthority
+from .config import BD, ISSUED_DIR, ca_paths, slugify
+from .keypool import KEYPOOL_DIR, KeyPool, read_passphrase
+from .partition import PARTITIONS_FILE, CrlPartitioning
+from .profiles import Profile, load_profiles
+from .request import CertRequest
+
+
+class Kind:
+    """Where and how one kind of certificate is written."""
+
+    def __init__(self, directory: str, template: str, profile: str, stem: str,
+                 cn_in_hosts: bool, slug: bool, p12_password_env: str, haproxy: bool = False):
+        self.directory = directory
+        self.template = template
+        self.profile = profile
+        self.stem = stem
+        # Hosts list the CN as first SAN (step03); people do not (step_email)
+        self.cn_in_hosts = cn_in_hosts
+        # People get a slugified folder name derived from the CN
+        self.slug = slug
+        self.p12_password_env = p12_password_env
+        self.haproxy = haproxy
+
+    def folder(self, name: str) -> str:
+        folder = slugify(name) if self.slug else name
+        if not folder or folder in ('.', '..') or '/' in folder:
+            raise ValueError(f"Invalid certificate name: {name!r}")
+        return folder
+
+
+KINDS = {
+    "host": Kind("hosts", "02_host.json", "server", "host",
+                 cn_in_hosts=True, slug=False, p12_password_env="HOST_P12_PASSWORD",
+                 haproxy=True),
+    "email": Kind("smime", "03_email.json", "email", "email",
+                  cn_in_hosts=False, slug=True, p12_password_env="EMAIL_P12_PASSWORD"),
+    "client": Kind("tls-clients", "03_email.json", "client", "client",
+                   cn_in_hosts=False, slug=True, p12_password_env="TLS_CLIENT_P12_PASSWORD"),
+}
+
+
+def write_atomic(path: Path, data: bytes, mode: int = 0o644):
+    """Write ``data`` to a temporary file next to ``path`` and rename it into place."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def index_issued(base_dir: Path, cert: x509.Certificate, cert_pem: bytes) -> Path:
+    """Store a certificate as ``issued/<serial>.pem`` for the OCSP responder."""
+    directory = base_dir / ISSUED_DIR
+    directory.mkdir(exist_ok=True)
+    path = directory / f"{cert.serial_number:x}.pem"
+    write_atomic(path, cert_pem)
+    return path
+
+
+class Issuer:
+    """Issues one kind of certificate into a demo-cfssl base directory."""
+
+    def __init__(self, kind: str, base_dir: Path = BD, profile: Optional[str] = None,
+                 template: Optional[Path] = None, profiles_path: Optional[Path] = None,
+                 p12_password: Optional[str] = None,
+                 key_pool_passphrase: Optional[bytes] = None,
+                 partitioned_crl: bool = False):
+        """
+        Args:
+            kind: ``host``, ``email`` or ``client``
+            base_dir: demo-cfssl base directory
+            profile: Signing profile name (default per kind)
+            template: CSR JSON template (default per kind, under ``base_dir``)
+            profiles_path: cfssl profiles (default ``base_dir/profiles.json``)
+            p12_password: PKCS#12 password (default from the kind's env variable)
+            key_pool_passphrase: Take keys from ``base_dir/keypool`` (see
+                :mod:`issuer.keypool`), generating only when a slot is empty
+            partitioned_crl: Stamp the CRL DP of the certificate's shard per
+                ``crl/ica/partitions.json`` (see :mod:`issuer.partition`)
+
+        Raises:
+            RuntimeError: If the CA, profiles or template cannot be loaded
+            ValueError: If the kind or profile is unknown
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown certificate kind: {kind}")
+        self.kind = KINDS[kind]
+        self.base_dir = base_dir
+
+        profiles = load_profiles(profiles_path or base_dir / "profiles.json")
+        profile = profile or self.kind.profile
+        if profile not in profiles:
+            raise ValueError(f"Unknown profile '{profile}' (have: {', '.join(profiles)})")
+        self.profile: Profile = profiles[profile]
+        self.template = CertRequest.load(template or base_dir / self.kind.template)
+
+        paths = ca_paths(base_dir)
+        self.ca = CertificateAuthority(paths["cert"], paths["key"], paths["root"])
+        if partitioned_crl:
+            self.ca.crl_partitioning = CrlPartitioning.load(base_dir / "crl" / "ica")
+            if self.ca.crl_partitioning is None:
+                raise RuntimeError(f"No CRL partitioning in {base_dir / 'crl' / 'ica' / PARTITIONS_FILE}; "
+                                   f"create one with 'issuer crl partition'")
+
+        if p12_password is None:
+            p12_password = os.getenv(self.kind.p12_password_env, "")
+        self.p12_encryption = (serialization.BestAvailableEncryption(p12_password.encode())
+                               if p12_password else serialization.NoEncryption())
+        self.key_pool = (KeyPool(base_dir / KEYPOOL_DIR, key_pool_passphrase)
+                         if key_pool_passphrase else None)
+
+    def directory(self, name: str) -> Path:
+        return self.base_dir / self.kind.directory / self.kind.folder(name)
+
+    def is_current(self, directory: Path, now: datetime) -> bool:
+        """True if a complete, unexpired certificate set already exists."""
+        if not (directory / f"{self.kind.stem}.json").exists():
+            return False
+        try:
+            cert = x509.load_pem_x509_certificate((directory / "cert.pem").read_bytes())
+        except (OSError, ValueError):
+            return False
+        return cert.not_valid_after_utc > now
+
+    def issue(self, name: str, sans: list[str], force: bool = False,
+              template: Optional[CertRequest] = None) -> dict:
+        """
+        Issue (or keep) the certificate for ``name``.
+
+        ``template`` overrides the kind's template, e.g. with an existing
+        ``cfg.json`` so a renewal keeps its key type and subject.
+
+        Returns:
+            Result dict with status ``issued`` or ``valid``
+
+        Raises:
+            ValueError: If the name or request is invalid
+        """
+        directory = self.directory(name)
+        result = {"kind": self.kind.stem, "name": name, "dir": str(directory)}
+        now = datetime.now(timezone.utc)
+        if not force and self.is_current(directory, now):
+            result["status"] = "valid"
+            return result
+
+        hosts = ([name] if self.kind.cn_in_hosts else []) + [s for s in sans if s != name]
+        request = (template or self.template).derive(name, hosts)
+        key = None
+        if self.key_pool is not None:
+            key = self.key_pool.take(request.key_algo, request.key_size)
+        result["key_source"] = "pool" if key is not None else "generated"
+        if key is None:
+            key = request.generate_key()
+        cert = self.ca.issue(key.public_key(), request, self.profile, now=now)
+        csr = request.csr(key)
+
+        key_pem = key.private_bytes(serialization.Encoding.PEM,
+                                    serialization.PrivateFormat.TraditionalOpenSSL,
+                                    serialization.NoEncryption())
+        cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+        csr_pem = csr.public_bytes(serialization.Encoding.PEM)
+        bundle_3 = cert_pem + self.ca.chain_pem
+
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = self.kind.stem
+        # Drop the completion marker first so an interrupted run is redone
+        (directory / f"{stem}.json").unlink(missing_ok=True)
+        write_atomic(directory / "cfg.json", request.to_json().encode())
+        write_atomic(directory / "key.pem", key_pem, 0o600)
+        write_atomic(directory / "cert.pem", cert_pem)
+        write_atomic(directory / f"{stem}.csr", csr_pem)
+        write_atomic(directory / "bundle-2.pem", cert_pem + self.ca.cert_pem)
+        write_atomic(directory / "bundle-3.pem", bundle_3)
+        if self.kind.haproxy:
+            write_atomic(directory / "haproxy.pem", bundle_3 + key_pem, 0o600)
+        write_atomic(directory / f"{stem}.p12", pkcs12.serialize_key_and_certificates(
+            name.encode(), key, cert, [self.ca.cert, self.ca.root], self.p12_encryption
+        ), 0o600)
+        index_issued(self.base_dir, cert, cert_pem)
+        # Same shape as cfssl's output, which steps.sh checks for
+        write_atomic(directory / f"{stem}.json", json.dumps({
+            "cert": cert_pem.decode(), "csr": csr_pem.decode(), "key": key_pem.decode(),
+        }).encode(), 0o600)
+
+        result.update({
+            "status": "issued",
+            "serial": format(cert.serial_number, 'x'),
+            "not_after": cert.not_valid_after_utc.isoformat(),
+        })
+        return result
+
+
+# Per-process issuer, set up by _init_worker
+_issuer: Optional[Issuer] = None
+_force = False
+
+
+def _init_worker(issuer_args: tuple, force: bool):
+    global _issuer, _force
+    _issuer = Issuer(*issuer_args)
+    _force = force
+
+
+def issue_one(issuer: Issuer, name: str, sans: list[str], force: bool = False,
+              template: Optional[CertRequest] = None) -> dict:
+    """Issue a single certificate; never raises."""
+    start = time.perf_counter()
+    try:
+        result = issuer.issue(name, sans, force, template)
+    except Exception as e:
+        result = {"kind": issuer.kind.stem, "name": name, "status": "error",
+                  "error": f"{type(e).__name__}: {e}"}
+    result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["pid"] = os.getpid()
+    return result
+
+
+def _issue_one(name: str, sans: list[str]) -> dict:
+    return issue_one(_issuer, name, sans, _force)
+
+
+def read_manifest(lines: Iterable[str]) -> Iterator[tuple[str, list[str]]]:
+    """
+    Parse ``name<TAB>san[<TAB>san...]`` lines; SAN fields may also be comma-separated.
+
+    Empty lines and lines starting with '#' are ignored.
+    """
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.strip() or line.startswith('#'):
+            continue
+        name, *fields = line.split('\t')
+        sans = [s.strip() for field in fields for s in field.split(',') if s.strip()]
+        yield name.strip(), sans
+
+
+def generate_jobs(count: int, pattern: str,
+                  san_patterns: list[str]) -> Iterator[tuple[str, list[str]]]:
+    """Synthetic jobs for load-test fleets, e.g. ``load-{n:05d}.lan`` for n in 0..count-1."""
+    for n in range(count):
+        yield pattern.format(n=n), [p.format(n=n) for p in san_patterns]
+
+
+def run_issue(jobs: Iterable[tuple[str, list[str]]], workers: int,
+              initargs: tuple) -> Iterator[dict]:
+    """
+    Issue certificates on a process pool, yielding results in input order.
+
+    At most ``workers * 4`` jobs are in flight.
+    """
+    window = max(1, workers) * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=initargs) as executor:
+        pending: deque = deque()
+        for name, sans in jobs:
+            pending.append(executor.submit(_issue_one, name, sans))
+            if len(pending) > window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer issue``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer issue",
+        description="Issue host, S/MIME or TLS client certificates in bulk (JSON lines output)"
+    )
+    parser.add_argument(
+        "kind",
+        choices=sorted(KINDS),
+        help="Certificate kind (host: hosts/, email: smime/, client: tls-clients/)"
+    )
+    parser.add_argument(
+        "name",
+        nargs="?",
+        help="Host name or person's name (CN) of a single certificate"
+    )
+    parser.add_argument(
+        "sans",
+        nargs="*",
+        help="Additional DNS names / IPs (host) or e-mail addresses (email, client)"
+    )
+    parser.add_argument(
+        "--manifest",
+        help="File with one 'name<TAB>san<TAB>...' line per certificate ('-' for stdin)"
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        help="Generate COUNT certificates named by --pattern (load-test fleets)"
+    )
+    parser.add_argument(
+        "--pattern",
+        default="load-{n:05d}.lan",
+        help="Name pattern for --count, formatted with n (default: load-{n:05d}.lan)"
+    )
+    parser.add_argument(
+        "--san-pattern",
+        action="append",
+        default=[],
+        help="SAN pattern for --count, e.g. 'user{n}@example.com' (repeatable)"
+    )
+    parser.add_argument(
+        "--base-dir",
+        type=Path,
+        default=BD,
+        help="demo-cfssl directory (default: $DEMO_CFSSL_DIR or ~/.config/demo-cfssl)"
+    )
+    parser.add_argument(
+        "--profile",
+        help="Signing profile from profiles.json (default: server, email or client)"
+    )
+    parser.add_argument(
+        "--template",
+        type=Path,
+        help="CSR JSON template (default: 02_host.json or 03_email.json in the base dir)"
+    )
+    parser.add_argument(
+        "--key-pool",
+        action="store_true",
+        help="Take keys from the pre-generated pool (passphrase: $ISSUER_KEYPOOL_PASSWORD[_FILE])"
+    )
+    parser.add_argument(
+        "--partitioned-crl",
+        action="store_true",
+        help="Stamp the CRL DP of each certificate's CRL shard (crl/ica/partitions.json)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Reissue certificates that are still valid"
+    )
+    parser.add_argument(
+        "--workers", "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of issuing processes (default: CPU count)"
+    )
+    args = parser.parse_args(argv)
+
+    sources = [args.name is not None, args.manifest is not None, args.count is not None]
+    if sum(sources) != 1:
+        parser.error("give exactly one of NAME, --manifest or --count")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        passphrase = read_passphrase() if args.key_pool else None
+        if args.key_pool and not passphrase:
+            raise RuntimeError("--key-pool needs ISSUER_KEYPOOL_PASSWORD or ISSUER_KEYPOOL_PASSWORD_FILE")
+        issuer_args = (args.kind, args.base_dir, args.profile, args.template, None, None,
+                       passphrase, args.partitioned_crl)
+        # Fail fast on unusable CA material before starting the pool
+        issuer = Issuer(*issuer_args)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    def iter_jobs() -> Iterator[tuple[str, list[str]]]:
+        if args.name is not None:
+            yield args.name, args.sans
+        elif args.count is not None:
+            yield from generate_jobs(args.count, args.pattern, args.san_pattern)
+        elif args.manifest == '-':
+            yield from read_manifest(sys.stdin)
+        else:
+            with open(args.manifest, encoding='utf-8') as f:
+                yield from read_manifest(f)
+
+    if args.name is not None:
+        # A single certificate is issued in-process: no pool start-up cost
+        results: Iterable[dict] = [issue_one(issuer, args.name, args.sans, args.force)]
+    else:
+        results = run_issue(iter_jobs(), args.workers, (issuer_args, args.force))
+
+    counts: dict[str, int] = {}
+    start = time.perf_counter()
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        print(json.dumps(result), flush=True)
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    print(f"{total} certificates in {elapsed:.1f}s: "
+          + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())), file=sys.stderr)
+    return 1 if counts.get("error") else 0
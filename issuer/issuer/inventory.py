@@ -0,0 +1,337 @@
+"""
+Certificate inventory: a SQLite index of every certificate under ``$BD``.
+
+``steps.sh`` decides whether to reissue by running ``openssl x509 -enddate``
+on each certificate, and ``x509info`` spawns several more ``openssl``
+processes per certificate. The inventory records serial, subject, SANs,
+issuer, validity, fingerprint, path and mtime of every ``cert.pem`` under
+``hosts/``, ``smime/``, ``smime-openssl/``, ``tls-clients/`` and ``tsa/``.
+Expiry and reissue checks then become queries.
+
+Rescans are incremental: a file is only parsed again when its mtime or size
+changed, and rows of deleted files are dropped. The database uses WAL mode,
+so queries (e.g. from the renewal daemon) do not block a rescan.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from .config import BD
+
+INVENTORY_FILE = "inventory.sqlite"
+
+# Top-level directories of the steps.sh layout: <dir>/<name>/cert.pem
+CERT_DIRS = ("hosts", "smime", "smime-openssl", "tls-clients", "tsa")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS certs (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    serial TEXT,
+    subject TEXT,
+    common_name TEXT,
+    sans TEXT,
+    issuer TEXT,
+    not_before INTEGER,
+    not_after INTEGER,
+    fingerprint TEXT,
+    key_type TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS certs_not_after ON certs (not_after);
+CREATE INDEX IF NOT EXISTS certs_serial ON certs (serial);
+CREATE INDEX IF NOT EXISTS certs_fingerprint ON certs (fingerprint);
+"""
+
+_COLUMNS = ("path", "kind", "name", "mtime_ns", "size", "serial", "subject", "common_name",
+            "sans", "issuer", "not_before", "not_after", "fingerprint", "key_type", "error")
+
+
+def _san_strings(cert: x509.Certificate) -> list[str]:
+    try:
+        sans = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        return []
+    values = []
+    for name in sans:
+        if isinstance(name, x509.DNSName):
+            values.append(f"DNS:{name.value}")
+        elif isinstance(name, x509.IPAddress):
+            values.append(f"IP:{name.value}")
+        elif isinstance(name, x509.RFC822Name):
+            values.append(f"email:{name.value}")
+        elif isinstance(name, x509.UniformResourceIdentifier):
+            values.append(f"URI:{name.value}")
+    return values
+
+
+def _key_type(cert: x509.Certificate) -> str:
+    key = cert.public_key()
+    if isinstance(key, ec.EllipticCurvePublicKey):
+        return f"ecdsa-{key.curve.key_size}"
+    if isinstance(key, rsa.RSAPublicKey):
+        return f"rsa-{key.key_size}"
+    return type(key).__name__
+
+
+def parse_cert_file(data: bytes) -> dict:
+    """Inventory columns of a PEM certificate (the first one in the file)."""
+    cert = x509.load_pem_x509_certificate(data)
+    cn = cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+    return {
+        "serial": format(cert.serial_number, 'x'),
+        "subject": cert.subject.rfc4514_string(),
+        "common_name": cn[0].value if cn else None,
+        "sans": json.dumps(_san_strings(cert)),
+        "issuer": cert.issuer.rfc4514_string(),
+        "not_before": int(cert.not_valid_before_utc.timestamp()),
+        "not_after": int(cert.not_valid_after_utc.timestamp()),
+        "fingerprint": cert.fingerprint(hashes.SHA256()).hex(),
+        "key_type": _key_type(cert),
+        "error": None,
+    }
+
+
+def _isoformat(ts: Optional[int]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else None
+
+
+class Inventory:
+    """SQLite index of the certificates in a demo-cfssl base directory."""
+
+    def __init__(self, base_dir: Path = BD, db_path: Optional[Path] = None):
+        """
+        Args:
+            base_dir: demo-cfssl base directory
+            db_path: Index file (default ``base_dir/inventory.sqlite``)
+
+        Raises:
+            RuntimeError: If the database cannot be opened
+        """
+        self.base_dir = base_dir
+        self.db_path = db_path or base_dir / INVENTORY_FILE
+        try:
+            self.db = sqlite3.connect(self.db_path, timeout=30)
+            self.db.row_factory = sqlite3.Row
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Failed to open inventory {self.db_path}: {e}")
+
+    def _cert_files(self) -> Iterator[tuple[str, str, str, os.stat_result]]:
+        """Yield (relative path, kind, name, stat) for every cert.pem in the layout."""
+        for kind in CERT_DIRS:
+            top = self.base_dir / kind
+            if not top.is_dir():
+                continue
+            with os.scandir(top) as entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        continue
+                    try:
+                        st = os.stat(os.path.join(entry.path, "cert.pem"))
+                    except FileNotFoundError:
+                        continue
+                    yield f"{kind}/{entry.name}/cert.pem", kind, entry.name, st
+
+    def scan(self) -> dict:
+        """
+        Bring the index up to date with the files on disk.
+
+        Returns:
+            Counts of added, updated, removed and unchanged entries
+        """
+        start = time.perf_counter()
+        known = {row["path"]: (row["mtime_ns"], row["size"])
+                 for row in self.db.execute("SELECT path, mtime_ns, size FROM certs")}
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "errors": 0}
+        rows = []
+        for path, kind, name, st in self._cert_files():
+            previous = known.pop(path, None)
+            if previous == (st.st_mtime_ns, st.st_size):
+                counts["unchanged"] += 1
+                continue
+            counts["added" if previous is None else "updated"] += 1
+            row = {"path": path, "kind": kind, "name": name,
+                   "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+            try:
+                row.update(parse_cert_file((self.base_dir / path).read_bytes()))
+            except (OSError, ValueError) as e:
+                counts["errors"] += 1
+                row.update({column: None for column in _COLUMNS if column not in row})
+                row["error"] = f"{type(e).__name__}: {e}"
+            rows.append(row)
+
+        with self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO certs ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + c for c in _COLUMNS)})", rows)
+            self.db.executemany("DELETE FROM certs WHERE path = ?", [(p,) for p in known])
+        counts["removed"] = len(known)
+        counts["total"] = counts["added"] + counts["updated"] + counts["unchanged"]
+        counts["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return counts
+
+    def query(self, kind: Optional[str] = None, name: Optional[str] = None,
+              serial: Optional[str] = None, fingerprint: Optional[str] = None,
+              expires_before: Optional[datetime] = None,
+              limit: Optional[int] = None) -> list[dict]:
+        """
+        Entries matching all given filters, soonest expiry first.
+
+        ``name`` matches the folder name or the CN and may contain ``%`` wildcards.
+        """
+        where, params = [], []
+        if kind is not None:
+            where.append("kind = ?")
+            params.append(kind)
+        if name is not None:
+            where.append("(name LIKE ? OR common_name LIKE ?)")
+            params += [name, name]
+        if serial is not None:
+            where.append("serial = ?")
+            params.append(serial.lower().lstrip('0') or '0')
+        if fingerprint is not None:
+            where.append("fingerprint = ?")
+            params.append(fingerprint.lower().replace(':', ''))
+        if expires_before is not None:
+            where.append("not_after < ?")
+            params.append(int(expires_before.timestamp()))
+        sql = "SELECT * FROM certs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY not_after IS NULL, not_after, path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self.to_dict(row) for row in self.db.execute(sql, params)]
+
+    def stats(self, now: Optional[datetime] = None, soon: timedelta = timedelta(days=30)) -> dict:
+        """Counts per kind: total, expired and expiring within ``soon``."""
+        now_ts = int((now or datetime.now(timezone.utc)).timestamp())
+        result = {}
+        for row in self.db.execute(
+                "SELECT kind, COUNT(*) AS total, "
+                "SUM(not_after < ?) AS expired, "
+                "SUM(not_after >= ? AND not_after < ?) AS expiring, "
+                "SUM(error IS NOT NULL) AS errors "
+                "FROM certs GROUP BY kind ORDER BY kind",
+                (now_ts, now_ts, now_ts + int(soon.total_seconds()))):
+            result[row["kind"]] = {key: row[key] or 0
+                                   for key in ("total", "expired", "expiring", "errors")}
+        return result
+
+    def to_dict(self, row: sqlite3.Row) -> dict:
+        """JSON-friendly form of a row: absolute paths, ISO dates, SAN list."""
+        entry = dict(row)
+        entry["path"] = str(self.base_dir / row["path"])
+        entry["dir"] = str((self.base_dir / row["path"]).parent)
+        entry["sans"] = json.loads(row["sans"]) if row["sans"] else []
+        entry["not_before"] = _isoformat(row["not_before"])
+        entry["not_after"] = _isoformat(row["not_after"])
+        del entry["mtime_ns"], entry["size"]
+        if entry["error"] is None:
+            del entry["error"]
+        return entry
+
+    def close(self):
+        self.db.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer inventory``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer inventory",
+        description="Index the certificates under the demo-cfssl directory and query them (JSON output)"
+    )
+    parser.add_argument(
+        "action",
+        choices=["scan", "list", "stats"],
+        help="scan: update the index; list: print matching certificates; stats: counts per kind"
+    )
+    parser.add_argument(
+        "--kind",
+        choices=CERT_DIRS,
+        help="list: only certificates under this directory"
+    )
+    parser.add_argument(
+        "--name",
+        help="list: folder name or CN (SQL LIKE pattern, e.g. 'load-%%')"
+    )
+    parser.add_argument(
+        "--serial",
+        help="list: serial number in hex"
+    )
+    parser.add_argument(
+        "--fingerprint",
+        help="list: SHA-256 fingerprint in hex"
+    )
+    parser.add_argument(
+        "--expires-within",
+        type=float,
+        metavar="DAYS",
+        help="list: only certificates expiring within DAYS (0 = already expired)"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="list: at most this many entries"
+    )
+    parser.add_argument(
+        "--no-scan",
+        action="store_true",
+        help="list, stats: query the index as is, without an incremental rescan first"
+    )
+    parser.add_argument(
+        "--base-dir",
+        type=Path,
+        default=BD,
+        help="demo-cfssl directory (default: $DEMO_CFSSL_DIR or ~/.config/demo-cfssl)"
+    )
+    parser.add_argument(
+        "--db",
+        type=Path,
+        help="Index file (default: <base-dir>/inventory.sqlite)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        inventory = Inventory(args.base_dir, args.db)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    try:
+        if args.action == "scan" or not args.no_scan:
+            counts = inventory.scan()
+            if args.action == "scan":
+                print(json.dumps(counts))
+                return 0
+
+        if args.action == "stats":
+            print(json.dumps(inventory.stats()))
+            return 0
+
+        expires_before = None
+        if args.expires_within is not None:
+            expires_before = datetime.now(timezone.utc) + timedelta(days=args.expires_within)
+        for entry in inventory.query(args.kind, args.name, args.serial, args.fingerprint,
+                                     expires_before, args.limit):
+            print(json.dumps(entry))
+        return 0
+    finally:
+        inventory.close()
@@ -0,0 +1,330 @@
+"""
+Pre-generated key pool: keys ready before they are needed.
+
+Key generation dominates issuance (an RSA-2048 key takes tens to hundreds of
+milliseconds, RSA-4096 seconds). The pool keeps a number of keys per
+algorithm/size ready on disk, refilled in background processes by
+``issuer keypool run``; ``issuer issue --key-pool`` takes keys from it and
+only generates on demand when a slot is empty.
+
+Layout under ``$DEMO_CFSSL_DIR/keypool``::
+
+    keypool/
+    ├── salt                 (scrypt salt, created on first use)
+    ├── check                (detects a wrong passphrase)
+    ├── ecdsa-384/
+    │   ├── <random>.key     (nonce + AES-256-GCM encrypted PKCS#8 DER)
+    │   └── ...
+    └── rsa-2048/
+
+Keys are encrypted at rest with a key derived once per process from the
+pool passphrase (``ISSUER_KEYPOOL_PASSWORD`` or a password file), so taking
+a key costs a rename, a read and an AES-GCM decryption. A key is claimed by
+renaming its file, which succeeds for exactly one taker, so several
+issuers can share one pool.
+"""
+
+import argparse
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+from .config import BD
+from .request import PrivateKey, generate_key
+
+logger = logging.getLogger(__name__)
+
+KEYPOOL_DIR = "keypool"
+_NONCE_SIZE = 12
+_CHECK_PLAINTEXT = b"issuer keypool"
+
+
+def read_passphrase(password_file: Optional[Path] = None) -> Optional[bytes]:
+    """Pool passphrase from a file, or ``ISSUER_KEYPOOL_PASSWORD[_FILE]``."""
+    password_file = password_file or os.getenv("ISSUER_KEYPOOL_PASSWORD_FILE")
+    if password_file:
+        return Path(password_file).read_bytes().strip()
+    password = os.getenv("ISSUER_KEYPOOL_PASSWORD")
+    return password.encode() if password else None
+
+
+def parse_slot(value: str) -> tuple[str, int]:
+    """
+    Parse ``ecdsa-384`` or ``rsa-2048`` into (algo, size).
+
+    Raises:
+        ValueError: If the value is malformed
+    """
+    algo, sep, size = value.partition('-')
+    if not sep or not size.isdigit() or algo not in ("ecdsa", "rsa"):
+        raise ValueError(f"Invalid key slot '{value}' (expected e.g. ecdsa-384 or rsa-2048)")
+    return algo, int(size)
+
+
+def parse_targets(values: list[str]) -> dict[tuple[str, int], int]:
+    """
+    Parse ``SLOT=COUNT`` items (comma-separated or repeated).
+
+    Raises:
+        ValueError: If an item is malformed
+    """
+    targets = {}
+    for value in values:
+        for item in value.split(','):
+            slot, sep, count = item.strip().partition('=')
+            if not sep or not count.isdigit():
+                raise ValueError(f"Invalid target '{item}' (expected e.g. rsa-2048=500)")
+            targets[parse_slot(slot)] = int(count)
+    return targets
+
+
+class KeyPool:
+    """Encrypted on-disk pool of pre-generated private keys."""
+
+    def __init__(self, directory: Path, passphrase: bytes):
+        """
+        Args:
+            directory: Pool directory (created if missing)
+            passphrase: Passphrase the keys are encrypted with
+
+        Raises:
+            RuntimeError: If the passphrase is empty or does not match the pool
+        """
+        if not passphrase:
+            raise RuntimeError("A key pool passphrase is required (ISSUER_KEYPOOL_PASSWORD)")
+        self.directory = directory
+        directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+
+        salt = self._read_or_create(directory / "salt", lambda: secrets.token_bytes(16))
+        kdf = Scrypt(salt=salt, length=32, n=2**14, r=8, p=1)
+        self._aead = AESGCM(kdf.derive(passphrase))
+
+        check = self._read_or_create(directory / "check",
+                                     lambda: self._encrypt(_CHECK_PLAINTEXT, b"check"))
+        try:
+            self._decrypt(check, b"check")
+        except InvalidTag:
+            raise RuntimeError(f"Wrong passphrase for key pool {directory}")
+
+    @staticmethod
+    def _read_or_create(path: Path, make) -> bytes:
+        # O_EXCL so concurrent first users agree on one value
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            return path.read_bytes()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(make())
+        return path.read_bytes()
+
+    def _encrypt(self, data: bytes, aad: bytes) -> bytes:
+        nonce = secrets.token_bytes(_NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, data, aad)
+
+    def _decrypt(self, blob: bytes, aad: bytes) -> bytes:
+        return self._aead.decrypt(blob[:_NONCE_SIZE], blob[_NONCE_SIZE:], aad)
+
+    def slot_dir(self, algo: str, size: int) -> Path:
+        return self.directory / f"{algo}-{size}"
+
+    def count(self, algo: str, size: int) -> int:
+        """Number of keys ready in a slot."""
+        slot = self.slot_dir(algo, size)
+        if not slot.is_dir():
+            return 0
+        return sum(1 for entry in os.scandir(slot) if entry.name.endswith(".key"))
+
+    def status(self) -> dict[str, int]:
+        """Ready keys per slot name."""
+        return {entry.name: self.count(*parse_slot(entry.name))
+                for entry in sorted(os.scandir(self.directory), key=lambda e: e.name)
+                if entry.is_dir()}
+
+    def put(self, key: PrivateKey, algo: str, size: int):
+        """Encrypt and store a key in its slot."""
+        slot = self.slot_dir(algo, size)
+        slot.mkdir(exist_ok=True, mode=0o700)
+        der = key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+        name = secrets.token_hex(16)
+        tmp = slot / f".{name}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self._encrypt(der, slot.name.encode()))
+        os.replace(tmp, slot / f"{name}.key")
+
+    def take(self, algo: str, size: int) -> Optional[PrivateKey]:
+        """
+        Remove and return one key from a slot, or None if it is empty.
+
+        Raises:
+            RuntimeError: If a claimed key cannot be decrypted
+        """
+        slot = self.slot_dir(algo, size)
+        if not slot.is_dir():
+            return None
+        with os.scandir(slot) as entries:
+            names = [entry.name for entry in entries if entry.name.endswith(".key")]
+        for name in names:
+            claimed = slot / f".{name}.{os.getpid()}.taken"
+            try:
+                os.rename(slot / name, claimed)
+            except FileNotFoundError:
+                continue  # another issuer took it first
+            try:
+                der = self._decrypt(claimed.read_bytes(), slot.name.encode())
+            except InvalidTag:
+                raise RuntimeError(f"Corrupt key in pool: {slot / name}")
+            finally:
+                claimed.unlink(missing_ok=True)
+            # The key is ours and authenticated by AES-GCM; the RSA consistency
+            # check would cost more than everything else in issuance
+            return serialization.load_der_private_key(der, None,
+                                                      unsafe_skip_rsa_key_validation=True)
+        return None
+
+    def missing(self, targets: dict[tuple[str, int], int],
+                low_water: float = 1.0) -> dict[tuple[str, int], int]:
+        """
+        Keys to generate per slot to reach ``targets``.
+
+        A slot is only topped up once it dropped below ``low_water * target``.
+        """
+        missing = {}
+        for (algo, size), target in targets.items():
+            have = self.count(algo, size)
+            if have < target * low_water:
+                missing[(algo, size)] = target - have
+        return missing
+
+
+# Per-process pool, set up by _init_worker
+_pool: Optional[KeyPool] = None
+
+
+def _init_worker(directory: Path, passphrase: bytes):
+    global _pool
+    # Ctrl-C is handled by the daemon loop, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _pool = KeyPool(directory, passphrase)
+
+
+def _generate_one(algo: str, size: int) -> float:
+    """Generate and store one key; returns the generation time in ms."""
+    start = time.perf_counter()
+    _pool.put(generate_key(algo, size), algo, size)
+    return (time.perf_counter() - start) * 1000
+
+
+def refill(executor: ProcessPoolExecutor, missing: dict[tuple[str, int], int]) -> dict:
+    """Generate the missing keys on ``executor``; returns per-slot counts and timings."""
+    futures = {slot: [executor.submit(_generate_one, *slot) for _ in range(count)]
+               for slot, count in missing.items()}
+    report = {}
+    for (algo, size), slot_futures in futures.items():
+        durations = [f.result() for f in slot_futures]
+        report[f"{algo}-{size}"] = {
+            "generated": len(durations),
+            "avg_ms": round(sum(durations) / len(durations), 1) if durations else 0.0,
+        }
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer keypool``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer keypool",
+        description="Maintain the encrypted pool of pre-generated keys"
+    )
+    parser.add_argument(
+        "action",
+        choices=["status", "fill", "run"],
+        help="status: print ready keys; fill: top up once; run: keep topping up in the background"
+    )
+    parser.add_argument(
+        "--target",
+        action="append",
+        default=[],
+        help="Keys to keep ready per slot, e.g. 'ecdsa-384=1000,rsa-2048=500' (repeatable)"
+    )
+    parser.add_argument(
+        "--low-water",
+        type=float,
+        default=0.5,
+        help="run: refill a slot once it drops below this fraction of its target (default: 0.5)"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="run: seconds between checks (default: 2)"
+    )
+    parser.add_argument(
+        "--pool-dir",
+        type=Path,
+        default=BD / KEYPOOL_DIR,
+        help="Pool directory (default: $DEMO_CFSSL_DIR/keypool)"
+    )
+    parser.add_argument(
+        "--password-file",
+        type=Path,
+        help="File with the pool passphrase (default: $ISSUER_KEYPOOL_PASSWORD[_FILE])"
+    )
+    parser.add_argument(
+        "--workers", "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of key generating processes (default: CPU count)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        targets = parse_targets(args.target)
+        pool = KeyPool(args.pool_dir, read_passphrase(args.password_file))
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if args.action != "status" and not targets:
+        parser.error("give at least one --target")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if args.action == "status":
+        print(json.dumps({"pool": str(pool.directory), "slots": pool.status()}))
+        return 0
+
+    passphrase = read_passphrase(args.password_file)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(pool.directory, passphrase)) as executor:
+        if args.action == "fill":
+            report = refill(executor, pool.missing(targets))
+            print(json.dumps({"refilled": report, "slots": pool.status()}))
+            return 0
+
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        logger.info(f"Key pool {pool.directory}: keeping "
+                    + ", ".join(f"{a}-{s}={n}" for (a, s), n in targets.items()) + " ready")
+        try:
+            while True:
+                missing = pool.missing(targets, args.low_water)
+                if missing:
+                    start = time.perf_counter()
+                    report = refill(executor, missing)
+                    logger.info(f"Refilled {report} in {time.perf_counter() - start:.1f}s")
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            logger.info("Shutting down...")
+    return 0
@@ -0,0 +1,123 @@
+"""
+CRL partitioning: which CRL shard covers a certificate.
+
+A partitioned CA publishes several small CRLs instead of one that grows
+without bound. Each shard has its own Issuing Distribution Point. Every
+certificate carries the CRL Distribution Point of its shard, so a relying
+party only fetches the shard that covers it. The partitioning is stored in
+``crl/<ca>/partitions.json``. The CRL generator (:mod:`issuer.crl`) and the
+issuance flow (``issuer issue --partitioned-crl``) read that same file, so
+the URL stamped into a certificate is always the URL its shard is published at.
+
+Schemes:
+
+- ``hash``: ``count`` shards by a hash of the serial number (uniform, static)
+- ``month``: one shard per expiry month (``YYYY-MM``). With fixed profile
+  lifetimes this is the issuance period shifted by the lifetime.
+  ``index.txt`` records the expiry, not the issuance date, so the shard
+  can be recomputed from it. Shards of past months only cover expired
+  certificates and are no longer published.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from cryptography import x509
+
+PARTITIONS_FILE = "partitions.json"
+
+SCHEMES = ("hash", "month")
+
+
+class CrlPartitioning:
+    """Maps certificates to CRL shards and shards to their URLs."""
+
+    def __init__(self, scheme: str, url_template: str, count: Optional[int] = None):
+        """
+        Args:
+            scheme: ``hash`` or ``month``
+            url_template: Shard URL with a ``{shard}`` placeholder
+            count: Number of shards (``hash`` only)
+
+        Raises:
+            ValueError: If the scheme, count or template is invalid
+        """
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown partition scheme: {scheme} (expected one of {', '.join(SCHEMES)})")
+        if scheme == "hash" and (count is None or count < 1):
+            raise ValueError("The hash scheme needs a shard count of at least 1")
+        if "{shard}" not in url_template:
+            raise ValueError(f"URL template has no {{shard}} placeholder: {url_template}")
+        self.scheme = scheme
+        self.url_template = url_template
+        self.count = count if scheme == "hash" else None
+
+    @classmethod
+    def load(cls, crl_dir: Path) -> Optional['CrlPartitioning']:
+        """
+        The partitioning of a CA's CRL directory, or None if it is not partitioned.
+
+        Raises:
+            RuntimeError: If the file exists but is invalid
+        """
+        path = crl_dir / PARTITIONS_FILE
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Failed to load {path}: {e}")
+        try:
+            return cls(data["scheme"], data["url"], data.get("count"))
+        except (KeyError, TypeError, ValueError) as e:
+            raise RuntimeError(f"Invalid partitioning in {path}: {e}")
+
+    def to_dict(self) -> dict:
+        data = {"scheme": self.scheme, "url": self.url_template}
+        if self.count is not None:
+            data["count"] = self.count
+        return data
+
+    def shard_of(self, serial: int, not_after: datetime) -> str:
+        """Shard id of a certificate."""
+        if self.scheme == "month":
+            return not_after.strftime("%Y-%m")
+        # Hashed, so sequential serials (openssl ca) spread evenly too
+        digest = hashlib.sha256(serial.to_bytes((serial.bit_length() + 7) // 8 or 1, 'big')).digest()
+        return f"{int.from_bytes(digest[:8]) % self.count:02d}"
+
+    def url(self, shard: str) -> str:
+        return self.url_template.format(shard=shard)
+
+    def url_for(self, serial: int, not_after: datetime) -> str:
+        """CRL Distribution Point URL to stamp into a certificate."""
+        return self.url(self.shard_of(serial, not_after))
+
+    def shards(self, now: datetime, until: datetime) -> list[str]:
+        """
+        Shards to publish: all hash shards, or the months from ``now`` to
+        ``until`` (the CA's expiry; no certificate outlives it).
+        """
+        if self.scheme == "hash":
+            return [f"{n:02d}" for n in range(self.count)]
+        months = []
+        year, month = now.year, now.month
+        while (year, month) <= (until.year, until.month):
+            months.append(f"{year:04d}-{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+
+    def distribution_point(self, shard: str) -> x509.IssuingDistributionPoint:
+        """Issuing Distribution Point of a shard CRL."""
+        return x509.IssuingDistributionPoint(
+            full_name=[x509.UniformResourceIdentifier(self.url(shard))],
+            relative_name=None,
+            only_contains_user_certs=False,
+            only_contains_ca_certs=False,
+            only_some_reasons=None,
+            indirect_crl=False,
+            only_contains_attribute_certs=False,
+        )
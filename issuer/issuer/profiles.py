@@ -0,0 +1,129 @@
+"""cfssl signing profiles (``profiles.json``) as certificate extensions."""
+
+import json
+import logging
+import re
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+
+from cryptography import x509
+from cryptography.x509.oid import ExtendedKeyUsageOID
+
+logger = logging.getLogger(__name__)
+
+# cfssl usage names -> x509.KeyUsage arguments
+KEY_USAGES = {
+    "signing": "digital_signature",
+    "digital signature": "digital_signature",
+    "content commitment": "content_commitment",
+    "key encipherment": "key_encipherment",
+    "key agreement": "key_agreement",
+    "data encipherment": "data_encipherment",
+    "cert sign": "key_cert_sign",
+    "crl sign": "crl_sign",
+    "encipher only": "encipher_only",
+    "decipher only": "decipher_only",
+}
+
+# cfssl usage names -> Extended Key Usage OIDs
+EXT_KEY_USAGES = {
+    "any": ExtendedKeyUsageOID.ANY_EXTENDED_KEY_USAGE,
+    "server auth": ExtendedKeyUsageOID.SERVER_AUTH,
+    "client auth": ExtendedKeyUsageOID.CLIENT_AUTH,
+    "code signing": ExtendedKeyUsageOID.CODE_SIGNING,
+    "email protection": ExtendedKeyUsageOID.EMAIL_PROTECTION,
+    "s/mime": ExtendedKeyUsageOID.EMAIL_PROTECTION,
+    "timestamping": ExtendedKeyUsageOID.TIME_STAMPING,
+    "ocsp signing": ExtendedKeyUsageOID.OCSP_SIGNING,
+}
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(h|m|s)')
+
+
+def parse_duration(value: str) -> timedelta:
+    """
+    Parse a Go duration as used by cfssl (e.g. ``8760h``, ``1h30m``).
+
+    Raises:
+        ValueError: If the value is not a duration
+    """
+    value = value.strip()
+    parts = _DURATION_PART.findall(value)
+    if not parts or ''.join(n + u for n, u in parts) != value:
+        raise ValueError(f"Invalid duration: {value!r}")
+    seconds = sum(float(n) * {"h": 3600, "m": 60, "s": 1}[u] for n, u in parts)
+    return timedelta(seconds=seconds)
+
+
+class Profile:
+    """One cfssl signing profile: usages, lifetime, CA constraint and URLs."""
+
+    def __init__(self, name: str, spec: dict, default: Optional[dict] = None):
+        """
+        Args:
+            name: Profile name (e.g. ``server``)
+            spec: Profile object from ``profiles.json``
+            default: The ``signing.default`` object supplying missing values
+
+        Raises:
+            ValueError: If the expiry cannot be parsed
+        """
+        default = default or {}
+        self.name = name
+        self.usages = list(spec.get("usages", default.get("usages", [])))
+        self.expiry = parse_duration(spec.get("expiry", default.get("expiry", "8760h")))
+
+        constraint = spec.get("ca_constraint", {})
+        self.is_ca = bool(constraint.get("is_ca", False))
+        self.max_path_len: Optional[int] = constraint.get("max_path_len")
+        if self.max_path_len == 0 and not constraint.get("max_path_len_zero", False):
+            # cfssl treats 0 as "unset" unless max_path_len_zero is given
+            self.max_path_len = None
+
+        # Optional URLs (see ocsp/add_ocsp_to_profiles.sh)
+        self.ocsp_url: Optional[str] = spec.get("ocsp_url", default.get("ocsp_url"))
+        self.crl_url: Optional[str] = spec.get("crl_url", default.get("crl_url"))
+        self.issuer_urls: list[str] = list(spec.get("issuer_urls", default.get("issuer_urls", [])))
+
+        unknown = [u for u in self.usages if u not in KEY_USAGES and u not in EXT_KEY_USAGES]
+        if unknown:
+            # cfssl silently skips these too (e.g. the "digital signing" typo)
+            logger.debug(f"Profile '{name}': ignoring unknown usages {unknown}")
+
+    def key_usage(self) -> x509.KeyUsage:
+        """KeyUsage extension value for this profile."""
+        flags = {arg: False for arg in set(KEY_USAGES.values())}
+        for usage in self.usages:
+            if usage in KEY_USAGES:
+                flags[KEY_USAGES[usage]] = True
+        return x509.KeyUsage(**flags)
+
+    def extended_key_usage(self) -> Optional[x509.ExtendedKeyUsage]:
+        """ExtendedKeyUsage extension value, or None if the profile has none."""
+        oids = []
+        for usage in self.usages:
+            oid = EXT_KEY_USAGES.get(usage)
+            if oid is not None and oid not in oids:
+                oids.append(oid)
+        return x509.ExtendedKeyUsage(oids) if oids else None
+
+    def __repr__(self) -> str:
+        return f"Profile(name={self.name!r}, usages={self.usages}, expiry={self.expiry})"
+
+
+def load_profiles(path: Path) -> dict[str, Profile]:
+    """
+    Load all signing profiles from a cfssl ``profiles.json``.
+
+    Raises:
+        RuntimeError: If the file cannot be read or parsed
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            signing = json.load(f)["signing"]
+        default = signing.get("default", {})
+        return {name: Profile(name, spec, default)
+                for name, spec in signing.get("profiles", {}).items()}
+    except (OSError, KeyError, ValueError) as e:
+        raise RuntimeError(f"Failed to load profiles from {path}: {e}")
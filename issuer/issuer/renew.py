@@ -0,0 +1,324 @@
+"""
+Renewal daemon: re-issue certificates before they expire, in batches.
+
+Each pass rescans the inventory (see :mod:`issuer.inventory`) and picks the
+certificates of ``hosts/``, ``smime/`` and ``tls-clients/`` that expire
+within the renewal window. They are re-issued from their ``cfg.json`` (same
+CN, SANs and key type) on a process pool, in batches of ``--batch-size``
+with a pause between batches. After every batch that renewed something,
+the reload hook runs once, not once per certificate. A thousand
+renewals then cost ten proxy reloads instead of a thousand.
+
+Every file is written to a temporary name and renamed into place (see
+:func:`issuer.engine.write_atomic`), so a proxy reloading at any moment sees
+either the old or the new bundle, never a partial one. The hook only runs
+after the whole batch, when keys and certificates match again.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from .config import BD
+from .engine import Issuer, issue_one
+from .inventory import Inventory
+from .keypool import read_passphrase
+from .request import CertRequest
+
+logger = logging.getLogger(__name__)
+
+# Inventory directory -> issuer kind (tsa/ and smime-openssl/ are not ours to renew)
+RENEWABLE = {"hosts": "host", "smime": "email", "tls-clients": "client"}
+
+
+def renewal_request(entry: dict) -> tuple[str, list[str], Optional[dict]]:
+    """
+    CN, SANs and request template to re-issue an inventory entry with.
+
+    The entry's ``cfg.json`` is preferred, so the key type and subject stay
+    as issued; without it the kind's template is used with the CN and SANs
+    of the current certificate.
+    """
+    cfg = Path(entry["dir"]) / "cfg.json"
+    try:
+        spec = json.loads(cfg.read_text(encoding='utf-8'))
+        return spec["CN"], [h for h in spec.get("hosts", []) if h], spec
+    except (OSError, ValueError, KeyError):
+        sans = [san.split(':', 1)[1] for san in entry["sans"]]
+        return entry["common_name"] or entry["name"], sans, None
+
+
+# Per-process issuers (one per kind), created on first use
+_issuers: dict[str, Issuer] = {}
+_base_dir: Path = BD
+_key_pool_passphrase: Optional[bytes] = None
+_partitioned_crl = False
+
+
+def _init_worker(base_dir: Path, key_pool_passphrase: Optional[bytes], partitioned_crl: bool):
+    global _base_dir, _key_pool_passphrase, _partitioned_crl
+    # Ctrl-C / SIGTERM are handled by the daemon loop, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _base_dir = base_dir
+    _key_pool_passphrase = key_pool_passphrase
+    _partitioned_crl = partitioned_crl
+
+
+def _renew_one(kind: str, name: str, sans: list[str], spec: Optional[dict]) -> dict:
+    """Re-issue one certificate in a worker; never raises."""
+    if kind not in _issuers:
+        try:
+            _issuers[kind] = Issuer(kind, _base_dir, key_pool_passphrase=_key_pool_passphrase,
+                                    partitioned_crl=_partitioned_crl)
+        except Exception as e:
+            return {"kind": kind, "name": name, "status": "error",
+                    "error": f"{type(e).__name__}: {e}", "pid": os.getpid()}
+    try:
+        template = CertRequest(spec) if spec is not None else None
+    except ValueError as e:
+        return {"kind": kind, "name": name, "status": "error",
+                "error": f"Invalid cfg.json: {e}", "pid": os.getpid()}
+    return issue_one(_issuers[kind], name, sans, force=True, template=template)
+
+
+class Renewer:
+    """Finds certificates due for renewal and re-issues them batch by batch."""
+
+    def __init__(self, base_dir: Path, window: timedelta, kinds: list[str],
+                 batch_size: int = 100, batch_pause: float = 0.0,
+                 hook: Optional[str] = None, dry_run: bool = False):
+        """
+        Args:
+            base_dir: demo-cfssl base directory
+            window: Renew certificates expiring within this period
+            kinds: Inventory directories to renew (keys of :data:`RENEWABLE`)
+            batch_size: Certificates per batch (one hook run per batch)
+            batch_pause: Seconds to wait between batches
+            hook: Shell command run after each batch that renewed something
+            dry_run: Only report what would be renewed
+
+        Raises:
+            RuntimeError: If the inventory cannot be opened
+        """
+        self.base_dir = base_dir
+        self.window = window
+        self.kinds = kinds
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.hook = hook
+        self.dry_run = dry_run
+        self.inventory = Inventory(base_dir)
+        # path -> serial we issued; if that serial is due again, renewing cannot help
+        self._issued: dict[str, str] = {}
+
+    def due(self) -> list[dict]:
+        """Rescan the inventory and return entries within the renewal window."""
+        self.inventory.scan()
+        expires_before = datetime.now(timezone.utc) + self.window
+        entries = []
+        for kind in self.kinds:
+            for entry in self.inventory.query(kind=kind, expires_before=expires_before):
+                if "error" in entry:
+                    continue
+                if self._issued.get(entry["path"]) == entry["serial"]:
+                    logger.warning(f"{entry['path']} is still due right after renewal "
+                                   f"(expires {entry['not_after']}; CA expiring?), skipping")
+                    continue
+                entries.append(entry)
+        entries.sort(key=lambda e: e["not_after"])
+        return entries
+
+    def run_hook(self, renewed: list[dict]) -> Optional[int]:
+        """Run the reload hook for a batch; returns its exit status."""
+        if not self.hook:
+            return None
+        env = dict(os.environ,
+                   ISSUER_RENEWED_COUNT=str(len(renewed)),
+                   ISSUER_RENEWED_DIRS="\n".join(r["dir"] for r in renewed))
+        start = time.perf_counter()
+        status = subprocess.run(self.hook, shell=True, env=env).returncode
+        logger.info(f"Reload hook exited with {status} "
+                    f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+        return status
+
+    def run_once(self, executor: ProcessPoolExecutor) -> dict:
+        """
+        One renewal pass; per-certificate results are printed as JSON lines.
+
+        Returns:
+            Summary with due, renewed, failed, batches and hook failures
+        """
+        entries = self.due()
+        summary = {"due": len(entries), "renewed": 0, "failed": 0, "batches": 0,
+                   "hook_failures": 0}
+        if entries:
+            logger.info(f"{len(entries)} certificates due within {self.window}")
+
+        for offset in range(0, len(entries), self.batch_size):
+            if offset and self.batch_pause and not self.dry_run:
+                time.sleep(self.batch_pause)
+            batch = entries[offset:offset + self.batch_size]
+            if self.dry_run:
+                for entry in batch:
+                    print(json.dumps({"path": entry["path"], "not_after": entry["not_after"],
+                                      "status": "due"}), flush=True)
+                continue
+
+            futures = []
+            for entry in batch:
+                name, sans, spec = renewal_request(entry)
+                futures.append((entry, executor.submit(_renew_one, RENEWABLE[entry["kind"]],
+                                                       name, sans, spec)))
+            renewed = []
+            for entry, future in futures:
+                result = future.result()
+                result["previous_not_after"] = entry["not_after"]
+                if result["status"] == "issued":
+                    renewed.append(result)
+                    self._issued[entry["path"]] = result["serial"]
+                else:
+                    summary["failed"] += 1
+                print(json.dumps(result), flush=True)
+
+            summary["batches"] += 1
+            summary["renewed"] += len(renewed)
+            if renewed:
+                status = self.run_hook(renewed)
+                if status:
+                    summary["hook_failures"] += 1
+            logger.info(f"Batch {summary['batches']}: {len(renewed)} renewed, "
+                        f"{len(batch) - len(renewed)} failed")
+        return summary
+
+    def close(self):
+        self.inventory.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer renew``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer renew",
+        description="Re-issue certificates that expire within the renewal window, in batches"
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=14.0,
+        metavar="DAYS",
+        help="Renew certificates expiring within DAYS (default: 14)"
+    )
+    parser.add_argument(
+        "--kind",
+        action="append",
+        choices=sorted(RENEWABLE),
+        help="Only renew under this directory (repeatable, default: all)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Certificates per batch; the hook runs once per batch (default: 100)"
+    )
+    parser.add_argument(
+        "--batch-pause",
+        type=float,
+        default=0.0,
+        help="Seconds to wait between batches, to rate-limit renewals (default: 0)"
+    )
+    parser.add_argument(
+        "--hook",
+        help="Shell command run after each batch, e.g. 'docker kill -s HUP haproxy' "
+             "(env: ISSUER_RENEWED_COUNT, ISSUER_RENEWED_DIRS)"
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Run one pass and exit (for cron) instead of running as a daemon"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=3600.0,
+        help="Daemon: seconds between passes (default: 3600)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only list the certificates that are due"
+    )
+    parser.add_argument(
+        "--key-pool",
+        action="store_true",
+        help="Take keys from the pre-generated pool (passphrase: $ISSUER_KEYPOOL_PASSWORD[_FILE])"
+    )
+    parser.add_argument(
+        "--partitioned-crl",
+        action="store_true",
+        help="Stamp the CRL DP of each certificate's CRL shard (crl/ica/partitions.json)"
+    )
+    parser.add_argument(
+        "--base-dir",
+        type=Path,
+        default=BD,
+        help="demo-cfssl directory (default: $DEMO_CFSSL_DIR or ~/.config/demo-cfssl)"
+    )
+    parser.add_argument(
+        "--workers", "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of issuing processes (default: CPU count)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+    try:
+        passphrase = read_passphrase() if args.key_pool else None
+        if args.key_pool and not passphrase:
+            raise RuntimeError("--key-pool needs ISSUER_KEYPOOL_PASSWORD or ISSUER_KEYPOOL_PASSWORD_FILE")
+        kinds = args.kind or sorted(RENEWABLE)
+        # Fail fast on unusable CA material before starting the pool
+        for kind in kinds:
+            Issuer(RENEWABLE[kind], args.base_dir, key_pool_passphrase=passphrase,
+                   partitioned_crl=args.partitioned_crl)
+        renewer = Renewer(args.base_dir, timedelta(days=args.window), kinds,
+                          args.batch_size, args.batch_pause, args.hook, args.dry_run)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    # Stop cleanly between batches on SIGTERM (systemd, docker stop)
+    signal.signal(signal.SIGTERM, lambda signum, frame: signal.raise_signal(signal.SIGINT))
+
+    failed = False
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.base_dir, passphrase,
+                                           args.partitioned_crl)) as executor:
+            while True:
+                summary = renewer.run_once(executor)
+                failed = bool(summary["failed"] or summary["hook_failures"])
+                logger.info(f"Pass done: {summary}")
+                if args.once:
+                    break
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        renewer.close()
+    return 1 if failed else 0
@@ -0,0 +1,145 @@
+"""cfssl CSR JSON requests (``02_host.json``, ``03_email.json``)."""
+
+import ipaddress
+import json
+from pathlib import Path
+from typing import Union
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+
+# cfssl name keys in the order cfssl writes them into the subject
+_NAME_OIDS = [
+    ("C", NameOID.COUNTRY_NAME),
+    ("ST", NameOID.STATE_OR_PROVINCE_NAME),
+    ("L", NameOID.LOCALITY_NAME),
+    ("O", NameOID.ORGANIZATION_NAME),
+    ("OU", NameOID.ORGANIZATIONAL_UNIT_NAME),
+]
+
+_CURVES = {256: ec.SECP256R1, 384: ec.SECP384R1, 521: ec.SECP521R1}
+
+PrivateKey = Union[ec.EllipticCurvePrivateKey, rsa.RSAPrivateKey]
+
+
+def hash_for_key(key: PrivateKey) -> hashes.HashAlgorithm:
+    """Signature hash for a key, as cfssl picks it (matched to the curve size)."""
+    if isinstance(key, ec.EllipticCurvePrivateKey):
+        if key.curve.key_size >= 521:
+            return hashes.SHA512()
+        if key.curve.key_size >= 384:
+            return hashes.SHA384()
+    return hashes.SHA256()
+
+
+def generate_key(algo: str, size: int) -> PrivateKey:
+    """
+    Generate a private key for a cfssl ``key`` block.
+
+    Raises:
+        ValueError: If the algorithm or size is not supported
+    """
+    if algo == "ecdsa":
+        if size not in _CURVES:
+            raise ValueError(f"Unsupported ECDSA key size: {size}")
+        return ec.generate_private_key(_CURVES[size]())
+    if algo == "rsa":
+        if size < 2048:
+            raise ValueError(f"RSA key size too small: {size}")
+        return rsa.generate_private_key(public_exponent=65537, key_size=size)
+    raise ValueError(f"Unsupported key algorithm: {algo}")
+
+
+def parse_hosts(hosts: list[str]) -> list[x509.GeneralName]:
+    """Split cfssl ``hosts`` into IP, e-mail, URI and DNS names like cfssl does."""
+    names: list[x509.GeneralName] = []
+    for host in hosts:
+        try:
+            names.append(x509.IPAddress(ipaddress.ip_address(host)))
+            continue
+        except ValueError:
+            pass
+        if '@' in host:
+            names.append(x509.RFC822Name(host))
+        elif '://' in host:
+            names.append(x509.UniformResourceIdentifier(host))
+        else:
+            names.append(x509.DNSName(host))
+    return names
+
+
+class CertRequest:
+    """A certificate request in cfssl CSR JSON form."""
+
+    def __init__(self, spec: dict):
+        """
+        Args:
+            spec: Parsed CSR JSON (``CN``, ``key``, ``names``, ``hosts``)
+
+        Raises:
+            ValueError: If the key algorithm or size is not supported
+        """
+        self.spec = spec
+        self.common_name: str = spec.get("CN", "")
+        key = spec.get("key", {})
+        self.key_algo = key.get("algo", "ecdsa")
+        self.key_size = int(key.get("size", 384 if self.key_algo == "ecdsa" else 2048))
+        if self.key_algo == "ecdsa" and self.key_size not in _CURVES:
+            raise ValueError(f"Unsupported ECDSA key size: {self.key_size}")
+        if self.key_algo == "rsa" and self.key_size < 2048:
+            raise ValueError(f"RSA key size too small: {self.key_size}")
+        if self.key_algo not in ("ecdsa", "rsa"):
+            raise ValueError(f"Unsupported key algorithm: {self.key_algo}")
+        self.names: list[dict] = spec.get("names", [])
+        self.hosts: list[str] = [h for h in spec.get("hosts", []) if h]
+
+    @classmethod
+    def load(cls, path: Path) -> 'CertRequest':
+        """
+        Load a CSR JSON template.
+
+        Raises:
+            RuntimeError: If the file cannot be read or parsed
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Failed to load request template {path}: {e}")
+
+    def derive(self, common_name: str, hosts: list[str]) -> 'CertRequest':
+        """Copy of this template with a new CN and hosts (as steps.sh writes cfg.json)."""
+        return CertRequest(dict(self.spec, CN=common_name, hosts=list(hosts)))
+
+    def generate_key(self) -> PrivateKey:
+        """Generate a private key as described by the ``key`` object."""
+        return generate_key(self.key_algo, self.key_size)
+
+    def subject(self) -> x509.Name:
+        """Subject name: the first ``names`` entry followed by the CN."""
+        attributes = []
+        if self.names:
+            for key, oid in _NAME_OIDS:
+                if self.names[0].get(key):
+                    attributes.append(x509.NameAttribute(oid, self.names[0][key]))
+        if self.common_name:
+            attributes.append(x509.NameAttribute(NameOID.COMMON_NAME, self.common_name))
+        return x509.Name(attributes)
+
+    def subject_alt_names(self) -> list[x509.GeneralName]:
+        """SANs from ``hosts`` (see :func:`parse_hosts`)."""
+        return parse_hosts(self.hosts)
+
+    def csr(self, key: PrivateKey) -> x509.CertificateSigningRequest:
+        """CSR signed by ``key``, as cfssl writes it next to the certificate."""
+        builder = x509.CertificateSigningRequestBuilder().subject_name(self.subject())
+        sans = self.subject_alt_names()
+        if sans:
+            builder = builder.add_extension(x509.SubjectAlternativeName(sans), critical=False)
+        return builder.sign(key, hash_for_key(key))
+
+    def to_json(self) -> str:
+        """The request as written to ``cfg.json``."""
+        return json.dumps(self.spec, indent=4)
@@ -0,0 +1,595 @@
+"""
+Revocation store: one SQLite database with a change feed for CRL and OCSP.
+
+``crl_mk.sh revoke`` appends to the tab-separated OpenSSL
+``crl/<ca>/index.txt``, while ``ocsp/main.py`` reads a pipe-separated
+``database.txt``. Each consumer can only pick up a change by re-reading a
+whole file. This module keeps the revocation state of both CAs in
+``crl/revocations.sqlite`` (WAL mode, so readers never block the writer):
+
+- ``revocations``: the current state, one row per revoked serial
+- ``changes``: an append-only feed. Every revocation, reason change and
+  release of a ``certificateHold`` gets the next sequence number.
+
+Consumers remember the last sequence number they applied and read only the
+newer changes. ``issuer crl delta`` builds the delta CRL from the changes
+since its base CRL, and the OCSP responder polls the feed. ``index.txt`` is
+exported from the store for ``openssl ca -gencrl``. Pure revocations are
+appended; a reason change or release rewrites the file. A new store imports
+the existing ``index.txt`` files.
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from cryptography import x509
+
+from .config import BD
+from .engine import write_atomic
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE = "revocations.sqlite"
+
+# CA type (as in crl_mk.sh) -> certificate, key
+CA_FILES = {
+    "ca": ("ca.pem", "ca-key.pem"),
+    "ica": ("ica-ca.pem", "ica-key.pem"),
+}
+
+# OpenSSL index.txt reason names
+REASONS = {
+    "unspecified": x509.ReasonFlags.unspecified,
+    "keyCompromise": x509.ReasonFlags.key_compromise,
+    "CACompromise": x509.ReasonFlags.ca_compromise,
+    "affiliationChanged": x509.ReasonFlags.affiliation_changed,
+    "superseded": x509.ReasonFlags.superseded,
+    "cessationOfOperation": x509.ReasonFlags.cessation_of_operation,
+    "certificateHold": x509.ReasonFlags.certificate_hold,
+    "removeFromCRL": x509.ReasonFlags.remove_from_crl,
+    "privilegeWithdrawn": x509.ReasonFlags.privilege_withdrawn,
+    "AACompromise": x509.ReasonFlags.aa_compromise,
+}
+
+REASON_NAMES = {flag: name for name, flag in REASONS.items()}
+
+# Change feed actions: a new revocation, a new reason for a revoked serial,
+# a released certificateHold
+ACTIONS = ("revoke", "update", "release")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS revocations (
+    ca TEXT NOT NULL,
+    serial TEXT NOT NULL,
+    expires INTEGER,
+    revoked_at INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    subject TEXT NOT NULL DEFAULT '',
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (ca, serial)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ca TEXT NOT NULL,
+    serial TEXT NOT NULL,
+    action TEXT NOT NULL,
+    expires INTEGER,
+    revoked_at INTEGER,
+    reason TEXT,
+    subject TEXT,
+    recorded_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_ca_seq ON changes (ca, seq);
+"""
+
+
+def openssl_serial(serial: int) -> str:
+    """A serial as OpenSSL prints it (and index.txt holds it): upper-case hex, whole bytes."""
+    digits = f"{serial:X}"
+    return digits.zfill(len(digits) + len(digits) % 2)
+
+
+def parse_asn1_time(value: str) -> datetime:
+    """Parse an index.txt time: UTCTime ``YYMMDDHHMMSSZ`` or GeneralizedTime."""
+    fmt = "%y%m%d%H%M%SZ" if len(value) == 13 else "%Y%m%d%H%M%SZ"
+    return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+
+
+def format_asn1_time(value: datetime) -> str:
+    """An index.txt time: UTCTime up to 2049, GeneralizedTime after (RFC 5280)."""
+    return value.strftime("%y%m%d%H%M%SZ" if value.year < 2050 else "%Y%m%d%H%M%SZ")
+
+
+class RevokedEntry:
+    """A revoked certificate from index.txt or the revocation store."""
+
+    def __init__(self, serial: int, revoked_at: datetime,
+                 reason: Optional[x509.ReasonFlags], expires: Optional[datetime], subject: str):
+        self.serial = serial
+        self.revoked_at = revoked_at
+        self.reason = reason
+        self.expires = expires
+        self.subject = subject
+
+    def revoked_certificate(self) -> x509.RevokedCertificate:
+        builder = (
+            x509.RevokedCertificateBuilder()
+            .serial_number(self.serial)
+            .revocation_date(self.revoked_at)
+        )
+        # Like openssl, no reason code for "unspecified"
+        if self.reason is not None and self.reason != x509.ReasonFlags.unspecified:
+            builder = builder.add_extension(x509.CRLReason(self.reason), critical=False)
+        return builder.build()
+
+    def index_line(self) -> str:
+        """The entry as an index.txt line (``R`` flag, file name ``unknown`` like crl_mk.sh)."""
+        revoked = format_asn1_time(self.revoked_at)
+        if self.reason is not None:
+            revoked += f",{REASON_NAMES[self.reason]}"
+        expires = format_asn1_time(self.expires) if self.expires else ""
+        return f"R\t{expires}\t{revoked}\t{openssl_serial(self.serial)}\tunknown\t{self.subject}"
+
+
+def read_index(path: Path) -> list[RevokedEntry]:
+    """
+    Revoked (``R``) entries of an OpenSSL index.txt.
+
+    Lines are ``R<TAB>expiry<TAB>revoked[,reason]<TAB>serial<TAB>file<TAB>subject``;
+    malformed lines are logged and skipped.
+    """
+    entries = []
+    try:
+        lines = path.read_text(encoding='utf-8').splitlines()
+    except FileNotFoundError:
+        return entries
+    for number, line in enumerate(lines, 1):
+        fields = line.split('\t')
+        if not fields or fields[0] != 'R':
+            continue
+        try:
+            revocation = fields[2].split(',')
+            reason = REASONS.get(revocation[1]) if len(revocation) > 1 else None
+            entries.append(RevokedEntry(
+                serial=int(fields[3], 16),
+                revoked_at=parse_asn1_time(revocation[0]),
+                reason=reason,
+                expires=parse_asn1_time(fields[1]) if fields[1] else None,
+                subject=fields[5] if len(fields) > 5 else "",
+            ))
+        except (IndexError, ValueError) as e:
+            logger.warning(f"{path}:{number}: skipping malformed entry: {e}")
+    return entries
+
+
+def _datetime(ts: Optional[int]) -> Optional[datetime]:
+    return datetime.fromtimestamp(ts, timezone.utc) if ts is not None else None
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[int]:
+    return int(value.timestamp()) if value is not None else None
+
+
+class Change:
+    """One entry of the change feed."""
+
+    def __init__(self, row: sqlite3.Row):
+        self.seq: int = row["seq"]
+        self.ca: str = row["ca"]
+        self.serial = int(row["serial"], 16)
+        self.action: str = row["action"]
+        self.revoked_at = _datetime(row["revoked_at"])
+        self.reason: Optional[str] = row["reason"]
+        self.expires = _datetime(row["expires"])
+        self.subject: str = row["subject"] or ""
+
+    def entry(self) -> RevokedEntry:
+        """The revocation as of this change (not meaningful for ``release``)."""
+        return RevokedEntry(self.serial, self.revoked_at, REASONS.get(self.reason),
+                            self.expires, self.subject)
+
+    def to_dict(self) -> dict:
+        return {
+            "seq": self.seq,
+            "ca": self.ca,
+            "serial": openssl_serial(self.serial),
+            "action": self.action,
+            "revoked_at": self.revoked_at.isoformat() if self.revoked_at else None,
+            "reason": self.reason,
+            "expires": self.expires.isoformat() if self.expires else None,
+            "subject": self.subject,
+        }
+
+
+class RevocationStore:
+    """Revocation state of the demo-cfssl CAs with a sequenced change feed."""
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: Store file (normally ``<base_dir>/crl/revocations.sqlite``)
+
+        Raises:
+            RuntimeError: If the database cannot be opened
+        """
+        self.db_path = db_path
+        try:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit; transactions are explicit (see _transaction)
+            self.db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+            self.db.row_factory = sqlite3.Row
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(_SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            raise RuntimeError(f"Failed to open revocation store {db_path}: {e}")
+
+    @classmethod
+    def open(cls, base_dir: Path, create: bool = True) -> Optional['RevocationStore']:
+        """
+        The store of a base directory. A new store imports the existing
+        ``crl/<ca>/index.txt`` files.
+
+        Args:
+            base_dir: demo-cfssl base directory
+            create: Create the store if there is none; otherwise return None
+
+        Raises:
+            RuntimeError: If the database cannot be opened
+        """
+        path = base_dir / "crl" / STORE_FILE
+        exists = path.exists()
+        if not exists and not create:
+            return None
+        store = cls(path)
+        if not exists:
+            for ca_type in CA_FILES:
+                index_path = base_dir / "crl" / ca_type / "index.txt"
+                if index_path.exists():
+                    imported = store.import_index(ca_type, index_path)
+                    logger.info(f"Imported {imported} revocations from {index_path}")
+        return store
+
+    @contextmanager
+    def _transaction(self, write: bool = False) -> Iterator[None]:
+        """
+        One consistent snapshot for reads; writes take the lock up front
+        (IMMEDIATE) so concurrent writers queue instead of failing.
+        """
+        self.db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _record(self, ca: str, serial: str, action: str, expires: Optional[int],
+                revoked_at: Optional[int], reason: Optional[str], subject: str) -> Change:
+        cursor = self.db.execute(
+            "INSERT INTO changes (ca, serial, action, expires, revoked_at, reason, subject, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (ca, serial, action, expires, revoked_at, reason, subject, int(time.time())))
+        return Change(self.db.execute("SELECT * FROM changes WHERE seq = ?",
+                                      (cursor.lastrowid,)).fetchone())
+
+    def revoke(self, ca: str, serial: int, expires: Optional[datetime], subject: str = "",
+               reason: str = "unspecified", revoked_at: Optional[datetime] = None) -> Optional[Change]:
+        """
+        Revoke a serial, or change the reason of a revoked one (e.g. a
+        ``certificateHold`` that turned out to be a ``keyCompromise``).
+
+        Returns:
+            The recorded change, or None if the serial is already revoked for this reason
+
+        Raises:
+            ValueError: If the CA or reason is unknown
+        """
+        if ca not in CA_FILES:
+            raise ValueError(f"Unknown CA type: {ca} (expected one of {', '.join(CA_FILES)})")
+        if reason not in REASONS or reason == "removeFromCRL":
+            raise ValueError(f"Unknown revocation reason: {reason}")
+        with self._transaction(write=True):
+            return self._revoke(ca, serial, expires, subject, reason, revoked_at)
+
+    def _revoke(self, ca: str, serial: int, expires: Optional[datetime], subject: str,
+                reason: str, revoked_at: Optional[datetime]) -> Optional[Change]:
+        """:meth:`revoke` inside the caller's transaction."""
+        hex_serial = openssl_serial(serial)
+        current = self.db.execute("SELECT * FROM revocations WHERE ca = ? AND serial = ?",
+                                  (ca, hex_serial)).fetchone()
+        if current is not None and current["reason"] == reason:
+            return None
+        if current is not None:
+            # The revocation date stays; only the reason changes
+            change = self._record(ca, hex_serial, "update", current["expires"],
+                                  current["revoked_at"], reason, current["subject"])
+        else:
+            change = self._record(ca, hex_serial, "revoke", _timestamp(expires),
+                                  _timestamp(revoked_at or datetime.now(timezone.utc)),
+                                  reason, subject)
+        self.db.execute(
+            "INSERT OR REPLACE INTO revocations (ca, serial, expires, revoked_at, reason, subject, seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (ca, hex_serial, _timestamp(change.expires), _timestamp(change.revoked_at),
+             reason, change.subject, change.seq))
+        return change
+
+    def release(self, ca: str, serial: int) -> Change:
+        """
+        Release a ``certificateHold`` (the only revocation RFC 5280 lets end).
+
+        Raises:
+            ValueError: If the serial is not on hold
+        """
+        hex_serial = openssl_serial(serial)
+        with self._transaction(write=True):
+            current = self.db.execute("SELECT * FROM revocations WHERE ca = ? AND serial = ?",
+                                      (ca, hex_serial)).fetchone()
+            if current is None or current["reason"] != "certificateHold":
+                raise ValueError(f"Serial {hex_serial} of {ca} is not on certificateHold")
+            change = self._record(ca, hex_serial, "release", current["expires"], None, None,
+                                  current["subject"])
+            self.db.execute("DELETE FROM revocations WHERE ca = ? AND serial = ?", (ca, hex_serial))
+        return change
+
+    def last_seq(self, ca: Optional[str] = None) -> int:
+        """Sequence number of the newest change (0 if there is none)."""
+        if ca is None:
+            row = self.db.execute("SELECT MAX(seq) FROM changes").fetchone()
+        else:
+            row = self.db.execute("SELECT MAX(seq) FROM changes WHERE ca = ?", (ca,)).fetchone()
+        return row[0] or 0
+
+    def changes(self, since: int = 0, ca: Optional[str] = None,
+                limit: Optional[int] = None) -> list[Change]:
+        """Changes after sequence number ``since``, oldest first."""
+        sql, params = "SELECT * FROM changes WHERE seq > ?", [since]
+        if ca is not None:
+            sql += " AND ca = ?"
+            params.append(ca)
+        sql += " ORDER BY seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Change(row) for row in self.db.execute(sql, params)]
+
+    def _entry(self, row: sqlite3.Row) -> RevokedEntry:
+        return RevokedEntry(int(row["serial"], 16), _datetime(row["revoked_at"]),
+                            REASONS[row["reason"]], _datetime(row["expires"]), row["subject"])
+
+    def snapshot(self, ca: str) -> tuple[int, list[RevokedEntry]]:
+        """The revoked entries of a CA and the sequence number they are current as of."""
+        with self._transaction():
+            seq = self.last_seq()
+            rows = self.db.execute("SELECT * FROM revocations WHERE ca = ? ORDER BY seq",
+                                   (ca,)).fetchall()
+        return seq, [self._entry(row) for row in rows]
+
+    def lookup(self, ca: str, serials: Iterable[int]) -> dict[int, RevokedEntry]:
+        """The current entries of the given serials that are revoked."""
+        found = {}
+        for serial in serials:
+            row = self.db.execute("SELECT * FROM revocations WHERE ca = ? AND serial = ?",
+                                  (ca, openssl_serial(serial))).fetchone()
+            if row is not None:
+                found[serial] = self._entry(row)
+        return found
+
+    def import_index(self, ca: str, path: Path) -> int:
+        """Record the revocations of an index.txt that the store does not have yet."""
+        imported = 0
+        entries = read_index(path)
+        with self._transaction(write=True):
+            for entry in entries:
+                reason = REASON_NAMES.get(entry.reason, "unspecified")
+                if reason == "removeFromCRL":
+                    continue
+                if self._revoke(ca, entry.serial, entry.expires, entry.subject, reason,
+                                entry.revoked_at) is not None:
+                    imported += 1
+        return imported
+
+    def export_index(self, ca: str, path: Path) -> dict:
+        """
+        Bring an index.txt up to date for ``openssl ca``.
+
+        ``<path>.seq`` records the sequence number and size of the last
+        export. If only new revocations happened since, they are appended.
+        Otherwise, or if the file was changed behind the store's back, its
+        unknown revocations are imported and the file is rewritten. Non-``R``
+        lines (``openssl ca`` issuance records) are kept.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The lock of the CRL generator (issuer.crl), which reads the same directory
+        with open(path.parent / ".crl.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._export_index(ca, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _export_index(self, ca: str, path: Path) -> dict:
+        marker = path.with_name(path.name + ".seq")
+        try:
+            exported_seq, exported_size = (int(v) for v in marker.read_text().split())
+        except (OSError, ValueError):
+            exported_seq, exported_size = None, None
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            size = None
+
+        changes = self.changes(since=exported_seq or 0, ca=ca) if exported_seq is not None else None
+        if changes is not None and size == exported_size:
+            if not changes:
+                return {"ca": ca, "mode": "unchanged", "seq": exported_seq, "lines": 0}
+            if all(change.action == "revoke" for change in changes):
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write("".join(change.entry().index_line() + "\n" for change in changes))
+                seq = changes[-1].seq
+                write_atomic(marker, f"{seq} {path.stat().st_size}\n".encode())
+                return {"ca": ca, "mode": "append", "seq": seq, "lines": len(changes)}
+
+        if size is not None and size != exported_size:
+            imported = self.import_index(ca, path)
+            if imported:
+                logger.info(f"Imported {imported} revocations added to {path} directly")
+        seq, entries = self.snapshot(ca)
+        revoked = {openssl_serial(entry.serial) for entry in entries}
+        kept = []
+        if size is not None:
+            for line in path.read_text(encoding='utf-8').splitlines():
+                fields = line.split('\t')
+                if fields[0] != 'R' and not (len(fields) > 3 and fields[3] in revoked):
+                    kept.append(line)
+        data = "".join(line + "\n" for line in kept + [entry.index_line() for entry in entries])
+        write_atomic(path, data.encode())
+        write_atomic(marker, f"{seq} {len(data.encode())}\n".encode())
+        return {"ca": ca, "mode": "rewrite", "seq": seq, "lines": len(kept) + len(entries)}
+
+    def close(self):
+        self.db.close()
+
+
+def ca_type_of(base_dir: Path, cert: x509.Certificate) -> str:
+    """
+    The CA type (``ca`` or ``ica``) whose certificate issued ``cert``.
+
+    Raises:
+        ValueError: If neither CA of the base directory issued it
+    """
+    for ca_type, (cert_name, _) in CA_FILES.items():
+        try:
+            ca_cert = x509.load_pem_x509_certificate((base_dir / cert_name).read_bytes())
+        except (OSError, ValueError):
+            continue
+        if ca_cert.subject == cert.issuer:
+            return ca_type
+    raise ValueError(f"Not issued by a CA of {base_dir}: {cert.issuer.rfc4514_string()}")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer revocation``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer revocation",
+        description="Revoke certificates in the revocation store and read its change feed (JSON output)"
+    )
+    parser.add_argument(
+        "action",
+        choices=["revoke", "release", "list", "changes", "export", "import"],
+        help="revoke CERT: revoke (or change the reason of) a certificate; "
+             "release CERT: end a certificateHold; list: revoked entries; "
+             "changes: the change feed after --since; "
+             "export: write crl/<ca>/index.txt; import: record revocations of crl/<ca>/index.txt"
+    )
+    parser.add_argument(
+        "cert",
+        nargs="?",
+        type=Path,
+        help="revoke, release: certificate file (PEM)"
+    )
+    parser.add_argument(
+        "--reason",
+        choices=[r for r in REASONS if r != "removeFromCRL"],
+        default="unspecified",
+        help="revoke: revocation reason (default: unspecified)"
+    )
+    parser.add_argument(
+        "--ca",
+        choices=sorted(CA_FILES),
+        help="list, changes, export, import: only this CA (default: both)"
+    )
+    parser.add_argument(
+        "--since",
+        type=int,
+        default=0,
+        help="changes: sequence number already applied (default: 0, everything)"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="changes: at most this many changes"
+    )
+    parser.add_argument(
+        "--no-export",
+        action="store_true",
+        help="revoke, release: do not update crl/<ca>/index.txt"
+    )
+    parser.add_argument(
+        "--base-dir",
+        type=Path,
+        default=BD,
+        help="demo-cfssl directory (default: $DEMO_CFSSL_DIR or ~/.config/demo-cfssl)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.action in ("revoke", "release") and args.cert is None:
+        parser.error(f"{args.action} needs a certificate file")
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+    try:
+        store = RevocationStore.open(args.base_dir)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    ca_types = [args.ca] if args.ca else list(CA_FILES)
+    try:
+        if args.action in ("revoke", "release"):
+            cert = x509.load_pem_x509_certificate(args.cert.read_bytes())
+            ca_type = ca_type_of(args.base_dir, cert)
+            if args.action == "revoke":
+                change = store.revoke(ca_type, cert.serial_number, cert.not_valid_after_utc,
+                                      cert.subject.rfc4514_string(), args.reason)
+            else:
+                change = store.release(ca_type, cert.serial_number)
+            if change is None:
+                result = {"status": "unchanged", "ca": ca_type,
+                          "serial": openssl_serial(cert.serial_number), "reason": args.reason}
+            else:
+                result = {"status": "ok", **change.to_dict()}
+                if not args.no_export:
+                    result["export"] = store.export_index(
+                        ca_type, args.base_dir / "crl" / ca_type / "index.txt")
+            print(json.dumps(result))
+        elif args.action == "changes":
+            for change in store.changes(args.since, args.ca, args.limit):
+                print(json.dumps(change.to_dict()))
+        elif args.action == "list":
+            for ca_type in ca_types:
+                seq, entries = store.snapshot(ca_type)
+                for entry in entries:
+                    print(json.dumps({
+                        "ca": ca_type,
+                        "serial": openssl_serial(entry.serial),
+                        "revoked_at": entry.revoked_at.isoformat(),
+                        "reason": REASON_NAMES.get(entry.reason),
+                        "expires": entry.expires.isoformat() if entry.expires else None,
+                        "subject": entry.subject,
+                    }))
+        elif args.action == "export":
+            for ca_type in ca_types:
+                print(json.dumps(store.export_index(
+                    ca_type, args.base_dir / "crl" / ca_type / "index.txt")))
+        else:
+            for ca_type in ca_types:
+                path = args.base_dir / "crl" / ca_type / "index.txt"
+                print(json.dumps({"ca": ca_type, "imported": store.import_index(ca_type, path),
+                                  "seq": store.last_seq()}))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        store.close()
+    return 0
@@ -0,0 +1,605 @@
+"""
+Squid ``sslcrtd_program`` helper: bumped-site certificates from a cache.
+
+A drop-in for ``security_file_certgen``. For every bumped connection whose
+certificate is not in Squid's own memory cache, Squid sends a
+``new_certificate`` request with the host, the adaptation parameters
+(``setCommonName``, ``setValidAfter``, ``setValidBefore``, ``Sign``,
+``SignHash``), the signing CA (``bumpca``) with its key, and the upstream
+server certificate to mimic. The helper answers with the forged leaf and
+its key. Unlike ``security_file_certgen`` it does not generate a key for
+every new leaf:
+
+- Keys come from the pre-generated pool (``--key-pool``, see
+  :mod:`issuer.keypool`), refilled by ``issuer keypool run``. Only an empty
+  pool falls back to generating a key on demand.
+- Minted leaves are cached by host, upstream certificate fingerprint, CA
+  and parameters: in memory per helper process (``--memory-entries``) and
+  in an SQLite database shared by all helpers, with least recently used
+  entries evicted beyond ``--max-size``. A changed upstream certificate
+  (or bumpca) is a different key, so a cached leaf never needs to be
+  invalidated.
+
+Squid runs ``sslcrtd_children`` helper processes and sends each one request
+at a time. Concurrent requests are answered by several helpers sharing one
+disk cache and one key pool; a per-entry lock lets only one of them mint a
+given leaf while the others wait for it and read it from the cache. With
+``concurrency=N`` in ``sslcrtd_children``, requests carry a channel ID that
+is echoed in the reply.
+
+Layout under ``$DEMO_CFSSL_DIR/sslcrtd`` (``--cache-dir``)::
+
+    sslcrtd/
+    ├── leaves.sqlite    (certificate + key PEM per entry, mode 0600)
+    └── .lock            (byte-range locks, one per entry being minted)
+"""
+
+import argparse
+import fcntl
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from .ca import BACKDATE
+from .config import BD
+from .keypool import KeyPool, parse_slot, read_passphrase
+from .request import PrivateKey, generate_key, hash_for_key
+
+logger = logging.getLogger(__name__)
+
+SSLCRTD_DIR = "sslcrtd"
+DB_FILE = "leaves.sqlite"
+# Squid's end-of-message marker for sslcrtd replies
+EOM = b"\x01"
+# Validity of leaves minted without an upstream certificate to mimic
+DEFAULT_VALIDITY = timedelta(days=365)
+# Re-mint leaves that expire within this margin
+EXPIRY_MARGIN = 3600
+# Record a cache hit in the database at most this often per entry (seconds)
+TOUCH_INTERVAL = 60
+
+_PEM_RE = re.compile(rb"-----BEGIN ([A-Z0-9 ]+)-----.+?-----END \1-----\r?\n?", re.DOTALL)
+_SIZE_RE = re.compile(r"^(\d+)\s*([KMG]?)B?$", re.IGNORECASE)
+# SignHash values as Squid sends them (OpenSSL 1.x short names or 3.x names)
+_HASHES = {
+    "SHA1": hashes.SHA1, "SHA224": hashes.SHA224, "SHA256": hashes.SHA256,
+    "SHA384": hashes.SHA384, "SHA512": hashes.SHA512,
+    "SHA2-224": hashes.SHA224, "SHA2-256": hashes.SHA256,
+    "SHA2-384": hashes.SHA384, "SHA2-512": hashes.SHA512,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leaves (
+    key TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    upstream TEXT NOT NULL,
+    expires INTEGER NOT NULL,
+    used INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    pem BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leaves_used ON leaves (used);
+"""
+
+
+def parse_size(value: str) -> int:
+    """
+    Parse a size as ``security_file_certgen -M`` takes it (``20MB``, ``512K``).
+
+    Raises:
+        ValueError: If the value is malformed
+    """
+    match = _SIZE_RE.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid size '{value}' (expected e.g. 20MB)")
+    return int(match.group(1)) * 1024 ** " KMG".index(match.group(2).upper() or " ")
+
+
+class HelperRequest:
+    """A parsed ``new_certificate`` request."""
+
+    def __init__(self, body: bytes):
+        """
+        Args:
+            body: The request body: ``name=value`` lines, then the signing
+                certificate, its key and optionally the certificate to mimic
+
+        Raises:
+            ValueError: If the body is malformed
+        """
+        start = body.find(b"-----BEGIN")
+        if start < 0:
+            raise ValueError("no signing certificate in request")
+        self.params = {}
+        for line in body[:start].decode().splitlines():
+            name, sep, value = line.strip().partition('=')
+            if sep:
+                self.params[name] = value
+        self.host = self.params.get("host", "")
+        if not self.host:
+            raise ValueError("no host in request")
+        self.common_name = self.params.get("setCommonName")
+        self.valid_after = "setValidAfter" in self.params
+        self.valid_before = "setValidBefore" in self.params
+        self.sign = self.params.get("Sign", "signTrusted")
+
+        certs, key_pem = [], None
+        for match in _PEM_RE.finditer(body, start):
+            if match.group(1) == b"CERTIFICATE":
+                certs.append(match.group(0))
+            elif match.group(1).endswith(b"PRIVATE KEY") and key_pem is None:
+                key_pem = match.group(0)
+        if not certs or key_pem is None:
+            raise ValueError("request needs the signing certificate and key")
+        self.ca_pem = certs[0]
+        self.ca_key_pem = key_pem
+        # Squid may repeat the signing certificate; the one to mimic differs
+        mimic = next((pem for pem in certs[1:] if pem != self.ca_pem), None)
+        self.ca_cert = x509.load_pem_x509_certificate(self.ca_pem)
+        self.mimic = x509.load_pem_x509_certificate(mimic) if mimic else None
+
+        sign_hash = self.params.get("SignHash")
+        if sign_hash and sign_hash.upper() not in _HASHES:
+            raise ValueError(f"unsupported SignHash '{sign_hash}'")
+        self.hash_algorithm = _HASHES[sign_hash.upper()]() if sign_hash else None
+
+    @property
+    def upstream_fingerprint(self) -> str:
+        """SHA-256 of the certificate to mimic, or empty without one."""
+        if self.mimic is None:
+            return ""
+        return self.mimic.fingerprint(hashes.SHA256()).hex()
+
+    def cache_key(self, key_type: str) -> str:
+        """Everything the minted leaf depends on, hashed."""
+        parts = [self.host, self.upstream_fingerprint,
+                 hashlib.sha256(self.ca_pem).hexdigest(), self.sign,
+                 self.common_name or "", str(self.valid_after), str(self.valid_before),
+                 self.params.get("SignHash", ""), key_type]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _general_name(host: str) -> x509.GeneralName:
+    try:
+        return x509.IPAddress(ipaddress.ip_address(host))
+    except ValueError:
+        return x509.DNSName(host)
+
+
+def _with_common_name(subject: x509.Name, common_name: str) -> x509.Name:
+    """``subject`` with its CN replaced by (or extended with) ``common_name``."""
+    cn = x509.NameAttribute(NameOID.COMMON_NAME, common_name[:64])
+    rdns = [rdn for rdn in subject.rdns
+            if not rdn.get_attributes_for_oid(NameOID.COMMON_NAME)]
+    return x509.Name(rdns + [x509.RelativeDistinguishedName([cn])])
+
+
+class LeafMinter:
+    """Forges leaves as Squid's ``security_file_certgen`` does, with pooled keys."""
+
+    def __init__(self, key_type: str, pool: Optional[KeyPool] = None):
+        """
+        Args:
+            key_type: Key slot of the leaves, e.g. ``rsa-2048``
+            pool: Pool to take keys from; None generates every key
+
+        Raises:
+            ValueError: If the key type is malformed
+        """
+        self.key_type = key_type
+        self.key_slot = parse_slot(key_type)
+        self.pool = pool
+        # Parsed signing keys by PEM digest: bumpca comes with every request
+        self._ca_keys = {}
+        self.stats = {"pool_keys": 0, "generated_keys": 0}
+
+    def _ca_key(self, request: HelperRequest) -> PrivateKey:
+        digest = hashlib.sha256(request.ca_key_pem).digest()
+        key = self._ca_keys.get(digest)
+        if key is None:
+            key = serialization.load_pem_private_key(request.ca_key_pem, None)
+            if key.public_key().public_numbers() != request.ca_cert.public_key().public_numbers():
+                raise ValueError("signing key does not match the signing certificate")
+            self._ca_keys[digest] = key
+        return key
+
+    def _leaf_key(self) -> PrivateKey:
+        if self.pool is not None:
+            key = self.pool.take(*self.key_slot)
+            if key is not None:
+                self.stats["pool_keys"] += 1
+                return key
+            logger.warning(f"Key pool slot {self.key_type} is empty, generating")
+        self.stats["generated_keys"] += 1
+        return generate_key(*self.key_slot)
+
+    def mint(self, request: HelperRequest) -> tuple[bytes, datetime]:
+        """
+        Forge the leaf for a request.
+
+        Returns:
+            Certificate and key PEM as Squid expects them, and the leaf's
+            notAfter
+
+        Raises:
+            ValueError: If the signing key is unusable
+        """
+        key = self._leaf_key()
+        public_key = key.public_key()
+        ca = request.ca_cert
+        mimic = request.mimic
+        now = datetime.now(timezone.utc)
+
+        if mimic is not None:
+            subject = mimic.subject
+            not_before, not_after = mimic.not_valid_before_utc, mimic.not_valid_after_utc
+        else:
+            subject = x509.Name([])
+            not_before = now - BACKDATE
+            not_after = min(now + DEFAULT_VALIDITY, ca.not_valid_after_utc)
+        if request.common_name or mimic is None:
+            subject = _with_common_name(subject, request.common_name or request.host)
+        if request.valid_after:
+            not_after = ca.not_valid_after_utc
+        if request.valid_before:
+            not_before = ca.not_valid_before_utc
+
+        sans = None
+        if mimic is not None and not request.common_name:
+            try:
+                sans = mimic.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+            except x509.ExtensionNotFound:
+                pass
+        if sans is None:
+            sans = x509.SubjectAlternativeName([_general_name(request.common_name or request.host)])
+
+        self_signed = request.sign == "signSelf"
+        builder = (
+            x509.CertificateBuilder()
+            .subject_name(subject)
+            .issuer_name(subject if self_signed else ca.subject)
+            .public_key(public_key)
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(not_before)
+            .not_valid_after(not_after)
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+            # RFC 5280: the SAN is critical in a certificate with an empty subject
+            .add_extension(sans, critical=len(subject) == 0)
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False)
+        )
+        # The key usages of the upstream certificate, else those of a TLS server
+        usages = {x509.KeyUsage: None, x509.ExtendedKeyUsage: None}
+        if mimic is not None:
+            for extension in mimic.extensions:
+                if type(extension.value) in usages:
+                    usages[type(extension.value)] = extension
+        for extension in usages.values():
+            if extension is not None:
+                builder = builder.add_extension(extension.value, critical=extension.critical)
+        if mimic is None:
+            builder = (
+                builder
+                .add_extension(x509.KeyUsage(
+                    digital_signature=True, key_encipherment=isinstance(key, rsa.RSAPrivateKey),
+                    content_commitment=False, data_encipherment=False, key_agreement=False,
+                    key_cert_sign=False, crl_sign=False, encipher_only=False,
+                    decipher_only=False), critical=True)
+                .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]),
+                               critical=False)
+            )
+
+        signing_key = key if self_signed else self._ca_key(request)
+        if not self_signed:
+            builder = builder.add_extension(
+                x509.AuthorityKeyIdentifier.from_issuer_public_key(signing_key.public_key()),
+                critical=False)
+        cert = builder.sign(signing_key, request.hash_algorithm or hash_for_key(signing_key))
+        pem = (cert.public_bytes(serialization.Encoding.PEM)
+               + key.private_bytes(serialization.Encoding.PEM,
+                                   serialization.PrivateFormat.PKCS8,
+                                   serialization.NoEncryption()))
+        return pem, not_after
+
+
+class LeafCache:
+    """Minted leaves in a per-process LRU over an SQLite LRU shared by all helpers."""
+
+    def __init__(self, directory: Path, max_size: int, memory_entries: int):
+        """
+        Args:
+            directory: Cache directory, created private to the owner
+            max_size: Bytes of certificates and keys kept on disk
+            memory_entries: Leaves kept in this process
+
+        Raises:
+            RuntimeError: If the database cannot be opened
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        try:
+            directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            # The database holds private keys: no group or world access
+            old_umask = os.umask(0o077)
+            try:
+                self.db = sqlite3.connect(directory / DB_FILE, timeout=30, isolation_level=None)
+                self.db.execute("PRAGMA journal_mode=WAL")
+                self.db.execute("PRAGMA synchronous=NORMAL")
+                self.db.executescript(_SCHEMA)
+                self._lock = open(directory / ".lock", 'a+b')
+            finally:
+                os.umask(old_umask)
+        except (OSError, sqlite3.Error) as e:
+            raise RuntimeError(f"Failed to open leaf cache {directory}: {e}")
+
+    def _remember(self, key: str, pem: bytes, expires: int):
+        self.memory[key] = (pem, expires)
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str, memory: bool = True) -> Optional[bytes]:
+        """The cached leaf for ``key``, or None if there is none (or it expires soon)."""
+        now = int(time.time())
+        if memory and key in self.memory:
+            pem, expires = self.memory[key]
+            if not expires or expires > now + EXPIRY_MARGIN:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return pem
+            del self.memory[key]
+        row = self.db.execute("SELECT pem, expires, used FROM leaves WHERE key = ?",
+                              (key,)).fetchone()
+        if row is None:
+            return None
+        pem, expires, used = row
+        if expires and expires <= now + EXPIRY_MARGIN:
+            self.db.execute("DELETE FROM leaves WHERE key = ?", (key,))
+            return None
+        if used < now - TOUCH_INTERVAL:
+            self.db.execute("UPDATE leaves SET used = ? WHERE key = ?", (now, key))
+        self.stats["disk_hits"] += 1
+        self._remember(key, pem, expires)
+        return pem
+
+    def put(self, key: str, host: str, upstream: str, expires: int, pem: bytes):
+        """Store a leaf (``expires`` 0: never) and evict the least recently used."""
+        self._remember(key, pem, expires)
+        self.db.execute(
+            "INSERT OR REPLACE INTO leaves (key, host, upstream, expires, used, size, pem) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, host, upstream, expires, int(time.time()), len(pem), pem))
+        excess = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM leaves").fetchone()[0] \
+            - self.max_size
+        if excess <= 0:
+            return
+        victims = []
+        for victim, size in self.db.execute("SELECT key, size FROM leaves ORDER BY used"):
+            victims.append((victim,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.executemany("DELETE FROM leaves WHERE key = ?", victims)
+        self.stats["evictions"] += len(victims)
+
+    def lock(self, key: str) -> 'EntryLock':
+        """A lock on one entry, held by at most one helper process."""
+        return EntryLock(self._lock, int(key[:8], 16))
+
+    def status(self) -> dict:
+        entries, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM leaves").fetchone()
+        return {"cache": str(self.directory / DB_FILE), "entries": entries,
+                "bytes": size, "max_bytes": self.max_size}
+
+
+class EntryLock:
+    """An exclusive byte-range lock on the cache lock file, one byte per entry."""
+
+    def __init__(self, lock_file: BinaryIO, offset: int):
+        self.lock_file = lock_file
+        self.offset = offset
+
+    def __enter__(self):
+        fcntl.lockf(self.lock_file, fcntl.LOCK_EX, 1, self.offset)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.lockf(self.lock_file, fcntl.LOCK_UN, 1, self.offset)
+
+
+class Helper:
+    """Answers Squid's helper requests from the cache, minting on a miss."""
+
+    def __init__(self, cache: LeafCache, minter: LeafMinter):
+        self.cache = cache
+        self.minter = minter
+        self.requests = 0
+
+    def certificate(self, request: HelperRequest) -> bytes:
+        """Certificate and key PEM for a request, cached or freshly minted."""
+        key = request.cache_key(self.minter.key_type)
+        pem = self.cache.get(key)
+        if pem is not None:
+            return pem
+        with self.cache.lock(key):
+            # Another helper may have minted it while we waited
+            pem = self.cache.get(key, memory=False)
+            if pem is not None:
+                return pem
+            self.cache.stats["misses"] += 1
+            start = time.perf_counter()
+            pem, not_after = self.minter.mint(request)
+            # A mimicked leaf depends only on the upstream certificate, so it
+            # is reused for as long as that is; others are re-minted on expiry
+            expires = 0 if request.mimic is not None else int(not_after.timestamp())
+            self.cache.put(key, request.host, request.upstream_fingerprint, expires, pem)
+        logger.info(f"Minted {request.host} ({request.sign}) in "
+                    f"{(time.perf_counter() - start) * 1000:.1f}ms")
+        return pem
+
+    def handle(self, code: str, body: bytes) -> tuple[str, bytes]:
+        """Reply code and body for one request; never raises on bad input."""
+        self.requests += 1
+        if code != "new_certificate":
+            return "ERR", f"unknown request '{code}'".encode()
+        try:
+            return "OK", self.certificate(HelperRequest(body))
+        except (ValueError, TypeError, UnicodeDecodeError) as e:
+            logger.error(f"Rejected request: {e}")
+            return "ERR", str(e).encode()
+        except (RuntimeError, sqlite3.Error) as e:
+            logger.error(f"Failed request: {e}")
+            return "ERR", str(e).encode()
+
+    def serve(self, stdin: BinaryIO, stdout: BinaryIO):
+        """Answer requests until Squid closes stdin."""
+        while True:
+            message = read_message(stdin)
+            if message is None:
+                return
+            channel, code, body = message
+            reply_code, reply = self.handle(code, body)
+            prefix = f"{channel} " if channel is not None else ""
+            stdout.write(f"{prefix}{reply_code} {len(reply)} ".encode() + reply + EOM)
+            stdout.flush()
+
+    def summary(self) -> dict:
+        return {"requests": self.requests, **self.cache.stats, **self.minter.stats}
+
+
+def _read_token(stream: BinaryIO) -> Optional[bytes]:
+    """The next space-delimited header token, or None at end of input."""
+    byte = stream.read(1)
+    while byte and byte.isspace():
+        byte = stream.read(1)
+    if not byte:
+        return None
+    token = bytearray()
+    while byte and not byte.isspace():
+        token += byte
+        byte = stream.read(1)
+    return bytes(token)
+
+
+def read_message(stream: BinaryIO) -> Optional[tuple[Optional[str], str, bytes]]:
+    """
+    Read one ``[channel] code length body`` request.
+
+    Returns:
+        (channel or None, code, body), or None at end of input
+
+    Raises:
+        ValueError: If the header is malformed or the body is cut short
+    """
+    token = _read_token(stream)
+    if token is None:
+        return None
+    channel = None
+    if token.isdigit():
+        channel, token = token.decode(), _read_token(stream)
+    length = _read_token(stream)
+    if token is None or length is None or not length.isdigit():
+        raise ValueError("malformed request header")
+    size = int(length)
+    body = stream.read(size) if size else b""
+    if len(body) != size:
+        raise ValueError(f"request body cut short ({len(body)} of {size} bytes)")
+    return channel, token.decode(), body
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer sslcrtd``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer sslcrtd",
+        description="Squid sslcrtd_program helper: bumped-site certificates from a cache"
+    )
+    parser.add_argument(
+        "--cache-dir", "-s",
+        type=Path,
+        default=BD / SSLCRTD_DIR,
+        help="Leaf cache directory, shared by all helpers (default: $DEMO_CFSSL_DIR/sslcrtd)"
+    )
+    parser.add_argument(
+        "--max-size", "-M",
+        default="20MB",
+        help="Size of the leaf cache on disk (default: 20MB)"
+    )
+    parser.add_argument(
+        "--memory-entries",
+        type=int,
+        default=1000,
+        help="Leaves kept in memory per helper (default: 1000)"
+    )
+    parser.add_argument(
+        "--key-type",
+        default="rsa-2048",
+        help="Key of the minted leaves, e.g. rsa-2048 or ecdsa-256 (default: rsa-2048)"
+    )
+    parser.add_argument(
+        "--key-pool",
+        type=Path,
+        help="Take leaf keys from this pool (passphrase: $ISSUER_KEYPOOL_PASSWORD[_FILE])"
+    )
+    parser.add_argument(
+        "--password-file",
+        type=Path,
+        help="File with the pool passphrase"
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Print the cache size as JSON and exit"
+    )
+    args = parser.parse_args(argv)
+
+    # stdout is the helper channel: log to stderr (Squid's cache.log)
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+    try:
+        cache = LeafCache(args.cache_dir, parse_size(args.max_size), args.memory_entries)
+        if args.status:
+            print(json.dumps(cache.status()))
+            return 0
+        pool = None
+        if args.key_pool:
+            passphrase = read_passphrase(args.password_file)
+            if not passphrase:
+                raise RuntimeError("--key-pool needs ISSUER_KEYPOOL_PASSWORD or "
+                                   "ISSUER_KEYPOOL_PASSWORD_FILE")
+            pool = KeyPool(args.key_pool, passphrase)
+        minter = LeafMinter(args.key_type, pool)
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.error(f"Error: {e}")
+        return 2
+
+    helper = Helper(cache, minter)
+    logger.info(f"Helper {os.getpid()} ready: cache {args.cache_dir}, "
+                f"{args.key_type} keys from {args.key_pool or 'on-demand generation'}")
+    try:
+        helper.serve(sys.stdin.buffer, sys.stdout.buffer)
+    except ValueError as e:
+        logger.error(f"Protocol error: {e}")
+        return 1
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    logger.info(f"Helper {os.getpid()} done: {json.dumps(helper.summary())}")
+    return 0
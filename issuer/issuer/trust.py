@@ -0,0 +1,494 @@
+"""
+Trust store: a deduplicated CA bundle and an OpenSSL hashed directory.
+
+``build_ca_bundle.sh`` concatenates the system CA file with ``ca.pem`` and
+``ica-ca.pem`` on every run, and every verifier then parses a few hundred
+roots at startup. ``issuer trust build`` writes the same certificates once
+each (deduplicated by SHA-256 fingerprint) into ``trust/``:
+
+- ``trust/ca-bundle.pem``: the bundle for ``-CAfile`` / ``cafile=``, our
+  own CAs first, each certificate preceded by its subject as a comment
+- ``trust/certs/``: one file per certificate plus ``<subject hash>.N``
+  symlinks, as ``openssl rehash`` (``c_rehash``) creates them, for
+  ``-CApath`` / ``capath=``. OpenSSL then loads a CA only when a chain
+  needs it.
+- ``trust/manifest.json``: the fingerprints of every source and every
+  certificate. A rebuild only re-reads the sources whose size or mtime
+  changed, writes the certificates that are new, removes the ones that are
+  gone, relinks only the hash buckets that changed, and leaves the bundle
+  alone if its content would be the same.
+
+The subject hash is OpenSSL's ``X509_NAME_hash_ex`` (what ``openssl x509
+-hash`` prints): the first four bytes, little-endian, of the SHA-1 of the
+canonical name encoding, in which string values are UTF-8, trimmed,
+with whitespace runs collapsed and ASCII lower-cased.
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from typing import Optional
+
+from cryptography import x509
+from cryptography.utils import CryptographyDeprecationWarning
+from cryptography.hazmat.primitives import serialization
+
+from .config import BD
+
+logger = logging.getLogger(__name__)
+
+TRUST_DIR = "trust"
+BUNDLE_FILE = "ca-bundle.pem"
+CERTS_DIR = "certs"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Our own CAs, in bundle order
+OWN_CA_FILES = ("ca.pem", "ica-ca.pem")
+
+# Where build_ca_bundle.sh looks for the system CA file, in the same order
+SYSTEM_CA_FILES = (
+    "/opt/homebrew/etc/openssl@3/cert.pem",
+    "/usr/local/etc/openssl/cert.pem",
+    "/etc/ssl/certs/ca-certificates.crt",
+    "/etc/ssl/cert.pem",
+)
+
+# Names in the hashed directory: <8 hex>.<n> links, <sha256 hex>.pem files
+_LINK_RE = re.compile(r"^[0-9a-f]{8}\.\d+$")
+_CERT_RE = re.compile(r"^[0-9a-f]{64}\.pem$")
+
+# ASN.1 string tags canonicalised by OpenSSL (ASN1_MASK_CANON) and how
+# ASN1_STRING_to_UTF8 reads them
+_CANON_STRINGS = {
+    0x0c: "utf-8",       # UTF8String
+    0x13: "latin-1",     # PrintableString
+    0x14: "latin-1",     # T61String
+    0x16: "latin-1",     # IA5String
+    0x1a: "latin-1",     # VisibleString
+    0x1c: "utf-32-be",   # UniversalString
+    0x1e: "utf-16-be",   # BMPString
+}
+_SPACES = b" \t\n\v\f\r"
+_SPACE_RUN_RE = re.compile(rb"[ \t\n\v\f\r]+")
+
+
+def _der_read(data: bytes, pos: int) -> tuple[int, int, int]:
+    """Tag, content start and content end of the DER element at ``pos``."""
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(data[pos:pos + size], 'big')
+        pos += size
+    return tag, pos, pos + length
+
+
+def _der_encode(tag: int, content: bytes) -> bytes:
+    size = len(content)
+    if size < 0x80:
+        return bytes((tag, size)) + content
+    length = size.to_bytes((size.bit_length() + 7) // 8, 'big')
+    return bytes((tag, 0x80 | len(length))) + length + content
+
+
+def _canonical_value(text: str) -> bytes:
+    value = text.encode('utf-8').strip(_SPACES)
+    # bytes.lower() only touches ASCII, as ossl_tolower
+    return _SPACE_RUN_RE.sub(b" ", value).lower()
+
+
+def canonical_name(name: x509.Name) -> bytes:
+    """
+    OpenSSL's canonical encoding of a name (``x509_name_canon``): the DER
+    of its RDN sets without the outer SEQUENCE, string values re-encoded as
+    canonical UTF8Strings.
+    """
+    der = name.public_bytes()
+    _, pos, end = _der_read(der, 0)
+    canon = []
+    while pos < end:
+        _, attr_pos, set_end = _der_read(der, pos)
+        attrs = []
+        while attr_pos < set_end:
+            _, oid_pos, attr_end = _der_read(der, attr_pos)
+            _, _, oid_end = _der_read(der, oid_pos)
+            tag, value_start, value_end = _der_read(der, oid_end)
+            if tag in _CANON_STRINGS:
+                text = der[value_start:value_end].decode(_CANON_STRINGS[tag])
+                value = _der_encode(0x0c, _canonical_value(text))
+            else:
+                value = der[oid_end:value_end]
+            attrs.append(_der_encode(0x30, der[oid_pos:oid_end] + value))
+            attr_pos = attr_end
+        # SET OF: DER orders the elements by their encoding
+        canon.append(_der_encode(0x31, b"".join(sorted(attrs))))
+        pos = set_end
+    return b"".join(canon)
+
+
+def subject_hash(name: x509.Name) -> str:
+    """The hash ``openssl x509 -hash`` prints for a name (8 hex digits)."""
+    digest = hashlib.sha1(canonical_name(name)).digest()
+    return f"{int.from_bytes(digest[:4], 'little'):08x}"
+
+
+def fingerprint(cert: x509.Certificate) -> str:
+    return hashlib.sha256(cert.public_bytes(serialization.Encoding.DER)).hexdigest()
+
+
+def system_ca_file() -> Optional[Path]:
+    """The system CA bundle, found as build_ca_bundle.sh finds it."""
+    for candidate in SYSTEM_CA_FILES:
+        if os.path.isfile(candidate):
+            return Path(candidate)
+    return None
+
+
+def _write_atomic(path: Path, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class TrustStore:
+    """The ``trust/`` directory: bundle, hashed directory and manifest."""
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Output directory (``trust/`` in the base directory)
+        """
+        self.path = path
+        self.bundle_path = path / BUNDLE_FILE
+        self.certs_path = path / CERTS_DIR
+        self.manifest_path = path / MANIFEST_FILE
+
+    def load_manifest(self) -> Optional[dict]:
+        """The manifest of the last build, or None if there is none (or it is unusable)."""
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring {self.manifest_path}: {e}")
+            return None
+        if manifest.get("version") != MANIFEST_VERSION:
+            logger.warning(f"Ignoring {self.manifest_path}: version {manifest.get('version')}")
+            return None
+        return manifest
+
+    def build(self, sources: list[Path], force: bool = False) -> dict:
+        """
+        Bring the bundle and the hashed directory up to date with ``sources``.
+
+        Args:
+            sources: PEM files, in bundle order; missing ones are skipped
+            force: Re-read every source and rewrite every file
+
+        Returns:
+            A summary of what changed
+
+        Raises:
+            RuntimeError: If a source cannot be parsed or has no certificates at all
+        """
+        self.certs_path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._build(sources, force)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _build(self, sources: list[Path], force: bool) -> dict:
+        manifest = None if force else self.load_manifest()
+        if manifest is None:
+            self._clean()
+            manifest = {"sources": {}, "certificates": {}}
+        old_certs: dict = manifest["certificates"]
+
+        # Fingerprints of every source; parse only those that changed
+        source_entries = {}
+        parsed: dict[str, x509.Certificate] = {}
+        duplicates = 0
+        reparsed = 0
+        for source in dict.fromkeys(sources):
+            try:
+                st = source.stat()
+            except FileNotFoundError:
+                logger.warning(f"Skipping {source}: not found")
+                continue
+            key = str(source)
+            entry = manifest["sources"].get(key)
+            if (entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+                    and all(fp in old_certs for fp in entry["fingerprints"])):
+                source_entries[key] = entry
+                continue
+            try:
+                with warnings.catch_warnings():
+                    # Some system roots have negative serials; they are passed through as is
+                    warnings.simplefilter("ignore", CryptographyDeprecationWarning)
+                    certs = x509.load_pem_x509_certificates(source.read_bytes())
+            except (OSError, ValueError) as e:
+                raise RuntimeError(f"Failed to load {source}: {e}")
+            reparsed += 1
+            fingerprints = []
+            for cert in certs:
+                fp = fingerprint(cert)
+                if fp in fingerprints:
+                    duplicates += 1
+                    continue
+                fingerprints.append(fp)
+                parsed.setdefault(fp, cert)
+            source_entries[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                   "fingerprints": fingerprints}
+
+        # Wanted certificates in bundle order, each once
+        certificates = {}
+        for key, entry in source_entries.items():
+            for fp in entry["fingerprints"]:
+                if fp in certificates:
+                    duplicates += 1
+                    continue
+                if fp in old_certs:
+                    certificates[fp] = old_certs[fp]
+                else:
+                    cert = parsed[fp]
+                    certificates[fp] = {
+                        "hash": subject_hash(cert.subject),
+                        "subject": cert.subject.rfc4514_string(),
+                        "not_after": cert.not_valid_after_utc.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                        "source": key,
+                    }
+        if not certificates:
+            raise RuntimeError("No certificates in " + ", ".join(str(s) for s in sources))
+
+        added = [fp for fp in certificates if fp not in old_certs]
+        removed = [fp for fp in old_certs if fp not in certificates]
+        for fp in added:
+            _write_atomic(self.certs_path / f"{fp}.pem",
+                          parsed[fp].public_bytes(serialization.Encoding.PEM))
+        for fp in removed:
+            (self.certs_path / f"{fp}.pem").unlink(missing_ok=True)
+
+        relinked = self._relink(self._buckets(old_certs), self._buckets(certificates))
+
+        # The bundle only changes if its certificates or their order do
+        rewritten = force or list(certificates) != list(old_certs) or not self.bundle_path.exists()
+        if rewritten:
+            self._write_bundle(certificates)
+
+        if rewritten or relinked or added or removed or source_entries != manifest["sources"]:
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "built": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "sources": source_entries,
+                "certificates": certificates,
+            }
+            _write_atomic(self.manifest_path, json.dumps(manifest, indent=2).encode() + b"\n")
+        return {
+            "bundle": str(self.bundle_path),
+            "capath": str(self.certs_path),
+            "certificates": len(certificates),
+            "sources_read": reparsed,
+            "added": len(added),
+            "removed": len(removed),
+            "duplicates": duplicates,
+            "relinked": relinked,
+            "bundle_rewritten": rewritten,
+        }
+
+    @staticmethod
+    def _buckets(certificates: dict) -> dict[str, list[str]]:
+        """Fingerprints by subject hash; sorted, so ``.N`` suffixes are stable."""
+        buckets: dict[str, list[str]] = {}
+        for fp, entry in certificates.items():
+            buckets.setdefault(entry["hash"], []).append(fp)
+        return {h: sorted(fps) for h, fps in buckets.items()}
+
+    def _relink(self, old: dict[str, list[str]], new: dict[str, list[str]]) -> int:
+        """Recreate the ``<hash>.N`` links of the buckets that changed."""
+        changed = 0
+        for hash_ in old.keys() | new.keys():
+            if old.get(hash_) == new.get(hash_):
+                continue
+            changed += 1
+            for n in range(len(old.get(hash_, ()))):
+                (self.certs_path / f"{hash_}.{n}").unlink(missing_ok=True)
+            for n, fp in enumerate(new.get(hash_, ())):
+                link = self.certs_path / f"{hash_}.{n}"
+                link.unlink(missing_ok=True)
+                link.symlink_to(f"{fp}.pem")
+        return changed
+
+    def _write_bundle(self, certificates: dict):
+        parts = [
+            "# CA bundle written by issuer trust build\n",
+            f"# Generated: {time.strftime('%Y-%m-%d %H:%M:%S %Z')}\n",
+            f"# Certificates: {len(certificates)}\n",
+        ]
+        for fp, entry in certificates.items():
+            pem = (self.certs_path / f"{fp}.pem").read_text(encoding='ascii')
+            parts.append(f"\n# {entry['subject']}\n# SHA256 {fp}\n{pem}")
+        _write_atomic(self.bundle_path, "".join(parts).encode('utf-8'))
+
+    def _clean(self):
+        """Remove the files of a previous build whose manifest is lost."""
+        for path in self.certs_path.iterdir():
+            if _LINK_RE.match(path.name) or _CERT_RE.match(path.name):
+                path.unlink()
+
+
+class HashedDirectory:
+    """
+    Lazy certificate lookup in an OpenSSL hashed directory (``-CApath``):
+    the candidates for a name are read from ``<hash>.0``, ``<hash>.1`` ...
+    the first time that name is asked for.
+    """
+
+    def __init__(self, path: Path):
+        if not path.is_dir():
+            raise RuntimeError(f"Not a directory: {path}")
+        self.path = path
+        self._cache: dict[str, list[x509.Certificate]] = {}
+
+    def lookup(self, name: x509.Name) -> list[x509.Certificate]:
+        """The certificates whose subject is ``name``."""
+        hash_ = subject_hash(name)
+        if hash_ not in self._cache:
+            certs = []
+            n = 0
+            while True:
+                try:
+                    data = (self.path / f"{hash_}.{n}").read_bytes()
+                except FileNotFoundError:
+                    break
+                try:
+                    certs.append(x509.load_pem_x509_certificate(data))
+                except ValueError as e:
+                    logger.warning(f"Skipping {self.path / f'{hash_}.{n}'}: {e}")
+                n += 1
+            self._cache[hash_] = certs
+        return [c for c in self._cache[hash_] if c.subject == name]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``issuer trust``."""
+    parser = argparse.ArgumentParser(
+        prog="issuer trust",
+        description="Build the deduplicated CA bundle and OpenSSL hashed directory in trust/ (JSON output)"
+    )
+    parser.add_argument(
+        "action",
+        choices=["build", "list", "hash"],
+        help="build: bring trust/ up to date (only what changed); "
+             "list: the certificates of the last build; "
+             "hash FILE...: subject hash of certificates, as openssl x509 -hash"
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        type=Path,
+        help="hash: certificate files (PEM)"
+    )
+    parser.add_argument(
+        "--add",
+        type=Path,
+        action="append",
+        default=[],
+        help="build: another PEM file to trust (repeatable)"
+    )
+    parser.add_argument(
+        "--system-ca",
+        type=Path,
+        help="build: system CA bundle (default: found as build_ca_bundle.sh finds it)"
+    )
+    parser.add_argument(
+        "--no-system",
+        action="store_true",
+        help="build: only our own CAs (and --add), like ca-bundle-myca.pem"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="build: ignore the manifest and rebuild everything"
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        help="Output directory (default: trust/ in the base directory)"
+    )
+    parser.add_argument(
+        "--base-dir",
+        type=Path,
+        default=BD,
+        help="demo-cfssl directory (default: $DEMO_CFSSL_DIR or ~/.config/demo-cfssl)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.action == "hash" and not args.files:
+        parser.error("hash needs certificate files")
+    if args.action != "hash" and args.files:
+        parser.error(f"{args.action} takes no certificate files")
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+
+    if args.action == "hash":
+        failed = 0
+        for path in args.files:
+            try:
+                cert = x509.load_pem_x509_certificate(path.read_bytes())
+            except (OSError, ValueError) as e:
+                logger.error(f"{path}: {e}")
+                failed += 1
+                continue
+            print(json.dumps({"file": str(path), "hash": subject_hash(cert.subject),
+                              "subject": cert.subject.rfc4514_string(), "sha256": fingerprint(cert)}))
+        return 1 if failed else 0
+
+    store = TrustStore(args.out or args.base_dir / TRUST_DIR)
+    if args.action == "list":
+        manifest = store.load_manifest()
+        if manifest is None:
+            print(f"Error: no build in {store.path}; run 'issuer trust build'", file=sys.stderr)
+            return 2
+        for fp, entry in manifest["certificates"].items():
+            print(json.dumps({"sha256": fp, **entry}))
+        return 0
+
+    sources = [args.base_dir / name for name in OWN_CA_FILES]
+    if not args.no_system:
+        system_ca = args.system_ca or system_ca_file()
+        if system_ca is None:
+            logger.warning("System CA bundle not found; building from our own CAs only")
+        else:
+            sources.append(system_ca)
+    sources.extend(args.add)
+    try:
+        result = store.build(sources, force=args.force)
+    except (OSError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(result))
+    logger.info(f"{result['certificates']} certificates ({result['added']} added, "
+                f"{result['removed']} removed, {result['duplicates']} duplicates dropped), "
+                f"{result['relinked']} hash buckets relinked")
+    return 0
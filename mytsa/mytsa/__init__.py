@@ -2,8 +2,10 @@
 
 from .config import Config
 from .core import TimeStampAuthority
+from .keypool import KeyPool
 from .app import app
+from .verify import TokenVerifier
 
 __version__ = "0.1.0"
-__all__ = ["Config", "TimeStampAuthority", "app", "__version__"]
+__all__ = ["Config", "TimeStampAuthority", "KeyPool", "TokenVerifier", "app", "__version__"]
 
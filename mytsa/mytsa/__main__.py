@@ -8,8 +8,19 @@ import uvicorn
 
 def main():
     """Main entry point for mytsa CLI."""
+    # Subcommand: batch verification of timestamp tokens
+    if len(sys.argv) > 1 and sys.argv[1] == "verify":
+        from .verify import main as verify_main
+        sys.exit(verify_main(sys.argv[2:]))
+    # Subcommand: detached signing with timestamps for file trees
+    if len(sys.argv) > 1 and sys.argv[1] == "sign":
+        from .sign import main as sign_main
+        sys.exit(sign_main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(
-        description="mytsa - Pure-Python RFC 3161 Time Stamp Authority server"
+        description="mytsa - Pure-Python RFC 3161 Time Stamp Authority server",
+        epilog="Use 'mytsa verify --help' for batch timestamp verification and "
+               "'mytsa sign --help' for detached signing of file trees",
     )
     parser.add_argument(
         "--host",
@@ -1,9 +1,11 @@
 """FastAPI application for mytsa TSA server."""
 
+import asyncio
 import logging
 from pathlib import Path
 
 from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -38,12 +40,23 @@ app.add_middleware(
 # Initialize TSA
 config = None
 tsa = None
+reload_task = None
+
+
+async def reload_keys_periodically(interval: int):
+    """Rescan the keys directory so keys can be added/retired without restart."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(tsa.key_pool.reload)
+        except Exception as e:
+            logger.error(f"Failed to reload TSA keys: {e}")
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize TSA on startup."""
-    global config, tsa
+    global config, tsa, reload_task
     
     logger.info("Starting mytsa TSA server...")
     
@@ -66,11 +79,29 @@ async def startup_event():
     try:
         tsa = TimeStampAuthority(config)
         logger.info("TSA initialized successfully")
-        logger.info(f"TSA certificate: {config.cert_path}")
+        if config.keys_dir is not None:
+            names = ", ".join(key.name for key in tsa.key_pool.keys)
+            logger.info(f"TSA keys directory: {config.keys_dir} (active: {names})")
+        else:
+            logger.info(f"TSA certificate: {config.cert_path}")
         logger.info(f"Policy OID: {config.policy_oid}")
     except Exception as e:
         logger.error(f"Failed to initialize TSA: {e}")
         raise
+    
+    if config.keys_dir is not None and config.keys_reload_seconds > 0:
+        reload_task = asyncio.create_task(
+            reload_keys_periodically(config.keys_reload_seconds)
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop key reloading and signing workers."""
+    if reload_task is not None:
+        reload_task.cancel()
+    if tsa is not None:
+        tsa.key_pool.close()
 
 
 @app.get("/")
@@ -83,6 +114,7 @@ async def root():
         "endpoints": {
             "POST /tsa": "RFC 3161 timestamp endpoint (Content-Type: application/timestamp-query)",
             "GET /tsa/certs": "Download TSA certificate chain",
+            "GET /tsa/keys": "List active TSA signing keys",
             "GET /health": "Health check endpoint",
             "GET /": "This information page"
         },
@@ -101,19 +133,40 @@ async def health():
         "status": "healthy",
         "version": __version__,
         "tsa_ready": True,
+        "active_keys": len(tsa.key_pool.keys),
     }
 
 
+@app.get("/tsa/keys")
+async def get_tsa_keys():
+    """List active signing keys (certificate details only, no key material)."""
+    if tsa is None:
+        raise HTTPException(status_code=503, detail="TSA not initialized")
+    
+    return {"keys": [key.info() for key in tsa.key_pool.keys]}
+
+
 @app.get("/tsa/certs")
 async def get_tsa_certs():
     """
     Serve TSA certificate chain.
     
     Returns the certificate chain (TSA cert + intermediates + root) as a downloadable PEM file.
+    With a keys directory, the chains of all active keys are concatenated.
     """
-    if config is None:
+    if config is None or tsa is None:
         raise HTTPException(status_code=503, detail="TSA not initialized")
     
+    if config.keys_dir is not None:
+        pem_data = "".join(key.chain_path.read_text() for key in tsa.key_pool.keys)
+        return Response(
+            content=pem_data,
+            media_type="application/x-pem-file",
+            headers={
+                "Content-Disposition": "attachment; filename=tsa-chain.pem"
+            }
+        )
+    
     chain_path = config.chain_path
     
     if not chain_path.exists():
@@ -164,7 +217,8 @@ async def timestamp(request: Request):
     
     # Process TSQ and generate TSR
     try:
-        tsr_data = tsa.process_request(tsq_data)
+        # Signing runs on per-key workers; keep the event loop free meanwhile
+        tsr_data = await run_in_threadpool(tsa.process_request, tsq_data)
         logger.info(f"Generated TSR response ({len(tsr_data)} bytes)")
     except Exception as e:
         logger.error(f"Failed to process TSQ: {e}")
@@ -47,6 +47,17 @@ class Config:
             "1"
         ))
         
+        # Optional directory of signing keys (one sub-directory per key).
+        # When set, cert/key/chain paths above are ignored.
+        keys_dir = os.getenv("TSA_KEYS_DIR")
+        self.keys_dir: Optional[Path] = Path(keys_dir) if keys_dir else None
+        
+        # How often to rescan the keys directory for added/retired keys
+        self.keys_reload_seconds = int(os.getenv(
+            "TSA_KEYS_RELOAD_SECONDS",
+            "30"
+        ))
+        
         # Optional key password
         self.key_password: Optional[bytes] = None
         key_pass_str = os.getenv("TSA_KEY_PASSWORD")
@@ -62,18 +73,25 @@ class Config:
         """
         errors = []
         
-        if not self.cert_path.exists():
-            errors.append(f"TSA certificate not found: {self.cert_path}")
-        
-        if not self.key_path.exists():
-            errors.append(f"TSA private key not found: {self.key_path}")
-        
-        if not self.chain_path.exists():
-            errors.append(f"TSA certificate chain not found: {self.chain_path}")
+        if self.keys_dir is not None:
+            if not self.keys_dir.is_dir():
+                errors.append(f"TSA keys directory not found: {self.keys_dir}")
+        else:
+            if not self.cert_path.exists():
+                errors.append(f"TSA certificate not found: {self.cert_path}")
+            
+            if not self.key_path.exists():
+                errors.append(f"TSA private key not found: {self.key_path}")
+            
+            if not self.chain_path.exists():
+                errors.append(f"TSA certificate chain not found: {self.chain_path}")
         
         if self.accuracy_seconds < 0:
             errors.append(f"Accuracy seconds must be non-negative: {self.accuracy_seconds}")
         
+        if self.keys_reload_seconds < 0:
+            errors.append(f"Keys reload seconds must be non-negative: {self.keys_reload_seconds}")
+        
         return errors
     
     def __repr__(self) -> str:
@@ -86,6 +104,7 @@ class Config:
             f"serial_path={self.serial_path}, "
             f"policy_oid={self.policy_oid}, "
             f"accuracy_seconds={self.accuracy_seconds}, "
+            f"keys_dir={self.keys_dir}, "
             f"key_password={'***' if self.key_password else 'None'}"
             f")"
         )
@@ -2,12 +2,25 @@
 
 import hashlib
 from datetime import datetime, timezone
-from asn1crypto import algos, cms, core, tsp
+from asn1crypto import algos, cms, core, tsp, x509
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
 
 from .config import Config
-from .utils import get_next_serial, load_certificate_chain, load_private_key
+from .keypool import KeyPool, SigningKey
+from .utils import get_next_serial
+
+
+class _RejectionResp(core.Sequence):
+    """
+    TimeStampResp without a token.
+    
+    asn1crypto declares timeStampToken as mandatory, so rejection responses
+    (where RFC 3161 requires it to be absent) are encoded with this subset.
+    """
+    _fields = [
+        ('status', tsp.PKIStatusInfo),
+    ]
 
 
 class TimeStampAuthority:
@@ -16,6 +29,7 @@ class TimeStampAuthority:
     
     This class handles:
     - Parsing TimeStampReq (TSQ) requests
+    - Selecting a signing key from the key pool (per policy OID, round-robin)
     - Generating TSTInfo structures
     - Creating CMS SignedData wrappers
     - Building TimeStampResp (TSR) responses
@@ -38,11 +52,8 @@ class TimeStampAuthority:
         if errors:
             raise RuntimeError(f"Invalid configuration: {'; '.join(errors)}")
         
-        # Load certificate chain
-        self.tsa_cert, self.chain_certs = load_certificate_chain(config.chain_path)
-        
-        # Load private key
-        self.private_key = load_private_key(config.key_path, config.key_password)
+        # Load signing keys and certificate chains
+        self.key_pool = KeyPool(config)
     
     def process_request(self, tsq_data: bytes) -> bytes:
         """
@@ -72,6 +83,13 @@ class TimeStampAuthority:
         if digest_oid not in ('2.16.840.1.101.3.4.2.1', '2.16.840.1.101.3.4.2.2'):
             return self._error_response('bad_alg', f"Unsupported hash algorithm: {digest_oid}")
         
+        # Select signing key for the requested (or default) policy
+        req_policy = tsq['req_policy'].dotted if tsq['req_policy'].native is not None else None
+        policy_oid = req_policy or self.config.policy_oid
+        key = self.key_pool.select(policy_oid)
+        if key is None:
+            return self._error_response('unaccepted_policy', f"Unsupported policy: {policy_oid}")
+        
         # Get next serial number
         try:
             serial = get_next_serial(self.config.serial_path)
@@ -82,7 +100,7 @@ class TimeStampAuthority:
         now = datetime.now(timezone.utc)
         tst_info = tsp.TSTInfo({
             'version': 'v1',
-            'policy': self.config.policy_oid,
+            'policy': policy_oid,
             'message_imprint': mi,
             'serial_number': serial,
             'gen_time': core.GeneralizedTime(now),
@@ -96,7 +114,7 @@ class TimeStampAuthority:
         
         # Create CMS SignedData
         try:
-            signed_data = self._create_signed_data(tst_info)
+            signed_data = self._create_signed_data(tst_info, key)
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -129,26 +147,23 @@ class TimeStampAuthority:
             traceback.print_exc()
             return self._error_response('system_failure', f"Failed to create TSR: {e}")
     
-    def _create_signed_data(self, tst_info: tsp.TSTInfo) -> cms.SignedData:
+    def _create_signed_data(self, tst_info: tsp.TSTInfo, key: SigningKey) -> cms.SignedData:
         """
         Create CMS SignedData for TSTInfo.
         
         Args:
             tst_info: TSTInfo structure to sign
+            key: Signing key (with certificate chain) to use
             
         Returns:
             CMS SignedData structure
         """
-        # Encapsulate TSTInfo as eContent with contentType 'tst_info'
-        # Build EncapsulatedContentInfo first to ensure the correct [0] EXPLICIT tag
+        # Encapsulate TSTInfo as eContent [0] EXPLICIT OCTET STRING with
+        # contentType 'tst_info' (1.2.840.113549.1.9.16.1.4)
         encapsulated = cms.EncapsulatedContentInfo({
-            'content_type': cms.ContentType('tst_info'),  # 1.2.840.113549.1.9.16.1.4
-            'content': tst_info
+            'content_type': cms.ContentType('tst_info'),
+            'content': cms.ParsableOctetString(tst_info.dump())
         })
-
-        # asn1crypto's SignedData expects a cms.ContentInfo instance, so we reload
-        # the encoded structure as ContentInfo to preserve the tagging produced above.
-        econtent = cms.ContentInfo.load(encapsulated.dump())
         
         # Determine hash algorithm
         hash_algo = 'sha256'
@@ -170,29 +185,42 @@ class TimeStampAuthority:
                 'type': cms.CMSAttributeType('signing_time'),
                 'values': [cms.Time({'generalized_time': core.GeneralizedTime(datetime.now(timezone.utc))})]
             }),
-            # Optional ESS signing-certificate-v2 attribute could be added here
+            # ESS signing-certificate-v2 binds the token to the TSA certificate (RFC 5816)
+            cms.CMSAttribute({
+                'type': cms.CMSAttributeType('signing_certificate_v2'),
+                'values': [tsp.SigningCertificateV2({
+                    'certs': [tsp.ESSCertIDv2({
+                        'hash_algorithm': algos.DigestAlgorithm({'algorithm': hash_algo}),
+                        'cert_hash': hashlib.sha256(key.tsa_cert.dump()).digest(),
+                        'issuer_serial': tsp.IssuerSerial({
+                            'issuer': [x509.GeneralName({'directory_name': key.tsa_cert.issuer})],
+                            'serial_number': key.tsa_cert.serial_number,
+                        }),
+                    })]
+                })]
+            }),
         ])
 
         signed_attr_bytes = signed_attrs.dump()
         
         # Sign the DER of signed attributes
-        signature = self._sign_data(signed_attr_bytes, hash_func)
+        signature = key.sign(signed_attr_bytes, hash_func)
         
         # Determine signature algorithm
-        if isinstance(self.private_key, rsa.RSAPrivateKey):
+        if isinstance(key.private_key, rsa.RSAPrivateKey):
             sig_algo = algos.SignedDigestAlgorithm({'algorithm': 'rsassa_pkcs1v15'})
-        elif isinstance(self.private_key, ec.EllipticCurvePrivateKey):
+        elif isinstance(key.private_key, ec.EllipticCurvePrivateKey):
             sig_algo = algos.SignedDigestAlgorithm({'algorithm': 'sha256_ecdsa'})
         else:
-            raise RuntimeError(f"Unsupported key type: {type(self.private_key)}")
+            raise RuntimeError(f"Unsupported key type: {type(key.private_key)}")
         
         # Create SignerInfo
         signer_info = cms.SignerInfo({
             'version': 'v1',
             'sid': cms.SignerIdentifier({
                 'issuer_and_serial_number': cms.IssuerAndSerialNumber({
-                    'issuer': self.tsa_cert.issuer,
-                    'serial_number': self.tsa_cert.serial_number
+                    'issuer': key.tsa_cert.issuer,
+                    'serial_number': key.tsa_cert.serial_number
                 })
             }),
             'digest_algorithm': algos.DigestAlgorithm({'algorithm': hash_algo}),
@@ -202,41 +230,16 @@ class TimeStampAuthority:
         })
         
         # Build SignedData
+        # Version 3 because eContentType is not id-data (RFC 5652, 5.1)
         signed_data = cms.SignedData()
-        signed_data['version'] = 'v1'
+        signed_data['version'] = 'v3'
         signed_data['digest_algorithms'] = [algos.DigestAlgorithm({'algorithm': hash_algo})]
-        signed_data['encap_content_info'] = econtent  # ContentInfo with ParsableOctetString
-        signed_data['certificates'] = [self.tsa_cert] + self.chain_certs
+        signed_data['encap_content_info'] = encapsulated
+        signed_data['certificates'] = [key.tsa_cert] + key.chain_certs
         signed_data['signer_infos'] = [signer_info]
         
         return signed_data
     
-    def _sign_data(self, data: bytes, hash_func) -> bytes:
-        """
-        Sign data with private key.
-        
-        Args:
-            data: Data to sign
-            hash_func: Hash function to use
-            
-        Returns:
-            Signature bytes
-        """
-        if isinstance(self.private_key, rsa.RSAPrivateKey):
-            return self.private_key.sign(
-                data,
-                padding.PKCS1v15(),
-                hash_func
-            )
-        elif isinstance(self.private_key, ec.EllipticCurvePrivateKey):
-            return self.private_key.sign(
-                data,
-                ec.ECDSA(hash_func)
-            )
-        else:
-            raise RuntimeError(f"Unsupported key type: {type(self.private_key)}")
-    
-    
     def _error_response(self, fail_code: str, message: str) -> bytes:
         """
         Build error TimeStampResp.
@@ -249,7 +252,7 @@ class TimeStampAuthority:
             DER-encoded TimeStampResp with rejection status
         """
         # PKIFailureInfo expects a set of strings, not a dict
-        resp = tsp.TimeStampResp({
+        resp = _RejectionResp({
             'status': tsp.PKIStatusInfo({
                 'status': 'rejection',
                 'status_string': [message],
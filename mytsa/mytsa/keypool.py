@@ -0,0 +1,282 @@
+"""Signing key pool for mytsa TSA server.
+
+A pool holds one or more TSA signing keys, each with its own certificate
+chain (as produced by ``step_tsa`` in ``steps.sh``) and its own dedicated
+signing worker. Keys are selected per request policy OID or round-robin,
+and can be added or retired at runtime by rescanning the keys directory.
+
+Keys directory layout (one sub-directory per key)::
+
+    $TSA_KEYS_DIR/
+    ├── mytsa-2025/
+    │   ├── cert.pem
+    │   ├── key.pem
+    │   ├── bundle-3.pem
+    │   └── policy.txt      (optional: policy OIDs served, one per line)
+    └── mytsa-2026/
+        ├── ...
+        └── retired         (optional: marker file, key stops signing)
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+
+from .config import Config
+from .utils import load_certificate_chain, load_private_key
+
+logger = logging.getLogger(__name__)
+
+
+class SigningKey:
+    """A TSA private key with its certificate chain and signing worker."""
+
+    def __init__(self, name: str, cert_path: Path, key_path: Path, chain_path: Path,
+                 key_password: Optional[bytes] = None,
+                 policies: Optional[list[str]] = None):
+        """
+        Load key material and start the dedicated signing worker.
+
+        Raises:
+            RuntimeError: If certificates or key cannot be loaded
+        """
+        self.name = name
+        self.cert_path = cert_path
+        self.key_path = key_path
+        self.chain_path = chain_path
+        self.policies = policies or []
+
+        self.tsa_cert, self.chain_certs = load_certificate_chain(chain_path)
+        self.private_key = load_private_key(key_path, key_password)
+
+        # Certificate fingerprint identifies this key version on reload
+        self.fingerprint = self.tsa_cert.sha256
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"tsa-key-{name}"
+        )
+
+    @property
+    def not_before(self) -> datetime:
+        return self.tsa_cert['tbs_certificate']['validity']['not_before'].native
+
+    @property
+    def not_after(self) -> datetime:
+        return self.tsa_cert['tbs_certificate']['validity']['not_after'].native
+
+    def is_valid(self, now: Optional[datetime] = None) -> bool:
+        """Check whether the TSA certificate is currently valid."""
+        now = now or datetime.now(timezone.utc)
+        return self.not_before <= now <= self.not_after
+
+    def serves(self, policy_oid: str, default_policy: str) -> bool:
+        """Check whether this key may sign tokens under ``policy_oid``."""
+        if self.policies:
+            return policy_oid in self.policies
+        return policy_oid == default_policy
+
+    def sign(self, data: bytes, hash_func) -> bytes:
+        """
+        Sign data on this key's dedicated worker.
+
+        Args:
+            data: Data to sign
+            hash_func: Hash function to use
+
+        Returns:
+            Signature bytes
+        """
+        try:
+            future = self._executor.submit(self._sign, data, hash_func)
+        except RuntimeError:
+            # Key was retired after being selected: finish this request inline
+            return self._sign(data, hash_func)
+        return future.result()
+
+    def _sign(self, data: bytes, hash_func) -> bytes:
+        if isinstance(self.private_key, rsa.RSAPrivateKey):
+            return self.private_key.sign(
+                data,
+                padding.PKCS1v15(),
+                hash_func
+            )
+        elif isinstance(self.private_key, ec.EllipticCurvePrivateKey):
+            return self.private_key.sign(
+                data,
+                ec.ECDSA(hash_func)
+            )
+        else:
+            raise RuntimeError(f"Unsupported key type: {type(self.private_key)}")
+
+    def close(self):
+        """Stop accepting work; queued signatures still complete."""
+        self._executor.shutdown(wait=False)
+
+    def info(self) -> dict:
+        """Return a JSON-serializable summary (no key material)."""
+        return {
+            "name": self.name,
+            "subject": self.tsa_cert.subject.human_friendly,
+            "serial_number": format(self.tsa_cert.serial_number, 'x'),
+            "not_before": self.not_before.isoformat(),
+            "not_after": self.not_after.isoformat(),
+            "policies": self.policies,
+            "fingerprint": self.fingerprint.hex(),
+        }
+
+
+class KeyPool:
+    """
+    Set of active TSA signing keys.
+
+    In single-key mode (``TSA_KEYS_DIR`` unset) the pool holds the key from
+    ``TSA_CERT_PATH``/``TSA_KEY_PATH``/``TSA_CHAIN_PATH``. In directory mode
+    the pool is rebuilt by :meth:`reload`, which adds new keys and retires
+    removed, expired or ``retired``-marked ones. Retired keys finish signing
+    requests already queued on their worker, so rotation needs no restart.
+    """
+
+    def __init__(self, config: Config):
+        """
+        Initialize pool and load keys.
+
+        Raises:
+            RuntimeError: If no usable signing key is found
+        """
+        self.config = config
+        self._keys: dict[str, SigningKey] = {}
+        self._lock = threading.Lock()
+        self._counter = 0
+
+        if config.keys_dir is None:
+            self._keys["default"] = SigningKey(
+                "default",
+                config.cert_path,
+                config.key_path,
+                config.chain_path,
+                config.key_password,
+            )
+        else:
+            self.reload()
+
+        if not self._keys:
+            raise RuntimeError(f"No usable TSA signing keys found in {config.keys_dir}")
+
+    @property
+    def keys(self) -> list[SigningKey]:
+        """Active keys, ordered by name."""
+        with self._lock:
+            return [self._keys[name] for name in sorted(self._keys)]
+
+    def select(self, policy_oid: Optional[str] = None) -> Optional[SigningKey]:
+        """
+        Pick a key for a request, round-robin among keys serving the policy.
+
+        Args:
+            policy_oid: Requested policy OID (default policy if None)
+
+        Without any ``policy.txt`` configured, every key serves every
+        requested policy, as the single-key server always did.
+
+        Returns:
+            Signing key, or None if no active key serves the policy
+        """
+        policy_oid = policy_oid or self.config.policy_oid
+        with self._lock:
+            keys = [self._keys[name] for name in sorted(self._keys)]
+            if any(key.policies for key in keys):
+                candidates = [key for key in keys
+                              if key.serves(policy_oid, self.config.policy_oid)]
+            else:
+                candidates = keys
+            if not candidates:
+                return None
+            key = candidates[self._counter % len(candidates)]
+            self._counter += 1
+            return key
+
+    def reload(self) -> None:
+        """
+        Rescan the keys directory and update the pool.
+
+        Keys that fail to load are logged and skipped; the previous version of
+        a key stays active until its replacement loads successfully.
+        """
+        if self.config.keys_dir is None:
+            return
+
+        found: dict[str, SigningKey] = {}
+        now = datetime.now(timezone.utc)
+        key_dirs = sorted(p for p in self.config.keys_dir.iterdir() if p.is_dir()) \
+            if self.config.keys_dir.is_dir() else []
+
+        for key_dir in key_dirs:
+            name = key_dir.name
+            if (key_dir / "retired").exists():
+                continue
+            cert_path = key_dir / "cert.pem"
+            key_path = key_dir / "key.pem"
+            chain_path = key_dir / "bundle-3.pem"
+            if not (cert_path.exists() and key_path.exists() and chain_path.exists()):
+                continue
+
+            current = self._keys.get(name)
+            try:
+                policies = _read_policies(key_dir / "policy.txt")
+                if current is not None and current.policies == policies \
+                        and _same_cert(current, chain_path):
+                    key = current
+                else:
+                    key = SigningKey(name, cert_path, key_path, chain_path,
+                                     self.config.key_password, policies)
+            except RuntimeError as e:
+                logger.error(f"Failed to load TSA key '{name}': {e}")
+                if current is not None:
+                    found[name] = current
+                continue
+
+            if not key.is_valid(now):
+                logger.warning(f"TSA key '{name}' certificate is not currently valid, skipping")
+                continue
+            found[name] = key
+
+        with self._lock:
+            old = self._keys
+            self._keys = found
+
+        for name, key in old.items():
+            if found.get(name) is not key:
+                logger.info(f"Retiring TSA key '{name}'")
+                key.close()
+        for name, key in found.items():
+            if old.get(name) is not key:
+                logger.info(f"Activated TSA key '{name}' (policies: {key.policies or ['default']})")
+
+    def close(self):
+        """Shut down all signing workers."""
+        with self._lock:
+            keys, self._keys = self._keys, {}
+        for key in keys.values():
+            key.close()
+
+
+def _read_policies(path: Path) -> list[str]:
+    """Read policy OIDs (one per line, '#' comments allowed)."""
+    if not path.exists():
+        return []
+    try:
+        lines = path.read_text().splitlines()
+    except OSError as e:
+        raise RuntimeError(f"Failed to read policy file {path}: {e}")
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def _same_cert(key: SigningKey, chain_path: Path) -> bool:
+    """Check whether the chain file still holds the loaded certificate."""
+    tsa_cert, _ = load_certificate_chain(chain_path)
+    return tsa_cert.sha256 == key.fingerprint
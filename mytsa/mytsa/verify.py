@@ -0,0 +1,491 @@
+"""Native batch verifier for RFC 3161 timestamp tokens.
+
+Replaces the chain of ``openssl`` invocations in ``tsa_verify.sh`` with an
+in-process check of many (data file, .tsr) pairs:
+
+- TimeStampResp status and TSTInfo parsing
+- Message imprint against a streaming hash of the data file
+- CMS signature over the signed attributes
+- Critical ``timeStamping`` Extended Key Usage on the TSA certificate
+- Certificate chain to a trusted root (validated once per TSA certificate)
+
+Results are written as JSON lines, one object per pair.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from asn1crypto import cms, core, tsp
+from asn1crypto import x509 as asn1_x509
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID
+
+# Read size used when hashing data files
+CHUNK_SIZE = 1024 * 1024
+
+# asn1crypto digest names -> hashlib / cryptography algorithms
+_HASHLIB_NAMES = {
+    'sha1': 'sha1',
+    'sha224': 'sha224',
+    'sha256': 'sha256',
+    'sha384': 'sha384',
+    'sha512': 'sha512',
+}
+
+_CRYPTO_HASHES = {
+    'sha1': hashes.SHA1,
+    'sha224': hashes.SHA224,
+    'sha256': hashes.SHA256,
+    'sha384': hashes.SHA384,
+    'sha512': hashes.SHA512,
+}
+
+
+class ChainResult:
+    """Outcome of validating one TSA certificate chain."""
+
+    def __init__(self, ok: bool, error: Optional[str] = None,
+                 subjects: Optional[list[str]] = None,
+                 not_before: Optional[datetime] = None,
+                 not_after: Optional[datetime] = None):
+        self.ok = ok
+        self.error = error
+        self.subjects = subjects or []
+        # Intersection of validity periods along the path
+        self.not_before = not_before
+        self.not_after = not_after
+
+
+class TokenVerifier:
+    """
+    Verify RFC 3161 timestamp responses against their data files.
+
+    Trust anchors and the per-certificate chain cache are shared across all
+    tokens, so each distinct TSA certificate is parsed and validated once no
+    matter how many tokens it signed.
+    """
+
+    def __init__(self, ca_certs: Optional[list[x509.Certificate]] = None,
+                 untrusted: Optional[list[x509.Certificate]] = None):
+        """
+        Initialize verifier.
+
+        Args:
+            ca_certs: Trusted certificates (chain validation is skipped if None)
+            untrusted: Additional intermediates available for path building
+        """
+        self.ca_certs = ca_certs
+        self.untrusted = untrusted or []
+        self._chain_cache: dict[bytes, ChainResult] = {}
+        self._chain_lock = threading.Lock()
+        # Parsed certificates keyed by DER, shared by all tokens of one TSA
+        self._cert_cache: dict[bytes, x509.Certificate] = {}
+
+    @classmethod
+    def from_files(cls, ca_file: Optional[Path] = None,
+                   untrusted_file: Optional[Path] = None) -> "TokenVerifier":
+        """Create a verifier from PEM bundle files."""
+        ca_certs = load_pem_certificates(ca_file) if ca_file else None
+        untrusted = load_pem_certificates(untrusted_file) if untrusted_file else []
+        return cls(ca_certs, untrusted)
+
+    def verify(self, data_path: Path, tsr_path: Path) -> dict:
+        """
+        Verify one timestamp response against its data file.
+
+        Args:
+            data_path: File that was timestamped
+            tsr_path: DER-encoded TimeStampResp
+
+        Returns:
+            Result dictionary (JSON serializable)
+        """
+        result = {
+            'data': str(data_path),
+            'tsr': str(tsr_path),
+            'status': 'error',
+        }
+        try:
+            result.update(self._verify(data_path, tsr_path))
+        except Exception as e:
+            result['error'] = str(e)
+            return result
+
+        checks = [result['granted'], result['imprint'], result['signature'], result['eku']]
+        if self.ca_certs is not None:
+            checks.append(result['chain'])
+        result['status'] = 'ok' if all(checks) else 'failed'
+        return result
+
+    def verify_many(self, pairs: Iterable[tuple[Path, Path]],
+                    workers: int = 4) -> Iterator[dict]:
+        """
+        Verify many pairs in parallel, yielding results in input order.
+
+        Data files are hashed on a thread pool; ``hashlib`` releases the GIL
+        for large buffers, so hashing scales with the number of workers.
+        Only a bounded window of pairs is in flight, so arbitrarily long
+        manifests can be streamed.
+        """
+        workers = max(1, workers)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for data_path, tsr_path in pairs:
+                pending.append(executor.submit(self.verify, data_path, tsr_path))
+                if len(pending) >= workers * 4:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _verify(self, data_path: Path, tsr_path: Path) -> dict:
+        """Run all checks, raising on malformed input."""
+        resp = tsp.TimeStampResp.load(tsr_path.read_bytes())
+        status = resp['status']['status'].native
+        if status not in ('granted', 'granted_with_mods'):
+            return {
+                'granted': False, 'imprint': False, 'signature': False,
+                'eku': False, 'chain': None,
+                'error': f"TSA status: {status}",
+            }
+
+        signed_data = resp['time_stamp_token']['content']
+        econtent = _econtent_bytes(signed_data['encap_content_info'])
+        tst_info = tsp.TSTInfo.load(econtent)
+
+        # Message imprint against the data file
+        mi = tst_info['message_imprint']
+        imprint_algo = mi['hash_algorithm']['algorithm'].native
+        digest = hash_file(data_path, imprint_algo)
+        imprint_ok = digest == mi['hashed_message'].native
+
+        # CMS signature
+        certs = [c.chosen for c in signed_data['certificates'] or []
+                 if isinstance(c.chosen, asn1_x509.Certificate)]
+        signer_info = signed_data['signer_infos'][0]
+        signer = _find_signer(signer_info, certs)
+        if signer is None:
+            raise ValueError("Signer certificate not included in token")
+        signer_cert = self._load_cert(signer.dump())
+        signature_ok = _verify_signer_info(signer_info, signer_cert, econtent)
+
+        # EKU and chain
+        eku_ok = _has_timestamping_eku(signer_cert)
+        gen_time = tst_info['gen_time'].native
+        chain_ok = None
+        chain_error = None
+        chain = None
+        if self.ca_certs is not None:
+            chain = self.validate_chain(signer_cert, certs)
+            chain_ok = chain.ok
+            chain_error = chain.error
+            if chain.ok and not (chain.not_before <= gen_time <= chain.not_after):
+                chain_ok = False
+                chain_error = "Timestamp outside certificate validity period"
+
+        result = {
+            'granted': True,
+            'imprint': imprint_ok,
+            'signature': signature_ok,
+            'eku': eku_ok,
+            'chain': chain_ok,
+            'gen_time': gen_time.isoformat(),
+            'serial': tst_info['serial_number'].native,
+            'policy': tst_info['policy'].dotted,
+            'hash_algorithm': imprint_algo,
+            'tsa': signer_cert.subject.rfc4514_string(),
+            'fingerprint': signer_cert.fingerprint(hashes.SHA256()).hex(),
+        }
+        if tst_info['nonce'].native is not None:
+            result['nonce'] = tst_info['nonce'].native
+        if chain is not None:
+            result['chain_subjects'] = chain.subjects
+        if chain_error:
+            result['error'] = chain_error
+        return result
+
+    def validate_chain(self, cert: x509.Certificate,
+                       token_certs: list[asn1_x509.Certificate]) -> ChainResult:
+        """
+        Build and validate the path from ``cert`` to a trusted root.
+
+        Results are cached by the SHA-256 fingerprint of ``cert``; the
+        certificates embedded in the token are only parsed on a cache miss.
+        """
+        key = cert.fingerprint(hashes.SHA256())
+        with self._chain_lock:
+            cached = self._chain_cache.get(key)
+            if cached is None:
+                pool = [self._load_cert(c.dump()) for c in token_certs] + self.untrusted
+                cached = self._build_path(cert, pool)
+                self._chain_cache[key] = cached
+            return cached
+
+    def _load_cert(self, der: bytes) -> x509.Certificate:
+        """Parse a DER certificate, reusing earlier parses."""
+        cert = self._cert_cache.get(der)
+        if cert is None:
+            cert = self._cert_cache.setdefault(der, x509.load_der_x509_certificate(der))
+        return cert
+
+    def _build_path(self, cert: x509.Certificate,
+                    pool: list[x509.Certificate]) -> ChainResult:
+        """Walk issuer links until a trusted self-signed root is reached."""
+        trusted = {c.fingerprint(hashes.SHA256()) for c in self.ca_certs}
+        candidates = list(self.ca_certs) + pool
+        path = [cert]
+        current = cert
+
+        while True:
+            if _is_self_signed(current):
+                if current.fingerprint(hashes.SHA256()) in trusted:
+                    break
+                return ChainResult(False, "Untrusted root certificate",
+                                   [c.subject.rfc4514_string() for c in path])
+            issuer = _find_issuer(current, candidates)
+            if issuer is None:
+                return ChainResult(False, "Unable to find issuer certificate",
+                                   [c.subject.rfc4514_string() for c in path])
+            if issuer in path or len(path) > 10:
+                return ChainResult(False, "Certificate path loop detected")
+            path.append(issuer)
+            current = issuer
+
+        for ca_cert in path[1:]:
+            try:
+                constraints = ca_cert.extensions.get_extension_for_class(x509.BasicConstraints)
+                if not constraints.value.ca:
+                    return ChainResult(False, f"Not a CA certificate: {ca_cert.subject.rfc4514_string()}")
+            except x509.ExtensionNotFound:
+                pass
+
+        return ChainResult(
+            True,
+            subjects=[c.subject.rfc4514_string() for c in path],
+            not_before=max(c.not_valid_before_utc for c in path),
+            not_after=min(c.not_valid_after_utc for c in path),
+        )
+
+
+def load_pem_certificates(path: Path) -> list[x509.Certificate]:
+    """
+    Load all certificates from a PEM bundle.
+
+    Raises:
+        RuntimeError: If file cannot be read or contains no certificates
+    """
+    try:
+        return x509.load_pem_x509_certificates(path.read_bytes())
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Failed to load certificates from {path}: {e}")
+
+
+def hash_file(path: Path, algorithm: str) -> bytes:
+    """Hash a file in fixed-size chunks."""
+    name = _HASHLIB_NAMES.get(algorithm)
+    if name is None:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+    h = hashlib.new(name)
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.digest()
+
+
+def _econtent_bytes(encap: cms.EncapsulatedContentInfo) -> bytes:
+    """Return the raw DER of the encapsulated TSTInfo."""
+    content = encap['content']
+    if isinstance(content, core.Any):
+        content = content.parsed
+    return bytes(content)
+
+
+def _find_signer(signer_info: cms.SignerInfo, certs: list):
+    """Locate the signer certificate referenced by the SignerIdentifier."""
+    sid = signer_info['sid']
+    if sid.name == 'issuer_and_serial_number':
+        issuer = sid.chosen['issuer']
+        serial = sid.chosen['serial_number'].native
+        for cert in certs:
+            if cert.serial_number == serial and cert.issuer == issuer:
+                return cert
+    else:
+        key_id = sid.chosen.native
+        for cert in certs:
+            if cert.key_identifier == key_id:
+                return cert
+    return None
+
+
+def _verify_signer_info(signer_info: cms.SignerInfo, cert: x509.Certificate,
+                        econtent: bytes) -> bool:
+    """Check the messageDigest attribute and the signature over signed attributes."""
+    digest_algo = signer_info['digest_algorithm']['algorithm'].native
+    hash_cls = _CRYPTO_HASHES.get(digest_algo)
+    if hash_cls is None:
+        raise ValueError(f"Unsupported digest algorithm: {digest_algo}")
+
+    signed_attrs = signer_info['signed_attrs']
+    if signed_attrs.native is None:
+        # No signed attributes: signature covers eContent directly
+        signed_bytes = econtent
+    else:
+        message_digest = None
+        for attr in signed_attrs:
+            if attr['type'].native == 'message_digest':
+                message_digest = attr['values'][0].native
+        if message_digest != hashlib.new(_HASHLIB_NAMES[digest_algo], econtent).digest():
+            return False
+        # Signature is computed over the DER SET OF, not the [0] IMPLICIT tag
+        signed_bytes = signed_attrs.untag().dump()
+
+    signature = signer_info['signature'].native
+    sig_algo = signer_info['signature_algorithm'].signature_algo
+    public_key = cert.public_key()
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            if sig_algo == 'rsassa_pss':
+                pad = padding.PSS(mgf=padding.MGF1(hash_cls()),
+                                  salt_length=padding.PSS.AUTO)
+            else:
+                pad = padding.PKCS1v15()
+            public_key.verify(signature, signed_bytes, pad, hash_cls())
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(signature, signed_bytes, ec.ECDSA(hash_cls()))
+        else:
+            raise ValueError(f"Unsupported key type: {type(public_key).__name__}")
+    except InvalidSignature:
+        return False
+    return True
+
+
+def _has_timestamping_eku(cert: x509.Certificate) -> bool:
+    """RFC 3161 requires a sole, critical timeStamping EKU."""
+    try:
+        ext = cert.extensions.get_extension_for_class(x509.ExtendedKeyUsage)
+    except x509.ExtensionNotFound:
+        return False
+    return ext.critical and list(ext.value) == [ExtendedKeyUsageOID.TIME_STAMPING]
+
+
+def _is_self_signed(cert: x509.Certificate) -> bool:
+    """Check whether a certificate is self-issued and self-signed."""
+    if cert.issuer != cert.subject:
+        return False
+    try:
+        cert.verify_directly_issued_by(cert)
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+    return True
+
+
+def _find_issuer(cert: x509.Certificate,
+                 candidates: list[x509.Certificate]) -> Optional[x509.Certificate]:
+    """Find the candidate whose key signed ``cert``."""
+    for candidate in candidates:
+        if candidate.subject != cert.issuer:
+            continue
+        try:
+            cert.verify_directly_issued_by(candidate)
+        except (ValueError, TypeError, InvalidSignature):
+            continue
+        return candidate
+    return None
+
+
+def default_tsr_path(data_path: Path) -> Path:
+    """Return the timestamp file ``tsa_sign.sh`` writes for a data file."""
+    signed = data_path.with_name(data_path.name + ".sign_tsa.tsr")
+    if signed.exists():
+        return signed
+    return data_path.with_name(data_path.name + ".tsr")
+
+
+def read_manifest(lines: Iterable[str]) -> Iterator[tuple[Path, Path]]:
+    """
+    Parse a manifest of ``data<TAB>tsr`` lines.
+
+    Lines with a single column use the default ``.sign_tsa.tsr`` / ``.tsr``
+    naming. Empty lines and ``#`` comments are skipped.
+    """
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        parts = line.split("\t")
+        data_path = Path(parts[0]).expanduser()
+        if len(parts) > 1 and parts[1]:
+            yield data_path, Path(parts[1]).expanduser()
+        else:
+            yield data_path, default_tsr_path(data_path)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point for ``mytsa verify``."""
+    parser = argparse.ArgumentParser(
+        prog="mytsa verify",
+        description="Verify RFC 3161 timestamp tokens against their data files (JSON lines output)"
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        type=Path,
+        help="Data files (timestamp read from <file>.sign_tsa.tsr or <file>.tsr)"
+    )
+    parser.add_argument(
+        "--manifest",
+        help="File with one 'data<TAB>tsr' pair per line ('-' for stdin)"
+    )
+    parser.add_argument(
+        "--ca-file",
+        type=Path,
+        help="Trusted CA bundle; enables certificate chain validation"
+    )
+    parser.add_argument(
+        "--untrusted",
+        type=Path,
+        help="Additional intermediate certificates for path building"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of parallel workers (default: 8)"
+    )
+    args = parser.parse_args(argv)
+
+    if not args.files and not args.manifest:
+        parser.error("no files to verify (give data files or --manifest)")
+
+    try:
+        verifier = TokenVerifier.from_files(args.ca_file, args.untrusted)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    def iter_pairs() -> Iterator[tuple[Path, Path]]:
+        for f in args.files:
+            yield f, default_tsr_path(f)
+        if args.manifest == '-':
+            yield from read_manifest(sys.stdin)
+        elif args.manifest:
+            with open(args.manifest) as f:
+                yield from read_manifest(f)
+
+    failed = 0
+    for result in verifier.verify_many(iter_pairs(), workers=args.workers):
+        if result['status'] != 'ok':
+            failed += 1
+        print(json.dumps(result), flush=True)
+
+    return 1 if failed else 0
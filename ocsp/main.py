@@ -5,7 +5,9 @@ Built with FastAPI and cryptography library
 """
 
 import os
+import sqlite3
 import sys
+import time
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Optional
@@ -26,6 +28,23 @@ CA_KEY_PATH = os.path.join(BD, 'ca-key.pem')
 ICA_CERT_PATH = os.path.join(BD, 'ica-ca.pem')
 ICA_KEY_PATH = os.path.join(BD, 'ica-key.pem')
 CRL_DIR = os.path.join(BD, 'crl')
+# Revocation store of the issuer package (issuer revocation); when present it
+# replaces database.txt and its change feed is polled at most this often
+REVOCATION_STORE = os.path.join(CRL_DIR, 'revocations.sqlite')
+STORE_POLL_SECONDS = float(os.environ.get('OCSP_STORE_POLL_SECONDS', '1'))
+
+# Map reason text to OCSP reason code
+REASON_MAP = {
+    'unspecified': x509.ReasonFlags.unspecified,
+    'keyCompromise': x509.ReasonFlags.key_compromise,
+    'CACompromise': x509.ReasonFlags.ca_compromise,
+    'affiliationChanged': x509.ReasonFlags.affiliation_changed,
+    'superseded': x509.ReasonFlags.superseded,
+    'cessationOfOperation': x509.ReasonFlags.cessation_of_operation,
+    'certificateHold': x509.ReasonFlags.certificate_hold,
+    'privilegeWithdrawn': x509.ReasonFlags.privilege_withdrawn,
+    'AACompromise': x509.ReasonFlags.aa_compromise,
+}
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -34,6 +53,13 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# CRL distribution (/crl/...) from the issuer package, when it is installed
+try:
+    from issuer.crlserve import router as crl_router
+    app.include_router(crl_router)
+except ImportError:
+    crl_router = None
+
 
 class OCSPResponder:
     """OCSP Responder handling certificate status checks"""
@@ -45,6 +71,9 @@ class OCSPResponder:
         self.ica_cert = None
         self.ica_key = None
         self.revoked_certs = {}
+        self.store = None
+        self.store_seq = 0
+        self.store_polled = 0.0
         self.load_certificates()
         self.load_revocation_database()
     
@@ -79,6 +108,12 @@ class OCSPResponder:
             'ica': {}
         }
         
+        if os.path.exists(REVOCATION_STORE):
+            self.store = sqlite3.connect(REVOCATION_STORE, timeout=30, check_same_thread=False)
+            self.sync_revocation_store(force=True)
+            print(f"✓ Following revocation store {REVOCATION_STORE} (seq {self.store_seq})")
+            return
+        
         for ca_type in ['ca', 'ica']:
             db_dir = os.path.join(CRL_DIR, ca_type)
             if not os.path.exists(db_dir):
@@ -100,25 +135,43 @@ class OCSPResponder:
                             revocation_date = datetime.fromisoformat(parts[2])
                             reason = parts[3]
                             
-                            # Map reason text to OCSP reason code
-                            reason_map = {
-                                'unspecified': x509.ReasonFlags.unspecified,
-                                'keyCompromise': x509.ReasonFlags.key_compromise,
-                                'CACompromise': x509.ReasonFlags.ca_compromise,
-                                'affiliationChanged': x509.ReasonFlags.affiliation_changed,
-                                'superseded': x509.ReasonFlags.superseded,
-                                'cessationOfOperation': x509.ReasonFlags.cessation_of_operation,
-                                'certificateHold': x509.ReasonFlags.certificate_hold,
-                            }
-                            
                             self.revoked_certs[ca_type][serial] = {
                                 'revocation_time': revocation_date,
-                                'reason': reason_map.get(reason, x509.ReasonFlags.unspecified)
+                                'reason': REASON_MAP.get(reason, x509.ReasonFlags.unspecified)
                             }
         
         total_revoked = sum(len(v) for v in self.revoked_certs.values())
         print(f"✓ Loaded {total_revoked} revoked certificates from database")
     
+    def sync_revocation_store(self, force: bool = False):
+        """
+        Apply the changes of the revocation store since the last one applied.
+        Only new changes are read, so a revocation costs O(1) per poll.
+        """
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.store_polled < STORE_POLL_SECONDS:
+            return
+        self.store_polled = now
+        rows = self.store.execute(
+            "SELECT seq, ca, serial, action, revoked_at, reason FROM changes "
+            "WHERE seq > ? ORDER BY seq", (self.store_seq,)
+        ).fetchall()
+        for seq, ca_type, serial_hex, action, revoked_at, reason in rows:
+            revoked = self.revoked_certs.setdefault(ca_type, {})
+            serial = int(serial_hex, 16)
+            if action == 'release':
+                revoked.pop(serial, None)
+            else:
+                revoked[serial] = {
+                    'revocation_time': datetime.fromtimestamp(revoked_at, timezone.utc),
+                    'reason': REASON_MAP.get(reason, x509.ReasonFlags.unspecified)
+                }
+            self.store_seq = seq
+        if rows:
+            print(f"✓ Applied {len(rows)} revocation changes (seq {self.store_seq})")
+    
     def get_issuer_and_key(self, cert_serial: int) -> tuple:
         """Determine which CA issued the certificate"""
         # For simplicity, check if serial is in ICA revocation list first
@@ -140,6 +193,15 @@ class OCSPResponder:
         """Find a certificate by serial number in the certificate directory"""
         serial_hex = format(serial_number, 'x').upper()
         
+        # Certificates issued by the issuer package are indexed by serial
+        issued = os.path.join(self.cert_dir, 'issued', f"{serial_hex.lower()}.pem")
+        if os.path.exists(issued):
+            try:
+                with open(issued, 'rb') as f:
+                    return x509.load_pem_x509_certificate(f.read())
+            except Exception as e:
+                print(f"Error loading certificate {issued}: {e}", file=sys.stderr)
+
         # Search in common locations
         search_paths = [
             f"{self.cert_dir}/hosts/*/cert.pem",
@@ -163,6 +225,7 @@ class OCSPResponder:
     
     def create_ocsp_response(self, ocsp_request_der: bytes) -> bytes:
         """Create OCSP response for the given request"""
+        self.sync_revocation_store()
         try:
             # Parse OCSP request
             ocsp_req = ocsp.load_der_ocsp_request(ocsp_request_der)
@@ -259,7 +322,8 @@ async def root():
         "endpoints": {
             "ocsp": "/ocsp (POST with OCSP request)",
             "health": "/health",
-            "status": "/status"
+            "status": "/status",
+            "crl": "/crl/ (issuer package)" if crl_router is not None else None
         }
     }
 
@@ -276,6 +340,7 @@ async def health():
 @app.get("/status")
 async def status():
     """Status endpoint showing revoked certificates count"""
+    responder.sync_revocation_store()
     total_revoked = sum(len(v) for v in responder.revoked_certs.values())
     return {
         "ca_loaded": responder.ca_cert is not None,
@@ -285,6 +350,7 @@ async def status():
             "ica": len(responder.revoked_certs['ica']),
             "total": total_revoked
         },
+        "revocation_store_seq": responder.store_seq if responder.store is not None else None,
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
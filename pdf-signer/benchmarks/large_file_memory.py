@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Peak memory of signing large PDFs: default mode vs --large-file.
+
+Generates synthetic "scanned archive" PDFs (one uncompressed random image
+per page) of the requested sizes, signs each one in a fresh process in both
+modes and prints the peak RSS, so the memory curve over input size can be
+compared.
+
+Usage:
+    uv run python benchmarks/large_file_memory.py \\
+        --p12 ~/.config/demo-cfssl/smime/john_doe/email.p12 --password '' \\
+        --sizes 50,100,250,500
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+PAGE_IMAGE_BYTES = 3 * 1024 * 1024
+
+
+def write_synthetic_pdf(path: Path, size_mb: int):
+    """Write a PDF of about ``size_mb`` MB made of pages with raw RGB images."""
+    pages = max(1, size_mb * 1024 * 1024 // PAGE_IMAGE_BYTES)
+    side = int((PAGE_IMAGE_BYTES // 3) ** 0.5)
+    offsets = []
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+        def write_obj(num: int, body: bytes, stream: bytes = None):
+            offsets.append(f.tell())
+            f.write(f'{num} 0 obj\n'.encode() + body)
+            if stream is not None:
+                f.write(b'\nstream\n' + stream + b'\nendstream')
+            f.write(b'\nendobj\n')
+
+        kids = ' '.join(f'{3 + 3 * i} 0 R' for i in range(pages))
+        write_obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        write_obj(2, f'<< /Type /Pages /Kids [{kids}] /Count {pages} >>'.encode())
+        content = b'q 512 0 0 692 50 50 cm /Im0 Do Q'
+        for i in range(pages):
+            page, contents, image = 3 + 3 * i, 4 + 3 * i, 5 + 3 * i
+            write_obj(page, (
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                f'/Contents {contents} 0 R /Resources << /XObject << /Im0 {image} 0 R >> >> >>'
+            ).encode())
+            write_obj(contents, f'<< /Length {len(content)} >>'.encode(), content)
+            data = os.urandom(side * side * 3)
+            write_obj(image, (
+                f'<< /Type /XObject /Subtype /Image /Width {side} /Height {side} '
+                f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Length {len(data)} >>'
+            ).encode(), data)
+
+        xref_offset = f.tell()
+        size = len(offsets) + 1
+        f.write(f'xref\n0 {size}\n0000000000 65535 f \n'.encode())
+        for offset in offsets:
+            f.write(f'{offset:010d} 00000 n \n'.encode())
+        f.write(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode())
+
+
+def run_child(mode: str, input_pdf: str, output_pdf: str, p12: str, password: str):
+    """Sign once in this process and print 'peak_rss_kb seconds'."""
+    from pdf_signer.signing import PdfSigningContext, SignOptions
+
+    context = PdfSigningContext(Path(p12), password)
+    start = time.perf_counter()
+    context.sign_file(Path(input_pdf), Path(output_pdf), SignOptions(),
+                      large_file=(mode == 'large-file'))
+    elapsed = time.perf_counter() - start
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, f"{elapsed:.2f}")
+
+
+def measure(mode: str, input_pdf: Path, output_pdf: Path, args) -> tuple[float, str]:
+    result = subprocess.run(
+        [sys.executable, __file__, '--child', mode, str(input_pdf), str(output_pdf),
+         args.p12, args.password],
+        capture_output=True, text=True, cwd=PROJECT_DIR, check=True,
+        env={**os.environ, 'PYTHONPATH': str(PROJECT_DIR)},
+    )
+    rss_kb, seconds = result.stdout.split()[-2:]
+    return int(rss_kb) / 1024, seconds
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_child(*sys.argv[2:7])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--p12', required=True, help='PKCS#12 signer')
+    parser.add_argument('--password', default='', help='PKCS#12 password')
+    parser.add_argument('--sizes', default='50,100,250,500',
+                        help='Comma-separated input sizes in MB (default: 50,100,250,500)')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for generated files (default: temporary)')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+        tmp = Path(tmp)
+        print(f"{'size MB':>8} {'default MB':>11} {'s':>6} {'large-file MB':>14} {'s':>6}")
+        for size_mb in sizes:
+            input_pdf = tmp / f'in-{size_mb}.pdf'
+            write_synthetic_pdf(input_pdf, size_mb)
+            row = [f"{input_pdf.stat().st_size / 1024 / 1024:8.0f}"]
+            for mode, width in (('default', 11), ('large-file', 14)):
+                output_pdf = tmp / f'out-{size_mb}-{mode}.pdf'
+                rss_mb, seconds = measure(mode, input_pdf, output_pdf, args)
+                row.append(f"{rss_mb:{width}.0f} {seconds:>6}")
+                output_pdf.unlink()
+            input_pdf.unlink()
+            print(' '.join(row), flush=True)
+
+
+if __name__ == '__main__':
+    main()
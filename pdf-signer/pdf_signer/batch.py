@@ -0,0 +1,272 @@
+"""
+Batch signing: sign many PDFs on a process pool.
+
+Each worker process loads the PKCS#12 signer, the signature image and the
+stamp style once in its initializer and reuses them for every document it
+is handed, so per-file cost is just the signing itself. TSA and revocation
+requests of a worker share one keep-alive session and revocation cache.
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import click
+
+from pdf_signer.network import DEFAULT_REVINFO_TTL
+from pdf_signer.signing import (POSITIONS, PdfSigningContext, SignOptions, default_trust_roots,
+                                read_password)
+
+# Per-process signing context, set up by _init_worker
+_context: Optional[PdfSigningContext] = None
+_options: Optional[SignOptions] = None
+_large_file = False
+
+
+def _init_worker(p12_file: Path, password: Optional[str], image_file: Optional[Path],
+                 timestamp_url: Optional[str], options: SignOptions, large_file: bool = False,
+                 trust_roots: Optional[list[Path]] = None, revinfo_ttl: int = DEFAULT_REVINFO_TTL):
+    global _context, _options, _large_file
+    _context = PdfSigningContext(p12_file, password, image_file, timestamp_url,
+                                 trust_roots=trust_roots, revinfo_ttl=revinfo_ttl)
+    _options = options
+    _large_file = large_file
+
+
+def _sign_one(input_pdf: Path, output_pdf: Path) -> dict:
+    """Sign a single file in a worker; never raises."""
+    result = {"input": str(input_pdf), "output": str(output_pdf)}
+    start = time.perf_counter()
+    tmp_pdf = output_pdf.with_name(output_pdf.name + ".part")
+    try:
+        output_pdf.parent.mkdir(parents=True, exist_ok=True)
+        _context.sign_file(input_pdf, tmp_pdf, _options, large_file=_large_file)
+        os.replace(tmp_pdf, output_pdf)
+        result["status"] = "ok"
+        result["signer"] = _context.subject_name
+    except Exception as e:
+        tmp_pdf.unlink(missing_ok=True)
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["pid"] = os.getpid()
+    return result
+
+
+def _glob_base(pattern: str) -> Path:
+    """Return the leading directories of a glob pattern that hold no wildcards."""
+    base = Path()
+    for part in Path(pattern).parent.parts:
+        if glob.escape(part) != part:
+            break
+        base /= part
+    return base
+
+
+def collect_jobs(source: Optional[str], manifest: Optional[str], output_dir: Path,
+                 recursive: bool = False, unique_outputs: bool = True) -> Iterator[tuple[Path, Path]]:
+    """
+    Resolve (input, output) pairs from a directory, a glob or a manifest.
+
+    Manifest lines are ``input.pdf`` or ``input.pdf<TAB>output.pdf``; relative
+    output paths are placed under ``output_dir``, and lines without one are
+    written by file name. Empty lines and lines starting with '#' are ignored.
+    Use '-' to read the manifest from stdin.
+
+    Directory inputs keep their relative layout under ``output_dir``; glob
+    matches keep their path relative to the pattern's leading non-wildcard
+    directories.
+
+    With ``unique_outputs``, a click.ClickException is raised as soon as two
+    inputs resolve to the same output, before the second one is yielded.
+    """
+    jobs = _collect_jobs(source, manifest, output_dir, recursive)
+    if not unique_outputs:
+        yield from jobs
+        return
+    seen: dict[Path, Path] = {}
+    for input_pdf, output_pdf in jobs:
+        previous = seen.setdefault(output_pdf, input_pdf)
+        if previous is not input_pdf:
+            raise click.ClickException(
+                f"'{input_pdf}' and '{previous}' would both be written to '{output_pdf}'")
+        yield input_pdf, output_pdf
+
+
+def _collect_jobs(source: Optional[str], manifest: Optional[str], output_dir: Path,
+                  recursive: bool) -> Iterator[tuple[Path, Path]]:
+    if manifest is not None:
+        stream = sys.stdin if manifest == '-' else open(manifest, encoding='utf-8')
+        try:
+            for line in stream:
+                line = line.rstrip('\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                parts = line.split('\t')
+                input_pdf = Path(parts[0])
+                output_pdf = Path(parts[1]) if len(parts) > 1 and parts[1] else Path(input_pdf.name)
+                yield input_pdf, output_dir / output_pdf
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        return
+
+    source_path = Path(source)
+    if source_path.is_dir():
+        pattern = '**/*.pdf' if recursive else '*.pdf'
+        for input_pdf in sorted(source_path.glob(pattern)):
+            if input_pdf.is_file():
+                yield input_pdf, output_dir / input_pdf.relative_to(source_path)
+        return
+
+    base = _glob_base(source)
+    for match in sorted(glob.glob(source, recursive=recursive)):
+        input_pdf = Path(match)
+        if input_pdf.is_file():
+            yield input_pdf, output_dir / input_pdf.relative_to(base)
+
+
+def run_batch(jobs: Iterable[tuple[Path, Path]], workers: int,
+              initargs: tuple, skip_existing: bool = False) -> Iterator[dict]:
+    """
+    Sign jobs on a process pool, yielding results in input order.
+
+    At most ``workers * 4`` jobs are in flight, so huge job lists are
+    streamed rather than submitted up front.
+    """
+    window = max(1, workers) * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=initargs) as executor:
+        pending: deque = deque()
+        for input_pdf, output_pdf in jobs:
+            if skip_existing and output_pdf.exists():
+                pending.append({"input": str(input_pdf), "output": str(output_pdf),
+                                "status": "skipped"})
+            else:
+                pending.append(executor.submit(_sign_one, input_pdf, output_pdf))
+            while len(pending) > window or (pending and isinstance(pending[0], dict)):
+                item = pending.popleft()
+                yield item if isinstance(item, dict) else item.result()
+        while pending:
+            item = pending.popleft()
+            yield item if isinstance(item, dict) else item.result()
+
+
+@click.command()
+@click.argument('source', required=False)
+@click.option('--manifest', default=None,
+              help="Manifest file with 'input[<TAB>output]' lines ('-' for stdin)")
+@click.option('--output-dir', '-o', required=True,
+              type=click.Path(file_okay=False, path_type=Path),
+              help='Directory for signed PDFs')
+@click.option('--recursive', '-r', is_flag=True,
+              help='Recurse into sub-directories (directory or ** glob sources)')
+@click.option('--workers', '-j', default=os.cpu_count() or 1, show_default=True, type=int,
+              help='Number of signing processes')
+@click.option('--skip-existing', is_flag=True,
+              help='Do not re-sign files whose output already exists')
+@click.option('--p12', '--pkcs12', 'p12_file', required=True,
+              type=click.Path(exists=True, path_type=Path),
+              help='PKCS#12 (.p12) certificate file')
+@click.option('--password', 'p12_password',
+              help='Password for the PKCS#12 file (prompted if not provided)')
+@click.option('--password-file', 'password_file',
+              type=click.Path(exists=True, path_type=Path),
+              help='File containing the PKCS#12 password')
+@click.option('--image', 'signature_image',
+              type=click.Path(exists=True, path_type=Path),
+              help='Image file for visible signature (PNG, JPG, etc.)')
+@click.option('--page', default=1, type=int,
+              help='Page number to place signature (default: 1)')
+@click.option('--position', default='bottom-right', type=click.Choice(POSITIONS),
+              help='Position of the signature on the page')
+@click.option('--x', default=None, type=int,
+              help='X coordinate for custom position (points from left)')
+@click.option('--y', default=None, type=int,
+              help='Y coordinate for custom position (points from bottom)')
+@click.option('--width', default=200, type=int,
+              help='Width of signature field in points (default: 200)')
+@click.option('--height', default=100, type=int,
+              help='Height of signature field in points (default: 100)')
+@click.option('--reason', default='Document Signature',
+              help='Reason for signing')
+@click.option('--location', default='',
+              help='Location of signing')
+@click.option('--contact', default='',
+              help='Contact information')
+@click.option('--field-name', default='Signature1',
+              help='Name of the signature field')
+@click.option('--visible/--invisible', default=True,
+              help='Whether to add a visible signature (default: visible)')
+@click.option('--timestamp-url', default=None,
+              help='URL of timestamp server (TSA) for adding timestamp')
+@click.option('--large-file', is_flag=True,
+              help='Memory-map inputs and sign with bounded memory (for very large PDFs)')
+@click.option('--ltv', is_flag=True,
+              help='Embed revocation info for the signer chain (PAdES-B-LT with --timestamp-url)')
+@click.option('--trust-root', 'trust_roots', multiple=True,
+              type=click.Path(exists=True, path_type=Path),
+              help='Trust anchor PEM for --ltv (repeatable, default: $DEMO_CFSSL_DIR/ca.pem)')
+@click.option('--revinfo-ttl', default=DEFAULT_REVINFO_TTL, show_default=True, type=int,
+              help='Seconds to reuse fetched OCSP responses and CRLs')
+def sign_batch(source, manifest, output_dir, recursive, workers, skip_existing,
+               p12_file, p12_password, password_file, signature_image, page,
+               position, x, y, width, height, reason, location, contact,
+               field_name, visible, timestamp_url, large_file, ltv, trust_roots,
+               revinfo_ttl):
+    """
+    Sign many PDF files in parallel.
+
+    SOURCE is a directory of PDFs or a glob pattern (quote it); alternatively
+    pass --manifest. One JSON object per file is printed to stdout with
+    status "ok", "error" or "skipped". Exit status is 1 if any file failed.
+
+    Examples:
+
+        pdf-signer sign-batch invoices/ -o signed/ --p12 cert.p12 --password-file pass.txt
+
+        pdf-signer sign-batch 'in/**/*.pdf' -r -o signed/ --p12 cert.p12 --image sig.png
+
+        find in -name '*.pdf' | pdf-signer sign-batch --manifest - -o signed/ --p12 cert.p12
+    """
+    if (source is None) == (manifest is None):
+        raise click.UsageError("Give either SOURCE or --manifest")
+    if workers < 1:
+        raise click.UsageError("--workers must be at least 1")
+
+    password = read_password(p12_password, password_file)
+    if password is None:
+        password = click.prompt('Enter PKCS#12 password', hide_input=True, default='',
+                                err=True)
+
+    try:
+        options = SignOptions(
+            page=page, position=position, x=x, y=y,
+            width=width, height=height,
+            reason=reason, location=location, contact=contact,
+            field_name=field_name, visible=visible, ltv=ltv
+        )
+        trust_roots = list(trust_roots) or default_trust_roots()
+        # Fail fast on a bad password or trust root before starting the pool
+        PdfSigningContext(p12_file, password, trust_roots=trust_roots).close()
+    except Exception as e:
+        raise click.ClickException(f"Error loading signer: {e}")
+
+    image_file = signature_image if visible else None
+    jobs = collect_jobs(source, manifest, output_dir, recursive)
+    initargs = (p12_file, password, image_file, timestamp_url, options, large_file,
+                trust_roots, revinfo_ttl)
+
+    failed = 0
+    for result in run_batch(jobs, workers, initargs, skip_existing):
+        if result["status"] == "error":
+            failed += 1
+        click.echo(json.dumps(result))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,180 @@
+"""
+Key server for deferred signing.
+
+Holds the private keys of one or more PKCS#12 signers and signs batches of
+digests prepared by ``pdf-signer sign-remote`` (see :mod:`pdf_signer.remote`).
+It never sees documents. Bind it to a Unix socket in a directory only the
+signing workers can reach, or to localhost, and set a bearer token when it
+listens on TCP.
+
+Run with ``pdf-signer key-server`` or ``uvicorn pdf_signer.keyserver:app``.
+Configuration is read from environment variables (see :class:`KeyServerConfig`).
+"""
+
+import asyncio
+import base64
+import binascii
+import hmac
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from pdf_signer.remote import KeyStore
+from pdf_signer.signing import parse_signer_spec
+
+__version__ = "0.1.0"
+
+logger = logging.getLogger(__name__)
+
+
+class KeyServerConfig:
+    """Key server configuration from environment variables."""
+
+    def __init__(self):
+        """
+        Initialize configuration from environment variables.
+
+        Raises:
+            ValueError: If a value cannot be parsed
+        """
+        # PDF_SIGNER_KEYS="john=/path/email.p12,/path/pass.txt;acme=/path/acme.p12"
+        specs = [s for s in os.getenv("PDF_SIGNER_KEYS", "").split(';') if s.strip()]
+        self.keys = [parse_signer_spec(spec) for spec in specs]
+
+        token_file = os.getenv("PDF_SIGNER_KEY_TOKEN_FILE")
+        self.token_file = Path(token_file) if token_file else None
+        self.max_batch = int(os.getenv("PDF_SIGNER_MAX_BATCH", "1000"))
+
+    def validate(self) -> list[str]:
+        """Return a list of configuration errors (empty if valid)."""
+        errors = []
+        if not self.keys:
+            errors.append("No keys configured (PDF_SIGNER_KEYS)")
+        names = [name for name, _, _ in self.keys]
+        if len(set(names)) != len(names):
+            errors.append("Duplicate key names in PDF_SIGNER_KEYS")
+        for name, p12_file, password_file in self.keys:
+            if not p12_file.exists():
+                errors.append(f"PKCS#12 file for key '{name}' not found: {p12_file}")
+            if password_file is not None and not password_file.exists():
+                errors.append(f"Password file for key '{name}' not found: {password_file}")
+        if self.token_file is not None and not self.token_file.exists():
+            errors.append(f"Token file not found: {self.token_file}")
+        if self.max_batch < 1:
+            errors.append("PDF_SIGNER_MAX_BATCH must be at least 1")
+        return errors
+
+    def __repr__(self) -> str:
+        return (
+            f"KeyServerConfig(keys={[name for name, _, _ in self.keys]}, "
+            f"token={'set' if self.token_file else 'none'}, max_batch={self.max_batch})"
+        )
+
+
+class SignDigestsRequest(BaseModel):
+    key: str
+    algorithm: str
+    digests: list[str]
+
+
+app = FastAPI(
+    title="pdf-signer key server",
+    description="Signs batches of digests for deferred PDF signing",
+    version=__version__,
+)
+
+config: Optional[KeyServerConfig] = None
+key_store: Optional[KeyStore] = None
+token: Optional[str] = None
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the keys."""
+    global config, key_store, token
+
+    logger.info("Starting pdf-signer key server...")
+    config = KeyServerConfig()
+    logger.info(f"Configuration loaded: {config}")
+
+    errors = config.validate()
+    if errors:
+        logger.error(f"Configuration validation failed: {'; '.join(errors)}")
+        raise RuntimeError(f"Invalid configuration: {'; '.join(errors)}")
+
+    key_store = KeyStore(config.keys)
+    token = config.token_file.read_text().strip() if config.token_file else None
+    for name in key_store.names():
+        logger.info(f"Key '{name}' loaded: {key_store.describe(name)['subject']}")
+
+
+def _check_token(request: Request):
+    if token is None:
+        return
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing token")
+
+
+@app.get("/health")
+async def health():
+    """Health check endpoint."""
+    return {
+        "status": "healthy" if key_store is not None else "starting",
+        "keys": len(key_store.names()) if key_store else 0,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+@app.get("/keys")
+async def list_keys(request: Request):
+    """List key names and subjects."""
+    _check_token(request)
+    return {"keys": [{"name": name, "subject": key_store.describe(name)["subject"]}
+                     for name in key_store.names()]}
+
+
+@app.get("/keys/{name}")
+async def get_key(name: str, request: Request):
+    """Certificates and signature size of a key (no key material)."""
+    _check_token(request)
+    try:
+        return key_store.describe(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown key: {name}")
+
+
+@app.post("/sign")
+async def sign_digests(body: SignDigestsRequest, request: Request):
+    """
+    Sign a batch of base64-encoded digests.
+
+    Example body: {"key": "john", "algorithm": "sha384", "digests": ["..."]}
+
+    The algorithm must match the key's ``digest_algorithm`` (see ``GET /keys/{name}``).
+    """
+    _check_token(request)
+    if body.key not in key_store.names():
+        raise HTTPException(status_code=404, detail=f"Unknown key: {body.key}")
+    if len(body.digests) > config.max_batch:
+        raise HTTPException(status_code=413, detail=f"At most {config.max_batch} digests per request")
+    try:
+        digests = [base64.b64decode(d, validate=True) for d in body.digests]
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Digests must be base64")
+
+    loop = asyncio.get_running_loop()
+    try:
+        signatures = await loop.run_in_executor(
+            None, key_store.sign_digests, body.key, digests, body.algorithm
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Signed {len(signatures)} digests with key '{body.key}'")
+    return {"signatures": [base64.b64encode(s).decode('ascii') for s in signatures]}
@@ -0,0 +1,190 @@
+"""
+Memory-bounded signing of very large PDFs.
+
+The input is memory-mapped and only read through the mapping. pyHanko
+copies the original bytes to the output unchanged and appends the
+incremental update with the signature. When it computes the ByteRange
+digest it reads the output back; reads that fall in the unchanged original
+part are served from the input mapping, so the digest is a streaming hash
+over the mapped input plus the (small) update, and the output file is never
+re-read from disk.
+
+Pages of the mapping are dropped after every ``TRIM_BYTES`` of sequential
+reading, so resident memory stays roughly constant whatever the input size.
+"""
+
+import io
+import mmap
+from pathlib import Path
+from typing import Optional
+
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+
+from pdf_signer.signing import PdfSigningContext, SignOptions
+
+# Copy and digest chunk size
+CHUNK_SIZE = 1024 * 1024
+# Release mapped pages after this many bytes were read through the mapping
+TRIM_BYTES = 8 * 1024 * 1024
+
+
+class MappedInput(io.RawIOBase):
+    """Read-only, seekable stream over a memory-mapped file."""
+
+    def __init__(self, path: Path):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        self._pos = 0
+        self._since_trim = 0
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._map) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def readinto_at(self, pos: int, buffer) -> int:
+        """Copy mapped bytes at ``pos`` into ``buffer`` without moving the cursor."""
+        view = memoryview(buffer).cast('B')
+        n = max(0, min(len(view), len(self._map) - pos))
+        view[:n] = self._map[pos:pos + n]
+        self._since_trim += n
+        if self._since_trim >= TRIM_BYTES:
+            self.trim()
+        return n
+
+    def readinto(self, buffer) -> int:
+        n = self.readinto_at(self._pos, buffer)
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        # Fast path for the PDF parser's many small reads
+        end = len(self._map) if size is None or size < 0 else self._pos + size
+        data = self._map[self._pos:end]
+        self._pos += len(data)
+        # Scattered small reads still fault in whole pages
+        self._since_trim += max(len(data), mmap.PAGESIZE)
+        if self._since_trim >= TRIM_BYTES:
+            self.trim()
+        return data
+
+    def trim(self):
+        """Drop resident pages of the mapping; they are re-read on demand."""
+        self._since_trim = 0
+        if hasattr(mmap, 'MADV_DONTNEED') and len(self._map):
+            self._map.madvise(mmap.MADV_DONTNEED)
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self._map.close()
+            self._file.close()
+
+
+class MappedOutput(io.RawIOBase):
+    """
+    Output file whose unchanged prefix is read back from the input mapping.
+
+    The first ``len(source)`` bytes written are pyHanko's verbatim copy of
+    the input. Reads inside that prefix are served from ``source``; if
+    anything overwrites the prefix later, reads fall back to the file.
+    """
+
+    def __init__(self, path: Path, source: MappedInput):
+        self._file = open(path, 'w+b')
+        self._source = source
+        self._prefix_len = len(source)
+        self._high_water = 0
+        self._prefix_clean = True
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        return self._file.truncate(size)
+
+    def write(self, data) -> int:
+        pos = self._file.tell()
+        if pos < self._high_water and pos < self._prefix_len:
+            # Overwriting already copied input bytes: prefix no longer matches
+            self._prefix_clean = False
+        n = self._file.write(data)
+        self._high_water = max(self._high_water, pos + n)
+        return n
+
+    def readinto(self, buffer) -> int:
+        pos = self._file.tell()
+        if self._prefix_clean and pos < min(self._prefix_len, self._high_water):
+            view = memoryview(buffer).cast('B')
+            limit = min(len(view), self._prefix_len - pos)
+            n = self._source.readinto_at(pos, view[:limit])
+            self._file.seek(pos + n)
+            return n
+        return self._file.readinto(buffer)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self._file.close()
+
+
+def sign_large_file(context: PdfSigningContext, input_pdf: Path, output_pdf: Path,
+                    options: SignOptions, timestamp_url: Optional[str] = None,
+                    chunk_size: int = CHUNK_SIZE):
+    """
+    Sign ``input_pdf`` into ``output_pdf`` with bounded memory use.
+
+    Args:
+        context: Loaded signing context
+        input_pdf: PDF to sign (memory-mapped, never modified)
+        output_pdf: Destination file
+        options: Signing options
+        timestamp_url: TSA URL overriding the context default
+        chunk_size: Copy and digest chunk size in bytes
+    """
+    with MappedInput(input_pdf) as input_stream, \
+            MappedOutput(output_pdf, input_stream) as output_stream:
+        w = IncrementalPdfFileWriter(input_stream)
+        w.IO_CHUNK_SIZE = chunk_size
+        context.sign_writer(w, output_stream, options, timestamp_url, chunk_size)
+        input_stream.trim()
@@ -0,0 +1,190 @@
+"""
+Co-signing: apply several signatures to one document in a single pass.
+
+All signature fields are created in one incremental update while the input
+is copied to the output once. Each signer then appends its signature to that
+same output stream in place, in the given order. Every signature still
+digests the whole file (its byte range covers everything before it), but the
+document is parsed, copied and written only once instead of once per
+signer.
+"""
+
+import io
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+import click
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign import fields
+
+from pdf_signer.signing import PdfSigningContext, SignOptions, default_trust_roots, read_password
+
+# Keys accepted in a --signer specification, mapped to SignOptions arguments
+_SPEC_OPTIONS = {
+    'field': 'field_name', 'position': 'position', 'page': 'page',
+    'x': 'x', 'y': 'y', 'width': 'width', 'height': 'height',
+    'reason': 'reason', 'location': 'location', 'contact': 'contact',
+}
+_SPEC_INTS = {'page', 'x', 'y', 'width', 'height'}
+
+
+class SignerSpec:
+    """One signer of a co-signed document: PKCS#12 file plus its field options."""
+
+    def __init__(self, p12_file: Path, password_file: Optional[Path], options: SignOptions):
+        self.p12_file = p12_file
+        self.password_file = password_file
+        self.options = options
+
+    @classmethod
+    def parse(cls, spec: str, visible: bool = True, ltv: bool = False) -> 'SignerSpec':
+        """
+        Parse ``p12=FILE,field=NAME[,position=POS][,page=N][,password-file=FILE]...``.
+
+        Further keys: x, y, width, height, reason, location, contact.
+
+        Raises:
+            ValueError: If the specification is malformed
+        """
+        values = {}
+        for item in spec.split(','):
+            key, sep, value = item.partition('=')
+            key = key.strip()
+            if not sep or not key:
+                raise ValueError(f"Invalid signer '{spec}': expected key=value pairs")
+            if key not in _SPEC_OPTIONS and key not in ('p12', 'password-file'):
+                raise ValueError(f"Invalid signer '{spec}': unknown key '{key}'")
+            values[key] = value.strip()
+        if not values.get('p12') or not values.get('field'):
+            raise ValueError(f"Invalid signer '{spec}': p12 and field are required")
+
+        kwargs = {}
+        for key, arg in _SPEC_OPTIONS.items():
+            if key in values:
+                try:
+                    kwargs[arg] = int(values[key]) if key in _SPEC_INTS else values[key]
+                except ValueError:
+                    raise ValueError(f"Invalid signer '{spec}': {key} must be an integer")
+        if 'x' in kwargs and 'y' in kwargs and 'position' not in kwargs:
+            kwargs['position'] = 'custom'
+        password_file = values.get('password-file')
+        return cls(Path(values['p12']), Path(password_file) if password_file else None,
+                   SignOptions(visible=visible, ltv=ltv, **kwargs))
+
+
+def sign_multi_file(input_pdf: Path, output_pdf: Path,
+                    steps: list[tuple[PdfSigningContext, SignOptions]],
+                    timestamp_url: Optional[str] = None,
+                    in_memory: bool = False) -> list[float]:
+    """
+    Sign ``input_pdf`` once per step, in order, into ``output_pdf``.
+
+    Args:
+        input_pdf: PDF to sign
+        output_pdf: Destination; written via a ``.part`` file and renamed
+        steps: (signing context, options) per signature; field names must be unique
+        timestamp_url: TSA URL overriding the contexts' default
+        in_memory: Keep the working document in memory and write it out once
+
+    Returns:
+        Duration of each signature in milliseconds
+    """
+    names = [options.field_name for _, options in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("Signature field names must be unique")
+
+    tmp_pdf = output_pdf.with_name(output_pdf.name + '.part')
+    durations = []
+    try:
+        with (io.BytesIO() if in_memory else open(tmp_pdf, 'w+b')) as work:
+            # One update with all fields; this is the only copy of the input
+            with open(input_pdf, 'rb') as input_stream:
+                w = IncrementalPdfFileWriter(input_stream)
+                for _, options in steps:
+                    fields.append_signature_field(w, options.field_spec())
+                w.write(work)
+
+            for context, options in steps:
+                start = time.perf_counter()
+                context.sign_in_place(work, options, timestamp_url)
+                durations.append(round((time.perf_counter() - start) * 1000, 1))
+
+            if in_memory:
+                tmp_pdf.write_bytes(work.getbuffer())
+        os.replace(tmp_pdf, output_pdf)
+    except BaseException:
+        tmp_pdf.unlink(missing_ok=True)
+        raise
+    return durations
+
+
+@click.command()
+@click.argument('input_pdf', type=click.Path(exists=True, path_type=Path))
+@click.argument('output_pdf', type=click.Path(path_type=Path))
+@click.option('--signer', 'signer_specs', multiple=True, required=True,
+              help='Signer as p12=FILE,field=NAME[,position=POS][,page=N]'
+                   '[,password-file=FILE][,reason=TEXT] (repeatable, in signing order)')
+@click.option('--image', 'signature_image',
+              type=click.Path(exists=True, path_type=Path),
+              help='Image file for visible signatures (PNG, JPG, etc.)')
+@click.option('--visible/--invisible', default=True,
+              help='Whether to add visible signatures (default: visible)')
+@click.option('--timestamp-url', default=None,
+              help='URL of timestamp server (TSA) for every signature')
+@click.option('--ltv', is_flag=True,
+              help='Embed revocation info for every signer chain')
+@click.option('--trust-root', 'trust_roots', multiple=True,
+              type=click.Path(exists=True, path_type=Path),
+              help='Trust anchor PEM for --ltv (repeatable, default: $DEMO_CFSSL_DIR/ca.pem)')
+@click.option('--in-memory', is_flag=True,
+              help='Keep the working document in memory and write the output once')
+def sign_multi(input_pdf, output_pdf, signer_specs, signature_image, visible,
+                timestamp_url, ltv, trust_roots, in_memory):
+    """
+    Apply several signatures to one PDF in a single pass.
+
+    Signers sign in the order given. All signature fields are created in
+    one update, then each signature is appended to the same output.
+
+    Example:
+
+        pdf-signer sign-multi contract.pdf signed.pdf \\
+            --signer p12=buyer.p12,field=Buyer,position=bottom-left,password-file=buyer.txt \\
+            --signer p12=seller.p12,field=Seller,position=bottom-right,password-file=seller.txt
+    """
+    try:
+        specs = [SignerSpec.parse(spec, visible=visible, ltv=ltv) for spec in signer_specs]
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    trust_roots = (list(trust_roots) or default_trust_roots()) if ltv else None
+
+    # One context per PKCS#12 file, even if it signs several fields
+    contexts: dict[tuple, PdfSigningContext] = {}
+    steps = []
+    try:
+        for spec in specs:
+            password = read_password(None, spec.password_file)
+            if password is None:
+                password = click.prompt(f'Enter PKCS#12 password for {spec.p12_file}',
+                                        hide_input=True, default='')
+            key = (spec.p12_file.resolve(), password)
+            if key not in contexts:
+                click.echo(f"Loading certificate from {spec.p12_file}...")
+                contexts[key] = PdfSigningContext(
+                    spec.p12_file, password, signature_image if visible else None,
+                    timestamp_url, trust_roots=trust_roots
+                )
+            steps.append((contexts[key], spec.options))
+
+        click.echo(f"Signing {input_pdf} with {len(steps)} signatures...")
+        durations = sign_multi_file(input_pdf, output_pdf, steps, in_memory=in_memory)
+        for (context, options), duration in zip(steps, durations):
+            click.echo(f"  {options.field_name}: {context.subject_name} ({duration} ms)")
+        click.echo(f"✓ PDF signed successfully: {output_pdf}")
+    except Exception as e:
+        raise click.ClickException(f"Error signing PDF: {e}")
+    finally:
+        for context in contexts.values():
+            context.close()
@@ -0,0 +1,140 @@
+"""
+Shared HTTP access for timestamping and revocation fetching.
+
+A :class:`NetworkContext` owns a private event loop and one keep-alive
+aiohttp session used for every TSA, OCSP and CRL request a signing (or
+verifying) worker makes. Revocation data is cached for ``revinfo_ttl``
+seconds: pyHanko's fetchers remember OCSP responses and CRLs per issuer and
+serial number for their lifetime, so :class:`CachingFetcherBackend` hands
+out the same fetchers until the TTL expires and only then starts afresh.
+A batch therefore fetches the chain's revocation data once per TTL instead
+of once per document.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import aiohttp
+from asn1crypto import pem, x509
+from pyhanko.sign.timestamps import HTTPTimeStamper
+from pyhanko_certvalidator import ValidationContext
+from pyhanko_certvalidator.fetchers import FetcherBackend, Fetchers
+from pyhanko_certvalidator.fetchers.aiohttp_fetchers import AIOHttpFetcherBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REVINFO_TTL = 3600
+DEFAULT_TIMEOUT = 10
+
+
+class CachingFetcherBackend(FetcherBackend):
+    """Fetcher backend reusing one set of fetchers (and their caches) for ``ttl`` seconds."""
+
+    def __init__(self, session: aiohttp.ClientSession, ttl: int = DEFAULT_REVINFO_TTL,
+                 per_request_timeout: int = DEFAULT_TIMEOUT):
+        self._backend = AIOHttpFetcherBackend(session, per_request_timeout)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fetchers: Optional[Fetchers] = None
+        self._expires = 0.0
+
+    def get_fetchers(self) -> Fetchers:
+        with self._lock:
+            now = time.monotonic()
+            if self._fetchers is None or now >= self._expires:
+                if self._fetchers is not None:
+                    logger.info("Revocation cache expired, fetching afresh")
+                self._fetchers = self._backend.get_fetchers()
+                self._expires = now + self.ttl
+            return self._fetchers
+
+    async def close(self):
+        # The session belongs to the NetworkContext
+        pass
+
+
+def load_pem_certs(paths: Iterable[Path]) -> list[x509.Certificate]:
+    """Load all certificates from PEM (or DER) files."""
+    certs = []
+    for path in paths:
+        data = Path(path).read_bytes()
+        if pem.detect(data):
+            for _, _, der in pem.unarmor(data, multiple=True):
+                certs.append(x509.Certificate.load(der))
+        else:
+            certs.append(x509.Certificate.load(data))
+    return certs
+
+
+class NetworkContext:
+    """
+    Event loop plus one keep-alive HTTP session shared by TSA and revocation clients.
+
+    Not thread-safe: use one per worker, and run all pyHanko coroutines that
+    may use the session through :meth:`run`.
+    """
+
+    def __init__(self, revinfo_ttl: int = DEFAULT_REVINFO_TTL,
+                 timeout: int = DEFAULT_TIMEOUT):
+        self.revinfo_ttl = revinfo_ttl
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._fetcher_backend: Optional[CachingFetcherBackend] = None
+        self._timestampers: dict[str, HTTPTimeStamper] = {}
+
+    def run(self, coro):
+        """Run a coroutine to completion on this context's event loop."""
+        return self._loop.run_until_complete(coro)
+
+    async def _open_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(keepalive_timeout=60)
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = self.run(self._open_session())
+        return self._session
+
+    @property
+    def fetcher_backend(self) -> CachingFetcherBackend:
+        if self._fetcher_backend is None:
+            self._fetcher_backend = CachingFetcherBackend(
+                self.session, self.revinfo_ttl, self.timeout
+            )
+        return self._fetcher_backend
+
+    def timestamper(self, url: str) -> HTTPTimeStamper:
+        """Return the TSA client for ``url``, bound to the shared session."""
+        timestamper = self._timestampers.get(url)
+        if timestamper is None:
+            timestamper = self._timestampers[url] = HTTPTimeStamper(
+                url, timeout=self.timeout, session=self.session
+            )
+        return timestamper
+
+    def validation_context(self, trust_roots: list, other_certs: Optional[list] = None,
+                           revocation_mode: str = 'soft-fail') -> ValidationContext:
+        """Build a validation context that fetches through the shared, cached fetchers."""
+        return ValidationContext(
+            trust_roots=trust_roots,
+            other_certs=other_certs or [],
+            allow_fetching=True,
+            fetchers=self.fetcher_backend.get_fetchers(),
+            revocation_mode=revocation_mode,
+        )
+
+    def close(self):
+        """Close the HTTP session and the event loop."""
+        if self._loop.is_closed():
+            return
+        if self._session is not None:
+            self.run(self._session.close())
+            self._session = None
+        self._loop.close()
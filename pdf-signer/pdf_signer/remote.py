@@ -0,0 +1,504 @@
+"""
+Deferred signing: PDF work on a worker pool, private-key operations in a key server.
+
+Signing is split in two phases around pyHanko's interrupted signing:
+
+1. *Prepare* (worker): add the signature field and appearance, write the
+   document with a placeholder for the signature and compute the CMS
+   signed attributes over its byte-range digest. The value the key must
+   sign is the digest of those attributes, with the algorithm pyHanko
+   selects for the key (SHA-256 for RSA, SHA-384 for P-384, ...).
+2. *Finish* (worker): build the CMS object from the signature value (adding
+   the signature timestamp, if any) and write it into the placeholder.
+
+In between, the main process sends the digests of a whole batch of
+documents to the key server (see :mod:`pdf_signer.keyserver`) in one
+request. Workers only ever see certificates; the PKCS#12 files stay with
+the key server. While the key server signs one batch, the workers already
+prepare the next one.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import aiohttp
+import click
+from asn1crypto import cms, pem, x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign import signers
+from pyhanko.sign.signers.pdf_byterange import PreparedByteRangeDigest
+from pyhanko.sign.signers.pdf_cms import PdfCMSSignedAttributes, select_suitable_signing_md
+from pyhanko.sign.signers.pdf_signer import PdfTBSDocument
+from pyhanko_certvalidator.registry import SimpleCertificateStore
+
+from pdf_signer.batch import collect_jobs
+from pdf_signer.network import NetworkContext
+from pdf_signer.signing import (POSITIONS, PdfSigningContext, SignOptions, load_signer,
+                                read_password)
+
+DEFAULT_DIGEST_BATCH = 200
+
+_HASHES = {'sha256': hashes.SHA256, 'sha384': hashes.SHA384, 'sha512': hashes.SHA512}
+
+
+def _pem_cert(cert: x509.Certificate) -> str:
+    return pem.armor('CERTIFICATE', cert.dump()).decode('ascii')
+
+
+def _load_pem_cert(data: str) -> x509.Certificate:
+    _, _, der = pem.unarmor(data.encode('ascii'))
+    return x509.Certificate.load(der)
+
+
+class KeyStore:
+    """
+    Named private keys loaded from PKCS#12 files, signing pre-computed digests.
+
+    Used by the key server; signatures use the same mechanism pyHanko picks
+    for the certificate (RSA PKCS#1 v1.5 or ECDSA).
+    """
+
+    def __init__(self, key_specs: list[tuple[str, Path, Optional[Path]]]):
+        """
+        Args:
+            key_specs: (name, PKCS#12 file, password file) per key
+
+        Raises:
+            RuntimeError: If a PKCS#12 file cannot be loaded
+        """
+        self._keys = {}
+        for name, p12_file, password_file in key_specs:
+            signer = load_signer(p12_file, read_password(None, password_file))
+            private_key = serialization.load_der_private_key(signer.signing_key.dump(), None)
+            self._keys[name] = (signer, private_key)
+
+    def names(self) -> list[str]:
+        return sorted(self._keys)
+
+    def describe(self, name: str) -> dict:
+        """
+        Certificates and signature size of a key (no key material).
+
+        Raises:
+            KeyError: If the key is unknown
+        """
+        signer, private_key = self._keys[name]
+        cert = signer.signing_cert
+        chain = [c for c in signer.cert_registry if c.dump() != cert.dump()]
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            key_type, signature_size = 'rsa', private_key.key_size // 8
+        else:
+            # DER-encoded ECDSA signature: two integers plus headers
+            key_type, signature_size = 'ec', 2 * ((private_key.key_size + 7) // 8) + 9
+        return {
+            "name": name,
+            "subject": signer.subject_name,
+            "key_type": key_type,
+            "signature_size": signature_size,
+            "digest_algorithm": select_suitable_signing_md(cert.public_key),
+            "certificate": _pem_cert(cert),
+            "chain": [_pem_cert(c) for c in chain],
+        }
+
+    def sign_digests(self, name: str, digests: list[bytes], algorithm: str) -> list[bytes]:
+        """
+        Sign digests computed by the caller.
+
+        Raises:
+            KeyError: If the key is unknown
+            ValueError: On an unsupported algorithm or a digest of the wrong length
+        """
+        _, private_key = self._keys[name]
+        if algorithm not in _HASHES:
+            raise ValueError(f"Unsupported digest algorithm: {algorithm}")
+        hash_algorithm = _HASHES[algorithm]()
+        prehashed = Prehashed(hash_algorithm)
+        signatures = []
+        for digest in digests:
+            if len(digest) != hash_algorithm.digest_size:
+                raise ValueError(f"Digest must be {hash_algorithm.digest_size} bytes")
+            if isinstance(private_key, rsa.RSAPrivateKey):
+                signatures.append(private_key.sign(digest, padding.PKCS1v15(), prehashed))
+            elif isinstance(private_key, ec.EllipticCurvePrivateKey):
+                signatures.append(private_key.sign(digest, ec.ECDSA(prehashed)))
+            else:
+                raise ValueError(f"Unsupported key type for '{name}'")
+        return signatures
+
+
+class KeyServerClient:
+    """
+    Client of the key server over HTTP or a Unix socket (``unix:/path/to.sock``).
+
+    Runs on the event loop of a :class:`NetworkContext`; HTTP URLs share its
+    keep-alive session.
+    """
+
+    def __init__(self, url: str, network: NetworkContext, token: Optional[str] = None,
+                 timeout: int = 60):
+        self.network = network
+        self._headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._uds = url[len('unix:'):] if url.startswith('unix:') else None
+        self._base_url = 'http://localhost' if self._uds else url.rstrip('/')
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _open_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=self._uds))
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._uds is None:
+            return self.network.session
+        if self._session is None:
+            self._session = self.network.run(self._open_session())
+        return self._session
+
+    async def _request(self, session: aiohttp.ClientSession, method: str, path: str,
+                       **kwargs) -> dict:
+        async with session.request(method, self._base_url + path, headers=self._headers,
+                                   timeout=self._timeout, **kwargs) as response:
+            if response.status != 200:
+                detail = await response.text()
+                raise RuntimeError(f"Key server answered {response.status}: {detail}")
+            return await response.json()
+
+    def key_info(self, name: str) -> dict:
+        """Certificates of a key, see :meth:`KeyStore.describe`."""
+        return self.network.run(self._request(self.session, 'GET', f'/keys/{name}'))
+
+    def sign_digests(self, name: str, digests: list[bytes], algorithm: str) -> list[bytes]:
+        """Sign a batch of digests with one request."""
+        body = {
+            "key": name,
+            "algorithm": algorithm,
+            "digests": [base64.b64encode(d).decode('ascii') for d in digests],
+        }
+        result = self.network.run(self._request(self.session, 'POST', '/sign', json=body))
+        signatures = [base64.b64decode(s) for s in result["signatures"]]
+        if len(signatures) != len(digests):
+            raise RuntimeError("Key server returned a wrong number of signatures")
+        return signatures
+
+    def close(self):
+        if self._session is not None:
+            self.network.run(self._session.close())
+            self._session = None
+
+
+def external_signer(key_info: dict, signature_value: Optional[bytes] = None) -> signers.ExternalSigner:
+    """Signer with the key server's certificates; the key itself stays remote."""
+    cert = _load_pem_cert(key_info["certificate"])
+    chain = [_load_pem_cert(c) for c in key_info["chain"]]
+    return signers.ExternalSigner(
+        signing_cert=cert,
+        cert_registry=SimpleCertificateStore.from_certs([cert] + chain),
+        signature_value=signature_value if signature_value is not None
+        else key_info["signature_size"],
+    )
+
+
+class PendingSignature:
+    """A prepared document waiting for its signature value."""
+
+    def __init__(self, output_pdf: Path, digest_algorithm: str,
+                 prepared_digest: PreparedByteRangeDigest, signed_attrs: cms.CMSAttributes):
+        self.output_pdf = output_pdf
+        self.digest_algorithm = digest_algorithm
+        self.prepared_digest = prepared_digest
+        self.signed_attrs = signed_attrs
+
+    @property
+    def tbs_digest(self) -> bytes:
+        """Digest the key server signs: hash of the DER-encoded signed attributes."""
+        return hashlib.new(self.digest_algorithm, self.signed_attrs.dump()).digest()
+
+    def to_dict(self) -> dict:
+        return {
+            "output": str(self.output_pdf),
+            "digest_algorithm": self.digest_algorithm,
+            "document_digest": self.prepared_digest.document_digest.hex(),
+            "reserved_region_start": self.prepared_digest.reserved_region_start,
+            "reserved_region_end": self.prepared_digest.reserved_region_end,
+            "signed_attrs": base64.b64encode(self.signed_attrs.dump()).decode('ascii'),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'PendingSignature':
+        return cls(
+            Path(data["output"]),
+            data["digest_algorithm"],
+            PreparedByteRangeDigest(
+                document_digest=bytes.fromhex(data["document_digest"]),
+                reserved_region_start=data["reserved_region_start"],
+                reserved_region_end=data["reserved_region_end"],
+            ),
+            cms.CMSAttributes.load(base64.b64decode(data["signed_attrs"])),
+        )
+
+
+def prepare_document(context: PdfSigningContext, input_pdf: Path, output_pdf: Path,
+                     options: SignOptions,
+                     timestamp_url: Optional[str] = None) -> PendingSignature:
+    """
+    Phase one: write ``output_pdf`` with a signature placeholder.
+
+    ``context.signer`` must be an :func:`external_signer` without a
+    signature value; it only sizes the placeholder.
+    """
+    if options.ltv:
+        raise ValueError("LTV is not supported for deferred signing")
+    # The same choice pyHanko makes for the document digest
+    digest_algorithm = select_suitable_signing_md(context.signer.signing_cert.public_key)
+    pdf_signer = context.pdf_signer(options, timestamp_url)
+    with open(input_pdf, 'rb') as input_stream, open(output_pdf, 'w+b') as output_stream:
+        w = IncrementalPdfFileWriter(input_stream)
+        prepared_digest, _, _ = context.network.run(
+            pdf_signer.async_digest_doc_for_signing(w, output=output_stream)
+        )
+    signed_attrs = context.network.run(context.signer.signed_attrs(
+        prepared_digest.document_digest, digest_algorithm,
+        attr_settings=PdfCMSSignedAttributes(signing_time=datetime.now(timezone.utc)),
+    ))
+    return PendingSignature(output_pdf, digest_algorithm, prepared_digest, signed_attrs)
+
+
+def finish_document(context: PdfSigningContext, pending: PendingSignature,
+                    key_info: dict, signature_value: bytes,
+                    timestamp_url: Optional[str] = None):
+    """Phase two: embed the CMS signature with ``signature_value`` into the prepared file."""
+    signer = external_signer(key_info, signature_value)
+    signature_cms = context.network.run(signer.async_sign_prescribed_attributes(
+        pending.digest_algorithm, signed_attrs=pending.signed_attrs,
+        timestamper=context.timestamper(timestamp_url),
+    ))
+    with open(pending.output_pdf, 'r+b') as output_stream:
+        context.network.run(PdfTBSDocument.async_finish_signing(
+            output_stream, pending.prepared_digest, signature_cms
+        ))
+
+
+# Per-process state, set up by _init_worker
+_context: Optional[PdfSigningContext] = None
+_key_info: Optional[dict] = None
+_options: Optional[SignOptions] = None
+
+
+def _init_worker(key_info: dict, image_file: Optional[Path], timestamp_url: Optional[str],
+                 options: SignOptions):
+    global _context, _key_info, _options
+    _context = PdfSigningContext(None, image_file=image_file, timestamp_url=timestamp_url,
+                                 signer=external_signer(key_info))
+    _key_info = key_info
+    _options = options
+
+
+def _prepare_one(input_pdf: Path, output_pdf: Path) -> dict:
+    """Phase one in a worker; never raises."""
+    result = {"input": str(input_pdf), "output": str(output_pdf)}
+    start = time.perf_counter()
+    tmp_pdf = output_pdf.with_name(output_pdf.name + ".part")
+    try:
+        output_pdf.parent.mkdir(parents=True, exist_ok=True)
+        pending = prepare_document(_context, input_pdf, tmp_pdf, _options)
+        result["pending"] = pending.to_dict()
+        result["tbs_digest"] = pending.tbs_digest
+    except Exception as e:
+        tmp_pdf.unlink(missing_ok=True)
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["prepare_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def _finish_one(result: dict, signature_value: bytes) -> dict:
+    """Phase two in a worker; never raises."""
+    start = time.perf_counter()
+    pending = PendingSignature.from_dict(result.pop("pending"))
+    result.pop("tbs_digest")
+    try:
+        finish_document(_context, pending, _key_info, signature_value)
+        os.replace(pending.output_pdf, result["output"])
+        result["status"] = "ok"
+        result["signer"] = _context.subject_name
+    except Exception as e:
+        pending.output_pdf.unlink(missing_ok=True)
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["finish_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["pid"] = os.getpid()
+    return result
+
+
+def _fail(result: dict, error: str) -> dict:
+    Path(result.pop("pending")["output"]).unlink(missing_ok=True)
+    result.pop("tbs_digest")
+    result["status"] = "error"
+    result["error"] = error
+    return result
+
+
+def run_remote_batch(jobs: Iterable[tuple[Path, Path]], workers: int, initargs: tuple,
+                     client: KeyServerClient, key_name: str,
+                     digest_batch: int = DEFAULT_DIGEST_BATCH) -> Iterator[dict]:
+    """
+    Sign jobs in chunks of ``digest_batch``, one key server request per chunk.
+
+    The next chunk is prepared on the pool while the key server signs the
+    current one. Results are yielded in input order.
+    """
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=initargs) as executor:
+
+        def submit_prepare():
+            return [executor.submit(_prepare_one, input_pdf, output_pdf)
+                    for input_pdf, output_pdf in islice(jobs, digest_batch)]
+
+        preparing = submit_prepare()
+        while preparing:
+            prepared = [future.result() for future in preparing]
+            preparing = submit_prepare()
+
+            ready = [r for r in prepared if "pending" in r]
+            signatures = []
+            if ready:
+                start = time.perf_counter()
+                try:
+                    signatures = client.sign_digests(
+                        key_name, [r["tbs_digest"] for r in ready],
+                        ready[0]["pending"]["digest_algorithm"]
+                    )
+                except Exception as e:
+                    signatures = None
+                    error = f"{type(e).__name__}: {e}"
+                sign_ms = round((time.perf_counter() - start) * 1000, 1)
+
+            signature_values = iter(signatures or [])
+            finishing = deque()
+            for result in prepared:
+                if "pending" not in result:
+                    finishing.append(result)
+                elif signatures is None:
+                    finishing.append(_fail(result, error))
+                else:
+                    result["key_server_ms"] = sign_ms
+                    finishing.append(executor.submit(_finish_one, result,
+                                                     next(signature_values)))
+            while finishing:
+                item = finishing.popleft()
+                yield item if isinstance(item, dict) else item.result()
+
+
+@click.command()
+@click.argument('source', required=False)
+@click.option('--manifest', default=None,
+              help="Manifest file with 'input[<TAB>output]' lines ('-' for stdin)")
+@click.option('--output-dir', '-o', required=True,
+              type=click.Path(file_okay=False, path_type=Path),
+              help='Directory for signed PDFs')
+@click.option('--recursive', '-r', is_flag=True,
+              help='Recurse into sub-directories (directory or ** glob sources)')
+@click.option('--workers', '-j', default=os.cpu_count() or 1, show_default=True, type=int,
+              help='Number of PDF processes')
+@click.option('--key-server', required=True,
+              help='Key server URL (http://host:port or unix:/path/to.sock)')
+@click.option('--key', 'key_name', required=True,
+              help='Name of the key on the key server')
+@click.option('--token-file', type=click.Path(exists=True, path_type=Path),
+              help='File containing the key server bearer token')
+@click.option('--digest-batch', default=DEFAULT_DIGEST_BATCH, show_default=True, type=int,
+              help='Documents per key server request')
+@click.option('--image', 'signature_image',
+              type=click.Path(exists=True, path_type=Path),
+              help='Image file for visible signature (PNG, JPG, etc.)')
+@click.option('--page', default=1, type=int,
+              help='Page number to place signature (default: 1)')
+@click.option('--position', default='bottom-right', type=click.Choice(POSITIONS),
+              help='Position of the signature on the page')
+@click.option('--x', default=None, type=int,
+              help='X coordinate for custom position (points from left)')
+@click.option('--y', default=None, type=int,
+              help='Y coordinate for custom position (points from bottom)')
+@click.option('--width', default=200, type=int,
+              help='Width of signature field in points (default: 200)')
+@click.option('--height', default=100, type=int,
+              help='Height of signature field in points (default: 100)')
+@click.option('--reason', default='Document Signature',
+              help='Reason for signing')
+@click.option('--location', default='',
+              help='Location of signing')
+@click.option('--contact', default='',
+              help='Contact information')
+@click.option('--field-name', default='Signature1',
+              help='Name of the signature field')
+@click.option('--visible/--invisible', default=True,
+              help='Whether to add a visible signature (default: visible)')
+@click.option('--timestamp-url', default=None,
+              help='URL of timestamp server (TSA) for adding timestamp')
+def sign_remote(source, manifest, output_dir, recursive, workers, key_server, key_name,
+                token_file, digest_batch, signature_image, page, position, x, y, width,
+                height, reason, location, contact, field_name, visible, timestamp_url):
+    """
+    Sign many PDF files with a key held by a key server.
+
+    The PDF work runs on local worker processes; only digests are sent to
+    the key server, DIGEST_BATCH at a time. Output is one JSON object per
+    file, as with sign-batch.
+
+    Examples:
+
+        pdf-signer key-server --key john=cert.p12,pass.txt --uds /run/pdf-signer/keys.sock
+
+        pdf-signer sign-remote invoices/ -o signed/ \\
+            --key-server unix:/run/pdf-signer/keys.sock --key john
+    """
+    if (source is None) == (manifest is None):
+        raise click.UsageError("Give either SOURCE or --manifest")
+    if workers < 1 or digest_batch < 1:
+        raise click.UsageError("--workers and --digest-batch must be at least 1")
+
+    token = token_file.read_text().strip() if token_file else None
+    network = NetworkContext()
+    client = KeyServerClient(key_server, network, token)
+    try:
+        options = SignOptions(
+            page=page, position=position, x=x, y=y,
+            width=width, height=height,
+            reason=reason, location=location, contact=contact,
+            field_name=field_name, visible=visible
+        )
+        key_info = client.key_info(key_name)
+    except Exception as e:
+        client.close()
+        network.close()
+        raise click.ClickException(f"Error loading key '{key_name}': {e}")
+
+    image_file = signature_image if visible else None
+    jobs = collect_jobs(source, manifest, output_dir, recursive)
+    initargs = (key_info, image_file, timestamp_url, options)
+
+    failed = 0
+    try:
+        for result in run_remote_batch(jobs, workers, initargs, client, key_name, digest_batch):
+            if result["status"] == "error":
+                failed += 1
+            click.echo(json.dumps(result))
+    finally:
+        client.close()
+        network.close()
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,331 @@
+"""
+PDF signing service for pdf-signer.
+
+Loads one or more PKCS#12 signers at startup and signs uploaded PDFs on a
+process pool whose workers keep the signers and stamp resources warm. The
+number of requests being signed or waiting for a worker is bounded; beyond
+that the service answers 503 so callers can back off.
+
+Uploads are streamed to a temporary file; the worker signs it into another
+temporary file that is sent back as the response, so no document is held
+in memory or pickled between processes.
+
+Run with ``pdf-signer serve`` or ``uvicorn pdf_signer.server:app``.
+Configuration is read from environment variables (see :class:`ServiceConfig`).
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+
+from pdf_signer.network import DEFAULT_REVINFO_TTL
+from pdf_signer.signing import (POSITIONS, PdfSigningContext, SignOptions, default_trust_roots,
+                                parse_signer_spec, read_password)
+
+__version__ = "0.1.0"
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceConfig:
+    """Signing service configuration from environment variables."""
+
+    def __init__(self):
+        """
+        Initialize configuration from environment variables.
+
+        Raises:
+            ValueError: If a value cannot be parsed
+        """
+        # PDF_SIGNER_SIGNERS="john=/path/email.p12,/path/pass.txt;acme=/path/acme.p12"
+        specs = [s for s in os.getenv("PDF_SIGNER_SIGNERS", "").split(';') if s.strip()]
+        self.signers = [parse_signer_spec(spec) for spec in specs]
+
+        image = os.getenv("PDF_SIGNER_IMAGE")
+        self.image_file = Path(image) if image else None
+
+        # Allowed TSA URLs; the first one is used when a request asks for a timestamp
+        self.timestamp_urls = [u.strip() for u in os.getenv("PDF_SIGNER_TSA_URLS", "").split(',')
+                               if u.strip()]
+
+        self.workers = int(os.getenv("PDF_SIGNER_WORKERS", str(os.cpu_count() or 1)))
+        self.queue_size = int(os.getenv("PDF_SIGNER_QUEUE_SIZE", "32"))
+        self.max_upload_bytes = int(os.getenv("PDF_SIGNER_MAX_UPLOAD_MB", "100")) * 1024 * 1024
+
+        # Trust anchors for LTV signing (comma-separated PEM files)
+        roots = os.getenv("PDF_SIGNER_TRUST_ROOTS")
+        self.trust_roots = ([Path(r.strip()) for r in roots.split(',') if r.strip()]
+                            if roots else default_trust_roots())
+        self.revinfo_ttl = int(os.getenv("PDF_SIGNER_REVINFO_TTL", str(DEFAULT_REVINFO_TTL)))
+
+    def validate(self) -> list[str]:
+        """Return a list of configuration errors (empty if valid)."""
+        errors = []
+        if not self.signers:
+            errors.append("No signers configured (PDF_SIGNER_SIGNERS)")
+        names = [name for name, _, _ in self.signers]
+        if len(set(names)) != len(names):
+            errors.append("Duplicate signer names in PDF_SIGNER_SIGNERS")
+        for name, p12_file, password_file in self.signers:
+            if not p12_file.exists():
+                errors.append(f"PKCS#12 file for signer '{name}' not found: {p12_file}")
+            if password_file is not None and not password_file.exists():
+                errors.append(f"Password file for signer '{name}' not found: {password_file}")
+        if self.image_file is not None and not self.image_file.exists():
+            errors.append(f"Signature image not found: {self.image_file}")
+        if self.workers < 1:
+            errors.append("PDF_SIGNER_WORKERS must be at least 1")
+        if self.queue_size < 0:
+            errors.append("PDF_SIGNER_QUEUE_SIZE must not be negative")
+        for root in self.trust_roots:
+            if not root.exists():
+                errors.append(f"Trust root not found: {root}")
+        return errors
+
+    def __repr__(self) -> str:
+        return (
+            f"ServiceConfig(signers={[name for name, _, _ in self.signers]}, "
+            f"image_file={self.image_file}, timestamp_urls={self.timestamp_urls}, "
+            f"workers={self.workers}, queue_size={self.queue_size}, "
+            f"trust_roots={[str(r) for r in self.trust_roots]})"
+        )
+
+
+# Per-process signing contexts, set up by _init_worker
+_contexts: dict[str, PdfSigningContext] = {}
+
+
+def _load_contexts(signer_specs: list, image_file: Optional[Path],
+                   trust_roots: Optional[list[Path]] = None,
+                   revinfo_ttl: int = DEFAULT_REVINFO_TTL) -> dict[str, PdfSigningContext]:
+    contexts = {}
+    for name, p12_file, password_file in signer_specs:
+        password = read_password(None, password_file)
+        contexts[name] = PdfSigningContext(p12_file, password, image_file,
+                                           trust_roots=trust_roots, revinfo_ttl=revinfo_ttl)
+    return contexts
+
+
+def _init_worker(signer_specs: list, image_file: Optional[Path],
+                 trust_roots: Optional[list[Path]], revinfo_ttl: int):
+    global _contexts
+    _contexts = _load_contexts(signer_specs, image_file, trust_roots, revinfo_ttl)
+
+
+def _sign_file(signer_name: str, input_pdf: Path, output_pdf: Path, options: SignOptions,
+               timestamp_url: Optional[str]):
+    """Sign ``input_pdf`` into ``output_pdf`` in a worker process."""
+    _contexts[signer_name].sign_file(input_pdf, output_pdf, options, timestamp_url)
+
+
+app = FastAPI(
+    title="pdf-signer",
+    description="PDF signing service with warm PKCS#12 signers",
+    version=__version__,
+)
+
+config: Optional[ServiceConfig] = None
+signer_info: dict[str, dict] = {}
+executor: Optional[ProcessPoolExecutor] = None
+slots: Optional[asyncio.Semaphore] = None
+# Uploads and signed documents; removed with the service
+spool_dir: Optional[Path] = None
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load signers and start the worker pool."""
+    global config, executor, slots, spool_dir
+
+    logger.info("Starting pdf-signer service...")
+    config = ServiceConfig()
+    logger.info(f"Configuration loaded: {config}")
+
+    errors = config.validate()
+    if errors:
+        logger.error(f"Configuration validation failed: {'; '.join(errors)}")
+        raise RuntimeError(f"Invalid configuration: {'; '.join(errors)}")
+
+    # Load once in the service process so bad passwords fail at startup
+    contexts = _load_contexts(config.signers, None, config.trust_roots)
+    for name, context in contexts.items():
+        cert = context.signer.signing_cert
+        signer_info[name] = {
+            "name": name,
+            "subject": context.subject_name,
+            "serial_number": format(cert.serial_number, 'x'),
+            "not_after": cert['tbs_certificate']['validity']['not_after'].native.isoformat(),
+        }
+        logger.info(f"Signer '{name}' loaded: {context.subject_name}")
+        context.close()
+
+    # spawn: do not fork the running event loop into workers
+    executor = ProcessPoolExecutor(
+        max_workers=config.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(config.signers, config.image_file, config.trust_roots, config.revinfo_ttl),
+    )
+    slots = asyncio.Semaphore(config.workers + config.queue_size)
+    spool_dir = Path(tempfile.mkdtemp(prefix="pdf-signer-"))
+    logger.info(f"Signing pool started: {config.workers} workers, queue size {config.queue_size}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the worker pool."""
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if spool_dir is not None:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+@app.get("/")
+async def root():
+    """Root endpoint with API information."""
+    return {
+        "service": "pdf-signer",
+        "version": __version__,
+        "endpoints": {
+            "sign": "/sign (POST application/pdf body, options as query parameters)",
+            "signers": "/signers",
+            "health": "/health",
+        },
+    }
+
+
+@app.get("/health")
+async def health():
+    """Health check endpoint."""
+    return {
+        "status": "healthy" if executor is not None else "starting",
+        "signers": len(signer_info),
+        "workers": config.workers if config else 0,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+@app.get("/signers")
+async def list_signers():
+    """List loaded signers (no key material)."""
+    return {"signers": [signer_info[name] for name in sorted(signer_info)]}
+
+
+def _spool_path(suffix: str) -> Path:
+    fd, name = tempfile.mkstemp(suffix=suffix, dir=spool_dir)
+    os.close(fd)
+    return Path(name)
+
+
+def _remove(*paths: Path):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+async def _spool_body(request: Request, path: Path) -> int:
+    """Stream the request body into ``path`` and return its size."""
+    size = 0
+    with open(path, 'wb') as spool:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > config.max_upload_bytes:
+                raise HTTPException(status_code=413, detail="PDF too large")
+            spool.write(chunk)
+    return size
+
+
+@app.post("/sign")
+async def sign(
+    request: Request,
+    signer: Optional[str] = Query(None, description="Signer name (default: only/first signer)"),
+    page: int = Query(1, ge=1),
+    position: str = Query('bottom-right', description=f"One of {', '.join(POSITIONS)}"),
+    x: Optional[int] = None,
+    y: Optional[int] = None,
+    width: int = Query(200, gt=0),
+    height: int = Query(100, gt=0),
+    reason: str = 'Document Signature',
+    location: str = '',
+    contact: str = '',
+    field_name: str = 'Signature1',
+    visible: bool = True,
+    timestamp: bool = Query(False, description="Add a timestamp from the default TSA"),
+    timestamp_url: Optional[str] = Query(None, description="TSA URL (must be allowed)"),
+    ltv: bool = Query(False, description="Embed revocation info (needs trust roots)"),
+):
+    """
+    Sign a PDF sent as the request body and return the signed PDF.
+
+    Example:
+        curl --data-binary @in.pdf -H 'Content-Type: application/pdf' \\
+            'http://localhost:8000/sign?signer=john&page=3' -o signed.pdf
+    """
+    if signer is None:
+        signer = sorted(signer_info)[0]
+    if signer not in signer_info:
+        raise HTTPException(status_code=404, detail=f"Unknown signer: {signer}")
+
+    if timestamp_url is not None:
+        if timestamp_url not in config.timestamp_urls:
+            raise HTTPException(status_code=400, detail="TSA URL not allowed")
+    elif timestamp:
+        if not config.timestamp_urls:
+            raise HTTPException(status_code=400, detail="No TSA configured")
+        timestamp_url = config.timestamp_urls[0]
+
+    try:
+        options = SignOptions(
+            page=page, position=position, x=x, y=y,
+            width=width, height=height,
+            reason=reason, location=location, contact=contact,
+            field_name=field_name, visible=visible, ltv=ltv
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if ltv and not config.trust_roots:
+        raise HTTPException(status_code=400, detail="No trust roots configured for LTV")
+
+    if slots.locked():
+        raise HTTPException(status_code=503, detail="Signing queue full",
+                            headers={"Retry-After": "1"})
+
+    input_pdf = _spool_path(".pdf")
+    output_pdf = _spool_path("-signed.pdf")
+    try:
+        async with slots:
+            if not await _spool_body(request, input_pdf):
+                raise HTTPException(status_code=400, detail="Empty request body")
+
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(
+                    executor, _sign_file, signer, input_pdf, output_pdf, options, timestamp_url
+                )
+            except BrokenProcessPool as e:
+                logger.error(f"Signing worker pool is broken: {e}")
+                raise HTTPException(status_code=500, detail="Internal server error")
+            except Exception as e:
+                logger.warning(f"Signing failed: {type(e).__name__}: {e}")
+                raise HTTPException(status_code=422, detail=f"Signing failed: {e}")
+    except BaseException:
+        _remove(input_pdf, output_pdf)
+        raise
+    input_pdf.unlink()
+
+    return FileResponse(
+        output_pdf,
+        media_type="application/pdf",
+        background=BackgroundTask(_remove, output_pdf),
+    )
@@ -7,18 +7,45 @@ a visible signature stamp/graphic that is clickable and verifiable in
 PDF viewers like Adobe Acrobat.
 """
 
+import importlib
+import logging
+import os
+from typing import Optional
+
 import click
 from pathlib import Path
-from datetime import datetime
-from PIL import Image
-import io
 
-from pyhanko.sign import signers, fields
-from pyhanko.pdf_utils import images
-from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
-from pyhanko import stamp
+from pyhanko.sign import fields
 from pyhanko.pdf_utils.reader import PdfFileReader
 
+from pdf_signer.signing import PdfSigningContext, SignOptions, default_trust_roots, read_password
+
+
+class LazyGroup(click.Group):
+    """
+    Command group importing a subcommand's module only when it is run.
+
+    ``sign`` and ``verify`` do not pay for (or need) the modules behind the
+    batch, multi-signer, deferred and verification commands.
+    """
+
+    def __init__(self, *args, lazy_commands: Optional[dict[str, str]] = None, **kwargs):
+        """
+        Args:
+            lazy_commands: Command name -> ``module:attribute`` of the command
+        """
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands:
+            module_name, attribute = self.lazy_commands[cmd_name].split(':')
+            return getattr(importlib.import_module(module_name), attribute)
+        return super().get_command(ctx, cmd_name)
+
 
 @click.command()
 @click.argument('input_pdf', type=click.Path(exists=True, path_type=Path))
@@ -61,10 +88,17 @@ from pyhanko.pdf_utils.reader import PdfFileReader
               help='Whether to add a visible signature (default: visible)')
 @click.option('--timestamp-url', default=None,
               help='URL of timestamp server (TSA) for adding timestamp')
+@click.option('--large-file', is_flag=True,
+              help='Memory-map the input and sign with bounded memory (for very large PDFs)')
+@click.option('--ltv', is_flag=True,
+              help='Embed revocation info for the signer chain (PAdES-B-LT with --timestamp-url)')
+@click.option('--trust-root', 'trust_roots', multiple=True,
+              type=click.Path(exists=True, path_type=Path),
+              help='Trust anchor PEM for --ltv (repeatable, default: $DEMO_CFSSL_DIR/ca.pem)')
 def sign_pdf(input_pdf, output_pdf, p12_file, p12_password, password_file,
              signature_image, page, position, x, y, width, height,
              reason, location, contact, field_name, text_params, visible,
-             timestamp_url):
+             timestamp_url, large_file, ltv, trust_roots):
     """
     Sign a PDF file with an X.509 certificate and optional visible signature.
     
@@ -81,150 +115,64 @@ def sign_pdf(input_pdf, output_pdf, p12_file, p12_password, password_file,
         
         # Sign with timestamp
         pdf-signer sign input.pdf output.pdf --p12 cert.p12 --image sig.png --timestamp-url http://timestamp.digicert.com
+        
+        # Long-term validation (PAdES-B-LT)
+        pdf-signer sign input.pdf output.pdf --p12 cert.p12 --timestamp-url http://localhost:8080/tsa --ltv --trust-root ca.pem
+        
+        # Very large PDF (constant memory use)
+        pdf-signer sign scan-archive.pdf signed.pdf --p12 cert.p12 --large-file
     """
     
     try:
         # Get password
-        if password_file:
-            password = password_file.read_text().strip()
-        elif p12_password:
-            password = p12_password
-        else:
+        password = read_password(p12_password, password_file)
+        if password is None:
             password = click.prompt('Enter PKCS#12 password', hide_input=True, default='')
         
+        options = SignOptions(
+            page=page, position=position, x=x, y=y,
+            width=width, height=height,
+            reason=reason, location=location, contact=contact,
+            field_name=field_name, visible=visible, ltv=ltv
+        )
+        
         # Load the PKCS#12 certificate
         click.echo(f"Loading certificate from {p12_file}...")
-        signer = signers.SimpleSigner.load_pkcs12(
-            pfx_file=str(p12_file),
-            passphrase=password.encode('utf-8') if password else None
+        if signature_image and visible:
+            click.echo(f"Loading signature image from {signature_image}...")
+        context = PdfSigningContext(
+            p12_file, password,
+            image_file=signature_image if visible else None,
+            timestamp_url=timestamp_url,
+            trust_roots=list(trust_roots) or default_trust_roots()
         )
         
-        click.echo(f"Certificate loaded: {signer.subject_name}")
+        click.echo(f"Certificate loaded: {context.subject_name}")
         
-        # Open the input PDF
-        with open(str(input_pdf), 'rb') as pdf_file:
-            pdf_reader = PdfFileReader(pdf_file)
-            
-            # Create a PDF writer for signing
-            w = IncrementalPdfFileWriter(pdf_file)
-            
-            # Determine signature field position
-            if position == 'custom':
-                if x is None or y is None:
-                    raise click.ClickException("Custom position requires --x and --y coordinates")
-                box_x = x
-                box_y = y
-            else:
-                # Get page dimensions (assuming US Letter: 612x792 points)
-                # In production, should get actual page dimensions
-                page_width = 612
-                page_height = 792
-                
-                if position == 'bottom-right':
-                    box_x = page_width - width - 50
-                    box_y = 50
-                elif position == 'bottom-left':
-                    box_x = 50
-                    box_y = 50
-                elif position == 'top-right':
-                    box_x = page_width - width - 50
-                    box_y = page_height - height - 50
-                elif position == 'top-left':
-                    box_x = 50
-                    box_y = page_height - height - 50
-            
-            # Create signature metadata
-            meta = signers.PdfSignatureMetadata(
-                field_name=field_name,
-                location=location,
-                reason=reason,
-                contact_info=contact
-            )
-            
-            if visible:
-                # Create visible signature appearance
-                if signature_image:
-                    # Load custom image
-                    click.echo(f"Loading signature image from {signature_image}...")
-                    from PIL import Image as PILImage
-                    
-                    # Load image using PIL
-                    pil_image = PILImage.open(str(signature_image))
-                    
-                    # Create stamp style with image
-                    sig_appearance = stamp.TextStampStyle(
-                        stamp_text=(
-                            f"Digitally signed by\n"
-                            f"%(signer)s\n"
-                            f"Date: %(ts)s\n"
-                            f"Reason: {reason}"
-                        ),
-                        background=images.PdfImage(pil_image),
-                        background_opacity=0.3,  # Make background semi-transparent
-                    )
-                else:
-                    # Default text-only signature
-                    sig_appearance = stamp.TextStampStyle(
-                        stamp_text=(
-                            f"Digitally signed by\n"
-                            f"%(signer)s\n"
-                            f"Date: %(ts)s\n"
-                            f"Reason: {reason}"
-                        ),
-                        border_width=1,
-                    )
-                
-                # Add signature field
-                sig_field = fields.SigFieldSpec(
-                    sig_field_name=field_name,
-                    box=(box_x, box_y, box_x + width, box_y + height),
-                    on_page=page - 1  # pyHanko uses 0-based page indexing
-                )
-                
-                click.echo(f"Adding visible signature on page {page} at position ({box_x}, {box_y})...")
-                
-                # Sign the PDF with visible signature
-                pdf_signer = signers.PdfSigner(
-                    meta,
-                    signer=signer,
-                    stamp_style=sig_appearance,
-                    new_field_spec=sig_field
-                )
-            else:
-                # Invisible signature
-                click.echo("Creating invisible signature...")
-                pdf_signer = signers.PdfSigner(
-                    meta,
-                    signer=signer
-                )
-            
-            # Add timestamp if requested
-            if timestamp_url:
-                from pyhanko.sign import timestamps
-                from pyhanko.sign.timestamps import HTTPTimeStamper
-                
-                click.echo(f"Adding timestamp from {timestamp_url}...")
-                timestamper = HTTPTimeStamper(timestamp_url)
-                
-                # Sign with timestamp
-                with open(str(output_pdf), 'wb') as output_file:
-                    pdf_signer.sign_pdf(
-                        w,
-                        output=output_file,
-                        timestamper=timestamper
-                    )
-            else:
-                # Sign without timestamp
-                with open(str(output_pdf), 'wb') as output_file:
-                    pdf_signer.sign_pdf(w, output=output_file)
-            
-            click.echo(f"✓ PDF signed successfully: {output_pdf}")
-            click.echo(f"  Signer: {signer.subject_name}")
-            click.echo(f"  Reason: {reason}")
-            if location:
-                click.echo(f"  Location: {location}")
-            if timestamp_url:
-                click.echo(f"  Timestamp: Added from {timestamp_url}")
+        if visible:
+            box_x, box_y, _, _ = options.box()
+            click.echo(f"Adding visible signature on page {page} at position ({box_x}, {box_y})...")
+        else:
+            click.echo("Creating invisible signature...")
+        if timestamp_url:
+            click.echo(f"Adding timestamp from {timestamp_url}...")
+        
+        if ltv:
+            click.echo("Embedding validation info (LTV)...")
+        try:
+            context.sign_file(input_pdf, output_pdf, options, large_file=large_file)
+        finally:
+            context.close()
+        
+        click.echo(f"✓ PDF signed successfully: {output_pdf}")
+        click.echo(f"  Signer: {context.subject_name}")
+        click.echo(f"  Reason: {reason}")
+        if location:
+            click.echo(f"  Location: {location}")
+        if timestamp_url:
+            click.echo(f"  Timestamp: Added from {timestamp_url}")
+        if ltv:
+            click.echo(f"  LTV: Validation info embedded")
             
     except FileNotFoundError as e:
         raise click.ClickException(f"File not found: {e}")
@@ -305,7 +253,114 @@ def verify(pdf_file, verbose):
         raise click.ClickException(f"Error verifying PDF: {e}")
 
 
-@click.group()
+@click.command()
+@click.option('--signer', 'signer_specs', multiple=True, required=True,
+              help='Signer as NAME=P12[,PASSWORD_FILE] (repeatable)')
+@click.option('--image', 'signature_image',
+              type=click.Path(exists=True, path_type=Path),
+              help='Image file for visible signatures (PNG, JPG, etc.)')
+@click.option('--timestamp-url', 'timestamp_urls', multiple=True,
+              help='Allowed TSA URL (repeatable, the first is the default)')
+@click.option('--workers', '-j', default=os.cpu_count() or 1, show_default=True, type=int,
+              help='Number of signing processes')
+@click.option('--queue-size', default=32, show_default=True, type=int,
+              help='Requests allowed to wait for a worker before answering 503')
+@click.option('--max-upload-mb', default=100, show_default=True, type=int,
+              help='Maximum PDF upload size in MB')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Listen address')
+@click.option('--port', default=8000, show_default=True, type=int, help='Listen port')
+@click.option('--trust-root', 'trust_roots', multiple=True,
+              type=click.Path(exists=True, path_type=Path),
+              help='Trust anchor PEM for ltv requests (repeatable, default: $DEMO_CFSSL_DIR/ca.pem)')
+@click.option('--revinfo-ttl', default=None, type=int,
+              help='Seconds to reuse fetched OCSP responses and CRLs (default: 3600)')
+def serve(signer_specs, signature_image, timestamp_urls, workers, queue_size,
+          max_upload_mb, host, port, trust_roots, revinfo_ttl):
+    """
+    Run the HTTP signing service.
+    
+    Signers are loaded once at startup and kept warm in a pool of worker
+    processes. Requires the server extra: uv pip install -e '.[server]'
+    
+    Example:
+    
+        pdf-signer serve --signer john=cert.p12,pass.txt --image sig.png --port 8000
+        
+        curl --data-binary @in.pdf -H 'Content-Type: application/pdf' \\
+            'http://localhost:8000/sign?signer=john&page=3' -o signed.pdf
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise click.ClickException("Service mode needs the server extra: uv pip install -e '.[server]'")
+    
+    os.environ["PDF_SIGNER_SIGNERS"] = ";".join(signer_specs)
+    if signature_image:
+        os.environ["PDF_SIGNER_IMAGE"] = str(signature_image)
+    os.environ["PDF_SIGNER_TSA_URLS"] = ",".join(timestamp_urls)
+    os.environ["PDF_SIGNER_WORKERS"] = str(workers)
+    os.environ["PDF_SIGNER_QUEUE_SIZE"] = str(queue_size)
+    os.environ["PDF_SIGNER_MAX_UPLOAD_MB"] = str(max_upload_mb)
+    if trust_roots:
+        os.environ["PDF_SIGNER_TRUST_ROOTS"] = ",".join(str(r) for r in trust_roots)
+    if revinfo_ttl is not None:
+        os.environ["PDF_SIGNER_REVINFO_TTL"] = str(revinfo_ttl)
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    uvicorn.run("pdf_signer.server:app", host=host, port=port, log_level="info")
+
+
+@click.command('key-server')
+@click.option('--key', 'key_specs', multiple=True, required=True,
+              help='Key as NAME=P12[,PASSWORD_FILE] (repeatable)')
+@click.option('--uds', type=click.Path(path_type=Path),
+              help='Listen on this Unix socket instead of TCP')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Listen address')
+@click.option('--port', default=8001, show_default=True, type=int, help='Listen port')
+@click.option('--token-file', type=click.Path(exists=True, path_type=Path),
+              help='File containing the bearer token clients must send')
+@click.option('--max-batch', default=1000, show_default=True, type=int,
+              help='Maximum digests per request')
+def key_server(key_specs, uds, host, port, token_file, max_batch):
+    """
+    Run the key server for deferred signing (sign-remote).
+    
+    Holds the PKCS#12 keys and signs batches of digests; documents never
+    reach it. Requires the server extra: uv pip install -e '.[server]'
+    
+    Example:
+    
+        pdf-signer key-server --key john=cert.p12,pass.txt --uds /run/pdf-signer/keys.sock
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise click.ClickException("Key server needs the server extra: uv pip install -e '.[server]'")
+    
+    os.environ["PDF_SIGNER_KEYS"] = ";".join(key_specs)
+    if token_file:
+        os.environ["PDF_SIGNER_KEY_TOKEN_FILE"] = str(token_file)
+    os.environ["PDF_SIGNER_MAX_BATCH"] = str(max_batch)
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if uds:
+        uvicorn.run("pdf_signer.keyserver:app", uds=str(uds), log_level="info")
+    else:
+        uvicorn.run("pdf_signer.keyserver:app", host=host, port=port, log_level="info")
+
+
+@click.group(cls=LazyGroup, lazy_commands={
+    'sign-batch': 'pdf_signer.batch:sign_batch',
+    'sign-multi': 'pdf_signer.multi:sign_multi',
+    'verify-batch': 'pdf_signer.verification:verify_batch',
+    'sign-remote': 'pdf_signer.remote:sign_remote',
+})
 @click.version_option(version='1.0.0')
 def cli():
     """
@@ -319,6 +374,8 @@ def cli():
 
 cli.add_command(sign_pdf, name='sign')
 cli.add_command(verify)
+cli.add_command(serve)
+cli.add_command(key_server)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,314 @@
+"""
+Reusable PDF signing pieces shared by the pdf-signer commands.
+
+``sign`` builds a :class:`PdfSigningContext` once per invocation; batch and
+service modes build one per worker process and reuse it for every document,
+so the PKCS#12 file is decrypted and the stamp resources are created once.
+"""
+
+import os
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image as PILImage
+
+from pyhanko import stamp
+from pyhanko.pdf_utils import images
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign import fields, signers
+
+from pdf_signer.network import DEFAULT_REVINFO_TTL, NetworkContext, load_pem_certs
+
+# Page dimensions used for predefined positions (US Letter: 612x792 points)
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+PAGE_MARGIN = 50
+
+POSITIONS = ['top-left', 'top-right', 'bottom-left', 'bottom-right', 'custom']
+
+# Key usage required of signer certificates; the demo profiles issue
+# digitalSignature, not nonRepudiation
+SIGNER_KEY_USAGE = {'digital_signature'}
+
+# demo-cfssl output directory, used for default trust roots
+BD = Path(os.environ.get('DEMO_CFSSL_DIR', os.path.expanduser('~/.config/demo-cfssl')))
+
+
+class SignOptions:
+    """Per-document signing options, mirroring the ``sign`` command flags."""
+
+    def __init__(self, page: int = 1, position: str = 'bottom-right',
+                 x: Optional[int] = None, y: Optional[int] = None,
+                 width: int = 200, height: int = 100,
+                 reason: str = 'Document Signature', location: str = '',
+                 contact: str = '', field_name: str = 'Signature1',
+                 visible: bool = True, ltv: bool = False):
+        if position not in POSITIONS:
+            raise ValueError(f"Unknown position: {position}")
+        if position == 'custom' and (x is None or y is None):
+            raise ValueError("Custom position requires x and y coordinates")
+        if page < 1:
+            raise ValueError("Page numbers start at 1")
+        self.page = page
+        self.position = position
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.reason = reason
+        self.location = location
+        self.contact = contact
+        self.field_name = field_name
+        self.visible = visible
+        # Embed revocation info for the signer chain (PAdES-B-LT with a TSA)
+        self.ltv = ltv
+
+    def box(self) -> tuple[int, int, int, int]:
+        """
+        Compute the signature field rectangle.
+
+        Returns:
+            (x1, y1, x2, y2) in PDF points
+        """
+        if self.position == 'custom':
+            box_x, box_y = self.x, self.y
+        elif self.position == 'bottom-right':
+            box_x = PAGE_WIDTH - self.width - PAGE_MARGIN
+            box_y = PAGE_MARGIN
+        elif self.position == 'bottom-left':
+            box_x = PAGE_MARGIN
+            box_y = PAGE_MARGIN
+        elif self.position == 'top-right':
+            box_x = PAGE_WIDTH - self.width - PAGE_MARGIN
+            box_y = PAGE_HEIGHT - self.height - PAGE_MARGIN
+        else:  # top-left
+            box_x = PAGE_MARGIN
+            box_y = PAGE_HEIGHT - self.height - PAGE_MARGIN
+        return box_x, box_y, box_x + self.width, box_y + self.height
+
+    def field_spec(self) -> fields.SigFieldSpec:
+        """Signature field for these options (no widget box when invisible)."""
+        return fields.SigFieldSpec(
+            sig_field_name=self.field_name,
+            box=self.box() if self.visible else None,
+            on_page=self.page - 1  # pyHanko uses 0-based page indexing
+        )
+
+
+def default_trust_roots() -> list[Path]:
+    """Root CA of the demo-cfssl directory, if present."""
+    ca_file = BD / 'ca.pem'
+    return [ca_file] if ca_file.exists() else []
+
+
+def read_password(password: Optional[str] = None,
+                  password_file: Optional[Path] = None) -> Optional[str]:
+    """Resolve the PKCS#12 password from a literal or a file."""
+    if password_file:
+        return password_file.read_text().strip()
+    return password
+
+
+def parse_signer_spec(spec: str) -> tuple[str, Path, Optional[Path]]:
+    """
+    Parse a ``NAME=P12[,PASSWORD_FILE]`` signer specification.
+
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    name, sep, rest = spec.partition('=')
+    if not sep or not name.strip() or not rest.strip():
+        raise ValueError(f"Invalid signer '{spec}', expected NAME=P12[,PASSWORD_FILE]")
+    p12_file, _, password_file = rest.partition(',')
+    return (name.strip(), Path(p12_file.strip()),
+            Path(password_file.strip()) if password_file.strip() else None)
+
+
+def load_signer(p12_file: Path, password: Optional[str] = None) -> signers.SimpleSigner:
+    """
+    Load a signer from a PKCS#12 file.
+
+    Raises:
+        RuntimeError: If the file cannot be decrypted or parsed
+    """
+    signer = signers.SimpleSigner.load_pkcs12(
+        pfx_file=str(p12_file),
+        passphrase=password.encode('utf-8') if password else None
+    )
+    if signer is None:
+        raise RuntimeError(f"Failed to load PKCS#12 file {p12_file}")
+    return signer
+
+
+def load_background(image_file: Path) -> images.PdfImage:
+    """Decode a signature image once into a reusable PdfImage."""
+    pil_image = PILImage.open(str(image_file))
+    pil_image.load()
+    return images.PdfImage(pil_image)
+
+
+def build_stamp_style(reason: str,
+                      background: Optional[images.PdfImage] = None) -> stamp.TextStampStyle:
+    """Build the visible signature appearance."""
+    stamp_text = (
+        f"Digitally signed by\n"
+        f"%(signer)s\n"
+        f"Date: %(ts)s\n"
+        f"Reason: {reason}"
+    )
+    if background is not None:
+        return stamp.TextStampStyle(
+            stamp_text=stamp_text,
+            background=background,
+            background_opacity=0.3,  # Make background semi-transparent
+        )
+    return stamp.TextStampStyle(stamp_text=stamp_text, border_width=1)
+
+
+class PdfSigningContext:
+    """
+    Signer, stamp resources and network clients loaded once and reused.
+
+    Stamp styles are cached per reason text, since the reason is baked into
+    the stamp text. TSA and revocation requests share one keep-alive HTTP
+    session and a TTL cache of revocation data (see :mod:`pdf_signer.network`).
+    A context is not thread-safe: use one per worker.
+    """
+
+    def __init__(self, p12_file: Optional[Path], password: Optional[str] = None,
+                 image_file: Optional[Path] = None,
+                 timestamp_url: Optional[str] = None,
+                 trust_roots: Optional[list[Path]] = None,
+                 revinfo_ttl: int = DEFAULT_REVINFO_TTL,
+                 signer: Optional[signers.Signer] = None):
+        """
+        Load signing material.
+
+        Args:
+            p12_file: PKCS#12 signer
+            password: PKCS#12 password
+            image_file: Background image for visible signatures
+            timestamp_url: Default TSA URL
+            trust_roots: PEM files with trust anchors, needed for LTV signatures
+            revinfo_ttl: Seconds to reuse fetched OCSP responses and CRLs
+            signer: Ready-made signer used instead of ``p12_file`` (e.g. an
+                ExternalSigner whose key lives in a key server)
+
+        Raises:
+            RuntimeError: If the PKCS#12 file or trust roots cannot be loaded
+        """
+        self.p12_file = p12_file
+        self.signer = signer if signer is not None else load_signer(p12_file, password)
+        self.background = load_background(image_file) if image_file else None
+        self.timestamp_url = timestamp_url
+        try:
+            self.trust_roots = load_pem_certs(trust_roots or [])
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Failed to load trust roots: {e}")
+        self.network = NetworkContext(revinfo_ttl=revinfo_ttl)
+        self._styles: dict[str, stamp.TextStampStyle] = {}
+
+    @property
+    def subject_name(self) -> str:
+        return self.signer.subject_name
+
+    def timestamper(self, timestamp_url: Optional[str] = None):
+        """Return the TSA client for a URL, defaulting to the context's."""
+        timestamp_url = timestamp_url or self.timestamp_url
+        if not timestamp_url:
+            return None
+        return self.network.timestamper(timestamp_url)
+
+    def stamp_style(self, reason: str) -> stamp.TextStampStyle:
+        style = self._styles.get(reason)
+        if style is None:
+            style = self._styles[reason] = build_stamp_style(reason, self.background)
+        return style
+
+    def pdf_signer(self, options: SignOptions, timestamp_url: Optional[str] = None,
+                   existing_field: bool = False) -> signers.PdfSigner:
+        """
+        Build a PdfSigner for one document.
+
+        With ``existing_field`` the field ``options.field_name`` must already
+        exist in the document (see :meth:`sign_in_place`) and is filled as is.
+        """
+        timestamper = self.timestamper(timestamp_url)
+        ltv_settings = {}
+        if options.ltv:
+            if not self.trust_roots:
+                raise RuntimeError("LTV signing needs at least one trust root")
+            ltv_settings = dict(
+                subfilter=fields.SigSeedSubFilter.PADES,
+                embed_validation_info=True,
+                signer_key_usage=SIGNER_KEY_USAGE,
+                validation_context=self.network.validation_context(
+                    self.trust_roots, list(self.signer.cert_registry)
+                ),
+            )
+        meta = signers.PdfSignatureMetadata(
+            field_name=options.field_name,
+            location=options.location,
+            reason=options.reason,
+            contact_info=options.contact,
+            **ltv_settings
+        )
+        if not options.visible:
+            return signers.PdfSigner(meta, signer=self.signer,
+                                     timestamper=timestamper)
+        return signers.PdfSigner(
+            meta,
+            signer=self.signer,
+            timestamper=timestamper,
+            stamp_style=self.stamp_style(options.reason),
+            new_field_spec=None if existing_field else options.field_spec()
+        )
+
+    def sign_stream(self, input_stream, output_stream, options: SignOptions,
+                    timestamp_url: Optional[str] = None):
+        """Sign a PDF read from ``input_stream`` into ``output_stream``."""
+        w = IncrementalPdfFileWriter(input_stream)
+        self.sign_writer(w, output_stream, options, timestamp_url)
+
+    def sign_writer(self, writer: IncrementalPdfFileWriter, output_stream,
+                    options: SignOptions, timestamp_url: Optional[str] = None,
+                    chunk_size: int = 4096):
+        """Sign an opened document on the shared event loop and HTTP session."""
+        pdf_signer = self.pdf_signer(options, timestamp_url)
+        self.network.run(pdf_signer.async_sign_pdf(
+            writer, output=output_stream, chunk_size=chunk_size
+        ))
+
+    def sign_in_place(self, stream, options: SignOptions,
+                      timestamp_url: Optional[str] = None):
+        """
+        Fill the existing field ``options.field_name`` of the PDF in ``stream``.
+
+        The signature is appended to ``stream`` (opened read/write) as a new
+        incremental update; nothing before it is rewritten.
+        """
+        w = IncrementalPdfFileWriter(stream)
+        pdf_signer = self.pdf_signer(options, timestamp_url, existing_field=True)
+        self.network.run(pdf_signer.async_sign_pdf(
+            w, existing_fields_only=True, in_place=True
+        ))
+
+    def sign_file(self, input_pdf: Path, output_pdf: Path, options: SignOptions,
+                  timestamp_url: Optional[str] = None, large_file: bool = False):
+        """
+        Sign ``input_pdf`` into ``output_pdf``.
+
+        With ``large_file`` the input is memory-mapped and signed with bounded
+        memory use (see :mod:`pdf_signer.largefile`).
+        """
+        if large_file:
+            from pdf_signer.largefile import sign_large_file
+            sign_large_file(self, input_pdf, output_pdf, options, timestamp_url)
+            return
+        with open(input_pdf, 'rb') as input_stream, \
+                open(output_pdf, 'wb') as output_stream:
+            self.sign_stream(input_stream, output_stream, options, timestamp_url)
+
+    def close(self):
+        """Release the HTTP session and event loop."""
+        self.network.close()
@@ -0,0 +1,241 @@
+"""
+Batch verification: validate the signatures of many PDFs on a process pool.
+
+Each worker process builds one :class:`VerificationContext` in its
+initializer: the trust anchors are parsed once, and a single pyHanko
+``ValidationContext`` is reused for every document. Its path and
+revocation caches therefore carry over from file to file. Revocation data
+comes through the worker's cached fetchers (see :mod:`pdf_signer.network`),
+so an archive signed by a handful of certificates costs a handful of OCSP/CRL
+fetches per worker instead of one per signature.
+"""
+
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import click
+from asn1crypto import x509
+from pyhanko.pdf_utils.reader import PdfFileReader
+from pyhanko.sign.validation import async_validate_pdf_signature
+from pyhanko.sign.validation.settings import KeyUsageConstraints
+
+from pdf_signer.batch import collect_jobs
+from pdf_signer.network import DEFAULT_REVINFO_TTL, NetworkContext, load_pem_certs
+from pdf_signer.signing import BD, SIGNER_KEY_USAGE
+
+REVOCATION_MODES = ['soft-fail', 'hard-fail', 'require']
+
+
+def default_verify_certs() -> list[Path]:
+    """Return the demo-cfssl root and intermediate certificates, if present."""
+    return [path for path in (BD / 'ca.pem', BD / 'ica-ca.pem') if path.exists()]
+
+
+def _name(cert: Optional[x509.Certificate]) -> Optional[str]:
+    if cert is None:
+        return None
+    return cert.subject.native.get('common_name') or cert.subject.human_friendly
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+class VerificationContext:
+    """
+    Trust anchors, revocation fetchers and one validation context, reused per document.
+
+    Self-signed certificates from ``cert_files`` become trust roots; all
+    other certificates are offered as intermediates for path building.
+    """
+
+    def __init__(self, cert_files: list[Path], revinfo_ttl: int = DEFAULT_REVINFO_TTL,
+                 revocation_mode: str = 'soft-fail'):
+        """
+        Args:
+            cert_files: PEM files with root and intermediate certificates
+            revinfo_ttl: Seconds to reuse fetched OCSP responses and CRLs
+            revocation_mode: pyHanko revocation mode (soft-fail, hard-fail, require)
+
+        Raises:
+            RuntimeError: If no trust root could be loaded
+        """
+        certs = load_pem_certs(cert_files)
+        roots = [cert for cert in certs if cert.self_signed != 'no']
+        if not roots:
+            raise RuntimeError("No self-signed trust root among the given certificates")
+        intermediates = [cert for cert in certs if cert.self_signed == 'no']
+        self.network = NetworkContext(revinfo_ttl=revinfo_ttl)
+        self.validation_context = self.network.validation_context(
+            roots, intermediates, revocation_mode=revocation_mode
+        )
+        self.key_usage = KeyUsageConstraints(key_usage=SIGNER_KEY_USAGE)
+
+    def verify_signature(self, embedded_sig) -> dict:
+        """Validate one embedded signature; never raises."""
+        result = {"field": str(embedded_sig.field_name)}
+        start = time.perf_counter()
+        try:
+            status = self.network.run(async_validate_pdf_signature(
+                embedded_sig, self.validation_context, key_usage_settings=self.key_usage
+            ))
+            result.update({
+                "signer": _name(status.signing_cert),
+                "signing_time": _isoformat(status.signer_reported_dt),
+                "intact": status.intact,
+                "valid": status.valid,
+                "trusted": status.trusted,
+                "revoked": status.revoked,
+                "coverage": status.coverage.name if status.coverage else None,
+                "modification_level": (status.modification_level.name
+                                       if status.modification_level else None),
+                "bottom_line": status.bottom_line,
+                "timestamp": None,
+            })
+            ts = status.timestamp_validity
+            if ts is not None:
+                result["timestamp"] = {
+                    "time": _isoformat(ts.timestamp),
+                    "intact": ts.intact,
+                    "valid": ts.valid,
+                    "trusted": ts.trusted,
+                    "tsa": _name(ts.signing_cert),
+                }
+        except Exception as e:
+            result["bottom_line"] = False
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def verify_file(self, pdf_file: Path) -> dict:
+        """Validate all signatures of a PDF; never raises."""
+        result = {"file": str(pdf_file)}
+        start = time.perf_counter()
+        try:
+            with open(pdf_file, 'rb') as f:
+                reader = PdfFileReader(f)
+                signatures = [self.verify_signature(sig) for sig in reader.embedded_signatures]
+            result["signatures"] = signatures
+            if not signatures:
+                result["status"] = "unsigned"
+            elif all(sig["bottom_line"] for sig in signatures):
+                result["status"] = "valid"
+            else:
+                result["status"] = "invalid"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["pid"] = os.getpid()
+        return result
+
+    def close(self):
+        self.network.close()
+
+
+# Per-process verification context, set up by _init_worker
+_context: Optional[VerificationContext] = None
+
+
+def _init_worker(cert_files: list[Path], revinfo_ttl: int, revocation_mode: str):
+    global _context
+    _context = VerificationContext(cert_files, revinfo_ttl, revocation_mode)
+
+
+def _verify_one(pdf_file: Path) -> dict:
+    return _context.verify_file(pdf_file)
+
+
+def collect_files(sources: Iterable[str], manifest: Optional[str],
+                  recursive: bool = False) -> Iterator[Path]:
+    """Resolve PDF paths from files, directories, globs or a manifest (first column)."""
+    if manifest is not None:
+        for input_pdf, _ in collect_jobs(None, manifest, Path(), recursive, unique_outputs=False):
+            yield input_pdf
+        return
+    for source in sources:
+        for input_pdf, _ in collect_jobs(source, None, Path(), recursive, unique_outputs=False):
+            yield input_pdf
+
+
+def run_verify(files: Iterable[Path], workers: int, initargs: tuple) -> Iterator[dict]:
+    """
+    Verify files on a process pool, yielding results in input order.
+
+    At most ``workers * 4`` files are in flight.
+    """
+    window = max(1, workers) * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=initargs) as executor:
+        pending: deque = deque()
+        for pdf_file in files:
+            pending.append(executor.submit(_verify_one, pdf_file))
+            if len(pending) > window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+@click.command()
+@click.argument('sources', nargs=-1)
+@click.option('--manifest', default=None,
+              help="Manifest file with one PDF path per line ('-' for stdin)")
+@click.option('--recursive', '-r', is_flag=True,
+              help='Recurse into sub-directories (directory or ** glob sources)')
+@click.option('--workers', '-j', default=os.cpu_count() or 1, show_default=True, type=int,
+              help='Number of verifying processes')
+@click.option('--trust-root', 'cert_files', multiple=True,
+              type=click.Path(exists=True, path_type=Path),
+              help='Root or intermediate certificate PEM (repeatable, '
+                   'default: $DEMO_CFSSL_DIR/ca.pem and ica-ca.pem)')
+@click.option('--revocation-mode', default='soft-fail', show_default=True,
+              type=click.Choice(REVOCATION_MODES),
+              help='How to treat missing or unreachable revocation info')
+@click.option('--revinfo-ttl', default=DEFAULT_REVINFO_TTL, show_default=True, type=int,
+              help='Seconds to reuse fetched OCSP responses and CRLs')
+def verify_batch(sources, manifest, recursive, workers, cert_files, revocation_mode,
+                 revinfo_ttl):
+    """
+    Verify the signatures of many PDF files in parallel.
+
+    SOURCES are PDF files, directories or glob patterns (quote them);
+    alternatively pass --manifest. One JSON object per file is printed to
+    stdout with status "valid", "invalid", "unsigned" or "error" and the
+    per-signature results. Exit status is 1 unless every file is valid.
+
+    Examples:
+
+        pdf-signer verify-batch archive/ -r -j 8 > report.jsonl
+
+        find archive -name '*.pdf' | pdf-signer verify-batch --manifest -
+    """
+    if bool(sources) == (manifest is not None):
+        raise click.UsageError("Give either SOURCES or --manifest")
+    if workers < 1:
+        raise click.UsageError("--workers must be at least 1")
+
+    cert_files = list(cert_files) or default_verify_certs()
+    try:
+        # Fail fast on unusable trust anchors before starting the pool
+        VerificationContext(cert_files).close()
+    except Exception as e:
+        raise click.ClickException(f"Error loading trust roots: {e}")
+
+    files = collect_files(sources, manifest, recursive)
+    initargs = (cert_files, revinfo_ttl, revocation_mode)
+
+    counts: dict[str, int] = {}
+    for result in run_verify(files, workers, initargs):
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        click.echo(json.dumps(result))
+    total = sum(counts.values())
+    click.echo(f"{total} files: " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())),
+               err=True)
+    if counts.get("valid", 0) != total:
+        sys.exit(1)
@@ -13,3 +13,31 @@ docker run -it \
     --entrypoint /usr/lib/squid/security_file_certgen \
     mysquid \
     -c -s /var/spool/squid/ssl_db -M 20MB
+
+# Key pool for the issuer sslcrtd helper (squid.conf sslcrtd_program).
+# The helper and the fill below run as the container's proxy user, so the
+# passphrase, the pool and the leaf cache are created in the container and
+# owned by proxy (not by the host user, whose 0600 files proxy cannot read)
+docker run --rm \
+    --user root \
+    -v $BD/data:/var/spool/squid \
+    -v $BD/config:/etc/squid \
+    --entrypoint /bin/sh \
+    mysquid \
+    -c 'set -e
+        if [ ! -f /etc/squid/keypool.pass ]; then
+            (umask 077; /opt/venv/bin/python -c "import secrets; print(secrets.token_hex(32))" > /etc/squid/keypool.pass)
+        fi
+        mkdir -p -m 700 /var/spool/squid/keypool /var/spool/squid/issuer_crtd
+        chown proxy:proxy /etc/squid/keypool.pass /var/spool/squid/keypool /var/spool/squid/issuer_crtd
+        chmod 600 /etc/squid/keypool.pass'
+docker run --rm \
+    --user proxy \
+    -v $BD/data:/var/spool/squid \
+    -v $BD/config:/etc/squid \
+    -v $(realpath ../issuer):/opt/issuer:ro \
+    -e PYTHONPATH=/opt/issuer \
+    -e ISSUER_KEYPOOL_PASSWORD_FILE=/etc/squid/keypool.pass \
+    --entrypoint /opt/venv/bin/python \
+    mysquid \
+    -m issuer keypool fill --pool-dir /var/spool/squid/keypool --target rsa-2048=${KEYPOOL_SIZE:-500}
@@ -38,6 +38,7 @@ docker run -it \
     -v $BD/logs:/var/log/squid \
     -v $BD/data:/var/spool/squid \
     -v $BD/config:/etc/squid \
+    -v $(realpath ../issuer):/opt/issuer:ro \
     `#-v $BD/config/snippet.conf:/etc/squid/conf.d/snippet.conf` \
     -p 3128:3128 \
     -p 3129:3129 \
@@ -16,6 +16,8 @@ for fn in glob(os.path.join(BD, "*")):
     print(os.path.basename(fn))
 # CA cert file name
 CA_CERT = os.getenv("CA_CERT", os.path.join(BD, "ca.pem"))
+# hashed CA directory (issuer trust build), e.g. $BD/trust/certs
+CA_PATH = os.getenv("CA_PATH", "")
 # test server host and port
 HOST = os.getenv("HOST", "localhost")
 PORT_STR = os.getenv("PORT", "8443")
@@ -28,6 +30,7 @@ except ValueError:
 # Print configuration
 print("--- Configuration:")
 print(f" CA_CERT = {CA_CERT}")
+print(f" CA_PATH = {CA_PATH}")
 print(f"    HOST = {HOST}")
 print(f"    PORT = {PORT}")
 input("--- Press Enter to continue...")
@@ -36,8 +39,8 @@ input("--- Press Enter to continue...")
 def main():
     """Main function"""
     # Create SSL context
-    if CA_CERT != "":
-        context = ssl.create_default_context(cafile=CA_CERT)
+    if CA_CERT != "" or CA_PATH != "":
+        context = ssl.create_default_context(cafile=CA_CERT or None, capath=CA_PATH or None)
     else:
         context = ssl.create_default_context()
     context.check_hostname = True
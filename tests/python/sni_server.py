@@ -0,0 +1,242 @@
+#!/usr/bin/env -S python3
+"""Concurrent SNI test server for every host under $BD/hosts
+
+An asyncio TLS server that serves each hosts/<name>/ certificate by SNI.
+Nothing is loaded up front. The SSLContext for a name is created on its
+first handshake from hosts/<name>/bundle-2.pem (or bundle-3.pem) and key.pem.
+It is then kept in a bounded LRU, so thousands of certificates can be served
+with only the recently used ones in memory. Hosts issued while the server
+runs are picked up on their first request.
+
+Every context issues TLS 1.3 session tickets (--tickets per handshake) and
+accepts them for resumption. OpenSSL encrypts and decrypts tickets with the
+keys of the initial (listening) context, not of the per-host one the SNI
+callback switches to, so tickets survive eviction from the LRU: a client
+of an evicted host still resumes, and only the certificate context is
+loaded again. The cost of a small cache is that loading, not lost sessions.
+
+With --mtls optional|required, clients are verified against our root and
+ICA ($BD/ca.pem, $BD/ica-ca.pem), e.g. with tls-clients/<name>/bundle-2.pem.
+
+Each connection gets a one-line HTTP response naming the host (and client
+certificate). GET /stats returns the counters as JSON: connections,
+resumed handshakes, and context cache hits, misses and evictions.
+
+Examples:
+  python3 sni_server.py --port 8443
+  python3 sni_server.py --mtls required --cache-size 100
+  python3 tls_load.py --target localhost:8443 --sni myhost.lan -c 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import signal
+import ssl
+import sys
+import time
+import weakref
+from collections import OrderedDict
+
+# get default base directory (the CA material of steps.sh)
+DEF_BD = os.path.join(os.getenv("HOME", "/tmp"), ".config", "demo-cfssl")
+BD = os.getenv("BD", DEF_BD)
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8443"))
+
+# A host name as it can appear under hosts/ (no path separators, no dot files)
+HOST_NAME_RE = re.compile(r"^[a-z0-9*_-][a-z0-9._*-]*$")
+# Bytes read of a request before answering
+MAX_REQUEST = 16 * 1024
+
+
+class ContextCache:
+    """Per-host SSLContexts, created on first use and kept in a bounded LRU."""
+
+    def __init__(self, hosts_dir, chain, size, tickets, mtls):
+        self.hosts_dir = hosts_dir
+        self.chain = chain
+        self.size = size
+        self.tickets = tickets
+        self.mtls = mtls
+        self.contexts = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "unknown": 0,
+                      "load_errors": 0, "load_ms": 0.0}
+
+    def make_context(self, host_dir):
+        """A server context for one host directory, configured like all others."""
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(os.path.join(host_dir, f"bundle-{self.chain}.pem"),
+                                os.path.join(host_dir, "key.pem"))
+        context.num_tickets = self.tickets
+        if self.mtls != "off":
+            # Verification runs with the context the SNI callback switched
+            # to, but the verify mode stays the one of the initial context:
+            # both are set on every context
+            context.verify_mode = ssl.CERT_REQUIRED if self.mtls == "required" else ssl.CERT_OPTIONAL
+            context.load_verify_locations(os.path.join(BD, "ca.pem"))
+            context.load_verify_locations(os.path.join(BD, "ica-ca.pem"))
+        return context
+
+    def get(self, name):
+        """The context for ``name``, or None if there is no such host."""
+        context = self.contexts.get(name)
+        if context is not None:
+            self.contexts.move_to_end(name)
+            self.stats["hits"] += 1
+            return context
+        host_dir = os.path.join(self.hosts_dir, name)
+        if not HOST_NAME_RE.match(name) or not os.path.isdir(host_dir):
+            self.stats["unknown"] += 1
+            return None
+        started = time.perf_counter()
+        try:
+            context = self.make_context(host_dir)
+        except (OSError, ssl.SSLError) as err:
+            self.stats["load_errors"] += 1
+            print(f"--- Cannot load {host_dir}: {err}", file=sys.stderr)
+            return None
+        self.stats["load_ms"] += (time.perf_counter() - started) * 1000
+        self.stats["misses"] += 1
+        self.contexts[name] = context
+        if len(self.contexts) > self.size:
+            self.contexts.popitem(last=False)
+            self.stats["evictions"] += 1
+        return context
+
+
+class SniServer:
+    """The asyncio server: SNI dispatch, a minimal HTTP response, counters."""
+
+    def __init__(self, cache, default_host, strict, handshake_timeout):
+        self.cache = cache
+        self.strict = strict
+        self.handshake_timeout = handshake_timeout
+        default_dir = os.path.join(cache.hosts_dir, default_host)
+        self.context = cache.make_context(default_dir)
+        self.context.sni_callback = self.on_sni
+        # SNI per connection: server_hostname is only set on the client side
+        self.server_names = weakref.WeakKeyDictionary()
+        self.stats = {"connections": 0, "active": 0, "handshakes": 0, "resumed": 0,
+                      "client_certs": 0, "errors": 0}
+        self.started = time.time()
+
+    def on_sni(self, ssl_object, server_name, initial_context):
+        """Switch to the context of the requested host."""
+        if server_name is None:
+            return None
+        self.server_names[ssl_object] = server_name
+        context = self.cache.get(server_name.lower())
+        if context is None:
+            return ssl.ALERT_DESCRIPTION_UNRECOGNIZED_NAME if self.strict else None
+        ssl_object.context = context
+        return None
+
+    async def handle(self, reader, writer):
+        self.stats["connections"] += 1
+        self.stats["active"] += 1
+        try:
+            ssl_object = writer.get_extra_info("ssl_object")
+            self.stats["handshakes"] += 1
+            if ssl_object.session_reused:
+                self.stats["resumed"] += 1
+            peer = writer.get_extra_info("peercert")
+            if peer:
+                self.stats["client_certs"] += 1
+            request = await asyncio.wait_for(reader.read(MAX_REQUEST), 10)
+            if request.startswith(b"GET /stats"):
+                body = json.dumps(self.snapshot()) + "\n"
+                content_type = "application/json"
+            else:
+                body = f"Hello from {self.server_names.get(ssl_object, '(no SNI)')}"
+                if peer:
+                    subject = dict(item for rdn in peer["subject"] for item in rdn)
+                    body += f" to {subject.get('commonName', '?')}"
+                body += "\n"
+                content_type = "text/plain"
+            writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                          f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n{body}").encode())
+            await writer.drain()
+        except (OSError, asyncio.TimeoutError, ssl.SSLError):
+            self.stats["errors"] += 1
+        finally:
+            self.stats["active"] -= 1
+            writer.close()
+
+    def snapshot(self):
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            **self.stats,
+            "contexts": len(self.cache.contexts),
+            "cache": {**self.cache.stats, "load_ms": round(self.cache.stats["load_ms"], 1)},
+        }
+
+    async def serve(self, host, port, backlog):
+        server = await asyncio.start_server(self.handle, host, port, ssl=self.context,
+                                            backlog=backlog,
+                                            ssl_handshake_timeout=self.handshake_timeout)
+        print(f"--- Listening on {host}:{port} for {self.cache.hosts_dir}/*", file=sys.stderr)
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set_result, None)
+        async with server:
+            await stop
+        print(json.dumps(self.snapshot()), file=sys.stderr)
+
+
+def raise_nofile(wanted):
+    """Lift the open-file soft limit towards the hard limit for many sockets."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE,
+                           (wanted if hard == resource.RLIM_INFINITY else min(wanted, hard), hard))
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description="Asyncio TLS server for every host under $BD/hosts, selected by SNI")
+    parser.add_argument("--host", default=HOST, help=f"Listen address (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Listen port (default: {PORT})")
+    parser.add_argument("--hosts-dir", default=os.path.join(BD, "hosts"),
+                        help="Directory of host certificates (default: $BD/hosts)")
+    parser.add_argument("--default-host", default="localhost",
+                        help="Certificate for clients without (or with an unknown) SNI "
+                             "(default: localhost, else the first host)")
+    parser.add_argument("--strict", action="store_true",
+                        help="Reject unknown server names instead of using the default host")
+    parser.add_argument("--chain", choices=["2", "3"], default="2",
+                        help="Serve bundle-2.pem (leaf + ICA) or bundle-3.pem (+ root)")
+    parser.add_argument("--cache-size", type=int, default=1000,
+                        help="Host contexts kept in memory (default: 1000)")
+    parser.add_argument("--tickets", type=int, default=2,
+                        help="TLS 1.3 session tickets per handshake, 0 for none (default: 2)")
+    parser.add_argument("--mtls", choices=["off", "optional", "required"], default="off",
+                        help="Verify client certificates against $BD/ca.pem and ica-ca.pem")
+    parser.add_argument("--backlog", type=int, default=4096,
+                        help="Listen backlog (default: 4096)")
+    parser.add_argument("--handshake-timeout", type=float, default=30.0,
+                        help="Seconds for a TLS handshake (default: 30)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.hosts_dir):
+        parser.error(f"No host certificates in {args.hosts_dir}")
+    default_host = args.default_host
+    if not os.path.isdir(os.path.join(args.hosts_dir, default_host)):
+        hosts = sorted(d for d in os.listdir(args.hosts_dir)
+                       if os.path.isdir(os.path.join(args.hosts_dir, d)))
+        if not hosts:
+            parser.error(f"No host certificates in {args.hosts_dir}")
+        default_host = hosts[0]
+    raise_nofile(args.backlog + 1024)
+    cache = ContextCache(args.hosts_dir, args.chain, args.cache_size, args.tickets, args.mtls)
+    server = SniServer(cache, default_host, args.strict, args.handshake_timeout)
+    asyncio.run(server.serve(args.host, args.port, args.backlog))
+
+
+if __name__ == "__main__":
+    main()
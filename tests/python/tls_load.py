@@ -0,0 +1,635 @@
+#!/usr/bin/env -S python3
+"""Concurrent TLS load generator for the generated certificate chains
+
+Opens many TLS connections at once with asyncio and measures, per phase:
+
+- full: every connection does a full handshake
+- resumed: every connection offers the session of its previous one
+
+For each it reports the handshake rate, handshake latency percentiles
+(p50/p90/p99/max, TCP connect excluded) and the TLS bytes on the wire per
+handshake. The TLS engine runs over memory BIOs, so every handshake byte is
+counted, not estimated.
+
+Against a running server (--target) it only measures. With --serve it starts
+`openssl s_server` for each combination of
+
+- host directory (hosts/<name>/: EC P-384 or RSA, whatever its key is)
+- chain (--chain 2 3: bundle-2.pem is leaf + ICA, bundle-3.pem adds the root)
+- OCSP stapling (--staple off on; a response signed with the ICA key)
+- mTLS (--mtls off on; the client presents tls-clients/<name>/bundle-2.pem)
+
+and prints one JSON line per combination and phase, plus a table on stderr,
+so chain and key profiles can be compared side by side.
+
+Requesting OCSP staples needs pyOpenSSL (pip install pyopenssl): the
+standard ssl module cannot send the status_request extension. A run with
+--staple on uses pyOpenSSL for all its variants, staple off included: its
+OpenSSL may send a different ClientHello (other key shares) than the one
+behind the ssl module, so only runs of one engine compare. Everything else
+uses the standard library only.
+
+Examples:
+  python3 tls_load.py --target localhost:8443 --sni localhost -c 1000 -d 10
+  python3 tls_load.py --target localhost:8443 --sni-hosts -c 1000    # sni_server.py
+  python3 tls_load.py --serve $BD/hosts/localhost --chain 2 3 --staple off on
+  python3 tls_load.py --serve $BD/hosts/localhost --mtls on --client-cert $BD/tls-clients/bob_smith
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+
+# get default base directory (the CA material of steps.sh)
+DEF_BD = os.path.join(os.getenv("HOME", "/tmp"), ".config", "demo-cfssl")
+BD = os.getenv("BD", DEF_BD)
+
+PHASES = ("full", "resumed")
+# Sent after the handshake; the response carries the TLS 1.3 session tickets
+DEF_REQUEST = "GET / HTTP/1.0\r\n\r\n"
+# Read at most this much of a response
+MAX_RESPONSE = 256 * 1024
+
+
+class StdlibTls:
+    """Client TLS over memory BIOs with the ssl module."""
+
+    def __init__(self, context, sni, session):
+        self.incoming = ssl.MemoryBIO()
+        self.outgoing = ssl.MemoryBIO()
+        self.obj = context.wrap_bio(self.incoming, self.outgoing,
+                                    server_hostname=sni, session=session)
+        self.stapled = None
+
+    def handshake(self):
+        """True once the handshake is complete."""
+        try:
+            self.obj.do_handshake()
+        except ssl.SSLWantReadError:
+            return False
+        return True
+
+    def pending(self):
+        return self.outgoing.read()
+
+    def feed(self, data):
+        if data:
+            self.incoming.write(data)
+        else:
+            self.incoming.write_eof()
+
+    def write(self, data):
+        self.obj.write(data)
+
+    def read(self):
+        """Decrypted data, b"" at the end, None if more input is needed."""
+        try:
+            return self.obj.read(65536)
+        except ssl.SSLWantReadError:
+            return None
+        except (ssl.SSLZeroReturnError, ssl.SSLEOFError):
+            return b""
+
+    @property
+    def session(self):
+        return self.obj.session
+
+    @property
+    def reused(self):
+        return self.obj.session_reused
+
+    @property
+    def version(self):
+        return self.obj.version()
+
+
+class OpenSslTls:
+    """Client TLS over memory BIOs with pyOpenSSL, to request OCSP staples."""
+
+    def __init__(self, context, sni, session, staple):
+        from OpenSSL import SSL
+        self.SSL = SSL
+        self.conn = SSL.Connection(context, None)
+        self.conn.set_app_data(self)
+        self.conn.set_connect_state()
+        self.conn.set_tlsext_host_name(sni.encode())
+        if staple:
+            self.conn.request_ocsp()
+        if session is not None:
+            self.conn.set_session(session)
+        self.stapled = 0
+
+    def handshake(self):
+        try:
+            self.conn.do_handshake()
+        except self.SSL.WantReadError:
+            return False
+        return True
+
+    def pending(self):
+        try:
+            return self.conn.bio_read(65536)
+        except self.SSL.WantReadError:
+            return b""
+
+    def feed(self, data):
+        if data:
+            self.conn.bio_write(data)
+        else:
+            self.conn.bio_shutdown()
+
+    def write(self, data):
+        self.conn.send(data)
+
+    def read(self):
+        try:
+            return self.conn.recv(65536)
+        except self.SSL.WantReadError:
+            return None
+        except (self.SSL.ZeroReturnError, self.SSL.SysCallError):
+            return b""
+
+    @property
+    def session(self):
+        return self.conn.get_session()
+
+    @property
+    def reused(self):
+        # pyOpenSSL has no accessor for it
+        return bool(self.SSL._lib.SSL_session_reused(self.conn._ssl))
+
+    @property
+    def version(self):
+        return self.conn.get_protocol_version_name()
+
+
+def stdlib_context(ca_file, client_cert=None):
+    context = ssl.create_default_context(cafile=ca_file)
+    if client_cert:
+        context.load_cert_chain(*client_cert)
+    return context
+
+
+def openssl_context(ca_file, client_cert=None):
+    from OpenSSL import SSL
+    context = SSL.Context(SSL.TLS_CLIENT_METHOD)
+    context.load_verify_locations(ca_file)
+    context.set_verify(SSL.VERIFY_PEER, lambda conn, cert, errno, depth, ok: bool(ok))
+    if client_cert:
+        context.use_certificate_chain_file(client_cert[0])
+        context.use_privatekey_file(client_cert[1])
+
+    def on_staple(conn, ocsp, data):
+        conn.get_app_data().stapled = len(ocsp)
+        return True
+
+    context.set_ocsp_client_callback(on_staple)
+    return context
+
+
+async def connect_once(loop, addr, make_tls, session, request):
+    """One connection: TCP connect, handshake, request, response."""
+    started = time.perf_counter()
+    sock = socket.socket(socket.AF_INET6 if ":" in addr[0] else socket.AF_INET,
+                         socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, addr)
+        connected = time.perf_counter()
+        tls = make_tls(session)
+        sent = received = 0
+        while not tls.handshake():
+            out = tls.pending()
+            if out:
+                sent += len(out)
+                await loop.sock_sendall(sock, out)
+            data = await loop.sock_recv(sock, 65536)
+            if not data:
+                raise ConnectionError("connection closed during the handshake")
+            received += len(data)
+            tls.feed(data)
+        out = tls.pending()
+        if out:
+            sent += len(out)
+            await loop.sock_sendall(sock, out)
+        done = time.perf_counter()
+        result = {
+            "connect": connected - started,
+            "handshake": done - connected,
+            "sent": sent,
+            "received": received,
+            "reused": tls.reused,
+            "stapled": tls.stapled,
+            "version": tls.version,
+        }
+        if request:
+            tls.write(request)
+            await loop.sock_sendall(sock, tls.pending())
+            body = 0
+            while body < MAX_RESPONSE:
+                data = tls.read()
+                if data == b"":
+                    break
+                if data is not None:
+                    body += len(data)
+                    continue
+                data = await loop.sock_recv(sock, 65536)
+                tls.feed(data)
+                if not data:
+                    body += len(tls.read() or b"")
+                    break
+            if not body:
+                # e.g. a server requiring a client certificate closes here in TLS 1.3
+                raise ConnectionError("connection closed without a response")
+        result["session"] = tls.session
+        return result
+    finally:
+        sock.close()
+
+
+class Stats:
+    """Latencies, bytes and errors of one phase."""
+
+    def __init__(self):
+        self.handshake = {"full": [], "resumed": []}
+        self.connect = []
+        self.bytes = {"full": [0, 0], "resumed": [0, 0]}
+        self.stapled = 0
+        self.errors = {}
+        self.versions = {}
+
+    def add(self, result):
+        kind = "resumed" if result["reused"] else "full"
+        self.handshake[kind].append(result["handshake"])
+        self.connect.append(result["connect"])
+        self.bytes[kind][0] += result["received"]
+        self.bytes[kind][1] += result["sent"]
+        if result["stapled"]:
+            self.stapled += 1
+        self.versions[result["version"]] = self.versions.get(result["version"], 0) + 1
+
+    def error(self, err):
+        name = type(err).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def merge(self, other):
+        for kind in self.handshake:
+            self.handshake[kind].extend(other.handshake[kind])
+            self.bytes[kind][0] += other.bytes[kind][0]
+            self.bytes[kind][1] += other.bytes[kind][1]
+        self.connect.extend(other.connect)
+        self.stapled += other.stapled
+        for name, count in other.errors.items():
+            self.errors[name] = self.errors.get(name, 0) + count
+        for name, count in other.versions.items():
+            self.versions[name] = self.versions.get(name, 0) + count
+
+    def summary(self, elapsed):
+        result = {"elapsed": round(elapsed, 3), "errors": sum(self.errors.values())}
+        if self.errors:
+            result["error_kinds"] = self.errors
+        for kind in ("full", "resumed"):
+            latencies = sorted(self.handshake[kind])
+            count = len(latencies)
+            result[kind] = {
+                "count": count,
+                "rate": round(count / elapsed, 1) if elapsed else 0.0,
+            }
+            if count:
+                result[kind]["handshake_ms"] = {
+                    p: round(percentile(latencies, q) * 1000, 2)
+                    for p, q in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))
+                }
+                result[kind]["bytes_in"] = round(self.bytes[kind][0] / count)
+                result[kind]["bytes_out"] = round(self.bytes[kind][1] / count)
+        if self.connect:
+            result["connect_ms_p50"] = round(percentile(sorted(self.connect), 50) * 1000, 2)
+        result["stapled"] = self.stapled
+        result["versions"] = self.versions
+        return result
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values."""
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+async def run_phase(cfg, phase, workers):
+    """Run ``workers`` connection loops for one phase; returns the stats."""
+    loop = asyncio.get_running_loop()
+    stats = Stats()
+    client_cert = cfg["client_cert"]
+    if cfg["engine"] == "openssl":
+        context = openssl_context(cfg["ca_file"], client_cert)
+        make_tls = lambda sni, session: OpenSslTls(context, sni, session, cfg["staple"])
+    else:
+        context = stdlib_context(cfg["ca_file"], client_cert)
+        make_tls = lambda sni, session: StdlibTls(context, sni, session)
+    names = cfg["sni"]
+    request = cfg["request"].encode() if cfg["request"] else b""
+    deadline = time.monotonic() + cfg["duration"]
+    budget = [cfg["connections"]] if cfg["connections"] else None
+
+    async def worker(n):
+        await asyncio.sleep(cfg["ramp"] * n / workers)
+        # Full handshakes go round-robin over the server names; resuming
+        # workers keep to one name each, so they have a session to offer
+        sessions = {}
+        turn = n
+        while time.monotonic() < deadline:
+            sni = names[turn % len(names)]
+            if phase == "full":
+                turn += workers
+            if budget is not None:
+                if budget[0] <= 0:
+                    return
+                budget[0] -= 1
+            # Connections still running at the deadline are cut off, not counted
+            timeout = min(cfg["timeout"], deadline - time.monotonic())
+            try:
+                result = await asyncio.wait_for(
+                    connect_once(loop, cfg["addr"], lambda session: make_tls(sni, session),
+                                 sessions.get(sni), request), timeout)
+            except Exception as err:
+                if time.monotonic() >= deadline:
+                    return
+                stats.error(err)
+                sessions.pop(sni, None)
+                continue
+            stats.add(result)
+            if phase == "resumed":
+                sessions[sni] = result["session"]
+
+    # Spread the first connections over the ramp-up instead of one SYN burst
+    await asyncio.gather(*(worker(n) for n in range(workers)))
+    return stats
+
+
+def _run_process(cfg, phase, workers):
+    """Process pool entry point: one event loop per process."""
+    return asyncio.run(run_phase(cfg, phase, workers))
+
+
+def run(cfg):
+    """Both phases with ``cfg['processes']`` processes; one summary per phase."""
+    raise_nofile(cfg["concurrency"])
+    summaries = []
+    for phase in cfg["phases"]:
+        started = time.perf_counter()
+        processes = cfg["processes"]
+        if processes == 1:
+            stats = _run_process(cfg, phase, cfg["concurrency"])
+        else:
+            shares = [cfg["concurrency"] // processes + (n < cfg["concurrency"] % processes)
+                      for n in range(processes)]
+            part_cfg = dict(cfg)
+            if cfg["connections"]:
+                part_cfg["connections"] = -(-cfg["connections"] // processes)
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                parts = list(pool.map(_run_process, [part_cfg] * processes,
+                                      [phase] * processes, shares))
+            stats = Stats()
+            for part in parts:
+                stats.merge(part)
+        summaries.append({"phase": phase, **stats.summary(time.perf_counter() - started)})
+    return summaries
+
+
+def raise_nofile(concurrency):
+    """Lift the open-file soft limit towards the hard limit for many sockets."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = concurrency + 64
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        new = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (new, hard))
+        if new < wanted:
+            print(f"--- Open file limit {new} is below the concurrency {concurrency}",
+                  file=sys.stderr)
+
+
+def key_type(cert_file):
+    """``ec-384`` or ``rsa-2048`` from the certificate's public key."""
+    text = subprocess.run(["openssl", "x509", "-noout", "-text", "-in", cert_file],
+                          capture_output=True, text=True, check=True).stdout
+    bits = text.split("Public-Key: (", 1)[1].split(" bit", 1)[0] if "Public-Key: (" in text else "?"
+    return f"{'rsa' if 'rsaEncryption' in text else 'ec'}-{bits}"
+
+
+def split_pem(path):
+    """The PEM blocks of a file."""
+    with open(path, encoding="ascii") as f:
+        data = f.read()
+    end = "-----END CERTIFICATE-----"
+    return [block.strip() + "\n" + end + "\n" for block in data.split(end) if "BEGIN" in block]
+
+
+class LocalServer:
+    """``openssl s_server`` with one chain, staple and mTLS setting."""
+
+    def __init__(self, host_dir, chain, staple, mtls, port, workdir):
+        self.host_dir = host_dir
+        self.port = port
+        self.name = os.path.basename(os.path.normpath(host_dir))
+        cert = os.path.join(host_dir, "cert.pem")
+        key = os.path.join(host_dir, "key.pem")
+        # s_server sends the -cert_chain certificates after the leaf, so drop the leaf
+        chain_file = os.path.join(workdir, f"{self.name}-chain-{chain}.pem")
+        with open(chain_file, "w", encoding="ascii") as f:
+            f.writelines(split_pem(os.path.join(host_dir, f"bundle-{chain}.pem"))[1:])
+        self.cmd = ["openssl", "s_server", "-accept", f"127.0.0.1:{port}", "-cert", cert,
+                    "-key", key, "-cert_chain", chain_file, "-www", "-quiet"]
+        if staple:
+            self.cmd += ["-status_file", ocsp_response(cert, workdir)]
+        if mtls:
+            self.cmd += ["-Verify", "1", "-verify_return_error",
+                         "-CAfile", os.path.join(BD, "ca.pem")]
+        # A file, not a pipe: with -Verify it logs every handshake and would
+        # block once a pipe nobody reads is full
+        self.log = os.path.join(workdir, f"s_server-{port}.log")
+        self.proc = None
+
+    def __enter__(self):
+        with open(self.log, "wb") as log:
+            self.proc = subprocess.Popen(self.cmd, stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.DEVNULL, stderr=log)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                with open(self.log, encoding="utf-8", errors="replace") as log:
+                    raise RuntimeError(f"openssl s_server exited: {log.read()}")
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("openssl s_server did not start")
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+def ocsp_response(cert, workdir):
+    """A DER OCSP response for ``cert``, signed by the ICA (the responder's signer)."""
+    response = os.path.join(workdir, os.path.basename(os.path.dirname(cert)) + "-ocsp.der")
+    if os.path.exists(response):
+        return response
+    index = os.path.join(BD, "crl", "ica", "index.txt")
+    if not os.path.exists(index):
+        index = os.path.join(workdir, "index.txt")
+        open(index, "a").close()
+    ica, ica_key = os.path.join(BD, "ica-ca.pem"), os.path.join(BD, "ica-key.pem")
+    request = os.path.join(workdir, "ocsp-req.der")
+    subprocess.run(["openssl", "ocsp", "-issuer", ica, "-cert", cert, "-no_nonce",
+                    "-reqout", request], capture_output=True, check=True)
+    subprocess.run(["openssl", "ocsp", "-index", index, "-CA", ica, "-rsigner", ica,
+                    "-rkey", ica_key, "-reqin", request, "-respout", response, "-ndays", "1"],
+                   capture_output=True, check=True)
+    return response
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def print_table(rows):
+    """Side-by-side comparison on stderr."""
+    header = (f"{'variant':<44} {'phase':<8} {'hs/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'in B':>7} {'out B':>6} {'reuse%':>6} {'err':>5}")
+    print(header, file=sys.stderr)
+    print("-" * len(header), file=sys.stderr)
+    for row in rows:
+        total = row["full"]["count"] + row["resumed"]["count"]
+        main = row["resumed"] if row["phase"] == "resumed" and row["resumed"]["count"] else row["full"]
+        reuse = 100 * row["resumed"]["count"] / total if total else 0
+        latency = main.get("handshake_ms", {})
+        print(f"{row['variant']:<44} {row['phase']:<8} {main['rate']:>8} "
+              f"{latency.get('p50', '-'):>8} {latency.get('p99', '-'):>8} "
+              f"{main.get('bytes_in', '-'):>7} {main.get('bytes_out', '-'):>6} "
+              f"{reuse:>6.1f} {row['errors']:>5}", file=sys.stderr)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(
+        description="Concurrent TLS load generator: handshake rate, latency and bytes on the wire")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target", help="HOST:PORT of a running TLS server")
+    target.add_argument("--serve", action="append",
+                        help="hosts/<name>/ directory to serve with openssl s_server (repeatable)")
+    parser.add_argument("--sni", nargs="+",
+                        help="Server names, used round-robin (default: target host, "
+                             "or the host directory name)")
+    parser.add_argument("--sni-hosts", action="store_true",
+                        help="--target: every host under $BD/hosts as server name "
+                             "(multi-tenant servers such as sni_server.py)")
+    parser.add_argument("--ca-file", default=os.path.join(BD, "ca.pem"),
+                        help="Trust anchors (default: $BD/ca.pem)")
+    parser.add_argument("--chain", nargs="+", choices=["2", "3"], default=["2"],
+                        help="--serve: bundle-2.pem (leaf + ICA) and/or bundle-3.pem (+ root)")
+    parser.add_argument("--staple", nargs="+", choices=["off", "on"], default=["off"],
+                        help="Request an OCSP staple (needs pyOpenSSL); --serve: staple one")
+    parser.add_argument("--mtls", nargs="+", choices=["off", "on"], default=["off"],
+                        help="Present a client certificate; --serve: require one")
+    parser.add_argument("--client-cert",
+                        help="tls-clients/<name>/ directory for --mtls on "
+                             "(default: the first one under $BD/tls-clients)")
+    parser.add_argument("-c", "--concurrency", type=int, default=100,
+                        help="Concurrent connections (default: 100)")
+    parser.add_argument("-d", "--duration", type=float, default=10.0,
+                        help="Seconds per phase (default: 10)")
+    parser.add_argument("-n", "--connections", type=int,
+                        help="Stop a phase after this many connections")
+    parser.add_argument("--phase", nargs="+", choices=PHASES, default=list(PHASES),
+                        help="Phases to run (default: full resumed)")
+    parser.add_argument("--request", default=DEF_REQUEST,
+                        help="Sent after the handshake, '' for none (default: GET / HTTP/1.0)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="Seconds per connection (default: 10)")
+    parser.add_argument("--ramp", type=float, default=1.0,
+                        help="Seconds over which the connections start (default: 1)")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="Client processes, each with its own event loop (default: 1)")
+    args = parser.parse_args()
+
+    if "on" in args.staple:
+        try:
+            import OpenSSL  # noqa: F401
+        except ImportError:
+            parser.error("--staple on needs pyOpenSSL: pip install pyopenssl")
+    client_cert = None
+    if "on" in args.mtls:
+        client_dir = args.client_cert or next(iter(sorted(glob(os.path.join(BD, "tls-clients", "*")))), None)
+        if client_dir is None:
+            parser.error(f"--mtls on needs --client-cert (no tls-clients under {BD})")
+        client_cert = (os.path.join(client_dir, "bundle-2.pem"), os.path.join(client_dir, "key.pem"))
+
+    base = {
+        "ca_file": args.ca_file,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "connections": args.connections,
+        "phases": args.phase,
+        "request": args.request,
+        "timeout": args.timeout,
+        "ramp": args.ramp,
+        "processes": args.processes,
+        "engine": "openssl" if "on" in args.staple else "stdlib",
+    }
+    rows = []
+    if args.target:
+        host, _, port = args.target.rpartition(":")
+        host = host.strip("[]")
+        addr = socket.getaddrinfo(host, int(port), type=socket.SOCK_STREAM)[0][4][:2]
+        names = args.sni or [host]
+        if args.sni_hosts:
+            names = sorted(os.path.basename(os.path.normpath(d))
+                           for d in glob(os.path.join(BD, "hosts", "*", "")))
+            if not names:
+                parser.error(f"No hosts under {BD}/hosts")
+        for staple, mtls in itertools.product(args.staple, args.mtls):
+            cfg = dict(base, addr=addr, sni=names, staple=staple == "on",
+                       client_cert=client_cert if mtls == "on" else None)
+            variant = f"{args.target} staple={staple} mtls={mtls}"
+            for summary in run(cfg):
+                rows.append({"variant": variant, **summary})
+                print(json.dumps(rows[-1]), flush=True)
+    else:
+        if shutil.which("openssl") is None:
+            parser.error("--serve needs the openssl command")
+        with tempfile.TemporaryDirectory(prefix="tls-load-") as workdir:
+            for host_dir, chain, staple, mtls in itertools.product(
+                    args.serve, args.chain, args.staple, args.mtls):
+                port = free_port()
+                server = LocalServer(host_dir, chain, staple == "on", mtls == "on", port, workdir)
+                cfg = dict(base, addr=("127.0.0.1", port), sni=args.sni or [server.name],
+                           staple=staple == "on", client_cert=client_cert if mtls == "on" else None)
+                variant = (f"{server.name} {key_type(os.path.join(host_dir, 'cert.pem'))} "
+                           f"bundle-{chain} staple={staple} mtls={mtls}")
+                print(f"--- {variant}", file=sys.stderr)
+                with server:
+                    for summary in run(cfg):
+                        rows.append({"variant": variant, **summary})
+                        print(json.dumps(rows[-1]), flush=True)
+    print("", file=sys.stderr)
+    print_table(rows)
+    return 1 if any(row["errors"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
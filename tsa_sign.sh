@@ -61,6 +61,9 @@ usage() {
     echo "  $0 --p12 email.p12 document.pdf"
     echo "  $0 --p12 email.p12 --password-file pass.txt report.pdf contract.docx"
     echo "  $0 --cert cert.pem --key key.pem presentation.pptx"
+    echo ""
+    echo "For many files or directory trees, 'mytsa sign' (mytsa/) writes the same"
+    echo "files in one process: mytsa sign contracts/ --p12 email.p12"
     exit 1
 }
 
@@ -25,6 +25,7 @@ SIGNATURE_FILE=""
 TIMESTAMP_FILE=""
 DEFAULT_CA_FILE="$HOME/.config/demo-cfssl/ca-bundle-all-roots.pem"
 CA_FILE=""
+CA_PATH=""
 VERIFY_CERT=false
 
 # Function to print usage
@@ -41,6 +42,8 @@ usage() {
     echo "Options:"
     echo "  --ca-file FILE      CA bundle for certificate chain verification"
     echo "                      Default: \$HOME/.config/demo-cfssl/ca-bundle-complete.pem"
+    echo "  --ca-path DIR       Hashed CA directory (issuer trust build) instead of a bundle;"
+    echo "                      OpenSSL loads only the CAs the chain needs"
     echo "  --verify-cert       Enable certificate chain verification"
     echo "  --help              Show this help message"
     echo ""
@@ -48,6 +51,7 @@ usage() {
     echo "  $0 document.pdf"
     echo "  $0 document.pdf --verify-cert"
     echo "  $0 document.pdf --ca-file /path/to/ca-bundle.pem --verify-cert"
+    echo "  $0 document.pdf --ca-path \$HOME/.config/demo-cfssl/trust/certs --verify-cert"
     echo ""
     echo "The script will:"
     echo "  1. Verify the CMS signature"
@@ -83,6 +87,10 @@ while [[ $# -gt 0 ]]; do
             CA_FILE="$2"
             shift 2
             ;;
+        --ca-path)
+            CA_PATH="$2"
+            shift 2
+            ;;
         --verify-cert)
             VERIFY_CERT=true
             shift
@@ -133,14 +141,20 @@ if [ -f "$TIMESTAMP_FILE" ]; then
     HAS_TIMESTAMP=true
 fi
 
+if [ -n "$CA_PATH" ] && [ ! -d "$CA_PATH" ]; then
+    log_error "CA directory not found: $CA_PATH"
+    log_info "Run 'issuer trust build' to create it"
+    exit 1
+fi
+
 # Use default CA bundle if none specified and it exists
-if [ -z "$CA_FILE" ] && [ -f "$DEFAULT_CA_FILE" ]; then
+if [ -z "$CA_FILE" ] && [ -z "$CA_PATH" ] && [ -f "$DEFAULT_CA_FILE" ]; then
     CA_FILE="$DEFAULT_CA_FILE"
 fi
 
 # Check CA file if cert verification is requested
-if [ "$VERIFY_CERT" = true ] && [ -z "$CA_FILE" ]; then
-    log_error "--verify-cert requires --ca-file"
+if [ "$VERIFY_CERT" = true ] && [ -z "$CA_FILE" ] && [ -z "$CA_PATH" ]; then
+    log_error "--verify-cert requires --ca-file or --ca-path"
     log_info "Run './build_ca_bundle.sh' to create the default CA bundle"
     exit 1
 fi
@@ -170,8 +184,16 @@ if [ -n "$CA_FILE" ]; then
         log_info "CA bundle: $CA_FILE"
     fi
 fi
+if [ -n "$CA_PATH" ]; then
+    log_info "CA directory: $CA_PATH"
+fi
 echo ""
 
+# Trust anchors for openssl: the hashed directory and/or the bundle
+CA_ARGS=()
+[ -n "$CA_PATH" ] && CA_ARGS+=(-CApath "$CA_PATH")
+[ -n "$CA_FILE" ] && CA_ARGS+=(-CAfile "$CA_FILE")
+
 # Verify the signature
 echo "───────────────────────────────────────────────────────────────"
 echo "  Step 1: Verifying CMS Signature"
@@ -181,7 +203,7 @@ echo ""
 VERIFY_CMD="openssl cms -verify -in \"$SIGNATURE_FILE\" -inform PEM -content \"$ORIGINAL_FILE\""
 
 if [ "$VERIFY_CERT" = true ]; then
-    VERIFY_CMD="$VERIFY_CMD -CAfile \"$CA_FILE\""
+    VERIFY_CMD="$VERIFY_CMD$(printf ' %q' "${CA_ARGS[@]}")"
     log_info "Verifying signature with certificate chain validation..."
 else
     VERIFY_CMD="$VERIFY_CMD -noverify"
@@ -282,7 +304,7 @@ if [ "$HAS_TIMESTAMP" = true ]; then
         echo "$TS_INFO" | grep -E "(Time stamp|Policy OID|Hash Algorithm|Nonce)" | sed 's/^/  /'
         
         # Try to verify timestamp against the original file
-        if [ -n "$CA_FILE" ]; then
+        if [ ${#CA_ARGS[@]} -gt 0 ]; then
             log_info "Verifying timestamp against original file..."
             
             # Create a timestamp query for comparison
@@ -290,7 +312,7 @@ if [ "$HAS_TIMESTAMP" = true ]; then
             trap "rm -rf $TEMP_DIR" EXIT
             
             # Try timestamp verification
-            TS_VERIFY_OUTPUT=$(openssl ts -verify -in "$TIMESTAMP_FILE" -data "$ORIGINAL_FILE" -CAfile "$CA_FILE" 2>&1)
+            TS_VERIFY_OUTPUT=$(openssl ts -verify -in "$TIMESTAMP_FILE" -data "$ORIGINAL_FILE" "${CA_ARGS[@]}" 2>&1)
             TS_VERIFY_RESULT=$?
             
             if [ $TS_VERIFY_RESULT -eq 0 ]; then